@@ -1,11 +1,22 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
-from typing import Dict, List, Any
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request, Header, Query, Response
+from typing import Dict, List, Any, Optional
 import datetime
 import asyncio
-from app.core.models import PlagiarismRequest, PlagiarismResponse, PlagiarismResult, AIDetectionResult
+import os
+from pydantic import ValidationError
+from app.core.models import PlagiarismOptions, PlagiarismRequest, parse_options, PlagiarismResponse, PlagiarismResult, AIDetectionResult
 from app.services.plagiarism_checker import PlagiarismChecker
 from app.services.ai_detector import AIDetector
+from app.services.incremental_checker import IncrementalChecker
+from app.services.pipeline import PlagiarismPipeline
+from app.services.result_store import HISTORY_ORDERS, ResultStore, authenticate, parse_api_keys
 from app.utils.pdf_extractor import PDFExtractor
+from app.utils.upload import StreamingUpload, UploadTooLarge, InvalidUpload
+from app.core.metrics import profiling
+from app.core.deadline import deadline_scope
+from app.core.lifecycle import CheckSlots, Draining
+from app.core.scheduler import resolve_tenant, tenant_scope
+from starlette.concurrency import run_in_threadpool
 import logging
 
 # Configure logging
@@ -20,73 +31,200 @@ router = APIRouter()
 pdf_extractor = PDFExtractor()
 plagiarism_checker = PlagiarismChecker()
 ai_detector = AIDetector()
+incremental_checker = IncrementalChecker(plagiarism_checker, ai_detector)
+pipeline = PlagiarismPipeline(pdf_extractor, plagiarism_checker, ai_detector, incremental_checker)
+check_slots = CheckSlots()
+result_store = ResultStore.from_env()
+# Keys of the tenants allowed to read stored reports ("tenant=key,...")
+report_api_keys = parse_api_keys(os.getenv("REPORT_API_KEYS"))
+
+def request_tenant(x_tenant_id: Optional[str] = Header(default=None)) -> str:
+    """Tenant of a request, from its X-Tenant-ID header (the default tenant without one)"""
+    try:
+        return resolve_tenant(x_tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid X-Tenant-ID: {str(e)}")
+
+def report_reader(x_api_key: Optional[str] = Header(default=None)) -> str:
+    """Tenant authenticated by a request's X-API-Key header, required to read stored reports"""
+    if result_store is None:
+        raise HTTPException(status_code=404, detail="Report storage is disabled")
+    tenant = authenticate(x_api_key, report_api_keys)
+    if tenant is None:
+        raise HTTPException(status_code=401, detail="Reading reports requires a valid X-API-Key",
+                            headers={"WWW-Authenticate": "X-API-Key"})
+    return tenant
+
+async def store_report(response: PlagiarismResponse, tenant: str, options) -> PlagiarismResponse:
+    """Save a response to the result store and set its report_id (a failed save does not fail the check)"""
+    if result_store is None:
+        return response
+    try:
+        response.report_id = await run_in_threadpool(
+            result_store.save, response.model_dump(mode="json"), tenant,
+            user_id=options.user_id, course_id=options.course_id, submission_id=options.submission_id
+        )
+    except Exception as e:
+        logger.warning(f"Could not store report: {str(e)}")
+    return response
 
 @router.post("/check-plagiarism", response_model=PlagiarismResponse)
-async def check_plagiarism(request: PlagiarismRequest):
+async def check_plagiarism(request: PlagiarismRequest, tenant: str = Depends(request_tenant)):
     """
     Checks a PDF document for plagiarism and AI-generated content
+    
+    Checks are queued fairly across tenants (the X-Tenant-ID header) and
+    priority classes (the `priority` option).
     """
     try:
         # Log request
-        logger.info(f"Received plagiarism check request for URL: {request.pdf_url}")
+        logger.info(f"Received plagiarism check request for URL: {request.pdf_url} (tenant {tenant})")
 
-        # Download PDF
-        pdf_content = await pdf_extractor.download_pdf(str(request.pdf_url))
-        
-        # Extract and process PDF into sections
-        sections = pdf_extractor.extract_and_process(pdf_content)
-        
-        # Combine all sections for plagiarism check
-        full_text = " ".join(sections.values())
-        
-        # Get total word count
-        total_word_count = len(full_text.split())
+        # Collect a per-stage breakdown when profiling is requested; the deadline
+        # clock starts before the download and covers the queue wait
+        with profiling(request.profile) as profile, deadline_scope(budget_ms=request.deadline_ms) as deadline, \
+                tenant_scope(tenant):
+            deadline.plan(pipeline.planned_stages(request))
+            # One slot per concurrent check, held from the download on; the download is
+            # streamed to a spooled file and the check runs off the event loop
+            async with check_slots.slot(tenant, request.priority or "interactive"):
+                pdf_file, content_hash = await pdf_extractor.download_pdf(
+                    str(request.pdf_url), timeout=deadline.timeout('download', 30)
+                )
+                try:
+                    result = await run_in_threadpool(pipeline.check_pdf, pdf_file, request,
+                                                     content_hash=content_hash)
+                finally:
+                    pdf_file.close()
+            
+            # Create response, stored so the report can be reopened without re-running the check
+            response = PlagiarismResponse(**result, stage_timings=profile.as_dict() if profile else None)
+            return await store_report(response, tenant, request)
         
-        # Check for plagiarism
-        if request.check_online_sources:
-            # Check plagiarism against online scholarly sources
-            plagiarism_results = plagiarism_checker.check_plagiarism_with_scholarly_search(
-                full_text, 
-                num_papers=request.num_papers, 
-                thresholds=request.thresholds
-            )
-        else:
-            # Use default reference texts (empty in this case - would need to be populated)
-            reference_texts = []
-            plagiarism_results = plagiarism_checker.check_plagiarism(
-                full_text, 
-                reference_texts, 
-                thresholds=request.thresholds
-            )
-        
-        # Get AI detection results
-        ai_detection_results = ai_detector.analyze_sections(sections)
-        
-        # Calculate overall plagiarism score
-        plagiarism_overall_score = 0.0
-        if plagiarism_results:
-            # Average of top 3 scores or all scores if less than 3
-            top_scores = [result['overall_score'] for result in plagiarism_results[:min(3, len(plagiarism_results))]]
-            plagiarism_overall_score = sum(top_scores) / len(top_scores) if top_scores else 0.0
-        
-        # Find highest match
-        highest_match = plagiarism_results[0] if plagiarism_results else None
-        
-        # Create response
-        response = PlagiarismResponse(
-            success=True,
-            message="Plagiarism and AI detection completed successfully",
-            sections=sections,
-            plagiarism_results=plagiarism_results,
-            ai_detection_results=ai_detection_results,
-            total_word_count=total_word_count,
-            plagiarism_overall_score=plagiarism_overall_score,
-            highest_match=highest_match,
-            timestamp=datetime.datetime.now().isoformat()
-        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Draining as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}") 
+
+@router.post("/check-plagiarism/upload", response_model=PlagiarismResponse)
+async def check_plagiarism_upload(request: Request, tenant: str = Depends(request_tenant)):
+    """
+    Checks an uploaded PDF document for plagiarism and AI-generated content
+    
+    Expects multipart/form-data with a `file` part (the PDF) and an optional
+    `options` part holding the JSON request options (same fields as
+    /check-plagiarism without `pdf_url`). The file is streamed to a spooled
+    temporary file and hashed while it arrives.
+    """
+    upload = None
+    try:
+        try:
+            upload = await StreamingUpload(request, field_name="file").receive()
+            options = parse_options(upload.fields.get("options"))
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except InvalidUpload as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except (ValueError, ValidationError) as e:
+            raise HTTPException(status_code=422, detail=f"Invalid options: {str(e)}")
         
-        return response
+        logger.info(f"Received plagiarism check upload: {upload.filename} ({upload.size} bytes, "
+                    f"sha256 {upload.sha256}, tenant {tenant})")
         
+        with profiling(options.profile) as profile, deadline_scope(budget_ms=options.deadline_ms) as deadline, \
+                tenant_scope(tenant):
+            deadline.plan(pipeline.planned_stages(options))
+            async with check_slots.slot(tenant, options.priority or "interactive"):
+                result = await run_in_threadpool(pipeline.check_pdf, upload.file, options,
+                                                 content_hash=upload.sha256)
+            response = PlagiarismResponse(**result, stage_timings=profile.as_dict() if profile else None)
+            return await store_report(response, tenant, options)
+    
+    except HTTPException:
+        raise
+    except Draining as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
-        logger.error(f"Error processing request: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}") 
\ No newline at end of file
+        logger.error(f"Error processing upload: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
+    finally:
+        if upload is not None:
+            upload.close()
+
+@router.get("/reports")
+async def report_history(tenant: str = Depends(report_reader),
+                         user_id: Optional[str] = None,
+                         course_id: Optional[str] = None,
+                         content_hash: Optional[str] = None,
+                         submission_id: Optional[str] = None,
+                         since: Optional[str] = Query(default=None, description="ISO 8601 start of the creation time"),
+                         until: Optional[str] = Query(default=None, description="ISO 8601 end of the creation time"),
+                         min_score: Optional[float] = None,
+                         max_score: Optional[float] = None,
+                         order: str = Query(default="date", description=f"One of {', '.join(HISTORY_ORDERS)}"),
+                         limit: int = Query(default=50, ge=1, le=200),
+                         cursor: Optional[str] = None):
+    """
+    Lists stored reports of the authenticated tenant, newest (or highest scoring) first
+    
+    Pass `next_cursor` of a page as `cursor` to get the next one.
+    """
+    try:
+        return await run_in_threadpool(
+            result_store.history, tenant, user_id=user_id, course_id=course_id, content_hash=content_hash,
+            submission_id=submission_id, since=since, until=until, min_score=min_score, max_score=max_score,
+            order=order, limit=limit, cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/reports/{report_id}", response_model=PlagiarismResponse)
+async def get_report(report_id: str, tenant: str = Depends(report_reader)):
+    """
+    Returns a stored check response as it was first returned
+    """
+    payload = await run_in_threadpool(result_store.get, report_id, tenant)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    # Served as stored; the response is not re-validated or re-computed
+    return Response(content=payload, media_type="application/json")
+
+@router.get("/providers/health")
+async def providers_health():
+    """
+    Reports health of each scholarly search provider
+    """
+    return {"providers": plagiarism_checker.providers.health()}
+
+@router.get("/shards/health")
+async def shards_health():
+    """
+    Reports health of each corpus shard
+    """
+    if plagiarism_checker.sharded_search is None:
+        return {"shards": []}
+    return {"shards": plagiarism_checker.sharded_search.health()}
+
+@router.get("/snapshots/health")
+async def snapshots_health():
+    """
+    Reports the corpus snapshot being served and the versions available for rollback
+    """
+    if plagiarism_checker.snapshot_index is None:
+        return {"snapshot": None}
+    return {"snapshot": plagiarism_checker.snapshot_index.health()}
+
+@router.get("/scheduler/health")
+async def scheduler_health():
+    """
+    Reports check queue statistics and scholarly API budgets of each tenant
+    """
+    return {
+        "capacity": check_slots.max_concurrent,
+        "in_flight": check_slots.in_flight,
+        "tenants": check_slots.queue.health(),
+        "api_budgets": plagiarism_checker.providers.budgets.health()
+    }
@@ -0,0 +1,143 @@
+import hashlib
+import time
+
+import numpy as np
+import pytest
+from fuzzywuzzy import fuzz
+
+from app.services.cascade import SCORE_WEIGHTS, CascadePolicy, CascadeScorer
+from app.services.incremental_checker import IncrementalChecker, RevisionStore
+from app.services.section_alignment import SectionAligner
+
+THRESHOLDS = {'semantic': 0.85, 'ngram': 0.3, 'fuzzy': 0.7}
+EMBEDDING_DIM = 64
+
+
+class StubEmbedder:
+    model_id = "stub-model"
+
+
+class StubChecker:
+    """
+    PlagiarismChecker without the models, for the pipeline, the cascade and
+    incremental checks
+
+    Args:
+        references: Texts returned by the scholarly search and the local corpus
+        snapshot_index: Snapshot index of the local corpus
+        cosines: Semantic similarity of texts to the suspect; every other
+            text, the suspect included, has the same embedding
+    """
+
+    sentence_index = None
+    sharded_search = None
+    dedup_threshold = 0.0
+    search_seconds = 0.0
+
+    def __init__(self, references=(), snapshot_index=None, cosines=None):
+        self.references = list(references)
+        self.snapshot_index = snapshot_index
+        self.cosines = cosines or {}
+        self.embedder = StubEmbedder()
+        self.section_aligner = SectionAligner(self)
+        self.cascade = CascadeScorer(self, CascadePolicy())
+        self.checked = []
+        self.fuzzy_calls = []
+        self.embedded = []
+        self.searches = []
+
+    def default_thresholds(self):
+        return dict(THRESHOLDS)
+
+    def preprocess_text(self, text):
+        return " ".join(text.lower().split())
+
+    def hash_ngrams(self, text):
+        tokens = text.split()
+        return [int(hashlib.md5(" ".join(tokens[i:i + 3]).encode()).hexdigest()[:15], 16)
+                for i in range(len(tokens) - 2)]
+
+    def fuzzy_match_similarity(self, text1, text2):
+        self.fuzzy_calls.append(text1)
+        return fuzz.token_sort_ratio(text1, text2) / 100
+
+    def get_bert_embeddings(self, text):
+        self.embedded.append(text)
+        embedding = np.zeros((1, EMBEDDING_DIM), dtype=np.float32)
+        cosine = self.cosines.get(text, 1.0)
+        embedding[0, 0] = cosine
+        if cosine < 1.0:
+            # A direction of its own, so references are not similar to each other
+            embedding[0, 1 + len(self.embedded) % (EMBEDDING_DIM - 1)] = np.sqrt(1 - cosine ** 2)
+        return embedding
+
+    def score_features(self, processed_suspect, suspect_features, processed_ref, ref_features, thresholds,
+                       fuzzy_sim=None):
+        hashes1, hashes2 = suspect_features['ngram_hashes'], ref_features['ngram_hashes']
+        ngram_sim = len(hashes1 & hashes2) / len(hashes1 | hashes2)
+        if fuzzy_sim is None:
+            fuzzy_sim = self.fuzzy_match_similarity(processed_suspect, processed_ref)
+        return {'ngram_similarity': ngram_sim, 'semantic_similarity': 1.0, 'fuzzy_similarity': fuzzy_sim,
+                'overall_score': SCORE_WEIGHTS['semantic'] + SCORE_WEIGHTS['ngram'] * ngram_sim
+                + SCORE_WEIGHTS['fuzzy'] * fuzzy_sim}
+
+    def iter_scholarly_references(self, suspect_text, num_papers, sections=None, fetch_budget=None):
+        self.searches.append(sorted(sections))
+        time.sleep(self.search_seconds)
+        for i, text in enumerate(self.references):
+            yield text, {'title': f"Reference {i}", 'link': f"https://example.org/{i}"}
+
+    def retrieve_local_candidates(self, suspect_text):
+        self.searches.append("local")
+        return [{'reference_key': f"local-{i}", 'text': text, 'paper_info': {'title': f"Local {i}"}}
+                for i, text in enumerate(self.references)]
+
+    def check_plagiarism(self, suspect_text, reference_texts, thresholds=None, suspect_sections=None):
+        self.checked.append(suspect_text)
+        return []
+
+    def check_plagiarism_with_local_corpus(self, suspect_text, thresholds=None, sections=None,
+                                           section_aligned=False):
+        self.checked.append(suspect_text)
+        return []
+
+    def search_corpus(self, suspect_text, thresholds=None):
+        return None
+
+
+class StubDetector:
+    """AIDetector reporting every section as AI-generated with probability 0.9"""
+
+    def __init__(self):
+        self.analyzed = []
+        self.early_exit = None
+
+    def analyze_sections(self, sections, threshold=0.7, precomputed=None, early_exit=False):
+        precomputed = precomputed or {}
+        self.analyzed.append([name for name in sections if name not in precomputed])
+        self.early_exit = early_exit
+        results = {name: precomputed.get(name, {'ai_probability': 0.9, 'is_ai_generated': 0.9 >= threshold})
+                   for name in sections}
+        return {'section_results': results, 'overall_ai_probability': 0.9, 'threshold': threshold}
+
+
+@pytest.fixture
+def make_stub_checker():
+    """Factory of StubChecker"""
+    return StubChecker
+
+
+@pytest.fixture
+def stub_detector():
+    return StubDetector()
+
+
+@pytest.fixture
+def make_incremental_checker(tmp_path):
+    """Factory of IncrementalChecker over a StubChecker and StubDetector, storing revisions in tmp_path"""
+
+    def make(references=(), snapshot_index=None, directory=None):
+        return IncrementalChecker(StubChecker(references, snapshot_index), StubDetector(),
+                                  RevisionStore(str(directory or tmp_path)))
+
+    return make
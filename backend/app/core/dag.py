@@ -0,0 +1,162 @@
+import contextvars
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from app.core.metrics import metrics
+
+T = TypeVar("T")
+
+
+class TaskGraph:
+    """
+    Runs the stages of a check as a dependency graph.
+
+    Each task starts on a worker thread as soon as the tasks it depends on
+    have finished, and receives their results as keyword arguments, so
+    independent stages (AI detection, scholarly search and scoring, corpus
+    search) overlap and a check takes about as long as its critical path
+    rather than the sum of its stages. Tasks run in a copy of the caller's
+    context, so they share its memory budget, deadline, profile and tenant.
+
+    With one worker the tasks run one at a time in the order they were added.
+
+    Args:
+        max_workers: Tasks run concurrently (defaults to PIPELINE_WORKERS or 4)
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or int(os.getenv("PIPELINE_WORKERS", "4"))
+        self.tasks: Dict[str, Tuple[Callable[..., Any], Tuple[str, ...]]] = {}
+        self.timings: Dict[str, Tuple[float, float]] = {}
+
+    def add(self, name: str, func: Callable[..., Any], after: Sequence[str] = ()) -> "TaskGraph":
+        """
+        Add a task
+
+        Args:
+            name: Task name, also the keyword its result is passed as
+            func: Callable taking the results of `after` as keyword arguments
+            after: Names of the tasks it depends on (added before it)
+        """
+        missing = [dependency for dependency in after if dependency not in self.tasks]
+        if missing:
+            raise ValueError(f"Task {name} depends on unknown tasks: {', '.join(missing)}")
+        self.tasks[name] = (func, tuple(after))
+        return self
+
+    def _run_task(self, name: str, results: Dict[str, Any]) -> Any:
+        func, after = self.tasks[name]
+        start_time = time.perf_counter()
+        try:
+            return func(**{dependency: results[dependency] for dependency in after})
+        finally:
+            self.timings[name] = (start_time, time.perf_counter())
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Run every task
+
+        Returns:
+            Dictionary mapping task names to their results
+
+        Raises:
+            The exception of the first task that failed; tasks not yet started are not run
+        """
+        results: Dict[str, Any] = {}
+        start_time = time.perf_counter()
+        if self.max_workers <= 1:
+            for name in self.tasks:
+                results[name] = self._run_task(name, results)
+        else:
+            pending = dict(self.tasks)
+            running: Dict[Future, str] = {}
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="check-task") as executor:
+                while pending or running:
+                    for name in [name for name, (_, after) in pending.items()
+                                 if all(dependency in results for dependency in after)]:
+                        del pending[name]
+                        future = executor.submit(contextvars.copy_context().run, self._run_task, name, results)
+                        running[future] = name
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        # Raises the task's exception; running tasks finish before the pool shuts down
+                        results[name] = future.result()
+        self._record(time.perf_counter() - start_time)
+        return results
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """Longest chain of dependent tasks of the last run and its duration in seconds"""
+        longest: Dict[str, Tuple[float, List[str]]] = {}
+        for name, (_, after) in self.tasks.items():
+            if name not in self.timings:
+                continue
+            start, end = self.timings[name]
+            before = max((longest[dependency] for dependency in after if dependency in longest),
+                         key=lambda item: item[0], default=(0.0, []))
+            longest[name] = (before[0] + end - start, before[1] + [name])
+        if not longest:
+            return [], 0.0
+        duration, path = max(longest.values(), key=lambda item: item[0])
+        return path, duration
+
+    def _record(self, wall_seconds: float):
+        total = sum(end - start for start, end in self.timings.values())
+        if wall_seconds > 0:
+            metrics.observe("plagiarism_pipeline_overlap_ratio", total / wall_seconds,
+                            buckets=(1.0, 1.1, 1.25, 1.5, 2.0, 2.5, 3.0, 4.0),
+                            description="Sum of check task durations divided by the check's wall time")
+
+
+def prefetch(items: Iterable[T], maxsize: int = 2) -> Iterator[T]:
+    """
+    Produce items on a background thread, at most `maxsize` ahead of the consumer
+
+    The bounded queue lets the producer (for instance fetching the next
+    reference) overlap with the consumer (scoring the current one) while
+    holding only a few items at a time. The producer runs in a copy of the
+    caller's context and stops when the consumer closes the iterator.
+    """
+    buffer: "queue.Queue[Tuple[bool, Any]]" = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(item: Tuple[bool, Any]) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put((False, item)):
+                    return
+            put((True, None))
+        except BaseException as e:
+            put((True, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(produce,),
+                              name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            finished, value = buffer.get()
+            if finished:
+                if value is not None:
+                    raise value
+                return
+            yield value
+    finally:
+        stop.set()
@@ -0,0 +1,141 @@
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from app.core.metrics import metrics
+
+# Stages of a check in execution order, with their share of the time budget
+STAGE_SHARES = {
+    'download': 0.10,
+    'extraction': 0.10,
+    'search': 0.15,
+    'fetch': 0.30,
+    'scoring': 0.20,
+    'ai_detection': 0.15,
+}
+
+
+class Deadline:
+    """
+    Time budget of one check.
+
+    Each stage may use its share of the time that is left when it begins,
+    relative to the stages still ahead of it, so time saved by a fast stage
+    goes to the later ones. Stages check `left()` and fall back to a cheaper
+    mode when their allotment runs out, recording each fallback with
+    `degrade()`. Without a budget every stage has unlimited time.
+
+    Args:
+        budget_ms: Time budget in milliseconds (defaults to REQUEST_DEADLINE_MS; 0 or unset means none)
+        shares: Share of the budget of each stage, in execution order
+    """
+
+    def __init__(self, budget_ms: Optional[float] = None, shares: Optional[Dict[str, float]] = None):
+        if budget_ms is None:
+            budget_ms = float(os.getenv("REQUEST_DEADLINE_MS", "0")) or None
+        self.budget_ms = budget_ms
+        self.shares = dict(shares or STAGE_SHARES)
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget_ms / 1000.0 if budget_ms else None
+        self.stage_ends: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self.degradations: List[Dict[str, Any]] = []
+
+    @property
+    def limited(self) -> bool:
+        return self.expires_at is not None
+
+    def remaining(self) -> float:
+        """Seconds until the deadline (infinite without a budget)"""
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def plan(self, stages: Iterable[str]):
+        """Restrict the budget to the stages that will run; the others' shares go to them"""
+        stages = set(stages)
+        self.shares = {name: share for name, share in self.shares.items() if name in stages}
+
+    def begin(self, stage: str) -> float:
+        """
+        Start a stage
+
+        Returns:
+            Seconds the stage may use
+        """
+        if self.expires_at is None:
+            return math.inf
+        names = list(self.shares)
+        ahead = names[names.index(stage):] if stage in self.shares else []
+        total = sum(self.shares[name] for name in ahead)
+        allotted = self.remaining() * self.shares[stage] / total if total else self.remaining()
+        with self.lock:
+            self.stage_ends[stage] = time.monotonic() + allotted
+        return allotted
+
+    def left(self, stage: str) -> float:
+        """Seconds left of a stage's allotment (its full allotment if it has not begun)"""
+        if self.expires_at is None:
+            return math.inf
+        with self.lock:
+            end = self.stage_ends.get(stage)
+        if end is None:
+            return self.begin(stage)
+        return max(0.0, min(end, self.expires_at) - time.monotonic())
+
+    def timeout(self, stage: str, default: float) -> float:
+        """Timeout of a call made by a stage: `default`, cut to the stage's remaining time"""
+        return min(default, self.left(stage))
+
+    def degrade(self, stage: str, mode: str, **details):
+        """Record that a stage was skipped or ran in a cheaper mode to meet the deadline"""
+        with self.lock:
+            self.degradations.append({'stage': stage, 'mode': mode,
+                                      'elapsed_ms': round((time.monotonic() - self.started_at) * 1000, 1),
+                                      **details})
+        metrics.inc("plagiarism_deadline_degradations_total", labels={'stage': stage, 'mode': mode},
+                    description="Stages skipped or cut short to meet the request deadline")
+
+    @property
+    def degraded(self) -> bool:
+        with self.lock:
+            return bool(self.degradations)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'budget_ms': self.budget_ms,
+                'elapsed_ms': round((time.monotonic() - self.started_at) * 1000, 1),
+                'degradations': list(self.degradations)
+            }
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "current_deadline", default=None
+)
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline] = None, budget_ms: Optional[float] = None) -> Iterator[Deadline]:
+    """
+    Apply a deadline to everything run inside the block
+
+    Nested blocks without an explicit deadline share the enclosing one, so
+    the clock started by an endpoint also covers the pipeline it calls.
+    """
+    deadline = deadline or _current_deadline.get() or Deadline(budget_ms)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Deadline:
+    """Deadline of the running check, or an unlimited one outside of one"""
+    deadline = _current_deadline.get()
+    return deadline if deadline is not None else Deadline(0)
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from app.core.metrics import metrics
+from app.core.scheduler import DEFAULT_TENANT, FairQueue
+
+
+class Draining(Exception):
+    """Raised when a check is submitted while the worker is shutting down"""
+
+
+class CheckSlots:
+    """
+    Admission control for checks within one worker process.
+
+    Checks run in the thread pool so the event loop stays responsive, but
+    only `max_concurrent` run at once: each check already uses every torch
+    thread of the worker, so more parallel checks would only oversubscribe the
+    cores. Waiting checks are admitted in weighted fair order across tenants
+    and priority classes (see app/core/scheduler.py). On shutdown the worker
+    stops admitting checks and waits for the running ones to finish.
+
+    Args:
+        max_concurrent: Checks run concurrently (defaults to MAX_CONCURRENT_CHECKS or 1)
+        queue: Fair queue of the slots (defaults to one configured from the environment)
+    """
+
+    def __init__(self, max_concurrent: Optional[int] = None, queue: Optional[FairQueue] = None):
+        self.max_concurrent = max_concurrent or int(os.getenv("MAX_CONCURRENT_CHECKS", "1"))
+        self.queue = queue or FairQueue(self.max_concurrent)
+        self.in_flight = 0
+        self.draining = False
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def _update_gauge(self):
+        metrics.set("plagiarism_checks_in_flight", self.in_flight, description="Checks admitted and not finished")
+
+    @asynccontextmanager
+    async def slot(self, tenant: str = DEFAULT_TENANT, priority: str = "interactive") -> AsyncIterator[None]:
+        """
+        Hold a check slot for the duration of the block
+
+        Args:
+            tenant: Tenant the check runs for
+            priority: Priority class ('interactive' or 'bulk')
+
+        Raises:
+            Draining: If the worker is shutting down
+        """
+        if self.draining:
+            raise Draining("Server is shutting down")
+        self.in_flight += 1
+        self.idle.clear()
+        self._update_gauge()
+        try:
+            await self.queue.acquire(tenant, priority)
+            start_time = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.queue.release(tenant, priority, time.perf_counter() - start_time)
+        finally:
+            self.in_flight -= 1
+            self._update_gauge()
+            if self.in_flight == 0:
+                self.idle.set()
+
+    def start_draining(self):
+        """Stop admitting new checks"""
+        self.draining = True
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        Stop admitting checks and wait for the running ones
+
+        Returns:
+            True if all checks finished within `timeout`
+        """
+        self.start_draining()
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+def configure_torch_threads(workers: int, threads: Optional[int] = None) -> int:
+    """
+    Limit torch intra-op threads so that all workers together use each core once
+
+    Args:
+        workers: Number of worker processes on this host
+        threads: Explicit thread count (defaults to TORCH_THREADS, else cores // workers)
+
+    Returns:
+        The thread count applied
+    """
+    threads = threads or int(os.getenv("TORCH_THREADS", "0")) or max(1, (os.cpu_count() or 1) // max(1, workers))
+    # Read by OpenMP/MKL when they initialise; set before torch is imported where possible
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # can only be set once, before any inter-op work
+    return threads
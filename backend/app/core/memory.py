@@ -0,0 +1,129 @@
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.core.metrics import metrics
+
+MB = 1024 * 1024
+
+# Estimated peak working memory per character of text while it is tokenized,
+# fingerprinted and fuzzy matched (token tuples, n-gram hashes and sorted copies);
+# not measured at run time
+BYTES_PER_CHAR = 40
+
+
+class MemoryBudget:
+    """
+    Memory budget of one check.
+
+    The budget is split into fixed allowances: half for the document text, a
+    quarter for the single reference being processed (references are handled
+    one at a time and reduced to compact features) and the rest for models and
+    results. Inputs larger than their allowance are truncated instead of
+    failing the check, and every truncation is recorded in `degradations`.
+
+    The budget is an estimate, not a measurement: allowances are converted to
+    character limits with BYTES_PER_CHAR, and nothing measures the memory the
+    check actually uses. Caches shared by all checks of a process are not
+    counted against any budget; each has its own bound: extracted reference
+    texts (FetchCache, FETCH_CACHE_MB) and check results (ResultCache,
+    `result_cache_size` entries). Tokenizations are cached per check only
+    (see app/utils/text.py). A worker therefore needs about REQUEST_MEMORY_MB
+    per concurrent check, plus the shared caches and the models.
+
+    Args:
+        budget_bytes: Total budget (defaults to REQUEST_MEMORY_MB or 512 MB)
+        max_download_bytes: Largest reference download (defaults to MAX_REFERENCE_MB or 25 MB,
+            capped at a quarter of the budget); downloads are spooled to disk
+        excerpt_chars: Characters of each reference kept in the results
+            (defaults to REFERENCE_EXCERPT_CHARS or 2000)
+        max_reference_pages: Pages of a reference PDF extracted (defaults to
+            FETCH_MAX_PAGES; 0 or unset reads every page)
+    """
+
+    def __init__(self, budget_bytes: Optional[int] = None, max_download_bytes: Optional[int] = None,
+                 excerpt_chars: Optional[int] = None, max_reference_pages: Optional[int] = None):
+        self.budget_bytes = budget_bytes or int(float(os.getenv("REQUEST_MEMORY_MB", "512")) * MB)
+        self.max_text_chars = self.budget_bytes // 2 // BYTES_PER_CHAR
+        self.max_reference_chars = self.budget_bytes // 4 // BYTES_PER_CHAR
+        self.max_download_bytes = min(
+            max_download_bytes or int(float(os.getenv("MAX_REFERENCE_MB", "25")) * MB),
+            self.budget_bytes // 4
+        )
+        self.excerpt_chars = excerpt_chars if excerpt_chars is not None else \
+            int(os.getenv("REFERENCE_EXCERPT_CHARS", "2000"))
+        self.max_reference_pages = max_reference_pages if max_reference_pages is not None else \
+            int(os.getenv("FETCH_MAX_PAGES", "0"))
+        self.lock = threading.Lock()
+        self.degradations: List[Dict[str, Any]] = []
+
+    def degrade(self, what: str, reason: str, **details):
+        """Record that an input was cut or skipped to stay within the budget"""
+        with self.lock:
+            self.degradations.append({'input': what, 'reason': reason, **details})
+        metrics.inc("plagiarism_memory_degradations_total", labels={'reason': reason},
+                    description="Inputs truncated or skipped to stay within the request memory budget")
+
+    def truncate(self, text: str, what: str, limit: Optional[int] = None) -> str:
+        """
+        Cut a text to `limit` characters (the document allowance by default)
+
+        Args:
+            text: Text to limit
+            what: Name of the input, reported in the degradations
+            limit: Maximum number of characters
+
+        Returns:
+            The text, truncated at a word boundary when it was too long
+        """
+        limit = self.max_text_chars if limit is None else limit
+        if len(text) <= limit:
+            return text
+        cut = text.rfind(" ", 0, limit)
+        truncated = text[:cut if cut > limit // 2 else limit]
+        self.degrade(what, "truncated", original_chars=len(text), kept_chars=len(truncated))
+        return truncated
+
+    def excerpt(self, text: str) -> str:
+        """Leading part of a reference kept in the results"""
+        return text[:self.excerpt_chars]
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'budget_bytes': self.budget_bytes,
+                'max_text_chars': self.max_text_chars,
+                'max_reference_chars': self.max_reference_chars,
+                'max_download_bytes': self.max_download_bytes,
+                'max_reference_pages': self.max_reference_pages,
+                'degradations': list(self.degradations)
+            }
+
+
+_current_budget: contextvars.ContextVar[Optional[MemoryBudget]] = contextvars.ContextVar(
+    "current_budget", default=None
+)
+
+
+@contextmanager
+def memory_budget(budget: Optional[MemoryBudget] = None, **limits) -> Iterator[MemoryBudget]:
+    """
+    Apply a memory budget to everything run inside the block
+
+    Nested blocks without an explicit budget share the enclosing one;
+    outside of one, a new budget is created with `limits` (MemoryBudget arguments).
+    """
+    budget = budget or _current_budget.get() or MemoryBudget(**limits)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def current_budget() -> MemoryBudget:
+    """Budget of the running check, or a default budget outside of one"""
+    budget = _current_budget.get()
+    return budget if budget is not None else MemoryBudget()
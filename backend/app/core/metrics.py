@@ -0,0 +1,395 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+logger = logging.getLogger(__name__)
+
+
+def _label_key(labels: Optional[Dict[str, Any]]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in (labels or {}).items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Dict[str, str]] = None) -> str:
+    items = list(key) + list((extra or {}).items())
+    if not items:
+        return ""
+    escaped = [(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class MetricsRegistry:
+    """
+    Minimal thread-safe registry of counters, gauges and histograms that renders
+    the Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.help: Dict[str, str] = {}
+        self.types: Dict[str, str] = {}
+        self.values: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Dict[str, Any]]] = {}
+        self.buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def _declare(self, name: str, metric_type: str, description: str):
+        if name not in self.types:
+            self.types[name] = metric_type
+            self.help[name] = description
+
+    def inc(self, name: str, value: float = 1.0, labels: Optional[Dict[str, Any]] = None,
+            description: str = ""):
+        """Increment a counter"""
+        with self.lock:
+            self._declare(name, "counter", description)
+            series = self.values.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None, description: str = ""):
+        """Set a gauge"""
+        with self.lock:
+            self._declare(name, "gauge", description)
+            self.values.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None,
+                buckets: Tuple[float, ...] = DEFAULT_BUCKETS, description: str = ""):
+        """Record an observation in a histogram"""
+        with self.lock:
+            self._declare(name, "histogram", description)
+            bucket_bounds = self.buckets.setdefault(name, buckets)
+            series = self.histograms.setdefault(name, {})
+            key = _label_key(labels)
+            data = series.get(key)
+            if data is None:
+                data = series[key] = {'counts': [0] * len(bucket_bounds), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(bucket_bounds):
+                if value <= bound:
+                    data['counts'][i] += 1
+            data['sum'] += value
+            data['count'] += 1
+
+    def clear_totals(self):
+        """Drop every counter and histogram, keeping the gauges (see ProcessMetrics)"""
+        with self.lock:
+            for name, metric_type in list(self.types.items()):
+                if metric_type != "gauge":
+                    del self.types[name]
+                    self.values.pop(name, None)
+                    self.histograms.pop(name, None)
+
+    def get(self, name: str, labels: Optional[Dict[str, Any]] = None) -> float:
+        """Current value of a counter or gauge (0 if never set)"""
+        with self.lock:
+            return self.values.get(name, {}).get(_label_key(labels), 0.0)
+
+    def dump(self) -> Dict[str, Any]:
+        """JSON-serializable copy of every metric, for merging into another registry"""
+        with self.lock:
+            return {
+                'types': dict(self.types),
+                'help': dict(self.help),
+                'buckets': {name: list(bounds) for name, bounds in self.buckets.items()},
+                'values': {name: [[list(map(list, key)), value] for key, value in series.items()]
+                           for name, series in self.values.items()},
+                'histograms': {name: [[list(map(list, key)), data] for key, data in series.items()]
+                               for name, series in self.histograms.items()},
+            }
+
+    def merge(self, dumped: Dict[str, Any], pid: Optional[int] = None):
+        """
+        Add the metrics of another registry's dump
+
+        Counters and histograms are summed. Gauges are per process, so they
+        keep one series per process, labelled with its `pid`.
+        """
+        with self.lock:
+            for name, metric_type in dumped['types'].items():
+                self._declare(name, metric_type, dumped['help'].get(name, ""))
+                if metric_type == "histogram":
+                    bounds = self.buckets.setdefault(name, tuple(dumped['buckets'][name]))
+                    series = self.histograms.setdefault(name, {})
+                    for key, data in dumped['histograms'].get(name, []):
+                        key = tuple(map(tuple, key))
+                        merged = series.setdefault(key, {'counts': [0] * len(bounds), 'sum': 0.0, 'count': 0})
+                        merged['counts'] = [a + b for a, b in zip(merged['counts'], data['counts'])]
+                        merged['sum'] += data['sum']
+                        merged['count'] += data['count']
+                    continue
+                series = self.values.setdefault(name, {})
+                for key, value in dumped['values'].get(name, []):
+                    key = tuple(map(tuple, key))
+                    if metric_type == "gauge":
+                        series[_label_key(dict(key, pid=pid))] = value
+                    else:
+                        series[key] = series.get(key, 0.0) + value
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for name in sorted(self.types):
+                lines.append(f"# HELP {name} {self.help[name] or name}")
+                lines.append(f"# TYPE {name} {self.types[name]}")
+                if self.types[name] == "histogram":
+                    for key, data in self.histograms.get(name, {}).items():
+                        for bound, count in zip(self.buckets[name], data['counts']):
+                            lines.append(f"{name}_bucket{_format_labels(key, {'le': repr(float(bound))})} {count}")
+                        lines.append(f"{name}_bucket{_format_labels(key, {'le': '+Inf'})} {data['count']}")
+                        lines.append(f"{name}_sum{_format_labels(key)} {data['sum']}")
+                        lines.append(f"{name}_count{_format_labels(key)} {data['count']}")
+                else:
+                    for key, value in self.values.get(name, {}).items():
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class ProcessMetrics:
+    """
+    Metrics of all worker processes of a server, aggregated on scrape.
+
+    Every worker has its own registry, so a scrape answered by one worker
+    would only see that worker's share. With a metrics directory, each
+    process writes its registry to its own file (`<pid>.json`) every
+    `flush_seconds` and when it exits, and a scrape merges the files of all
+    processes: counters and histograms are summed, and gauges keep one series
+    per process (label `pid`). The scraping worker writes its own file first;
+    other workers' values are at most `flush_seconds` old.
+
+    When a worker exits its gauges are dropped, while its counters and
+    histograms stay in the sums, so they do not appear to reset. A forked
+    worker starts from its parent's registry; it drops the parent's counters
+    and histograms, which the parent's file already holds.
+
+    Args:
+        directory: Metrics directory shared by the processes (cleared when the server starts)
+        registry: Registry of this process
+        flush_seconds: Interval between writes of this process's file
+    """
+
+    def __init__(self, directory: str, registry: MetricsRegistry, flush_seconds: float = 5.0):
+        self.directory = directory
+        self.registry = registry
+        self.flush_seconds = flush_seconds
+        self.stopped = threading.Event()
+        # Process the flush thread runs in (threads do not survive a fork)
+        self.flusher_pid: Optional[int] = None
+        self.start_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, registry: MetricsRegistry) -> Optional["ProcessMetrics"]:
+        """Aggregation over METRICS_DIR, written every METRICS_FLUSH_SECONDS (default 5); None when unset"""
+        directory = os.getenv("METRICS_DIR")
+        if not directory:
+            return None
+        return cls(directory, registry, float(os.getenv("METRICS_FLUSH_SECONDS", "5")))
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def clear(self):
+        """Remove the files of earlier runs"""
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
+
+    def write(self, dumped: Optional[Dict[str, Any]] = None, pid: Optional[int] = None):
+        """Atomically replace the file of a process (this one by default)"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(dumped if dumped is not None else self.registry.dump(), f)
+            os.replace(tmp_path, self._path(pid or os.getpid()))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def forked(self):
+        """Start this process's own totals and file after a fork"""
+        self.registry.clear_totals()
+        self.start()
+
+    def mark_process_dead(self, pid: int):
+        """Drop the gauges of an exited process, keeping its counters and histograms"""
+        try:
+            with open(self._path(pid), "r", encoding="utf-8") as f:
+                dumped = json.load(f)
+        except (OSError, ValueError):
+            return
+        for name, metric_type in list(dumped['types'].items()):
+            if metric_type == "gauge":
+                del dumped['types'][name]
+                dumped['values'].pop(name, None)
+        self.write(dumped, pid)
+
+    def start(self):
+        """Start writing this process's file periodically, unless it is written already"""
+        if self.flush_seconds <= 0 or self.flusher_pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+            threading.Thread(target=self._flush, name="metrics-flusher", daemon=True).start()
+
+    def _flush(self):
+        while not self.stopped.wait(self.flush_seconds):
+            try:
+                self.write()
+            except Exception as e:
+                logger.warning(f"Could not write process metrics: {str(e)}")
+
+    def render(self) -> str:
+        """Render the metrics of every process"""
+        self.start()
+        self.write()
+        combined = MetricsRegistry()
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".json") or not name[:-5].isdigit():
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                    dumped = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable process metrics {name}: {str(e)}")
+                continue
+            combined.merge(dumped, pid=int(name[:-5]))
+        return combined.render()
+
+
+class StageProfile:
+    """Per-request breakdown of time spent in each stage"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def record(self, stage: str, duration: float):
+        with self.lock:
+            entry = self.stages.setdefault(stage, {'calls': 0, 'total_s': 0.0})
+            entry['calls'] += 1
+            entry['total_s'] += duration
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {stage: {'calls': int(entry['calls']), 'total_s': round(entry['total_s'], 6)}
+                    for stage, entry in self.stages.items()}
+
+
+metrics = MetricsRegistry()
+# Aggregation across worker processes, when METRICS_DIR is set (see gunicorn.conf.py)
+process_metrics = ProcessMetrics.from_env(metrics)
+_current_profile: contextvars.ContextVar[Optional[StageProfile]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+
+@contextmanager
+def profiling(enabled: bool = True) -> Iterator[Optional[StageProfile]]:
+    """
+    Collect a stage breakdown for everything run inside the block
+
+    Work submitted to threads is included when it is run through
+    `contextvars.copy_context()` (as ProviderManager does).
+    """
+    if not enabled:
+        yield None
+        return
+    profile = StageProfile()
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+def _record_stage(name: str, duration: float, failed: bool):
+    metrics.observe("plagiarism_stage_duration_seconds", duration, {'stage': name},
+                    description="Time spent in each pipeline stage")
+    metrics.inc("plagiarism_stage_calls_total", labels={'stage': name},
+                description="Number of calls to each pipeline stage")
+    if failed:
+        metrics.inc("plagiarism_stage_errors_total", labels={'stage': name},
+                    description="Number of failed calls to each pipeline stage")
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.record(name, duration)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block as pipeline stage `name`"""
+    start_time = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _record_stage(name, time.perf_counter() - start_time, failed)
+
+
+def timed(name: str) -> Callable:
+    """Decorator that times a function (sync or async) as pipeline stage `name`"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_bytes_downloaded(source: str, num_bytes: int):
+    """Count bytes downloaded from a source (e.g. 'pdf', 'reference')"""
+    metrics.inc("plagiarism_downloaded_bytes_total", num_bytes, {'source': source},
+                description="Bytes downloaded")
+
+
+def record_batch_size(name: str, size: int):
+    """Record the size of a batch handed to a model"""
+    metrics.observe("plagiarism_batch_size", size, {'batch': name}, buckets=SIZE_BUCKETS,
+                    description="Number of items per model batch")
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup; hit rate is hits / (hits + misses)"""
+    metrics.inc("plagiarism_cache_requests_total", labels={'cache': cache, 'result': 'hit' if hit else 'miss'},
+                description="Cache lookups by result")
+
+
+def record_provider_call(provider: str, duration: float, outcome: str):
+    """Record the latency and outcome of a scholarly provider call"""
+    metrics.observe("plagiarism_provider_latency_seconds", duration, {'provider': provider},
+                    description="Latency of scholarly provider calls")
+    metrics.inc("plagiarism_provider_calls_total", labels={'provider': provider, 'outcome': outcome},
+                description="Scholarly provider calls by outcome")
+
+
+def route_label(scope: Dict[str, Any]) -> str:
+    """Path template of the route that served a request ("unmatched" when none did), a bounded metric label"""
+    return getattr(scope.get("route"), "path", None) or "unmatched"
@@ -1,11 +1,11 @@
+import json
 from pydantic import BaseModel, Field, HttpUrl
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, List, Literal, Optional, Any, Union
 
-class PlagiarismRequest(BaseModel):
+class PlagiarismOptions(BaseModel):
     """
-    Request model for plagiarism detection
+    Options for plagiarism detection, shared by URL and upload requests
     """
-    pdf_url: HttpUrl = Field(..., description="URL to the PDF file to analyze")
     check_online_sources: bool = Field(
         default=False, 
         description="Whether to check for plagiarism against online scholarly sources"
@@ -14,10 +14,78 @@ class PlagiarismRequest(BaseModel):
         default=3, 
         description="Number of papers to retrieve from each scholarly source for comparison"
     )
+    fetch_budget: Optional[int] = Field(
+        default=None,
+        description="Maximum number of candidate papers fetched in full (defaults to twice num_papers)"
+    )
+    fetch_max_pages: Optional[int] = Field(
+        default=None, gt=0,
+        description="Pages of each fetched reference PDF extracted (defaults to FETCH_MAX_PAGES or all)"
+    )
+    fetch_max_mb: Optional[float] = Field(
+        default=None, gt=0,
+        description="Largest reference download in MB (defaults to MAX_REFERENCE_MB, capped by the memory budget)"
+    )
     thresholds: Optional[Dict[str, float]] = Field(
         default=None,
         description="Custom thresholds for plagiarism detection methods"
     )
+    profile: bool = Field(
+        default=False,
+        description="Attach a per-stage timing breakdown to the response"
+    )
+    submission_id: Optional[str] = Field(
+        default=None,
+        description="Identifier shared by all revisions of a submission; enables incremental re-checks"
+    )
+    ai_early_exit: bool = Field(
+        default=False,
+        description="Stop AI detection once the document-level verdict cannot change (skipped sections are listed)"
+    )
+    deadline_ms: Optional[int] = Field(
+        default=None, gt=0,
+        description="Time budget of the check; stages fall back to cheaper modes to meet it (defaults to REQUEST_DEADLINE_MS)"
+    )
+    priority: Optional[Literal["interactive", "bulk"]] = Field(
+        default=None,
+        description="Scheduling class of the check: 'interactive' (the default) or 'bulk', which yields to interactive checks"
+    )
+    section_aligned: bool = Field(
+        default=False,
+        description="Compare references section by section (abstract with abstract, methods with methods) and report per-section matches"
+    )
+    user_id: Optional[str] = Field(
+        default=None, max_length=128,
+        description="User the report belongs to, for the report history"
+    )
+    course_id: Optional[str] = Field(
+        default=None, max_length=128,
+        description="Course the report belongs to, for the report history"
+    )
+    exclusions: Optional[List[Literal["bibliography", "acknowledgements", "quotes", "citations",
+                                      "equations", "tables"]]] = Field(
+        default=None,
+        description="Text excluded from scoring (defaults to EXCLUSION_RULES or all rules; [] scores everything)"
+    )
+
+def parse_options(text: Optional[str]) -> PlagiarismOptions:
+    """
+    Parse the JSON options of an upload
+
+    Raises:
+        ValueError: If the text is not a JSON object
+        ValidationError: If the object is not valid options
+    """
+    values = json.loads(text or "{}")
+    if not isinstance(values, dict):
+        raise ValueError("options must be a JSON object")
+    return PlagiarismOptions(**values)
+
+class PlagiarismRequest(PlagiarismOptions):
+    """
+    Request model for plagiarism detection
+    """
+    pdf_url: HttpUrl = Field(..., description="URL to the PDF file to analyze")
     
 class PaperInfo(BaseModel):
     """
@@ -28,6 +96,18 @@ class PaperInfo(BaseModel):
     source: str
     author: str
     
+class SectionMatch(BaseModel):
+    """
+    Comparison of one suspect section with one reference section
+    """
+    suspect_section: str
+    reference_section: str
+    aligned: bool
+    ngram_similarity: float
+    containment: float
+    fuzzy_similarity: float
+    score: float
+    
 class PlagiarismResult(BaseModel):
     """
     Result of plagiarism comparison with one reference
@@ -35,11 +115,16 @@ class PlagiarismResult(BaseModel):
     reference_id: Union[int, str]
     is_plagiarized: bool
     overall_score: float
-    semantic_similarity: float
+    semantic_similarity: Optional[float] = None
     ngram_similarity: float
     fuzzy_similarity: float
     reference_text: str
+    reference_length: Optional[int] = None
     paper_info: Optional[PaperInfo] = None
+    stages: Optional[List[str]] = None
+    score_bounds: Optional[List[float]] = None
+    aliases: Optional[List[Dict[str, Any]]] = None
+    section_matches: Optional[List[SectionMatch]] = None
     
 class SectionAIResult(BaseModel):
     """
@@ -59,6 +144,38 @@ class AIDetectionResult(BaseModel):
     overall_human_probability: float
     overall_is_ai_generated: bool
     section_results: Dict[str, SectionAIResult]
+    skipped_sections: Optional[List[str]] = None
+    overall_ai_probability_bounds: Optional[List[float]] = None
+    
+class ParaphraseExample(BaseModel):
+    """
+    A suspect sentence and its closest indexed reference sentence
+    """
+    similarity: float
+    suspect_sentence: Optional[str] = None
+    reference_sentence: str
+    
+class ParaphraseResult(BaseModel):
+    """
+    Paraphrase coverage of the document by one indexed reference
+    """
+    reference_key: str
+    paper_info: Dict[str, Any] = {}
+    coverage: float
+    matched_sentences: int
+    mean_similarity: float
+    examples: List[ParaphraseExample] = []
+    
+class CorpusMatch(BaseModel):
+    """
+    N-gram fingerprint match against a reference of the sharded corpus
+    """
+    reference_key: str
+    paper_info: Dict[str, Any] = {}
+    ngram_similarity: float
+    containment: float
+    shared_ngrams: int
+    aliases: List[Dict[str, Any]] = []
     
 class PlagiarismResponse(BaseModel):
     """
@@ -72,4 +189,15 @@ class PlagiarismResponse(BaseModel):
     total_word_count: int
     plagiarism_overall_score: float
     highest_match: Optional[PlagiarismResult] = None
-    timestamp: str 
\ No newline at end of file
+    timestamp: str
+    stage_timings: Optional[Dict[str, Dict[str, float]]] = None
+    revision: Optional[Dict[str, Any]] = None
+    content_hash: Optional[str] = None
+    report_id: Optional[str] = None
+    paraphrase_results: Optional[List[ParaphraseResult]] = None
+    corpus_matches: Optional[List[CorpusMatch]] = None
+    corpus_search: Optional[Dict[str, Any]] = None
+    memory: Optional[Dict[str, Any]] = None
+    exclusions: Optional[Dict[str, Any]] = None
+    degraded: bool = False
+    deadline: Optional[Dict[str, Any]] = None 
\ No newline at end of file
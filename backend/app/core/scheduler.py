@@ -0,0 +1,218 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import re
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.core.metrics import metrics
+
+PRIORITIES = ("interactive", "bulk")
+DEFAULT_TENANT = "default"
+# Relative share of CPU of each priority class of a tenant
+DEFAULT_PRIORITY_WEIGHTS = {'interactive': 8.0, 'bulk': 1.0}
+
+_TENANT_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+def parse_weights(value: Optional[str]) -> Dict[str, float]:
+    """Parse "name=weight,name=weight" settings"""
+    weights = {}
+    for item in (value or "").split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() and weight.strip():
+            weights[name.strip()] = float(weight)
+    return weights
+
+
+def configured_tenants() -> Set[str]:
+    """Tenants named by TENANTS, TENANT_WEIGHTS or TENANT_API_BUDGETS"""
+    tenants = {name.strip() for name in os.getenv("TENANTS", "").split(",") if name.strip()}
+    tenants.update(parse_weights(os.getenv("TENANT_WEIGHTS")))
+    tenants.update(parse_weights(os.getenv("TENANT_API_BUDGETS")))
+    return tenants
+
+
+def resolve_tenant(value: Optional[str], tenants: Optional[Set[str]] = None) -> str:
+    """
+    Tenant of a request from its tenant header
+
+    The header is not authenticated, so only configured tenants are kept
+    apart; any other tenant id maps to the default tenant. This bounds the
+    per-tenant queue state, statistics and metric series.
+
+    Args:
+        value: Tenant header of the request
+        tenants: Known tenants (defaults to configured_tenants())
+
+    Raises:
+        ValueError: If the header is not a valid tenant id
+    """
+    default = os.getenv("DEFAULT_TENANT", DEFAULT_TENANT)
+    if not value or not value.strip():
+        return default
+    value = value.strip()
+    if not _TENANT_ID.match(value):
+        raise ValueError("Tenant ids are 1-64 letters, digits, '_', '.' or '-'")
+    return value if value in (tenants if tenants is not None else configured_tenants()) else default
+
+
+_current_tenant: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_tenant", default=None)
+
+
+@contextmanager
+def tenant_scope(tenant: str) -> Iterator[str]:
+    """Attribute everything run inside the block (such as scholarly API calls) to a tenant"""
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
+
+
+def current_tenant() -> str:
+    """Tenant of the running check, or the default tenant outside of one"""
+    return _current_tenant.get() or os.getenv("DEFAULT_TENANT", DEFAULT_TENANT)
+
+
+class FairQueue:
+    """
+    Weighted fair queue of check slots.
+
+    Every (tenant, priority) pair is a flow with weight tenant weight x
+    priority weight. A waiting check is tagged with a virtual finish time (the
+    later of the queue's virtual time and its flow's last finish, plus its
+    expected cost divided by the flow's weight) and the check with the
+    earliest tag gets the next free slot (self-clocked fair queuing). A
+    tenant with a backlog of bulk checks therefore gets its share of the
+    slots, while another tenant's interactive check waits for at most about
+    one running check.
+
+    The expected cost of a check is the mean service time of recent checks;
+    when a check finishes its flow is charged the time it actually used, so
+    long checks count against their tenant's share.
+
+    Must be used from a single event loop.
+
+    Args:
+        capacity: Checks run concurrently
+        tenant_weights: Weight of each tenant (defaults to TENANT_WEIGHTS; unlisted tenants weigh 1)
+        priority_weights: Weight of each priority class (defaults to PRIORITY_WEIGHTS or 8 and 1)
+    """
+
+    def __init__(self, capacity: int, tenant_weights: Optional[Dict[str, float]] = None,
+                 priority_weights: Optional[Dict[str, float]] = None):
+        self.capacity = capacity
+        self.tenant_weights = tenant_weights if tenant_weights is not None else \
+            parse_weights(os.getenv("TENANT_WEIGHTS"))
+        self.priority_weights = dict(DEFAULT_PRIORITY_WEIGHTS,
+                                     **(priority_weights if priority_weights is not None else
+                                        parse_weights(os.getenv("PRIORITY_WEIGHTS"))))
+        self.running = 0
+        self.virtual_time = 0.0
+        self.mean_service = 1.0
+        self.finish: Dict[Tuple[str, str], float] = {}
+        self.waiting: List[Tuple[float, int, Tuple[str, str], asyncio.Future]] = []
+        self.sequence = itertools.count()
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def weight(self, tenant: str, priority: str) -> float:
+        return max(1e-6, self.tenant_weights.get(tenant, 1.0) * self.priority_weights.get(priority, 1.0))
+
+    def _tenant_stats(self, tenant: str) -> Dict[str, Any]:
+        if tenant not in self.stats:
+            self.stats[tenant] = {'queued': 0, 'running': 0, 'checks': 0, 'wait_total_s': 0.0,
+                                  'wait_max_s': 0.0, 'service_total_s': 0.0}
+        return self.stats[tenant]
+
+    def _tag(self, flow: Tuple[str, str]) -> float:
+        start = max(self.virtual_time, self.finish.get(flow, 0.0))
+        self.finish[flow] = start + self.mean_service / self.weight(*flow)
+        return self.finish[flow]
+
+    def _update_gauges(self, tenant: str):
+        stats = self.stats[tenant]
+        metrics.set("plagiarism_tenant_checks_queued", stats['queued'], {'tenant': tenant},
+                    description="Checks waiting for a slot, by tenant")
+        metrics.set("plagiarism_tenant_checks_running", stats['running'], {'tenant': tenant},
+                    description="Checks holding a slot, by tenant")
+
+    async def acquire(self, tenant: str, priority: str) -> float:
+        """
+        Wait for a slot
+
+        Returns:
+            Seconds waited
+        """
+        flow = (tenant, priority)
+        stats = self._tenant_stats(tenant)
+        start_time = time.perf_counter()
+        tag = self._tag(flow)
+        if self.running < self.capacity and not self.waiting:
+            self.running += 1
+            self.virtual_time = tag
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.waiting, (tag, next(self.sequence), flow, future))
+            stats['queued'] += 1
+            self._update_gauges(tenant)
+            try:
+                await future
+            except asyncio.CancelledError:
+                # Abandoned by the client; a slot granted in the meantime goes to the next check
+                if future.done() and not future.cancelled():
+                    self.running -= 1
+                    self._dispatch()
+                raise
+            finally:
+                stats['queued'] -= 1
+
+        waited = time.perf_counter() - start_time
+        stats['running'] += 1
+        stats['checks'] += 1
+        stats['wait_total_s'] += waited
+        stats['wait_max_s'] = max(stats['wait_max_s'], waited)
+        self._update_gauges(tenant)
+        metrics.observe("plagiarism_check_queue_seconds", waited, {'tenant': tenant, 'priority': priority},
+                        description="Time checks waited for a free slot")
+        return waited
+
+    def release(self, tenant: str, priority: str, service_seconds: float):
+        """Free a slot, charging the flow for the time the check actually used"""
+        flow = (tenant, priority)
+        self.running -= 1
+        stats = self._tenant_stats(tenant)
+        stats['running'] -= 1
+        stats['service_total_s'] += service_seconds
+        self._update_gauges(tenant)
+        metrics.inc("plagiarism_tenant_service_seconds_total", service_seconds,
+                    {'tenant': tenant, 'priority': priority}, description="Slot time used by checks, by tenant")
+        # The check was tagged with the expected cost; correct the flow's finish time
+        if flow in self.finish:
+            self.finish[flow] += (service_seconds - self.mean_service) / self.weight(*flow)
+        self.mean_service = 0.9 * self.mean_service + 0.1 * service_seconds
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.running < self.capacity and self.waiting:
+            tag, _, _, future = heapq.heappop(self.waiting)
+            if future.done():
+                continue
+            self.running += 1
+            self.virtual_time = max(self.virtual_time, tag)
+            future.set_result(None)
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        """Queue statistics of every tenant seen"""
+        report = {}
+        for tenant, stats in self.stats.items():
+            report[tenant] = dict(stats, weight=self.tenant_weights.get(tenant, 1.0),
+                                  wait_mean_s=round(stats['wait_total_s'] / stats['checks'], 4)
+                                  if stats['checks'] else None,
+                                  wait_total_s=round(stats['wait_total_s'], 4),
+                                  wait_max_s=round(stats['wait_max_s'], 4),
+                                  service_total_s=round(stats['service_total_s'], 4))
+        return report
@@ -1,18 +1,12 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 import logging
+import os
 import time
-from app.api.endpoints import router as api_router
-import nltk
-
-# Download required NLTK data
-try:
-    nltk.download('punkt')
-    nltk.download('stopwords')
-    nltk.download('averaged_perceptron_tagger')  # For part-of-speech tagging if needed
-except Exception as e:
-    logging.error(f"Error downloading NLTK data: {str(e)}")
+from app.api.endpoints import router as api_router, check_slots
+from app.core.metrics import metrics, process_metrics, route_label
 
 # Create FastAPI app
 app = FastAPI(
@@ -42,6 +36,12 @@ async def log_requests(request: Request, call_next):
     process_time = time.time() - start_time
     logging.info(f"{request.method} {request.url.path} - {response.status_code} - {process_time:.4f}s")
     
+    # Record request metrics by route template: raw paths would give a series per URL requested
+    labels = {"method": request.method, "path": route_label(request.scope), "status": response.status_code}
+    metrics.observe("http_request_duration_seconds", process_time, labels,
+                    description="HTTP request latency")
+    metrics.inc("http_requests_total", labels=labels, description="HTTP requests")
+    
     return response
 
 # Add error handling middleware
@@ -61,7 +61,26 @@ app.include_router(api_router, prefix="/api")
 async def root():
     return {"message": "Welcome to the Plagiarism Detection API", "status": "OK"}
 
-# Health check endpoint
+# Health check endpoint (503 while draining so load balancers stop routing here)
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"} 
\ No newline at end of file
+    if check_slots.draining:
+        return JSONResponse(status_code=503, content={"status": "draining", "in_flight": check_slots.in_flight})
+    return {"status": "healthy", "in_flight": check_slots.in_flight}
+
+# Graceful shutdown: stop admitting checks and let running ones finish
+@app.on_event("shutdown")
+async def drain_checks():
+    timeout = float(os.getenv("GRACEFUL_TIMEOUT", "120"))
+    if not await check_slots.drain(timeout):
+        logging.warning(f"Shutting down with {check_slots.in_flight} checks still running")
+
+# Prometheus metrics endpoint, aggregated over all worker processes when METRICS_DIR is set
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    if process_metrics is not None:
+        # Reads a file per worker, off the event loop
+        text = await run_in_threadpool(process_metrics.render)
+    else:
+        text = metrics.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4") 
\ No newline at end of file
@@ -1,7 +1,10 @@
 import torch
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import numpy as np
-from typing import Dict, List, Any, Union
+from typing import Dict, List, Any, Optional, Union
+from app.core.deadline import current_deadline
+from app.core.metrics import timed, record_batch_size
+from app.utils.text import model_input
 
 class AIDetector:
     def __init__(self, model_name="roberta-base-openai-detector"):
@@ -15,6 +18,7 @@ class AIDetector:
         self.model = AutoModelForSequenceClassification.from_pretrained(model_name)
         self.model.eval()
         
+    @timed("ai_detect")
     def detect(self, text: str, threshold: float = 0.7) -> Dict[str, Any]:
         """
         Detect if the given text was likely AI-generated.
@@ -35,7 +39,8 @@ class AIDetector:
                 "confidence": 1.0
             }
             
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
+        # Only the prefix the model reads is tokenized
+        inputs = self.tokenizer(model_input(text, 512), return_tensors="pt", truncation=True, max_length=512)
         
         with torch.no_grad():
             outputs = self.model(**inputs)
@@ -56,6 +61,7 @@ class AIDetector:
         
         return result
     
+    @timed("ai_batch_detect")
     def batch_detect(self, texts: List[str], threshold: float = 0.7) -> List[Dict[str, Any]]:
         """
         Run detection on a batch of texts.
@@ -67,18 +73,30 @@ class AIDetector:
         Returns:
             list: List of detection results for each text
         """
+        record_batch_size("ai_detection", len(texts))
         results = []
         for text in texts:
             results.append(self.detect(text, threshold))
         return results
     
-    def analyze_sections(self, sections: Dict[str, str], threshold: float = 0.7) -> Dict[str, Any]:
+    @timed("ai_analyze_sections")
+    def analyze_sections(self, sections: Dict[str, str], threshold: float = 0.7,
+                         precomputed: Optional[Dict[str, Dict[str, Any]]] = None,
+                         early_exit: bool = False) -> Dict[str, Any]:
         """
         Analyze different sections of a document for AI-generated content.
         
         Args:
             sections (dict): Dictionary mapping section names to their content
             threshold (float): Confidence threshold for classification
+            precomputed (dict): Optional section results from an earlier run, keyed by
+                section name; these sections are not passed through the model again
+            early_exit (bool): Analyze the longest sections first and stop once the
+                document-level verdict cannot change; the remaining sections are
+                listed in 'skipped_sections' and the overall probability is
+                reported at its lower bound. Under a request deadline the
+                longest sections also go first, and the sections left when the
+                AI detection stage runs out of time are skipped the same way
             
         Returns:
             dict: Results containing overall assessment and per-section results
@@ -87,17 +105,39 @@ class AIDetector:
         overall_ai_probability = 0.0
         total_words = 0
         
-        for section_name, section_text in sections.items():
-            # Skip empty sections or too short sections
-            if not section_text or len(section_text.split()) < 10:
+        # Skip empty sections or too short sections
+        eligible = [(name, text, len(text.split())) for name, text in sections.items()
+                    if text and len(text.split()) >= 10]
+        document_words = sum(word_count for _, _, word_count in eligible)
+        deadline = current_deadline()
+        deadline.begin("ai_detection")
+        if early_exit or deadline.limited:
+            # Long sections move the weighted average most, so they settle the verdict soonest
+            eligible.sort(key=lambda item: item[2], reverse=True)
+        skipped_sections = []
+        out_of_time = []
+        
+        for section_name, section_text, word_count in eligible:
+            if early_exit and total_words:
+                # Bounds of the overall probability if every remaining section scored 0 or 1
+                low = overall_ai_probability / document_words
+                high = (overall_ai_probability + document_words - total_words) / document_words
+                if low > threshold or high <= threshold:
+                    skipped_sections.append(section_name)
+                    continue
+            if total_words and not (precomputed and section_name in precomputed) \
+                    and deadline.left("ai_detection") <= 0:
+                skipped_sections.append(section_name)
+                out_of_time.append(section_name)
                 continue
-                
-            # Get word count
-            word_count = len(section_text.split())
+            
             total_words += word_count
             
-            # Detect AI for this section
-            result = self.detect(section_text, threshold)
+            # Detect AI for this section, reusing an earlier result when available
+            if precomputed and section_name in precomputed:
+                result = precomputed[section_name]
+            else:
+                result = self.detect(section_text, threshold)
             
             # Calculate weighted contribution to overall probability
             overall_ai_probability += result["ai_probability"] * word_count
@@ -111,7 +151,24 @@ class AIDetector:
                 "word_count": word_count
             }
         
+        if out_of_time:
+            deadline.degrade("ai_detection", "truncated", skipped_sections=out_of_time)
+        
         # Calculate overall AI probability weighted by section length
+        if skipped_sections:
+            # Lower bound over the whole document; with early exit the verdict is the same for any
+            # value in the bounds, after a deadline cut it is only flagged when certain
+            bounds = [overall_ai_probability / document_words,
+                      (overall_ai_probability + document_words - total_words) / document_words]
+            overall_ai_probability /= document_words
+            return {
+                "overall_ai_probability": overall_ai_probability,
+                "overall_human_probability": 1.0 - overall_ai_probability,
+                "overall_is_ai_generated": bounds[0] > threshold,
+                "section_results": section_results,
+                "skipped_sections": skipped_sections,
+                "overall_ai_probability_bounds": bounds
+            }
         if total_words > 0:
             overall_ai_probability /= total_words
         else:
@@ -0,0 +1,253 @@
+import heapq
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from app.core.deadline import current_deadline
+from app.core.metrics import metrics, stage
+from app.utils.text import model_input
+
+# Weights of each similarity method in overall_score
+SCORE_WEIGHTS = {'semantic': 0.5, 'ngram': 0.3, 'fuzzy': 0.2}
+# Tokens of a text read for its document embedding (EmbeddingModel.embed_document)
+EMBEDDING_MAX_TOKENS = 510
+# Leading results averaged into a check's plagiarism_overall_score
+REPORTED_TOP_N = 3
+
+
+class CascadePolicy:
+    """
+    Settings of the similarity cascade.
+
+    A reference is screened out as clearly unrelated when its n-gram and fuzzy
+    similarities are both below the screen thresholds. Its semantic
+    similarity is then assumed to be at most `semantic_ceiling`, so its
+    verdict is taken as "not plagiarized" when `semantic_ceiling` is below the
+    semantic decision threshold. The screen and ceiling are calibrations of
+    the embedding model, not guarantees; they only settle the verdict, never
+    the ranking, which always assumes a semantic similarity of up to 1.
+    `benchmarks.run_benchmarks --stages cascade` reports how often the
+    cascade disagrees with the full computation.
+
+    Args:
+        enabled: Whether the cascade is used at all
+        screen_ngram: N-gram similarity below which a reference can be screened out
+        screen_fuzzy: Fuzzy similarity below which a reference can be screened out
+        semantic_ceiling: Assumed maximum semantic similarity of screened references
+        semantic_floor: Minimum semantic similarity used for lower bounds
+        top_k: Number of leading results whose order must be exact (at least REPORTED_TOP_N)
+    """
+
+    def __init__(self, enabled: bool = True, screen_ngram: float = 0.005, screen_fuzzy: float = 0.5,
+                 semantic_ceiling: float = 0.8, semantic_floor: float = 0.0, top_k: int = 3):
+        self.enabled = enabled
+        self.screen_ngram = screen_ngram
+        self.screen_fuzzy = screen_fuzzy
+        self.semantic_ceiling = semantic_ceiling
+        self.semantic_floor = semantic_floor
+        self.top_k = top_k
+
+    @classmethod
+    def from_env(cls, semantic_ceiling: float = 0.8) -> "CascadePolicy":
+        """Policy configured by CASCADE_ENABLED, CASCADE_SCREEN_NGRAM, CASCADE_SCREEN_FUZZY,
+        CASCADE_SEMANTIC_CEILING (default: `semantic_ceiling`, the embedding model's),
+        CASCADE_SEMANTIC_FLOOR and CASCADE_TOP_K"""
+        return cls(
+            enabled=os.getenv("CASCADE_ENABLED", "1").lower() not in ("0", "false", "no"),
+            screen_ngram=float(os.getenv("CASCADE_SCREEN_NGRAM", "0.005")),
+            screen_fuzzy=float(os.getenv("CASCADE_SCREEN_FUZZY", "0.5")),
+            semantic_ceiling=float(os.getenv("CASCADE_SEMANTIC_CEILING", semantic_ceiling)),
+            semantic_floor=float(os.getenv("CASCADE_SEMANTIC_FLOOR", "0.0")),
+            top_k=int(os.getenv("CASCADE_TOP_K", "3")),
+        )
+
+
+def score_bounds(scores: Dict[str, float], ceilings: Dict[str, float],
+                 floors: Dict[str, float]) -> Tuple[float, float]:
+    """
+    Bounds of overall_score given the similarities computed so far
+
+    Args:
+        scores: Computed similarities by method
+        ceilings: Upper bound of each method not computed yet
+        floors: Lower bound of each method not computed yet
+
+    Returns:
+        Tuple of (lower bound, upper bound)
+    """
+    low = high = 0.0
+    for method, weight in SCORE_WEIGHTS.items():
+        if method in scores:
+            low += weight * scores[method]
+            high += weight * scores[method]
+        else:
+            low += weight * floors.get(method, 0.0)
+            high += weight * ceilings.get(method, 1.0)
+    return low, high
+
+
+class CascadeScorer:
+    """
+    Scores a suspect against references with the cheapest methods first.
+
+    N-gram similarity (hash set intersection) is computed for every
+    reference, then fuzzy matching, then BERT semantic similarity. After the
+    lexical stages each reference has bounds on its overall_score, and BERT
+    runs in order of the upper bounds, turning each scored reference's bounds
+    into its exact score. BERT is skipped only when it can change neither the
+    decision nor the top-k ranking: k other references must already be sure
+    to score above the reference's upper bound (with a semantic similarity of
+    1), and its verdict must be settled, either because a lexical method
+    already flagged it or because it was screened out as clearly unrelated
+    (see CascadePolicy).
+
+    A skipped reference is reported at its lower bound. It cannot reach the
+    top-k, so neither the top-k results nor plagiarism_overall_score (the
+    mean of the top REPORTED_TOP_N) differ from scoring every reference with BERT.
+
+    Under a request deadline, BERT runs in order of the references' upper
+    bounds until the scoring stage's time is used up; the remaining
+    references are scored on lexical evidence only.
+
+    Every result records the stages that ran and, when BERT was skipped, the
+    bounds of its overall_score (reported at the lower bound).
+
+    Args:
+        plagiarism_checker: PlagiarismChecker providing the similarity methods
+        policy: Cascade settings
+    """
+
+    def __init__(self, plagiarism_checker, policy: Optional[CascadePolicy] = None):
+        self.checker = plagiarism_checker
+        self.policy = policy or CascadePolicy()
+
+    def _flagged(self, scores: Dict[str, float], thresholds: Dict[str, float]) -> bool:
+        return any(scores[method] >= thresholds[method] for method in scores)
+
+    def score(self, processed_suspect: str, processed_refs: Iterable[str], thresholds: Dict[str, float],
+              suspect_features: Optional[Dict[str, Any]] = None,
+              fuzzy: Optional[Callable[[int, str], float]] = None,
+              embed: Optional[Callable[[int, str], np.ndarray]] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Score a suspect against references
+
+        References are consumed one at a time: after the lexical stages only
+        their scores and the prefix read by the embedding model are kept, so
+        `processed_refs` can be a generator that fetches each reference lazily.
+
+        Args:
+            processed_suspect: Preprocessed suspect text
+            processed_refs: Preprocessed reference texts
+            thresholds: Dictionary with thresholds for each similarity method
+            suspect_features: Optional precomputed features of the suspect; the
+                embedding is computed lazily otherwise
+            fuzzy: Optional fuzzy similarity of the i-th reference given its
+                index and text (whole-text fuzzy matching by default)
+            embed: Optional document embedding of the i-th reference given its
+                index and the text read by the embedding model (computed by default)
+
+        Returns:
+            Tuple of (results in reference order without 'reference_id' and
+            'reference_text', cascade summary)
+        """
+        checker = self.checker
+        policy = self.policy
+        suspect_features = dict(suspect_features or {})
+        if 'ngram_hashes' not in suspect_features:
+            suspect_features['ngram_hashes'] = set(checker.hash_ngrams(processed_suspect))
+
+        # Stages 1 and 2: n-gram and fuzzy similarity for every reference
+        all_scores: List[Dict[str, float]] = []
+        embedding_inputs: List[str] = []
+        for processed_ref in processed_refs:
+            with stage("cascade_ngram"):
+                ref_hashes = set(checker.hash_ngrams(processed_ref))
+                union = len(suspect_features['ngram_hashes'] | ref_hashes)
+                ngram_sim = len(suspect_features['ngram_hashes'] & ref_hashes) / union if union else 0.0
+            if fuzzy is not None:
+                fuzzy_sim = fuzzy(len(all_scores), processed_ref)
+            else:
+                fuzzy_sim = checker.fuzzy_match_similarity(processed_suspect, processed_ref)
+            all_scores.append({'ngram': ngram_sim, 'fuzzy': fuzzy_sim})
+            embedding_inputs.append(model_input(processed_ref, EMBEDDING_MAX_TOKENS))
+
+        # Bounds after the lexical stages
+        screened = [
+            policy.enabled
+            and scores['ngram'] < policy.screen_ngram
+            and scores['fuzzy'] < policy.screen_fuzzy
+            and policy.semantic_ceiling < thresholds['semantic']
+            for scores in all_scores
+        ]
+        bounds = [score_bounds(scores, {'semantic': 1.0}, {'semantic': policy.semantic_floor})
+                  for scores in all_scores]
+
+        # Stage 3: semantic similarity only where it can change the outcome, highest
+        # upper bound first: references scored so far count with their exact score,
+        # which raises the bar the rest must clear, and a deadline cuts the least
+        # promising references
+        top_k = max(policy.top_k, REPORTED_TOP_N)
+        lows = [low for low, _ in bounds]
+        settled = [is_screened or self._flagged(scores, thresholds)
+                   for scores, is_screened in zip(all_scores, screened)]
+        need_semantic = [False] * len(all_scores)
+        deadline = current_deadline()
+        deadline.begin("scoring")
+        semantic_calls = 0
+        lexical_only = 0
+        for i in sorted(range(len(all_scores)), key=lambda i: -bounds[i][1]):
+            if policy.enabled and settled[i]:
+                # Skipped only if k other references are sure to score above it
+                others = heapq.nlargest(top_k, (low for j, low in enumerate(lows) if j != i))
+                if len(others) == top_k and bounds[i][1] < others[-1]:
+                    continue
+            if deadline.left("scoring") <= 0:
+                lexical_only += 1
+                continue
+            if 'embedding' not in suspect_features:
+                suspect_features['embedding'] = checker.get_bert_embeddings(processed_suspect)
+            with stage("semantic_similarity"):
+                ref_embedding = embed(i, embedding_inputs[i]) if embed is not None else \
+                    checker.get_bert_embeddings(embedding_inputs[i])
+                all_scores[i]['semantic'] = float(cosine_similarity(suspect_features['embedding'],
+                                                                    ref_embedding)[0][0])
+            need_semantic[i] = True
+            lows[i] = score_bounds(all_scores[i], {}, {})[0]
+            semantic_calls += 1
+        if lexical_only:
+            deadline.degrade("scoring", "lexical_only", references=lexical_only)
+
+        results = []
+        for scores, computed, (low, high) in zip(all_scores, need_semantic, bounds):
+            stages_run = ['ngram', 'fuzzy']
+            result_bounds = None
+            if computed:
+                stages_run.append('semantic')
+                overall_score = score_bounds(scores, {}, {})[0]
+            else:
+                result_bounds = [float(low), float(high)]
+                overall_score = low
+
+            results.append({
+                'is_plagiarized': bool(self._flagged(scores, thresholds)),
+                'overall_score': float(overall_score),
+                'semantic_similarity': float(scores['semantic']) if 'semantic' in scores else None,
+                'ngram_similarity': float(scores['ngram']),
+                'fuzzy_similarity': float(scores['fuzzy']),
+                'stages': stages_run,
+                'score_bounds': result_bounds,
+            })
+
+        skipped = len(all_scores) - semantic_calls
+        if skipped:
+            metrics.inc("plagiarism_cascade_skipped_total", skipped, {'stage': 'semantic'},
+                        description="Similarity computations skipped by the cascade")
+        summary = {
+            'references': len(all_scores),
+            'semantic_computed': semantic_calls,
+            'semantic_skipped': skipped,
+            'screened_out': int(sum(screened)),
+        }
+        return results, summary
@@ -0,0 +1,165 @@
+from collections import defaultdict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.metrics import metrics
+
+# MinHash signature length and LSH banding (16 bands of 4 rows: pairs with a
+# Jaccard similarity of 0.5 become candidates with probability ~0.64, of 0.7 ~0.98)
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+
+_SEEDS = np.random.default_rng(20240611).integers(1, np.iinfo(np.int64).max, size=NUM_PERMUTATIONS,
+                                                  dtype=np.int64).astype(np.uint64)
+_MAX = np.iinfo(np.uint64).max
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, applied element-wise with wrapping uint64 arithmetic"""
+    with np.errstate(over="ignore"):
+        z = values + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def minhash_signature(fingerprints: np.ndarray, chunk_size: int = 4096) -> np.ndarray:
+    """
+    MinHash signature of a set of n-gram fingerprints
+
+    Args:
+        fingerprints: Unique 64-bit fingerprints (sharded_search.fingerprint_array)
+        chunk_size: Fingerprints hashed at once, bounding the temporary array
+
+    Returns:
+        uint64 array of NUM_PERMUTATIONS minimum hashes
+    """
+    signature = np.full(NUM_PERMUTATIONS, _MAX, dtype=np.uint64)
+    fingerprints = np.asarray(fingerprints, dtype=np.uint64)
+    for start in range(0, len(fingerprints), chunk_size):
+        block = fingerprints[start:start + chunk_size]
+        np.minimum(signature, _mix(block[None, :] ^ _SEEDS[:, None]).min(axis=1), out=signature)
+    return signature
+
+
+def containment(a: np.ndarray, b: np.ndarray) -> float:
+    """Share of the smaller fingerprint set contained in the larger one"""
+    if len(a) == 0 or len(b) == 0:
+        return 0.0
+    return len(np.intersect1d(a, b, assume_unique=True)) / min(len(a), len(b))
+
+
+class NearDuplicateIndex:
+    """
+    Finds near-duplicate texts (preprints, published versions, mirrors) by
+    their n-gram fingerprints.
+
+    Candidates come from MinHash LSH buckets and are confirmed by exact
+    containment: two texts are duplicates when at least `threshold` of the
+    smaller one's n-grams occur in the other.
+
+    Args:
+        threshold: Minimum containment of a duplicate
+    """
+
+    def __init__(self, threshold: float = 0.8):
+        self.threshold = threshold
+        self.rows = NUM_PERMUTATIONS // LSH_BANDS
+        self.buckets: Dict[Tuple[int, bytes], List[Hashable]] = defaultdict(list)
+        self.fingerprints: Dict[Hashable, np.ndarray] = {}
+
+    def _bands(self, signature: np.ndarray):
+        for band in range(LSH_BANDS):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def matches(self, fingerprints: np.ndarray,
+                signature: Optional[np.ndarray] = None) -> List[Tuple[Hashable, float]]:
+        """
+        Indexed keys that are near-duplicates of a fingerprint set
+
+        Returns:
+            List of (key, containment), highest containment first
+        """
+        if len(fingerprints) == 0:
+            return []
+        signature = minhash_signature(fingerprints) if signature is None else signature
+        candidates: Dict[Hashable, None] = {}
+        for band_key in self._bands(signature):
+            candidates.update(dict.fromkeys(self.buckets.get(band_key, ())))
+        matches = [(key, containment(fingerprints, self.fingerprints[key])) for key in candidates]
+        return sorted([match for match in matches if match[1] >= self.threshold], key=lambda m: -m[1])
+
+    def add(self, key: Hashable, fingerprints: np.ndarray, signature: Optional[np.ndarray] = None):
+        """Index a fingerprint set under `key`"""
+        if len(fingerprints) == 0:
+            return
+        signature = minhash_signature(fingerprints) if signature is None else signature
+        self.fingerprints[key] = fingerprints
+        for band_key in self._bands(signature):
+            self.buckets[band_key].append(key)
+
+    def find_or_add(self, key: Hashable, fingerprints: np.ndarray) -> Optional[Tuple[Hashable, float]]:
+        """
+        Streaming deduplication: the first text of a cluster is its canonical
+
+        Returns:
+            (canonical key, containment) when the text duplicates an indexed
+            one, otherwise None after indexing it as a new canonical
+        """
+        signature = minhash_signature(fingerprints)
+        matches = self.matches(fingerprints, signature)
+        if matches:
+            metrics.inc("plagiarism_duplicate_references_total", labels={'stage': 'query'},
+                        description="References folded into a near-duplicate canonical")
+            return matches[0]
+        self.add(key, fingerprints, signature)
+        return None
+
+
+def cluster_near_duplicates(items: Sequence[Tuple[Hashable, np.ndarray]],
+                            threshold: float = 0.8) -> List[Dict[str, Any]]:
+    """
+    Group near-duplicates of a corpus
+
+    Every item is compared with the items indexed before it, and matches are
+    merged transitively. The item with the most fingerprints (the most
+    complete version) becomes the canonical of its cluster.
+
+    Args:
+        items: (key, fingerprints) pairs
+        threshold: Minimum containment of a duplicate
+
+    Returns:
+        One dictionary per cluster with 'canonical' and 'aliases', a list of
+        (key, containment with the canonical) pairs, in input order of the canonicals
+    """
+    index = NearDuplicateIndex(threshold)
+    parent = list(range(len(items)))
+    position = {key: i for i, (key, _) in enumerate(items)}
+
+    def root(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, (key, fingerprints) in enumerate(items):
+        signature = minhash_signature(fingerprints)
+        for other, _ in index.matches(fingerprints, signature):
+            parent[root(i)] = root(position[other])
+        index.add(key, fingerprints, signature)
+
+    members: Dict[int, List[int]] = defaultdict(list)
+    for i in range(len(items)):
+        members[root(i)].append(i)
+
+    clusters = []
+    for group in sorted(members.values(), key=lambda group: group[0]):
+        canonical = max(group, key=lambda i: (len(items[i][1]), -i))
+        aliases = [(items[i][0], containment(items[canonical][1], items[i][1])) for i in group if i != canonical]
+        if aliases:
+            metrics.inc("plagiarism_duplicate_references_total", len(aliases), {'stage': 'ingest'},
+                        description="References folded into a near-duplicate canonical")
+        clusters.append({'canonical': items[canonical][0], 'aliases': aliases})
+    return clusters
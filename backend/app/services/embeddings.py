@@ -0,0 +1,165 @@
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+from transformers import AutoModel, AutoTokenizer
+
+from app.core.metrics import record_batch_size
+from app.services.cascade import EMBEDDING_MAX_TOKENS
+from app.utils.text import model_input
+
+# Named models. Thresholds are calibrations of each model's cosine scale:
+# `semantic_threshold` is the default decision threshold and `semantic_ceiling`
+# the similarity assumed for references the cascade screens out.
+# benchmarks.embedding_models measures both on a labeled set.
+EMBEDDING_PRESETS: Dict[str, Dict[str, Any]] = {
+    "bert": {'path': "bert-base-uncased", 'pooling': "cls", 'semantic_threshold': 0.85,
+             'semantic_ceiling': 0.8},
+    "minilm": {'path': "sentence-transformers/all-MiniLM-L6-v2", 'pooling': "mean", 'semantic_threshold': 0.75,
+               'semantic_ceiling': 0.5},
+}
+POOLINGS = ("cls", "mean")
+
+
+def _local_pooling(path: str) -> Optional[str]:
+    """Pooling of a sentence-transformers model directory, or None for a plain encoder"""
+    if not os.path.exists(os.path.join(path, "modules.json")):
+        return None
+    pooling_config = os.path.join(path, "1_Pooling", "config.json")
+    if os.path.exists(pooling_config):
+        with open(pooling_config, "r", encoding="utf-8") as f:
+            if json.load(f).get("pooling_mode_cls_token"):
+                return "cls"
+    return "mean"
+
+
+class EmbeddingModel:
+    """
+    Transformer encoder producing document and sentence embeddings.
+
+    Document embeddings use the model's pooling: the [CLS] vector for
+    bert-base-uncased (the original behaviour) or the L2-normalized mean of
+    the token vectors for sentence encoders such as MiniLM. Sentence
+    embeddings are always mean-pooled and normalized, as the sentence indexes
+    expect.
+
+    `name` identifies the weights and `model_id` the weights and document
+    pooling. Both are stored with every persisted embedding and index, so
+    embeddings of different models are never compared.
+
+    Args:
+        path: Hugging Face model id or local directory
+        pooling: 'cls' or 'mean'
+        semantic_threshold: Default semantic decision threshold for this model
+        semantic_ceiling: Default cascade ceiling for this model
+        device: Torch device (CUDA when available by default)
+    """
+
+    def __init__(self, path: str, pooling: str = "cls", semantic_threshold: float = 0.85,
+                 semantic_ceiling: float = 0.8, device: Optional[str] = None):
+        if pooling not in POOLINGS:
+            raise ValueError(f"Unsupported pooling: {pooling}")
+        self.path = path
+        self.pooling = pooling
+        self.semantic_threshold = semantic_threshold
+        self.semantic_ceiling = semantic_ceiling
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        self.model = AutoModel.from_pretrained(path)
+        self.device = torch.device(device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+        self.model.to(self.device)
+        self.model.eval()
+
+    @classmethod
+    def from_env(cls, model: Optional[str] = None) -> "EmbeddingModel":
+        """
+        Load the model named by `model` or EMBEDDING_MODEL (default 'bert')
+
+        The name is a preset of EMBEDDING_PRESETS, a Hugging Face id or a local
+        directory; sentence-transformers models use mean pooling (or the
+        pooling of their configuration), other encoders the [CLS] vector.
+        EMBEDDING_POOLING, EMBEDDING_SEMANTIC_THRESHOLD and
+        EMBEDDING_SEMANTIC_CEILING override the defaults.
+        """
+        model = model or os.getenv("EMBEDDING_MODEL", "bert")
+        settings = dict(EMBEDDING_PRESETS.get(model, {'path': model}))
+        if 'pooling' not in settings:
+            if os.path.isdir(model):
+                pooling = _local_pooling(model) or "cls"
+            else:
+                pooling = "mean" if model.startswith("sentence-transformers/") else "cls"
+            # Thresholds of the preset with the same pooling
+            settings = dict(EMBEDDING_PRESETS["minilm" if pooling == "mean" else "bert"],
+                            path=model, pooling=pooling)
+        return cls(
+            settings['path'],
+            pooling=os.getenv("EMBEDDING_POOLING", settings['pooling']),
+            semantic_threshold=float(os.getenv("EMBEDDING_SEMANTIC_THRESHOLD", settings['semantic_threshold'])),
+            semantic_ceiling=float(os.getenv("EMBEDDING_SEMANTIC_CEILING", settings['semantic_ceiling'])),
+        )
+
+    @property
+    def name(self) -> str:
+        """Identity of the weights: the model id, or the directory name of a local model"""
+        if os.path.isdir(self.path):
+            return os.path.basename(os.path.normpath(self.path))
+        return self.path
+
+    @property
+    def model_id(self) -> str:
+        """Identity of the document embeddings (weights and pooling)"""
+        return f"{self.name}:{self.pooling}"
+
+    @property
+    def dim(self) -> int:
+        return self.model.config.hidden_size
+
+    def _encode(self, texts: List[str], max_length: int, pooling: str) -> np.ndarray:
+        inputs = self.tokenizer(texts, return_tensors="pt", truncation=True,
+                                max_length=max_length, padding=True).to(self.device)
+        with torch.no_grad():
+            outputs = self.model(**inputs, return_dict=True)
+
+        if pooling == "cls":
+            # The [CLS] token embedding (first token)
+            return outputs.last_hidden_state[:, 0, :].cpu().numpy()
+
+        # Average the token vectors, ignoring padding
+        mask = inputs['attention_mask'].unsqueeze(-1).type_as(outputs.last_hidden_state)
+        pooled = (outputs.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
+        return pooled.cpu().numpy().astype(np.float32)
+
+    def embed_document(self, text: str, max_length: int = EMBEDDING_MAX_TOKENS) -> np.ndarray:
+        """
+        Document embedding of a text
+
+        Returns:
+            Array of shape (1, dim)
+        """
+        record_batch_size("embeddings", 1)
+        # Only the prefix the model reads is tokenized
+        return self._encode([model_input(text, max_length)], max_length, self.pooling)
+
+    def embed_sentences(self, texts: List[str], batch_size: int = 32, max_length: int = 128) -> np.ndarray:
+        """
+        Mean-pooled, L2-normalized embeddings of short texts (sentences or paragraphs)
+
+        Args:
+            texts: Texts to embed
+            batch_size: Number of texts per forward pass
+            max_length: Maximum number of tokens per text
+
+        Returns:
+            Float32 array of shape (len(texts), dim)
+        """
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            batch = [model_input(text, max_length) for text in texts[start:start + batch_size]]
+            record_batch_size("sentence_embeddings", len(batch))
+            vectors.append(self._encode(batch, max_length, "mean"))
+
+        if not vectors:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.vstack(vectors)
@@ -0,0 +1,542 @@
+import datetime
+import difflib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: lineages are locked within a process only
+    fcntl = None
+
+from app.core.memory import current_budget
+from app.core.metrics import record_cache, timed
+from app.core.scheduler import current_tenant
+from app.services.cascade import EMBEDDING_MAX_TOKENS
+from app.services.dedup import NearDuplicateIndex
+from app.services.sharded_search import fingerprint_array
+from app.utils.text import TOKENIZER_VERSION, model_input, sentence_spans
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text: str) -> str:
+    """Stable content hash used to detect changed sections and paragraphs"""
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def split_paragraphs(text: str) -> List[str]:
+    """
+    Split a section into paragraphs
+
+    Blank lines separate paragraphs when present; PDF text flattened to a single
+    line is split into runs of roughly five sentences instead.
+    """
+    blocks = [block.strip() for block in text.split("\n\n") if block.strip()]
+    if len(blocks) > 1:
+        return blocks
+
+    sentences = [text[start:end].strip() for start, end in sentence_spans(text) if text[start:end].strip()]
+    return [" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)]
+
+
+class RevisionStore:
+    """
+    File-backed store of per-section state from previous checks, one JSON file
+    per submission lineage. Lineages are keyed by tenant and submission ID, so
+    tenants using the same submission IDs never see each other's state.
+
+    A check holds its lineage's lock (`lineage`) from loading the state to
+    saving the new one, so concurrent revisions of a lineage are applied one
+    after the other instead of the last save discarding the others. The lock
+    is a file lock, which also holds between worker processes sharing the
+    directory. The directory is created on the first write.
+
+    Args:
+        directory: Storage directory (defaults to REVISION_STORE_DIR or ./revision_store)
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.getenv("REVISION_STORE_DIR", "revision_store")
+        self.lock = threading.Lock()
+        # Lock of each lineage in use in this process and its number of holders and waiters
+        self.lineage_locks: Dict[str, List[Any]] = {}
+
+    def _path(self, submission_id: str, tenant: Optional[str] = None) -> str:
+        key = f"{tenant or current_tenant()}\n{submission_id}"
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.json")
+
+    @contextmanager
+    def lineage(self, submission_id: str, tenant: Optional[str] = None) -> Iterator[None]:
+        """Hold the lock of a lineage (of the current tenant by default)"""
+        path = self._path(submission_id, tenant)
+        with self.lock:
+            entry = self.lineage_locks.setdefault(path, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                if fcntl is None:
+                    yield
+                    return
+                os.makedirs(self.directory, exist_ok=True)
+                with open(path[:-len(".json")] + ".lock", "a") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.lineage_locks[path]
+
+    def load(self, submission_id: str, tenant: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return the stored state of a lineage (of the current tenant by default), or None if it was never checked"""
+        path = self._path(submission_id, tenant)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable revision state for {submission_id}: {str(e)}")
+            return None
+
+    def save(self, submission_id: str, state: Dict[str, Any], tenant: Optional[str] = None):
+        """Atomically replace the stored state of a lineage (of the current tenant by default)"""
+        path = self._path(submission_id, tenant)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class IncrementalChecker:
+    """
+    Revision-aware checks: resubmissions of the same lineage only recompute the
+    sections that changed.
+
+    References come from the same source as in a normal check: scholarly
+    search with online sources, otherwise candidates from the local corpus
+    snapshot when one is configured. For each section the store keeps its
+    hash, paragraph hashes and AI detection result, and for each reference
+    its fingerprints, its embedding once computed and its fuzzy
+    similarities. A resubmission reuses the lineage's references: only the
+    changed sections are searched again (for the local corpus, which is
+    cheap to search, the whole text is), and references found that way are
+    added to the lineage's set. Only changed sections are passed through the
+    AI detector, and the suspect is embedded again only when the prefix read
+    by the embedding model changed. N-gram similarity is recomputed from the
+    whole text, as in a normal check (hashing is cheap).
+
+    Scoring goes through the checker's cascade like a normal check, so a
+    reference is embedded only when its semantic similarity can change the
+    outcome, and its embedding is then kept for later revisions. Without
+    `section_aligned`, fuzzy similarity is whole-text matching, recomputed
+    when any section changed. With it, fuzzy similarity is computed section
+    by section: each section is compared with the reference sections by
+    SectionAligner (a reference with fewer than two sections counts as one),
+    and the document's fuzzy similarity is the best similarity of each
+    compared section, weighted by its length, so only changed sections are
+    matched again. This differs from the section selection of a normal
+    section-aligned check, but not between revisions.
+
+    Args:
+        plagiarism_checker: PlagiarismChecker used for references, features and scoring
+        ai_detector: AIDetector used for changed sections
+        store: RevisionStore holding previous states
+    """
+
+    def __init__(self, plagiarism_checker, ai_detector, store: Optional[RevisionStore] = None):
+        self.plagiarism_checker = plagiarism_checker
+        self.ai_detector = ai_detector
+        self.store = store or RevisionStore()
+
+    def diff_sections(self, previous: Optional[Dict[str, Any]],
+                      sections: Dict[str, str]) -> Tuple[List[str], List[str], int]:
+        """
+        Compare sections with the previous revision
+
+        Args:
+            previous: Stored state of the previous revision (or None)
+            sections: Sections of the new revision
+
+        Returns:
+            Tuple of (changed section names, unchanged section names,
+            number of changed paragraphs)
+        """
+        old_sections = (previous or {}).get('sections', {})
+        changed, unchanged = [], []
+        changed_paragraphs = 0
+        for name, content in sections.items():
+            old = old_sections.get(name)
+            if old is not None and old['hash'] == text_hash(content):
+                unchanged.append(name)
+                continue
+            changed.append(name)
+            new_hashes = [text_hash(p) for p in split_paragraphs(content)]
+            old_hashes = old['paragraph_hashes'] if old else []
+            matcher = difflib.SequenceMatcher(a=old_hashes, b=new_hashes, autojunk=False)
+            changed_paragraphs += sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+                                      if tag != "equal")
+        return changed, unchanged, changed_paragraphs
+
+    def _reference_source(self, check_online_sources: bool) -> Optional[str]:
+        """Where a normal check with these options takes its references from"""
+        if check_online_sources:
+            return "scholarly"
+        if getattr(self.plagiarism_checker, 'snapshot_index', None) is not None:
+            return "local"
+        return None
+
+    def _snapshot_version(self, source: Optional[str]) -> Optional[int]:
+        if source != "local":
+            return None
+        snapshot = self.plagiarism_checker.snapshot_index.current
+        return snapshot.version if snapshot is not None else None
+
+    def _find_references(self, source: Optional[str], suspect_text: str, sections: Dict[str, str],
+                         num_papers: int, fetch_budget: Optional[int]) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        """(key, content, paper info) of the references found for a text"""
+        checker = self.plagiarism_checker
+        if source == "scholarly":
+            for content, source_info in checker.iter_scholarly_references(
+                    suspect_text, num_papers, sections=sections, fetch_budget=fetch_budget):
+                yield source_info.get('link') or source_info.get('title', ''), content, source_info
+        elif source == "local":
+            for candidate in checker.retrieve_local_candidates(suspect_text):
+                yield candidate['reference_key'], candidate['text'], candidate['paper_info']
+
+    def _fetch_references(self, source: Optional[str], suspect_text: str, sections: Dict[str, str],
+                          num_papers: int, fetch_budget: Optional[int],
+                          references: Optional[List[Dict[str, Any]]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Search and fetch references, then compute their reusable features
+
+        Args:
+            references: References already held by the lineage; found
+                references with the same key, or near-duplicates of them, are
+                not added again
+
+        Returns:
+            Tuple of (the lineage's references followed by the new ones,
+            number of references added)
+        """
+        checker = self.plagiarism_checker
+        budget = current_budget()
+        references = list(references or [])
+        keys = {reference.get('key') for reference in references}
+        duplicates = NearDuplicateIndex(checker.dedup_threshold) if checker.dedup_threshold > 0 else None
+        if duplicates is not None:
+            for position, reference in enumerate(references):
+                duplicates.add(position, fingerprint_array(reference['ngram_hashes']))
+        added = 0
+        for i, (key, content, source_info) in enumerate(self._find_references(source, suspect_text, sections,
+                                                                              num_papers, fetch_budget)):
+            if key and key in keys:
+                continue
+            content = budget.truncate(content, f"reference {i}", budget.max_reference_chars)
+            ngram_hashes = checker.hash_ngrams(checker.preprocess_text(content))
+            if duplicates is not None:
+                # Near-duplicates of a kept reference are stored as its aliases only
+                duplicate = duplicates.find_or_add(len(references), fingerprint_array(ngram_hashes))
+                if duplicate is not None:
+                    canonical, similarity = duplicate
+                    references[canonical]['aliases'].append({'paper_info': source_info,
+                                                             'similarity': float(similarity)})
+                    keys.add(key)
+                    continue
+            keys.add(key)
+            references.append({
+                'key': key,
+                'text': content,
+                'paper_info': source_info,
+                'ngram_hashes': sorted(set(ngram_hashes)),
+                # Computed when scoring needs it
+                'embedding': None,
+                'aliases': []
+            })
+            added += 1
+        return references, added
+
+    def _section_scores(self, reference: Dict[str, Any], sections: Dict[str, str],
+                        section_states: Dict[str, Dict[str, Any]], unchanged: List[str],
+                        prepared_sections: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Fuzzy similarity of each section with a reference, reusing the stored
+        scores of unchanged sections
+
+        Returns:
+            Dictionary mapping section names to their 'hash', 'words', best
+            'fuzzy' similarity (None when the section was not compared) and
+            section 'matches'
+        """
+        aligner = self.plagiarism_checker.section_aligner
+        stored = reference.get('section_scores') or {}
+        reference_sections = None
+        section_scores = {}
+        for name, content in sections.items():
+            old = stored.get(name)
+            if name in unchanged and old is not None and old['hash'] == section_states[name]['hash']:
+                record_cache("revision_section_score", True)
+                section_scores[name] = old
+                continue
+            record_cache("revision_section_score", False)
+            if reference_sections is None:
+                reference_sections = aligner.prepare(aligner.split(reference['text'])
+                                                     or {'document': reference['text']})
+            if name not in prepared_sections:
+                prepared_sections[name] = aligner.prepare({name: content})[name]
+            section = prepared_sections[name]
+            fuzzy_sim, matches = aligner.compare({name: section}, reference_sections)
+            section_scores[name] = {
+                'hash': section_states[name]['hash'],
+                'words': section['words'],
+                'fuzzy': float(fuzzy_sim) if matches else None,
+                'matches': matches
+            }
+        return section_scores
+
+    @timed("incremental_check")
+    def check(self, submission_id: str, sections: Dict[str, str], check_online_sources: bool = False,
+              num_papers: int = 3, thresholds: Optional[Dict[str, float]] = None,
+              fetch_budget: Optional[int] = None, ai_threshold: float = 0.7,
+              section_aligned: bool = False, ai_early_exit: bool = False) -> Dict[str, Any]:
+        """
+        Check a revision of a submission, reusing results for unchanged sections
+
+        Args:
+            submission_id: Identifier shared by all revisions of a submission
+            sections: Sections of this revision
+            check_online_sources: Whether to search scholarly sources (the local corpus otherwise)
+            num_papers: Number of papers to retrieve from each source
+            thresholds: Dictionary with thresholds for each similarity method
+            fetch_budget: Maximum number of full-text fetches
+            ai_threshold: Threshold for AI-generated classification
+            section_aligned: Compute fuzzy similarity section by section
+            ai_early_exit: Stop AI detection once the document-level verdict is settled
+
+        Returns:
+            Dictionary with 'plagiarism_results', 'ai_detection_results' and
+            'revision' (revision number, changed and reused sections, references added)
+        """
+        # Another revision of the lineage checked meanwhile is not overwritten
+        with self.store.lineage(submission_id):
+            return self._check(submission_id, sections, check_online_sources, num_papers, thresholds,
+                               fetch_budget, ai_threshold, section_aligned, ai_early_exit)
+
+    def _check(self, submission_id: str, sections: Dict[str, str], check_online_sources: bool, num_papers: int,
+               thresholds: Optional[Dict[str, float]], fetch_budget: Optional[int], ai_threshold: float,
+               section_aligned: bool, ai_early_exit: bool) -> Dict[str, Any]:
+        checker = self.plagiarism_checker
+        budget = current_budget()
+        thresholds = thresholds or checker.default_thresholds()
+        previous = self.store.load(submission_id)
+        if previous is not None and previous.get('tokenizer_version') != TOKENIZER_VERSION:
+            # Fingerprints from another tokenizer are not comparable; keep only the revision number
+            logger.info(f"Recomputing {submission_id}: stored state uses another tokenizer version")
+            previous = {'revision': previous.get('revision', 0)}
+        if previous is not None and previous.get('references') is not None \
+                and previous.get('embedding_model') != checker.embedder.model_id:
+            # Reference embeddings of another model are not comparable; they are computed again
+            logger.info(f"Dropping reference embeddings of {submission_id}: stored embeddings use another model")
+            for reference in previous['references']:
+                reference['embedding'] = None
+        changed, unchanged, changed_paragraphs = self.diff_sections(previous, sections)
+        for _ in unchanged:
+            record_cache("revision_section", True)
+        for _ in changed:
+            record_cache("revision_section", False)
+
+        old_sections = (previous or {}).get('sections', {})
+        full_text = " ".join(sections.values())
+
+        # References: reuse the lineage's reference set when it comes from the same source,
+        # and search for the text that changed
+        source = self._reference_source(check_online_sources)
+        snapshot_version = self._snapshot_version(source)
+        stored_source = None
+        if previous is not None:
+            stored_source = previous.get('reference_source', "scholarly" if previous.get('online') else None)
+        references = (previous or {}).get('references') if stored_source == source else None
+        references_reused = references is not None
+        added = 0
+        if not references_reused:
+            references, added = self._fetch_references(source, full_text, sections, num_papers, fetch_budget)
+        else:
+            record_cache("revision_references", True)
+            if source == "scholarly" and changed:
+                changed_sections = {name: sections[name] for name in changed}
+                references, added = self._fetch_references(source, " ".join(changed_sections.values()),
+                                                           changed_sections, num_papers, fetch_budget, references)
+            elif source == "local" and (changed or previous.get('snapshot') != snapshot_version):
+                references, added = self._fetch_references(source, full_text, sections, num_papers,
+                                                           fetch_budget, references)
+
+        # Nothing changed: the previous results are still valid
+        if references_reused and not added and not changed and len(old_sections) == len(sections) \
+                and previous.get('thresholds') == thresholds and previous.get('ai_threshold') == ai_threshold \
+                and previous.get('section_aligned', True) == section_aligned \
+                and previous.get('ai_early_exit', False) == ai_early_exit \
+                and previous.get('snapshot') == snapshot_version:
+            return {
+                'plagiarism_results': previous['plagiarism_results'],
+                'ai_detection_results': previous['ai_detection_results'],
+                'revision': {
+                    'submission_id': submission_id,
+                    'revision': previous['revision'],
+                    'changed_sections': [],
+                    'reused_sections': unchanged,
+                    'changed_paragraphs': 0,
+                    'references_reused': True,
+                    'references_added': 0
+                }
+            }
+
+        section_states = {}
+        for name, content in sections.items():
+            if name in unchanged:
+                section_states[name] = old_sections[name]
+                continue
+            section_states[name] = {
+                'hash': text_hash(content),
+                'paragraph_hashes': [text_hash(p) for p in split_paragraphs(content)],
+                'ai_result': None
+            }
+
+        # AI detection: reuse results of unchanged sections classified with the same threshold
+        precomputed = {}
+        if (previous or {}).get('ai_threshold') == ai_threshold:
+            precomputed = {name: old_sections[name]['ai_result'] for name in unchanged
+                           if old_sections[name].get('ai_result') is not None}
+        ai_detection_results = self.ai_detector.analyze_sections(sections, ai_threshold, precomputed=precomputed,
+                                                                 early_exit=ai_early_exit)
+        for name, result in ai_detection_results['section_results'].items():
+            section_states[name]['ai_result'] = result
+
+        # Plagiarism: n-grams of the whole text, the suspect embedding when its input changed
+        processed_suspect = checker.preprocess_text(full_text)
+        embedding_input = text_hash(model_input(processed_suspect, EMBEDDING_MAX_TOKENS))
+        if (previous or {}).get('embedding_input') == embedding_input and 'suspect_embedding' in previous \
+                and previous.get('embedding_model') == checker.embedder.model_id:
+            record_cache("revision_embedding", True)
+            suspect_embedding = np.asarray(previous['suspect_embedding'], dtype=np.float32).reshape(1, -1)
+        else:
+            record_cache("revision_embedding", False)
+            suspect_embedding = checker.get_bert_embeddings(processed_suspect)
+        suspect_features = {
+            'ngram_hashes': set(checker.hash_ngrams(processed_suspect)),
+            'embedding': suspect_embedding
+        }
+        document_hash = text_hash(full_text)
+        prepared_sections = {}
+
+        def fuzzy_similarity(position: int, processed_ref: str) -> float:
+            """Fuzzy similarity of a reference, reusing stored similarities of unchanged text"""
+            reference = references[position]
+            if section_aligned:
+                section_scores = self._section_scores(reference, sections, section_states, unchanged,
+                                                      prepared_sections)
+                reference['section_scores'] = section_scores
+                compared = [scores for scores in section_scores.values() if scores['fuzzy'] is not None]
+                compared_words = sum(scores['words'] for scores in compared)
+                return sum(scores['fuzzy'] * scores['words'] for scores in compared) / compared_words \
+                    if compared_words else 0.0
+            stored = reference.get('document_fuzzy')
+            if stored is not None and stored['hash'] == document_hash:
+                record_cache("revision_document_fuzzy", True)
+                return stored['fuzzy']
+            record_cache("revision_document_fuzzy", False)
+            fuzzy_sim = float(checker.fuzzy_match_similarity(processed_suspect, processed_ref))
+            reference['document_fuzzy'] = {'hash': document_hash, 'fuzzy': fuzzy_sim}
+            return fuzzy_sim
+
+        def reference_embedding(position: int, embedding_text: str) -> np.ndarray:
+            """Stored embedding of a reference, computed the first time scoring needs it"""
+            reference = references[position]
+            if reference.get('embedding') is None:
+                record_cache("revision_reference_embedding", False)
+                reference['embedding'] = np.asarray(checker.get_bert_embeddings(embedding_text)).ravel().tolist()
+            else:
+                record_cache("revision_reference_embedding", True)
+            return np.asarray(reference['embedding'], dtype=np.float32).reshape(1, -1)
+
+        processed_refs = (checker.preprocess_text(reference['text']) for reference in references)
+        if checker.cascade.policy.enabled:
+            # Cascade: lexical similarities for every reference, embeddings only where needed
+            plagiarism_results, _ = checker.cascade.score(processed_suspect, processed_refs, thresholds,
+                                                          suspect_features=suspect_features,
+                                                          fuzzy=fuzzy_similarity, embed=reference_embedding)
+        else:
+            plagiarism_results = []
+            for position, processed_ref in enumerate(processed_refs):
+                ref_features = {
+                    'ngram_hashes': set(references[position]['ngram_hashes']),
+                    'embedding': reference_embedding(position, processed_ref)
+                }
+                plagiarism_results.append(checker.score_features(
+                    processed_suspect, suspect_features, processed_ref, ref_features, thresholds,
+                    fuzzy_sim=fuzzy_similarity(position, processed_ref)
+                ))
+        for i, (result, reference) in enumerate(zip(plagiarism_results, references)):
+            result['reference_id'] = i
+            result['reference_text'] = budget.excerpt(reference['text'])
+            result['reference_length'] = len(reference['text'])
+            result['paper_info'] = reference['paper_info']
+            result['aliases'] = reference.get('aliases', [])
+            if section_aligned:
+                result['section_matches'] = sorted((match for scores in reference['section_scores'].values()
+                                                    for match in scores['matches']),
+                                                   key=lambda match: match['score'], reverse=True)
+        plagiarism_results.sort(key=lambda x: x['overall_score'], reverse=True)
+
+        revision = (previous or {}).get('revision', 0) + 1
+        self.store.save(submission_id, {
+            'submission_id': submission_id,
+            'tenant': current_tenant(),
+            'revision': revision,
+            'tokenizer_version': TOKENIZER_VERSION,
+            'embedding_model': checker.embedder.model_id,
+            'updated_at': datetime.datetime.now().isoformat(),
+            'reference_source': source,
+            'snapshot': snapshot_version,
+            'thresholds': thresholds,
+            'ai_threshold': ai_threshold,
+            'section_aligned': section_aligned,
+            'ai_early_exit': ai_early_exit,
+            'embedding_input': embedding_input,
+            'suspect_embedding': np.asarray(suspect_embedding).ravel().tolist(),
+            'sections': section_states,
+            'references': references,
+            'plagiarism_results': plagiarism_results,
+            'ai_detection_results': ai_detection_results
+        })
+
+        return {
+            'plagiarism_results': plagiarism_results,
+            'ai_detection_results': ai_detection_results,
+            'revision': {
+                'submission_id': submission_id,
+                'revision': revision,
+                'changed_sections': changed,
+                'reused_sections': unchanged,
+                'changed_paragraphs': changed_paragraphs,
+                'references_reused': references_reused,
+                'references_added': added
+            }
+        }
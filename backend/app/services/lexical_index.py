@@ -0,0 +1,331 @@
+import hashlib
+import json
+import math
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.metrics import metrics
+
+TERMS_DIR = "terms"
+TERM_HASHES_FILE = "term_hashes.npy"
+TERM_DF_FILE = "term_df.npy"
+TERM_BLOCKS_FILE = "term_blocks.npy"
+BLOCK_LAST_FILE = "block_last.npy"
+BLOCK_OFFSETS_FILE = "block_offsets.npy"
+BLOCK_MAX_FILE = "block_max.npy"
+POSTINGS_FILE = "postings.bin"
+DOC_LENGTHS_FILE = "doc_lengths.npy"
+TERMS_META_FILE = "meta.json"
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Postings per compressed block; each block has its last document and highest impact for skipping
+BLOCK_SIZE = 128
+
+
+def term_hash(term: str) -> int:
+    """64-bit hash identifying a term in the lexicon"""
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def bm25_idf(df: np.ndarray, docs: int) -> np.ndarray:
+    """BM25 inverse document frequency (the non-negative Lucene form)"""
+    df = np.asarray(df, dtype=np.float64)
+    return np.log1p((docs - df + 0.5) / (df + 0.5))
+
+
+def encode_varints(values: np.ndarray) -> Tuple[bytes, np.ndarray]:
+    """
+    LEB128-encode non-negative integers below 2**35
+
+    Returns:
+        Tuple of (encoded bytes, number of bytes of each value)
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in (7, 14, 21, 28):
+        sizes += values >= (1 << shift)
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    starts = np.cumsum(sizes) - sizes
+    for i in range(5):
+        selected = sizes > i
+        if not selected.any():
+            break
+        low = (values[selected] >> np.uint64(7 * i)) & np.uint64(0x7F)
+        more = (sizes[selected] > i + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[selected] + i] = (low | more).astype(np.uint8)
+    return out.tobytes(), sizes
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """Decode a run of LEB128 integers (see encode_varints)"""
+    data = np.asarray(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.nonzero(data < 0x80)[0]
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    lengths = ends - starts + 1
+    shifts = (np.arange(len(data)) - np.repeat(starts, lengths)) * 7
+    return np.add.reduceat((data & 0x7F).astype(np.int64) << shifts, starts)
+
+
+def _impacts(tfs: np.ndarray, lengths: np.ndarray, avgdl: float) -> np.ndarray:
+    """Term-frequency part of BM25 of each posting"""
+    tfs = np.asarray(tfs, dtype=np.float64)
+    return tfs * (K1 + 1) / (tfs + K1 * (1 - B + B * np.asarray(lengths, dtype=np.float64) / avgdl))
+
+
+def write_term_index(directory: str, documents: Iterable[Dict[str, int]]):
+    """
+    Write the BM25 inverted index of a segment
+
+    Posting lists are sorted by document and cut into blocks of BLOCK_SIZE
+    postings. A block stores the gaps between its document ids and their
+    term frequencies as LEB128 varints (one or two bytes per posting for
+    most terms), and the lexicon keeps each block's last document id, byte
+    offset and highest BM25 impact, so queries can decode single blocks and
+    skip blocks that cannot change the top-k.
+
+    Args:
+        directory: Segment directory; the index is written to its terms/ subdirectory
+        documents: Term frequencies of each document, in document id order
+    """
+    directory = os.path.join(directory, TERMS_DIR)
+    os.makedirs(directory)
+    postings: Dict[int, Tuple[List[int], List[int]]] = {}
+    lengths = []
+    for doc_id, frequencies in enumerate(documents):
+        lengths.append(sum(frequencies.values()))
+        for term, tf in frequencies.items():
+            docs, tfs = postings.setdefault(term_hash(term), ([], []))
+            docs.append(doc_id)
+            tfs.append(tf)
+    lengths = np.array(lengths, dtype=np.uint32)
+    avgdl = float(lengths.mean()) if len(lengths) and lengths.sum() else 1.0
+
+    hashes = np.array(sorted(postings), dtype=np.uint64)
+    df = np.zeros(len(hashes), dtype=np.uint32)
+    term_blocks = np.zeros(len(hashes) + 1, dtype=np.int64)
+    block_last, block_max, block_values, parts = [], [], [], []
+    for i, hashed in enumerate(hashes):
+        docs, tfs = postings[int(hashed)]
+        docs = np.array(docs, dtype=np.int64)
+        tfs = np.array(tfs, dtype=np.int64)
+        df[i] = len(docs)
+        gaps = np.diff(docs, prepend=0)
+        impacts = _impacts(tfs, lengths[docs], avgdl)
+        for start in range(0, len(docs), BLOCK_SIZE):
+            end = min(start + BLOCK_SIZE, len(docs))
+            parts.append(gaps[start:end])
+            parts.append(tfs[start:end])
+            block_values.append(2 * (end - start))
+            block_last.append(docs[end - 1])
+            block_max.append(impacts[start:end].max())
+        term_blocks[i + 1] = len(block_last)
+
+    encoded, sizes = encode_varints(np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64))
+    value_ends = np.cumsum(block_values, dtype=np.int64)
+    byte_ends = np.cumsum(sizes)[value_ends - 1] if len(value_ends) else np.zeros(0, dtype=np.int64)
+    block_offsets = np.concatenate([[0], byte_ends]).astype(np.int64)
+
+    np.save(os.path.join(directory, TERM_HASHES_FILE), hashes)
+    np.save(os.path.join(directory, TERM_DF_FILE), df)
+    np.save(os.path.join(directory, TERM_BLOCKS_FILE), term_blocks)
+    np.save(os.path.join(directory, BLOCK_LAST_FILE), np.array(block_last, dtype=np.int64))
+    np.save(os.path.join(directory, BLOCK_OFFSETS_FILE), block_offsets)
+    np.save(os.path.join(directory, BLOCK_MAX_FILE), np.array(block_max, dtype=np.float32))
+    np.save(os.path.join(directory, DOC_LENGTHS_FILE), lengths)
+    with open(os.path.join(directory, POSTINGS_FILE), "wb") as f:
+        f.write(encoded)
+    with open(os.path.join(directory, TERMS_META_FILE), "w", encoding="utf-8") as f:
+        json.dump({'version': 1, 'docs': len(lengths), 'terms': len(hashes), 'postings': int(df.sum()),
+                   'avgdl': avgdl, 'k1': K1, 'b': B, 'block_size': BLOCK_SIZE}, f)
+
+
+class TermIndex:
+    """
+    Memory-mapped BM25 inverted index of one segment (see write_term_index).
+
+    `top_k` prunes with MaxScore: query terms are taken in decreasing order
+    of their score upper bound, and once the bounds of the remaining terms
+    add up to less than the current k-th best score, those terms can no
+    longer bring in new documents; they only update the scores of existing
+    candidates. Candidates that cannot reach the k-th score are dropped, and
+    a block of a remaining term is decoded only if a surviving candidate
+    falls in it and could still reach the top-k with that block's highest
+    impact (block-max pruning).
+
+    Args:
+        directory: Segment directory holding a terms/ subdirectory
+    """
+
+    def __init__(self, directory: str):
+        directory = os.path.join(directory, TERMS_DIR)
+        with open(os.path.join(directory, TERMS_META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.docs = self.meta['docs']
+        self.avgdl = self.meta['avgdl']
+        self.hashes = np.load(os.path.join(directory, TERM_HASHES_FILE), mmap_mode="r")
+        self.df = np.load(os.path.join(directory, TERM_DF_FILE), mmap_mode="r")
+        self.term_blocks = np.load(os.path.join(directory, TERM_BLOCKS_FILE), mmap_mode="r")
+        self.block_last = np.load(os.path.join(directory, BLOCK_LAST_FILE), mmap_mode="r")
+        self.block_offsets = np.load(os.path.join(directory, BLOCK_OFFSETS_FILE), mmap_mode="r")
+        self.block_max = np.load(os.path.join(directory, BLOCK_MAX_FILE), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(directory, DOC_LENGTHS_FILE), mmap_mode="r")
+        postings_path = os.path.join(directory, POSTINGS_FILE)
+        self.postings = np.memmap(postings_path, dtype=np.uint8, mode="r") \
+            if os.path.getsize(postings_path) else np.zeros(0, dtype=np.uint8)
+
+    def lookup(self, hashes: np.ndarray) -> np.ndarray:
+        """Term ids of term hashes (-1 for terms not in the segment)"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if len(self.hashes) == 0:
+            return np.full(len(hashes), -1, dtype=np.int64)
+        positions = np.searchsorted(self.hashes, hashes)
+        found = (positions < len(self.hashes)) & (np.asarray(self.hashes)[np.minimum(positions, len(self.hashes) - 1)] == hashes)
+        return np.where(found, positions, -1)
+
+    def document_frequencies(self, hashes: np.ndarray) -> np.ndarray:
+        term_ids = self.lookup(hashes)
+        return np.where(term_ids >= 0, np.asarray(self.df)[np.maximum(term_ids, 0)] if len(self.df) else 0, 0)
+
+    def _decode(self, term_id: int, blocks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Documents and term frequencies in the given blocks (ascending, relative to the term's first block)"""
+        term_first = int(self.term_blocks[term_id])
+        absolute = term_first + np.asarray(blocks, dtype=np.int64)
+        starts = np.asarray(self.block_offsets)[absolute]
+        sizes = np.asarray(self.block_offsets)[absolute + 1] - starts
+        byte_index = np.repeat(starts - (np.cumsum(sizes) - sizes), sizes) + np.arange(int(sizes.sum()))
+        values = decode_varints(np.asarray(self.postings[starts[0]:starts[-1] + sizes[-1]])[byte_index - starts[0]])
+        # Only a term's last block holds fewer than BLOCK_SIZE postings
+        counts = np.minimum(BLOCK_SIZE, int(self.df[term_id]) - np.asarray(blocks, dtype=np.int64) * BLOCK_SIZE)
+        block_starts = np.cumsum(counts) - counts
+        positions = np.arange(int(counts.sum())) - np.repeat(block_starts, counts)
+        gap_index = np.repeat(2 * block_starts, counts) + positions
+        gaps = values[gap_index]
+        tfs = values[gap_index + np.repeat(counts, counts)]
+        # Gaps of a block continue from the last document of the term's previous block
+        bases = np.where(absolute > term_first, np.asarray(self.block_last)[np.maximum(absolute - 1, 0)], 0)
+        cumulative = np.cumsum(gaps)
+        docs = cumulative - np.repeat(cumulative[block_starts] - gaps[block_starts] - bases, counts)
+        return docs, tfs
+
+    def top_k(self, hashes: np.ndarray, idfs: np.ndarray, k: int, threshold: float = 0.0,
+              live: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k documents by BM25
+
+        Args:
+            hashes: Term hashes of the query
+            idfs: IDF of each query term (computed over every segment of the snapshot)
+            k: Number of documents returned
+            threshold: Score the results must exceed (the k-th best score found in other segments)
+            live: Optional mask of the documents that may be returned
+
+        Returns:
+            Tuple of (document ids, scores) sorted by descending score
+        """
+        term_ids = self.lookup(hashes)
+        present = term_ids >= 0
+        term_ids, idfs = term_ids[present], np.asarray(idfs, dtype=np.float64)[present]
+        if len(term_ids) == 0 or k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        block_max = np.asarray(self.block_max)
+        bounds = np.array([idf * block_max[self.term_blocks[t]:self.term_blocks[t + 1]].max()
+                           for t, idf in zip(term_ids, idfs)])
+        order = np.argsort(-bounds)
+        term_ids, idfs, bounds = term_ids[order], idfs[order], bounds[order]
+        # Highest score a document can still gain from terms i.. onwards
+        remaining = np.concatenate([np.cumsum(bounds[::-1])[::-1], [0.0]])
+
+        candidates = np.zeros(0, dtype=np.int64)
+        scores = np.zeros(0)
+        theta = threshold
+        decoded = skipped = 0
+
+        def kth(values: np.ndarray) -> float:
+            return float(np.partition(values, len(values) - k)[len(values) - k]) if len(values) >= k else theta
+
+        # Essential terms: documents not seen yet may still reach the top-k
+        i = 0
+        while i < len(term_ids) and remaining[i] > theta:
+            term_id = int(term_ids[i])
+            first, last = int(self.term_blocks[term_id]), int(self.term_blocks[term_id + 1])
+            docs, tfs = self._decode(term_id, np.arange(last - first))
+            decoded += last - first
+            if live is not None:
+                keep = live[docs]
+                docs, tfs = docs[keep], tfs[keep]
+            gained = idfs[i] * _impacts(tfs, np.asarray(self.doc_lengths)[docs], self.avgdl)
+            merged, inverse = np.unique(np.concatenate([candidates, docs]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([scores, gained]), minlength=len(merged))
+            candidates = merged
+            theta = max(theta, kth(scores))
+            i += 1
+
+        # Non-essential terms: only candidates that can still reach the top-k are scored
+        for j in range(i, len(term_ids)):
+            alive = scores + remaining[j] > theta
+            candidates, scores = candidates[alive], scores[alive]
+            if len(candidates) == 0:
+                break
+            term_id = int(term_ids[j])
+            first, last = int(self.term_blocks[term_id]), int(self.term_blocks[term_id + 1])
+            lasts = np.asarray(self.block_last[first:last])
+            blocks = np.searchsorted(lasts, candidates)
+            inside = blocks < len(lasts)
+            # Block-max: the candidate's block must be able to lift it over the threshold
+            promising = inside.copy()
+            promising[inside] = scores[inside] + idfs[j] * block_max[first + blocks[inside]] + remaining[j + 1] > theta
+            needed = np.unique(blocks[promising])
+            decoded += len(needed)
+            skipped += (last - first) - len(needed)
+            if len(needed):
+                docs, tfs = self._decode(term_id, needed)
+                matched = np.nonzero(promising)[0]
+                positions = np.minimum(np.searchsorted(docs, candidates[matched]), len(docs) - 1)
+                hit = docs[positions] == candidates[matched]
+                matched = matched[hit]
+                scores[matched] += idfs[j] * _impacts(tfs[positions[hit]],
+                                                      np.asarray(self.doc_lengths)[candidates[matched]], self.avgdl)
+            theta = max(theta, kth(scores))
+
+        metrics.inc("plagiarism_bm25_blocks_total", decoded, {'outcome': 'decoded'},
+                    description="Posting blocks of BM25 queries, decoded or skipped by pruning")
+        metrics.inc("plagiarism_bm25_blocks_total", skipped, {'outcome': 'skipped'},
+                    description="Posting blocks of BM25 queries, decoded or skipped by pruning")
+        above = scores > threshold
+        candidates, scores = candidates[above], scores[above]
+        best = np.argsort(-scores, kind="stable")[:k]
+        return candidates[best], scores[best]
+
+
+def query_terms(frequencies: Dict[str, int], document_frequency, docs: int,
+                max_terms: int = 32) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Distinctive terms of a suspect, to query a term index with
+
+    Terms are ranked by (1 + log tf) x IDF; terms absent from the corpus are dropped.
+
+    Args:
+        frequencies: Term frequencies of the suspect
+        document_frequency: Function returning the corpus document frequency of term hashes
+        docs: Documents in the corpus
+        max_terms: Terms kept
+
+    Returns:
+        Tuple of (term hashes, IDFs)
+    """
+    if not frequencies or docs == 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0)
+    terms = list(frequencies)
+    hashes = np.array([term_hash(term) for term in terms], dtype=np.uint64)
+    df = np.asarray(document_frequency(hashes))
+    idfs = bm25_idf(df, docs)
+    weights = np.array([1 + math.log(frequencies[term]) for term in terms]) * idfs
+    weights[df == 0] = -1.0
+    best = [i for i in np.argsort(-weights, kind="stable")[:max_terms] if weights[i] > 0]
+    return hashes[best], idfs[best]
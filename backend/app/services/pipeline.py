@@ -0,0 +1,296 @@
+import copy
+import datetime
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, List, Optional, Union
+
+from app.core.dag import TaskGraph
+from app.core.deadline import deadline_scope
+from app.core.memory import MB, memory_budget
+from app.core.metrics import record_cache, stage
+from app.services.cascade import REPORTED_TOP_N
+from app.utils.exclusion import TextExcluder
+from app.utils.text import tokenization_cache
+
+
+class ResultCache:
+    """
+    Small thread-safe LRU cache of check results keyed by document content
+    hash and request options.
+
+    Args:
+        max_entries: Maximum number of cached results
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            result = self.entries.get(key)
+            if result is not None:
+                self.entries.move_to_end(key)
+        record_cache("result", result is not None)
+        return copy.deepcopy(result) if result is not None else None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = copy.deepcopy(result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+def _options_dict(options) -> Dict[str, Any]:
+    if hasattr(options, "model_dump"):
+        return options.model_dump(mode="json")
+    return json.loads(options.json())
+
+
+class PlagiarismPipeline:
+    """
+    Runs the plagiarism and AI detection check on a document. Shared by the
+    HTTP endpoints and offline tools so they produce identical results.
+
+    Args:
+        pdf_extractor: PDFExtractor instance
+        plagiarism_checker: PlagiarismChecker instance
+        ai_detector: AIDetector instance
+        incremental_checker: Optional IncrementalChecker for requests with a submission_id
+        result_cache_size: Number of results cached by content hash (0 disables caching)
+    """
+
+    def __init__(self, pdf_extractor, plagiarism_checker, ai_detector, incremental_checker=None,
+                 result_cache_size: int = 128):
+        self.pdf_extractor = pdf_extractor
+        self.plagiarism_checker = plagiarism_checker
+        self.ai_detector = ai_detector
+        self.incremental_checker = incremental_checker
+        self.result_cache = ResultCache(result_cache_size)
+
+    def cache_key(self, content_hash: str, options) -> str:
+        """
+        Cache key of a document/options pair and the corpus snapshot being served
+
+        Profiling, scheduling and report metadata do not affect results; a new
+        snapshot does, so results of earlier snapshots are no longer found.
+        """
+        values = _options_dict(options)
+        for name in ('profile', 'pdf_url', 'deadline_ms', 'priority', 'user_id', 'course_id'):
+            values.pop(name, None)
+        snapshot_index = getattr(self.plagiarism_checker, 'snapshot_index', None)
+        snapshot = snapshot_index.current if snapshot_index is not None else None
+        if snapshot is not None:
+            values['snapshot'] = snapshot.version
+        return content_hash + ":" + json.dumps(values, sort_keys=True)
+
+    def check_pdf(self, pdf: Union[bytes, BinaryIO], options, content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Check a PDF document
+
+        Args:
+            pdf: PDF content as bytes or a readable binary file object
+            options: PlagiarismOptions (or PlagiarismRequest)
+            content_hash: SHA-256 of the PDF, used to look up cached results
+
+        Returns:
+            Dictionary with the fields of PlagiarismResponse
+        """
+        # Incremental checks have their own per-lineage store
+        cacheable = content_hash is not None and not options.submission_id
+        if cacheable:
+            # Taken before the check: a snapshot swapped in meanwhile is not the one it used
+            key = self.cache_key(content_hash, options)
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                return cached
+
+        # Extraction and the check share one memory budget and deadline
+        with memory_budget(**self.budget_limits(options)), deadline_scope(budget_ms=options.deadline_ms):
+            # Extract and process PDF into sections
+            sections = self.pdf_extractor.extract_and_process(pdf)
+            result = self.check_sections(sections, options)
+        result['content_hash'] = content_hash
+
+        # Degraded results are not cached; a later request may have the time to complete
+        if cacheable and not result['degraded']:
+            self.result_cache.put(key, result)
+        return result
+
+    def check_sections(self, sections: Dict[str, str], options) -> Dict[str, Any]:
+        """
+        Check already extracted sections
+
+        Runs within the memory budget of the enclosing check (see
+        app/core/memory.py): a document longer than its allowance is checked
+        on its leading part, and the response's 'memory' field lists every
+        input that was cut or skipped. Under a deadline (`options.deadline_ms`,
+        see app/core/deadline.py) stages fall back to cheaper modes as their
+        time runs out; 'degraded' is set and 'deadline' lists the fallbacks.
+        Text matched by the exclusion rules
+        of `options.exclusions` (see app/utils/exclusion.py) is removed first
+        and listed by offset in 'exclusions'.
+
+        Args:
+            sections: Dictionary mapping section names to their content
+            options: PlagiarismOptions (or PlagiarismRequest)
+
+        Returns:
+            Dictionary with the fields of PlagiarismResponse
+        """
+        with memory_budget(**self.budget_limits(options)) as budget, \
+                deadline_scope(budget_ms=options.deadline_ms) as deadline, tokenization_cache():
+            deadline.plan(self.planned_stages(options))
+            result = self._check_sections(sections, options, budget, deadline)
+        result['memory'] = budget.as_dict()
+        result['degraded'] = deadline.degraded
+        result['deadline'] = deadline.as_dict() if deadline.limited else None
+        return result
+
+    def budget_limits(self, options) -> Dict[str, Any]:
+        """Reference fetch limits of a check's memory budget requested in its options"""
+        fetch_max_mb = getattr(options, 'fetch_max_mb', None)
+        return {
+            'max_download_bytes': int(fetch_max_mb * MB) if fetch_max_mb else None,
+            'max_reference_pages': getattr(options, 'fetch_max_pages', None),
+        }
+
+    def planned_stages(self, options) -> List[str]:
+        """Stages of a check with these options, which share its deadline"""
+        stages = ['download', 'extraction', 'scoring', 'ai_detection']
+        if options.check_online_sources:
+            stages += ['search', 'fetch']
+        return stages
+
+    def _check_sections(self, sections: Dict[str, str], options, budget, deadline) -> Dict[str, Any]:
+        # Get total word count
+        total_word_count = len(" ".join(sections.values()).split())
+
+        # Bibliography, quotations, citations, equations and tables are cut out before scoring
+        document_sections = sections
+        sections, exclusions = TextExcluder(options.exclusions).apply(sections)
+
+        # Combine all sections for plagiarism check
+        full_text = budget.truncate(" ".join(sections.values()), "document")
+
+        # Independent stages run as a task graph: AI detection, the plagiarism
+        # check (search, fetch and scoring) and the local index searches overlap
+        graph = TaskGraph()
+        if options.submission_id and self.incremental_checker is not None:
+            # Revision-aware check: only changed sections are recomputed
+            graph.add('incremental', lambda: self.incremental_checker.check(
+                options.submission_id,
+                sections,
+                check_online_sources=options.check_online_sources,
+                num_papers=options.num_papers,
+                thresholds=options.thresholds,
+                fetch_budget=options.fetch_budget,
+                section_aligned=options.section_aligned,
+                ai_early_exit=options.ai_early_exit
+            ))
+        else:
+            if options.check_online_sources:
+                # Check plagiarism against online scholarly sources
+                graph.add('plagiarism', lambda: self.plagiarism_checker.check_plagiarism_with_scholarly_search(
+                    full_text,
+                    num_papers=options.num_papers,
+                    thresholds=options.thresholds,
+                    sections=sections,
+                    fetch_budget=options.fetch_budget,
+                    section_aligned=options.section_aligned
+                ))
+            elif getattr(self.plagiarism_checker, 'snapshot_index', None) is not None:
+                # Check plagiarism against candidates retrieved from the local corpus snapshot
+                graph.add('plagiarism', lambda: self.plagiarism_checker.check_plagiarism_with_local_corpus(
+                    full_text,
+                    thresholds=options.thresholds,
+                    sections=sections,
+                    section_aligned=options.section_aligned
+                ))
+            else:
+                # Use default reference texts (empty in this case - would need to be populated)
+                reference_texts = []
+                graph.add('plagiarism', lambda: self.plagiarism_checker.check_plagiarism(
+                    full_text,
+                    reference_texts,
+                    thresholds=options.thresholds,
+                    suspect_sections=sections if options.section_aligned else None
+                ))
+
+            # Get AI detection results; it only needs the sections
+            graph.add('ai_detection', lambda: self.ai_detector.analyze_sections(sections,
+                                                                               early_exit=options.ai_early_exit))
+
+        # Sentence-level paraphrase coverage against the local index, when configured
+        if getattr(self.plagiarism_checker, 'sentence_index', None) is not None:
+            def paraphrase():
+                if deadline.remaining() <= 0:
+                    deadline.degrade('paraphrase', 'skipped')
+                    return None
+                return self.plagiarism_checker.paraphrase_coverage(
+                    full_text, threshold=(options.thresholds or {}).get('paraphrase')
+                )
+            graph.add('paraphrase', paraphrase)
+
+        # Sharded corpus and snapshot search, when configured
+        if getattr(self.plagiarism_checker, 'sharded_search', None) is not None or \
+                getattr(self.plagiarism_checker, 'snapshot_index', None) is not None:
+            def corpus_search():
+                if deadline.remaining() <= 0:
+                    deadline.degrade('corpus_search', 'skipped')
+                    return None
+                return self.plagiarism_checker.search_corpus(full_text, thresholds=options.thresholds)
+            graph.add('corpus_search', corpus_search)
+
+        outputs = graph.run()
+        revision = None
+        if 'incremental' in outputs:
+            plagiarism_results = outputs['incremental']['plagiarism_results']
+            ai_detection_results = outputs['incremental']['ai_detection_results']
+            revision = outputs['incremental']['revision']
+        else:
+            plagiarism_results = outputs['plagiarism']
+            ai_detection_results = outputs['ai_detection']
+
+        paraphrase_results = outputs.get('paraphrase')
+        corpus_matches, corpus_search = None, None
+        corpus = outputs.get('corpus_search')
+        if corpus is not None:
+            corpus_matches = corpus['fingerprint_matches']
+            if corpus['paraphrase_matches']:
+                paraphrase_results = sorted((paraphrase_results or []) + corpus['paraphrase_matches'],
+                                            key=lambda match: match['coverage'], reverse=True)
+            corpus_search = {key: corpus[key] for key in ('shards', 'failed_shards', 'partial', 'snapshot')}
+
+        with stage("aggregate_results"):
+            # Calculate overall plagiarism score
+            plagiarism_overall_score = 0.0
+            if plagiarism_results:
+                # Average of top 3 scores or all scores if less than 3
+                top_scores = [result['overall_score'] for result in plagiarism_results[:REPORTED_TOP_N]]
+                plagiarism_overall_score = sum(top_scores) / len(top_scores) if top_scores else 0.0
+
+            # Find highest match
+            highest_match = plagiarism_results[0] if plagiarism_results else None
+
+        return {
+            'success': True,
+            'message': "Plagiarism and AI detection completed successfully",
+            'sections': document_sections,
+            'plagiarism_results': plagiarism_results,
+            'ai_detection_results': ai_detection_results,
+            'total_word_count': total_word_count,
+            'plagiarism_overall_score': plagiarism_overall_score,
+            'highest_match': highest_match,
+            'timestamp': datetime.datetime.now().isoformat(),
+            'revision': revision,
+            'paraphrase_results': paraphrase_results,
+            'corpus_matches': corpus_matches,
+            'corpus_search': corpus_search,
+            'exclusions': exclusions
+        }
@@ -1,39 +1,43 @@
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
-from transformers import AutoTokenizer, AutoModel
-import torch
-import nltk
-from nltk.util import ngrams
 import hashlib
 from fuzzywuzzy import fuzz
 import re
 import pandas as pd
 from tqdm import tqdm
-import requests
 import json
 import time
-from bs4 import BeautifulSoup
 import os
-from scholarly import scholarly
-import PyPDF2
-import io
-from serpapi import Client
+import contextvars
+import heapq
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from typing import Dict, List, Optional, Tuple, Any, Union
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Any, Union
+from app.services.scholarly_providers import ProviderManager
+from app.services.query_planner import QueryPlanner
+from app.services.semantic_index import SentenceIndex
+from app.services.sharded_search import ShardedSearch, fingerprint_array
+from app.services.snapshots import SnapshotIndex
+from app.services.dedup import NearDuplicateIndex
+from app.services.embeddings import EmbeddingModel
+from app.services.cascade import EMBEDDING_MAX_TOKENS, SCORE_WEIGHTS, CascadePolicy, CascadeScorer
+from app.services.section_alignment import SectionAligner
+from app.services.reference_fetcher import ReferenceFetcher
+from app.core.dag import prefetch
+from app.core.deadline import current_deadline
+from app.core.memory import current_budget
+from app.core.metrics import timed, stage, record_batch_size
+from app.utils.html_extractor import HTMLExtractor
+from app.utils.text import normalize, split_sentences, term_frequencies, tokenize
+import logging
 
-# Ensure NLTK resources are downloaded
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+logger = logging.getLogger(__name__)
 
 class PlagiarismChecker:
-    def __init__(self, bert_model="bert-base-uncased"):
-        # Initialize BERT model and tokenizer
-        self.tokenizer = AutoTokenizer.from_pretrained(bert_model)
-        self.model = AutoModel.from_pretrained(bert_model)
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model.to(self.device)
+    def __init__(self, bert_model: Optional[str] = None):
+        # Embedding model: a preset name, Hugging Face id or local path (defaults to EMBEDDING_MODEL or BERT)
+        self.embedder = EmbeddingModel.from_env(bert_model)
         
         # Vector database
         self.vector_database = None
@@ -44,30 +48,77 @@ class PlagiarismChecker:
         self.scopus_api_key = os.getenv('SCOPUS_API_KEY')
         self.core_api_key = os.getenv('CORE_API_KEY')
         self.ieee_api_key = os.getenv('IEEE_API_KEY')
+        
+        # Scholarly search providers (configured through SCHOLARLY_PROVIDERS)
+        self.providers = ProviderManager.from_env(
+            serpapi_key=self.serpapi_key,
+            scopus_api_key=self.scopus_api_key,
+            core_api_key=self.core_api_key,
+            ieee_api_key=self.ieee_api_key
+        )
+        self.query_planner = QueryPlanner()
+        
+        # Optional sentence index over a local reference corpus (see semantic_index.py)
+        index_dir = os.getenv('SENTENCE_INDEX_DIR')
+        self.sentence_index = SentenceIndex(index_dir) if index_dir else None
+        if self.sentence_index is not None:
+            self.sentence_index.check_model(self.embedder.name)
+        
+        # Optional sharded corpus served by shard processes (SHARD_ADDRESSES)
+        self.sharded_search = ShardedSearch.from_env()
+        
+        # Optional versioned on-disk corpus index, hot-swapped to new snapshots (SNAPSHOT_DIR)
+        self.snapshot_index = SnapshotIndex.from_env()
+        if self.snapshot_index is not None:
+            self.snapshot_index.check_model(self.embedder.model_id)
+        # Snapshot references retrieved as candidates of an offline check
+        self.local_candidates = max(1, int(os.getenv('LOCAL_CANDIDATES', '10')))
+        
+        # References sharing at least DEDUP_THRESHOLD of their n-grams are scored once (0 disables)
+        self.dedup_threshold = float(os.getenv('DEDUP_THRESHOLD', '0.8'))
+        
+        # Reference downloads in flight at once, and fetched references queued ahead of scoring
+        self.fetch_concurrency = max(1, int(os.getenv('FETCH_CONCURRENCY', '2')))
+        self.fetch_queue_size = max(1, int(os.getenv('FETCH_QUEUE_SIZE', '2')))
+        
+        # Extraction of fetched HTML pages (HTML_EXTRACT_WORKERS > 0 runs it in a process pool)
+        self.html_extractor = HTMLExtractor()
+        
+        # Streaming, size-capped and conditional download of references
+        self.fetcher = ReferenceFetcher(self.html_extractor)
+        
+        # Cheap lexical stages first, BERT only where it can change the outcome
+        self.cascade = CascadeScorer(self, CascadePolicy.from_env(self.embedder.semantic_ceiling))
+        
+        # Section-aligned comparison of sectioned suspects and references
+        self.section_aligner = SectionAligner(self)
     
     def preprocess_text(self, text: str) -> str:
         """Basic text preprocessing"""
-        # Convert to lowercase, remove extra whitespace
-        text = re.sub(r'\s+', ' ', text.lower().strip())
-        return text
+        # Fix Unicode artifacts, convert to lowercase, remove extra whitespace
+        return normalize(text)
     
-    def get_bert_embeddings(self, text: str, max_length: int = 510) -> np.ndarray:
-        """Generate BERT embeddings for a piece of text"""
-        # Tokenize and prepare for BERT
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, 
-                                max_length=max_length, padding=True).to(self.device)
-        
-        # Get BERT embeddings with attention mask
-        with torch.no_grad():
-            outputs = self.model(**inputs, output_hidden_states=True, return_dict=True)
-        
-        # Get the last hidden state
-        last_hidden_state = outputs.hidden_states[-1]
-        
-        # Use the [CLS] token embedding (first token) as the document embedding
-        embeddings = last_hidden_state[:, 0, :].cpu().numpy()
-        return embeddings
+    @timed("embeddings")
+    def get_bert_embeddings(self, text: str, max_length: int = EMBEDDING_MAX_TOKENS) -> np.ndarray:
+        """Document embedding of a text with the configured model ([CLS] of BERT by default)"""
+        return self.embedder.embed_document(text, max_length)
+    
+    @timed("sentence_embeddings")
+    def get_sentence_embeddings(self, texts: List[str], batch_size: int = 32, max_length: int = 128) -> np.ndarray:
+        """
+        Generate mean-pooled, L2-normalized embeddings for short texts (sentences or paragraphs)
+        
+        Args:
+            texts: Texts to embed
+            batch_size: Number of texts per forward pass
+            max_length: Maximum number of tokens per text
+            
+        Returns:
+            Float32 array of shape (len(texts), hidden_size)
+        """
+        return self.embedder.embed_sentences(texts, batch_size, max_length)
     
+    @timed("semantic_similarity")
     def semantic_similarity(self, text1: str, text2: str) -> float:
         """Calculate semantic similarity using BERT and cosine similarity"""
         # Get embeddings
@@ -80,9 +131,8 @@ class PlagiarismChecker:
     
     def generate_ngrams(self, text: str, n: int) -> List[Tuple[str, ...]]:
         """Generate n-grams from text"""
-        tokens = nltk.word_tokenize(text.lower())
-        n_grams = list(ngrams(tokens, n))
-        return n_grams
+        # Tokenizations are cached, so repeated comparisons of the same text share one
+        return tokenize(text.lower()).ngrams(n)
     
     def hash_ngrams(self, text: str, n: int = 5) -> List[str]:
         """Create hashed n-grams for document fingerprinting"""
@@ -97,6 +147,7 @@ class PlagiarismChecker:
             
         return hashed_ngrams
     
+    @timed("ngram_similarity")
     def ngram_similarity(self, text1: str, text2: str, n: int = 5) -> float:
         """Calculate similarity based on n-gram hashing"""
         hashes1 = set(self.hash_ngrams(text1, n))
@@ -111,11 +162,13 @@ class PlagiarismChecker:
         
         return intersection / union
     
+    @timed("fuzzy_similarity")
     def fuzzy_match_similarity(self, text1: str, text2: str) -> float:
         """Calculate fuzzy matching similarity"""
         # Using token sort ratio to handle word order differences
         return fuzz.token_sort_ratio(text1, text2) / 100
     
+    @timed("vector_database_build")
     def create_vector_database(self, documents: List[str], document_ids: Optional[List[str]] = None) -> pd.DataFrame:
         """Create a vector database from a list of documents"""
         # Create DataFrame
@@ -128,6 +181,7 @@ class PlagiarismChecker:
         })
         
         # Generate vectors for all documents
+        record_batch_size("vector_database", len(documents))
         vectors = []
         for doc in tqdm(documents, desc="Creating vectors"):
             # Preprocess text
@@ -143,9 +197,16 @@ class PlagiarismChecker:
         self.vector_database = df
         return df
     
+    @timed("vector_query")
     def query_vector_database(self, query_text: str, top_n: int = 5) -> pd.DataFrame:
-        """Query the vector database for similar documents"""
-        if self.vector_database is None:
+        """
+        Query the vector database for similar documents
+        
+        Without an in-process vector database, the current corpus snapshot
+        (SNAPSHOT_DIR) is queried instead.
+        """
+        snapshot = self.snapshot_index.current if self.snapshot_index is not None else None
+        if self.vector_database is None and snapshot is None:
             raise ValueError("Vector database not created. Call create_vector_database first.")
         
         # Process query text
@@ -153,6 +214,14 @@ class PlagiarismChecker:
         query_vector = self.get_bert_embeddings(processed_query)
         query_vector = query_vector.reshape(1, -1)
         
+        if self.vector_database is None:
+            matches = snapshot.search_embeddings(query_vector, top_n)
+            return pd.DataFrame({
+                'document': [snapshot.text(match['reference_key']) for match in matches],
+                'document_id': [match['reference_key'] for match in matches],
+                'similarity': [match['similarity'] for match in matches]
+            }, columns=["document", "document_id", "similarity"])
+        
         # Calculate similarity with all documents
         self.vector_database["similarity"] = self.vector_database["vector"].apply(
             lambda x: cosine_similarity(query_vector, x)[0][0]
@@ -163,22 +232,232 @@ class PlagiarismChecker:
         
         return results[["document", "document_id", "similarity"]]
     
-    def check_plagiarism(self, suspect_text: str, reference_texts: List[str], 
+    def default_thresholds(self) -> Dict[str, float]:
+        """Default decision thresholds for each similarity method"""
+        return {
+            'semantic': self.embedder.semantic_threshold,  # Threshold for semantic similarity (model-specific)
+            'ngram': 0.4,      # Threshold for n-gram similarity
+            'fuzzy': 0.7,      # Threshold for fuzzy matching
+            'paraphrase': 0.9  # Sentence similarity counted as a paraphrase hit
+        }
+    
+    @timed("extract_features")
+    def extract_features(self, processed_text: str) -> Dict[str, Any]:
+        """
+        Compute the reusable comparison features of a preprocessed text
+        
+        Args:
+            processed_text: Text returned by preprocess_text
+            
+        Returns:
+            Dictionary with 'ngram_hashes' (set of n-gram fingerprints) and
+            'embedding' (BERT document embedding)
+        """
+        return {
+            'ngram_hashes': set(self.hash_ngrams(processed_text)),
+            'embedding': self.get_bert_embeddings(processed_text)
+        }
+    
+    def score_features(self, processed_suspect: str, suspect_features: Dict[str, Any],
+                       processed_ref: str, ref_features: Dict[str, Any],
+                       thresholds: Dict[str, float], fuzzy_sim: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Score one suspect/reference pair from precomputed features
+        
+        Args:
+            processed_suspect: Preprocessed suspect text (used for fuzzy matching)
+            suspect_features: Features of the suspect from extract_features
+            processed_ref: Preprocessed reference text (used for fuzzy matching)
+            ref_features: Features of the reference from extract_features
+            thresholds: Dictionary with thresholds for each similarity method
+            fuzzy_sim: Precomputed fuzzy similarity (e.g. section-aligned); whole-text fuzzy matching otherwise
+            
+        Returns:
+            Result dictionary without 'reference_id' and 'reference_text'
+        """
+        # Calculate similarities using different methods
+        with stage("semantic_similarity"):
+            sem_sim = cosine_similarity(suspect_features['embedding'], ref_features['embedding'])[0][0]
+        with stage("ngram_similarity"):
+            hashes1, hashes2 = suspect_features['ngram_hashes'], ref_features['ngram_hashes']
+            union = len(hashes1 | hashes2)
+            ngram_sim = len(hashes1 & hashes2) / union if union else 0
+        if fuzzy_sim is None:
+            fuzzy_sim = self.fuzzy_match_similarity(processed_suspect, processed_ref)
+        
+        # Determine if it's plagiarized based on thresholds
+        is_plagiarized = (
+            sem_sim >= thresholds['semantic'] or
+            ngram_sim >= thresholds['ngram'] or
+            fuzzy_sim >= thresholds['fuzzy']
+        )
+        
+        # Calculate an overall plagiarism score (weighted average)
+        overall_score = (
+            SCORE_WEIGHTS['semantic'] * sem_sim +    # BERT semantic similarity (higher weight)
+            SCORE_WEIGHTS['ngram'] * ngram_sim +     # N-gram similarity
+            SCORE_WEIGHTS['fuzzy'] * fuzzy_sim       # Fuzzy matching
+        )
+        
+        return {
+            'is_plagiarized': bool(is_plagiarized),
+            'overall_score': float(overall_score),
+            'semantic_similarity': float(sem_sim),
+            'ngram_similarity': float(ngram_sim),
+            'fuzzy_similarity': float(fuzzy_sim),
+            'stages': ['ngram', 'fuzzy', 'semantic']
+        }
+    
+    @timed("paraphrase_coverage")
+    def paraphrase_coverage(self, suspect_text: str, threshold: Optional[float] = None,
+                            k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Per-reference paraphrase coverage of a suspect text against the sentence index
+        
+        Args:
+            suspect_text: Text to check
+            threshold: Minimum sentence similarity counted as a hit
+            k: Number of nearest indexed sentences retrieved per suspect sentence
+            
+        Returns:
+            List of coverage results sorted by coverage (empty when no index is configured)
+        """
+        if self.sentence_index is None or len(self.sentence_index) == 0:
+            return []
+        if threshold is None:
+            threshold = self.default_thresholds()['paraphrase']
+        
+        sentences = split_sentences(suspect_text)
+        if not sentences:
+            return []
+        embeddings = self.get_sentence_embeddings(sentences)
+        return self.sentence_index.coverage(embeddings, threshold=threshold, k=k, query_sentences=sentences)
+    
+    @timed("corpus_search")
+    def search_corpus(self, suspect_text: str, k: int = 10,
+                      thresholds: Optional[Dict[str, float]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Search the sharded reference corpus by n-gram fingerprints and, when the
+        shards have sentence indexes, by sentence embeddings; the current corpus
+        snapshot is searched by fingerprints too
+        
+        Args:
+            suspect_text: Text to check
+            k: Number of references returned per result list
+            thresholds: Dictionary with thresholds for each similarity method
+            
+        Returns:
+            Result of ShardedSearch.search with the snapshot's matches merged in
+            and its version in 'snapshot', or None when neither shards nor a
+            snapshot are configured
+        """
+        snapshot = self.snapshot_index.current if self.snapshot_index is not None else None
+        if self.sharded_search is None and snapshot is None:
+            return None
+        threshold = (thresholds or {}).get('paraphrase', self.default_thresholds()['paraphrase'])
+        
+        fingerprints = fingerprint_array(self.hash_ngrams(self.preprocess_text(suspect_text)))
+        result = {'fingerprint_matches': [], 'paraphrase_matches': [], 'shards': 0, 'failed_shards': [],
+                  'partial': False}
+        if self.sharded_search is not None:
+            sentences, embeddings = None, None
+            if self.sharded_search.sentences:
+                sentences = split_sentences(suspect_text)
+                embeddings = self.get_sentence_embeddings(sentences) if sentences else None
+            result = self.sharded_search.search(fingerprints=fingerprints, embeddings=embeddings, k=k,
+                                                threshold=threshold, query_sentences=sentences,
+                                                model=self.embedder.name)
+        result['snapshot'] = None
+        if snapshot is not None:
+            # One snapshot for the whole search, even if a newer one is swapped in meanwhile
+            result['fingerprint_matches'] = heapq.nlargest(
+                k, result['fingerprint_matches'] + snapshot.search_fingerprints(fingerprints, k),
+                key=lambda match: match['ngram_similarity']
+            )
+            result['snapshot'] = snapshot.version
+        return result
+    
+    @timed("check_plagiarism")
+    def check_plagiarism(self, suspect_text: str, reference_texts: Iterable[str], 
                          thresholds: Optional[Dict[str, float]] = None, 
-                         use_database: bool = False) -> List[Dict[str, Any]]:
-        """Check plagiarism using multiple techniques"""
+                         use_database: bool = False,
+                         suspect_sections: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """
+        Check plagiarism using multiple techniques
+        
+        References are processed one at a time and reduced to their scores, so
+        `reference_texts` can be a generator that fetches them lazily. Each is
+        cut to the memory budget's reference allowance, and results keep only
+        an excerpt of it in 'reference_text'. Near-duplicates of an earlier
+        reference (preprints, published versions, mirrors) are not scored
+        again; they are listed in the 'aliases' of the first copy.
+        
+        With `suspect_sections`, references are split into sections too and
+        fuzzy similarity is computed section by section (see
+        section_alignment.py); results list the compared section pairs in
+        'section_matches'. Unsectioned texts are compared as a whole.
+        
+        With `use_database`, the suspect is compared with the nearest documents
+        of the in-process vector database, which is built from
+        `reference_texts` if it does not exist yet. Only when no references
+        are passed and a snapshot is published (SNAPSHOT_DIR) is the snapshot
+        searched instead; passed references are never ignored in favour of it.
+        """
         if thresholds is None:
-            thresholds = {
-                'semantic': 0.85,  # Threshold for BERT semantic similarity
-                'ngram': 0.4,      # Threshold for n-gram similarity
-                'fuzzy': 0.7       # Threshold for fuzzy matching
-            }
+            thresholds = self.default_thresholds()
+        budget = current_budget()
         
         # Preprocess suspect text
         processed_suspect = self.preprocess_text(suspect_text)
         
-        if use_database and (self.vector_database is None):
-            # Create vector database if it doesn't exist
+        # Id, excerpt, length and aliases of each scored reference, filled in as they are consumed
+        scored: List[Dict[str, Any]] = []
+        duplicates = NearDuplicateIndex(self.dedup_threshold) if self.dedup_threshold > 0 else None
+        
+        # Prepared sections of the suspect and of the reference being scored
+        aligned_suspect = None
+        if suspect_sections:
+            aligned_suspect = self.section_aligner.prepare(self.section_aligner.select(suspect_sections)) or None
+        reference_sections: Dict[int, Dict[str, Dict[str, Any]]] = {}
+        
+        def fuzzy_similarity(position: int, processed_ref: str) -> float:
+            """Fuzzy similarity of the scored reference at `position`, section-aligned when both are sectioned"""
+            sections = reference_sections.pop(position, None)
+            if not sections:
+                return self.fuzzy_match_similarity(processed_suspect, processed_ref)
+            fuzzy_sim, matches = self.section_aligner.compare(aligned_suspect, sections)
+            scored[position]['section_matches'] = matches
+            return fuzzy_sim
+        
+        def processed_references() -> Iterator[str]:
+            for i, ref_text in enumerate(reference_texts):
+                excerpt, length = budget.excerpt(ref_text), len(ref_text)
+                ref_text = budget.truncate(ref_text, f"reference {i}", budget.max_reference_chars)
+                processed_ref = self.preprocess_text(ref_text)
+                sections = self.section_aligner.split(ref_text) if aligned_suspect else None
+                del ref_text
+                if duplicates is not None:
+                    with stage("deduplication"):
+                        duplicate = duplicates.find_or_add(len(scored),
+                                                           fingerprint_array(self.hash_ngrams(processed_ref)))
+                    if duplicate is not None:
+                        canonical, similarity = duplicate
+                        scored[canonical]['aliases'].append({'reference_id': i, 'similarity': float(similarity)})
+                        continue
+                if sections:
+                    reference_sections[len(scored)] = self.section_aligner.prepare(sections)
+                scored.append({'reference_id': i, 'reference_text': excerpt, 'reference_length': length,
+                               'aliases': []})
+                yield processed_ref
+        
+        if use_database:
+            # The vector database holds every reference
+            reference_texts = list(reference_texts)
+        
+        snapshot = self.snapshot_index.current if self.snapshot_index is not None else None
+        if use_database and self.vector_database is None and (reference_texts or snapshot is None):
+            # Create vector database if it doesn't exist; only a check without references of its
+            # own queries the published snapshot instead
             self.create_vector_database(reference_texts)
         
         results = []
@@ -209,9 +488,9 @@ class PlagiarismChecker:
                 
                 # Calculate an overall plagiarism score (weighted average)
                 overall_score = (
-                    0.5 * semantic_sim +    # BERT semantic similarity (higher weight)
-                    0.3 * ngram_sim +       # N-gram similarity
-                    0.2 * fuzzy_sim         # Fuzzy matching
+                    SCORE_WEIGHTS['semantic'] * semantic_sim +    # BERT semantic similarity (higher weight)
+                    SCORE_WEIGHTS['ngram'] * ngram_sim +          # N-gram similarity
+                    SCORE_WEIGHTS['fuzzy'] * fuzzy_sim            # Fuzzy matching
                 )
                 
                 results.append({
@@ -221,42 +500,30 @@ class PlagiarismChecker:
                     'semantic_similarity': float(semantic_sim),
                     'ngram_similarity': float(ngram_sim),
                     'fuzzy_similarity': float(fuzzy_sim),
-                    'reference_text': ref_text
+                    'reference_text': budget.excerpt(ref_text),
+                    'reference_length': len(ref_text)
                 })
+        elif self.cascade.policy.enabled:
+            # Cascade: lexical similarities for every reference, BERT only where needed
+            cascade_results, summary = self.cascade.score(processed_suspect, processed_references(), thresholds,
+                                                          fuzzy=fuzzy_similarity)
+            logger.info(f"Cascade computed semantic similarity for {summary['semantic_computed']} "
+                        f"of {summary['references']} references")
+            for result, reference in zip(cascade_results, scored):
+                result.update(reference)
+                results.append(result)
         else:
-            # Standard approach comparing with each reference text
-            for i, ref_text in enumerate(reference_texts):
-                # Preprocess text
-                processed_ref = self.preprocess_text(ref_text)
-                
-                # Calculate similarities using different methods
-                sem_sim = self.semantic_similarity(processed_suspect, processed_ref)
-                ngram_sim = self.ngram_similarity(processed_suspect, processed_ref)
-                fuzzy_sim = self.fuzzy_match_similarity(processed_suspect, processed_ref)
-                
-                # Determine if it's plagiarized based on thresholds
-                is_plagiarized = (
-                    sem_sim >= thresholds['semantic'] or
-                    ngram_sim >= thresholds['ngram'] or
-                    fuzzy_sim >= thresholds['fuzzy']
-                )
-                
-                # Calculate an overall plagiarism score (weighted average)
-                overall_score = (
-                    0.5 * sem_sim +    # BERT semantic similarity (higher weight)
-                    0.3 * ngram_sim +  # N-gram similarity
-                    0.2 * fuzzy_sim    # Fuzzy matching
-                )
+            # Standard approach comparing with each reference text; the suspect's
+            # features are computed once and reused for every reference
+            suspect_features = self.extract_features(processed_suspect)
+            for processed_ref in processed_references():
+                ref_features = self.extract_features(processed_ref)
                 
-                results.append({
-                    'reference_id': i,
-                    'is_plagiarized': is_plagiarized,
-                    'overall_score': float(overall_score),
-                    'semantic_similarity': float(sem_sim),
-                    'ngram_similarity': float(ngram_sim),
-                    'fuzzy_similarity': float(fuzzy_sim),
-                    'reference_text': ref_text
-                })
+                result = self.score_features(processed_suspect, suspect_features,
+                                             processed_ref, ref_features, thresholds,
+                                             fuzzy_sim=fuzzy_similarity(len(scored) - 1, processed_ref))
+                result.update(scored[-1])
+                results.append(result)
         
         # Sort results by overall plagiarism score (descending)
         results.sort(key=lambda x: x['overall_score'], reverse=True)
@@ -266,32 +533,14 @@ class PlagiarismChecker:
     # SCHOLARLY DATABASE SEARCH METHODS
     
     def extract_keywords(self, text: str, num_keywords: int = 5) -> List[str]:
-        """Extract important keywords from text using NLTK"""
-        from nltk.corpus import stopwords
-        from nltk.tokenize import word_tokenize
-        from collections import Counter
-        
-        # Download stopwords if not already
-        try:
-            nltk.data.find('corpora/stopwords')
-        except LookupError:
-            nltk.download('stopwords')
-        
-        # Tokenize and filter out stopwords
-        stop_words = set(stopwords.words('english'))
-        word_tokens = word_tokenize(text.lower())
-        filtered_words = [w for w in word_tokens if w.isalnum() and w not in stop_words]
-        
-        # Count word frequency
-        word_freq = Counter(filtered_words)
-        
-        # Get most common words
-        keywords = [word for word, freq in word_freq.most_common(num_keywords)]
+        """Extract important keywords from text"""
+        # Most frequent content words (stopwords and numbers filtered out)
+        keywords = [word for word, freq in term_frequencies(text).most_common(num_keywords)]
         return keywords
     
     def search_google_scholar(self, query: str, num_results: int = 5) -> List[Dict[str, str]]:
         """
-        Search Google Scholar using scholarly or SerpAPI
+        Search Google Scholar using SerpAPI, falling back to scholarly
         
         Args:
             query: Search query
@@ -300,69 +549,7 @@ class PlagiarismChecker:
         Returns:
             List of dictionaries with paper details
         """
-        results = []
-        
-        # Try using SerpAPI if API key is available (more reliable)
-        if self.serpapi_key:
-            try:
-                params = {
-                    "api_key": self.serpapi_key,
-                    "engine": "google_scholar",
-                    "q": query,
-                    "num": num_results
-                }
-                
-                # Create Client instance and then call search
-                client = Client(api_key=self.serpapi_key)
-                response = client.search(params)
-                
-                if "organic_results" in response:
-                    for paper in response["organic_results"][:num_results]:
-                        paper_info = {
-                            'title': paper.get('title', 'Unknown'),
-                            'link': paper.get('link', ''),
-                            'snippet': paper.get('snippet', ''),
-                            'publication_info': paper.get('publication_info', {}).get('summary', ''),
-                            'source': 'Google Scholar (SerpAPI)'
-                        }
-                        results.append(paper_info)
-                
-                return results
-            except Exception as e:
-                print(f"SerpAPI search failed: {str(e)}")
-                # Fall back to scholarly if SerpAPI fails
-        
-        # Fall back to scholarly (less reliable but free)
-        try:
-            search_query = scholarly.search_pubs(query)
-            
-            for i in range(num_results):
-                try:
-                    publication = next(search_query)
-                    
-                    # Extract available information
-                    paper_info = {
-                        'title': publication.get('bib', {}).get('title', 'Unknown'),
-                        'abstract': publication.get('bib', {}).get('abstract', ''),
-                        'pub_year': publication.get('bib', {}).get('pub_year', ''),
-                        'author': publication.get('bib', {}).get('author', 'Unknown'),
-                        'venue': publication.get('bib', {}).get('venue', ''),
-                        'link': publication.get('pub_url', ''),
-                        'citations': publication.get('num_citations', 0),
-                        'source': 'Google Scholar (scholarly)'
-                    }
-                    
-                    results.append(paper_info)
-                except StopIteration:
-                    break
-                except Exception as e:
-                    print(f"Error retrieving publication: {str(e)}")
-                    continue
-                
-            return results
-        except Exception as e:
-            print(f"Scholarly search failed: {str(e)}")
-            return []
+        return self.providers.search('google_scholar', query, num_results)
     
     def search_scopus(self, query: str, num_results: int = 5) -> List[Dict[str, str]]:
         """
@@ -375,56 +562,7 @@ class PlagiarismChecker:
         Returns:
             List of dictionaries with paper details
         """
-        if not self.scopus_api_key:
-            print("Scopus API key not found in .env file. Set SCOPUS_API_KEY variable.")
-            return []
-        
-        results = []
-        
-        try:
-            # Format query for Scopus API
-            formatted_query = query.replace(' ', '+')
-            
-            # Scopus API endpoint for search
-            url = f"https://api.elsevier.com/content/search/scopus"
-            
-            # Headers with API key
-            headers = {
-                "X-ELS-APIKey": self.scopus_api_key,
-                "Accept": "application/json"
-            }
-            
-            # Parameters for the search
-            params = {
-                "query": formatted_query,
-                "count": num_results,
-                "view": "COMPLETE"
-            }
-            
-            # Send request
-            response = requests.get(url, headers=headers, params=params)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if "search-results" in data and "entry" in data["search-results"]:
-                    for paper in data["search-results"]["entry"]:
-                        paper_info = {
-                            'title': paper.get('dc:title', 'Unknown'),
-                            'abstract': paper.get('dc:description', ''),
-                            'author': paper.get('dc:creator', 'Unknown'),
-                            'publication_year': paper.get('prism:coverDate', '')[:4] if 'prism:coverDate' in paper else '',
-                            'link': paper.get('prism:url', ''),
-                            'source': 'Scopus API'
-                        }
-                        results.append(paper_info)
-            else:
-                print(f"Scopus API error: {response.status_code}, {response.text}")
-                
-            return results
-        except Exception as e:
-            print(f"Scopus search failed: {str(e)}")
-            return []
+        return self.providers.search('scopus', query, num_results)
     
     def search_core(self, query: str, num_results: int = 5) -> List[Dict[str, str]]:
         """
@@ -437,57 +575,7 @@ class PlagiarismChecker:
         Returns:
             List of dictionaries with paper details
         """
-        if not self.core_api_key:
-            print("CORE API key not found in .env file. Set CORE_API_KEY variable.")
-            return []
-        
-        results = []
-        
-        try:
-            # CORE API endpoint
-            url = "https://api.core.ac.uk/v3/search/works"
-            
-            # Headers with API key
-            headers = {
-                "Authorization": f"Bearer {self.core_api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # Request body
-            data = {
-                "q": query,
-                "limit": num_results,
-                "scroll": True
-            }
-            
-            # Send request
-            response = requests.post(url, headers=headers, json=data)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if "results" in data:
-                    for paper in data["results"]:
-                        authors = []
-                        if "authors" in paper and paper["authors"]:
-                            authors = [author.get("name", "") for author in paper["authors"] if "name" in author]
-                        
-                        paper_info = {
-                            'title': paper.get('title', 'Unknown'),
-                            'abstract': paper.get('abstract', ''),
-                            'author': ", ".join(authors) if authors else 'Unknown',
-                            'publication_year': str(paper.get('yearPublished', '')),
-                            'link': paper.get('downloadUrl', '') or paper.get('doi', ''),
-                            'source': 'CORE API'
-                        }
-                        results.append(paper_info)
-            else:
-                print(f"CORE API error: {response.status_code}, {response.text}")
-                
-            return results
-        except Exception as e:
-            print(f"CORE search failed: {str(e)}")
-            return []
+        return self.providers.search('core', query, num_results)
     
     def search_ieee(self, query: str, num_results: int = 5) -> List[Dict[str, str]]:
         """
@@ -500,182 +588,159 @@ class PlagiarismChecker:
         Returns:
             List of dictionaries with paper details
         """
-        if not self.ieee_api_key:
-            print("IEEE API key not found in .env file. Set IEEE_API_KEY variable.")
-            return []
-        
-        results = []
-        
-        try:
-            # IEEE API endpoint
-            url = "https://ieeexploreapi.ieee.org/api/v1/search/articles"
-            
-            # Parameters for the search
-            params = {
-                "apikey": self.ieee_api_key,
-                "format": "json",
-                "max_records": num_results,
-                "querytext": query,
-                "abstract": True
-            }
-            
-            # Send request
-            response = requests.get(url, params=params)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if "articles" in data:
-                    for paper in data["articles"]:
-                        paper_info = {
-                            'title': paper.get('title', 'Unknown'),
-                            'abstract': paper.get('abstract', ''),
-                            'author': paper.get('authors', {}).get('authors', [{}])[0].get('full_name', 'Unknown') 
-                                      if 'authors' in paper and 'authors' in paper['authors'] and paper['authors']['authors'] else 'Unknown',
-                            'publication_year': paper.get('publication_year', ''),
-                            'link': f"https://doi.org/{paper.get('doi', '')}" if 'doi' in paper else '',
-                            'source': 'IEEE Xplore API'
-                        }
-                        results.append(paper_info)
-            else:
-                print(f"IEEE API error: {response.status_code}, {response.text}")
-                
-            return results
-        except Exception as e:
-            print(f"IEEE search failed: {str(e)}")
-            return []
+        return self.providers.search('ieee', query, num_results)
     
-    def fetch_paper_content(self, url: str) -> str:
+    @timed("fetch_reference")
+    def fetch_paper_content(self, url: str, timeout: float = 10) -> str:
         """
         Attempt to fetch and extract content from a paper URL
         
+        The response is streamed and abandoned as soon as its headers or
+        first kilobyte show it is not text or exceeds the memory budget's
+        download allowance; text extraction stops at the reference allowance
+        and the budget's page limit (see reference_fetcher.py).
+        
         Args:
             url: URL to the paper or abstract page
+            timeout: Seconds to wait for the server
             
         Returns:
             String with the extracted content
         """
-        if not url:
-            return ""
-        
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=10)
-            
-            if response.status_code != 200:
-                return ""
-            
-            # Check if it's a PDF
-            if url.lower().endswith('.pdf') or 'application/pdf' in response.headers.get('Content-Type', ''):
-                try:
-                    pdf_reader = PyPDF2.PdfReader(io.BytesIO(response.content))
-                    text = ""
-                    for page_num in range(len(pdf_reader.pages)):
-                        text += pdf_reader.pages[page_num].extract_text()
-                    return text
-                except Exception as e:
-                    print(f"PDF extraction error: {str(e)}")
-                    return ""
-            
-            # Otherwise, try to extract text from HTML
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style", "nav", "footer", "header"]):
-                script.extract()
-            
-            # Look for common paper content containers
-            content = ""
-            
-            # Check for abstract sections
-            abstract_sections = soup.find_all(['div', 'section', 'p'], 
-                                              class_=lambda c: c and any(term in c.lower() for term in 
-                                                                       ['abstract', 'summary', 'paper-content']))
-            
-            if abstract_sections:
-                for section in abstract_sections:
-                    content += section.get_text(strip=True) + "\n\n"
-            else:
-                # Fallback to main content
-                main_content = soup.find('main') or soup.find('article') or soup.find('body')
-                if main_content:
-                    paragraphs = main_content.find_all('p')
-                    for p in paragraphs:
-                        content += p.get_text(strip=True) + "\n\n"
-            
-            return content.strip()
+            return self.fetcher.fetch(url, timeout)
         except Exception as e:
-            print(f"Error fetching paper content: {str(e)}")
+            logger.warning(f"Error fetching paper content: {str(e)}")
             return ""
     
-    def search_scholarly_databases(self, suspect_text: str, num_papers: int = 5) -> Tuple[List[str], List[Dict[str, str]]]:
+    @timed("scholarly_search")
+    def search_scholarly_databases(self, suspect_text: str, num_papers: int = 5,
+                                   sections: Optional[Dict[str, str]] = None,
+                                   fetch_budget: Optional[int] = None) -> Tuple[List[str], List[Dict[str, str]]]:
         """
         Search scholarly databases for similar papers to the suspect text
         
         Args:
             suspect_text: Text to check for plagiarism
-            num_papers: Number of papers to retrieve from each source
+            num_papers: Number of papers to retrieve from each source per query
+            sections: Optional sections of the suspect paper used to plan queries
+            fetch_budget: Maximum number of full-text fetches (defaults to num_papers * 2)
             
         Returns:
             List of retrieved papers with their content
         """
-        # Extract keywords from the suspect text
-        keywords = self.extract_keywords(suspect_text, num_keywords=7)
-        query = " ".join(keywords)
-        
-        all_papers = []
         paper_contents = []
         paper_sources = []
+        for content, source in self.iter_scholarly_references(suspect_text, num_papers, sections, fetch_budget):
+            paper_contents.append(content)
+            paper_sources.append(source)
+        return paper_contents, paper_sources
+    
+    def iter_scholarly_references(self, suspect_text: str, num_papers: int = 5,
+                                  sections: Optional[Dict[str, str]] = None,
+                                  fetch_budget: Optional[int] = None) -> Iterator[Tuple[str, Dict[str, str]]]:
+        """
+        Search scholarly databases and fetch the best candidates one at a time
+        
+        Several targeted queries are built from distinctive passages, hits are
+        deduplicated across queries and providers by DOI/title, and only the
+        candidates whose snippets best match the suspect text are fetched in full.
+        Up to `fetch_concurrency` papers are downloaded at once, ahead of the
+        consumer, and yielded in ranking order, so only a few full texts are
+        held at a time. Under a request deadline,
+        searches are cut short when the search stage runs out of time, and
+        once the fetch stage does, the remaining candidates are compared on
+        their abstract or snippet instead of their full text.
         
-        print(f"Searching for papers using keywords: {query}")
-        
-        # Search Google Scholar
-        scholar_results = self.search_google_scholar(query, num_results=num_papers)
-        all_papers.extend(scholar_results)
-        
-        # Search Scopus
-        scopus_results = self.search_scopus(query, num_results=num_papers)
-        all_papers.extend(scopus_results)
-        
-        # Search CORE
-        core_results = self.search_core(query, num_results=num_papers)
-        all_papers.extend(core_results)
-        
-        # Search IEEE
-        ieee_results = self.search_ieee(query, num_results=num_papers)
-        all_papers.extend(ieee_results)
+        Args:
+            suspect_text: Text to check for plagiarism
+            num_papers: Number of papers to retrieve from each source per query
+            sections: Optional sections of the suspect paper used to plan queries
+            fetch_budget: Maximum number of full-text fetches (defaults to num_papers * 2)
+            
+        Yields:
+            Tuples of (paper content, paper source information)
+        """
+        deadline = current_deadline()
+        deadline.begin("search")
+        with stage("query_planning"):
+            queries = self.query_planner.plan_queries(suspect_text, sections)
+        if not queries:
+            # Fall back to the most frequent keywords of the whole text
+            queries = [" ".join(self.extract_keywords(suspect_text, num_keywords=7))]
         
-        print(f"Found {len(all_papers)} papers. Fetching content...")
+        all_papers = []
         
-        # Fetch content for each paper
-        for paper in tqdm(all_papers, desc="Fetching paper content"):
-            # Try to get content from URL
-            content = self.fetch_paper_content(paper.get('link', ''))
-            
-            # If no content from URL, use abstract or snippet if available
-            if not content:
-                content = paper.get('abstract', '') or paper.get('snippet', '')
-            
-            # Skip papers with insufficient content
-            if len(content) < 100:
-                continue
+        # Search every configured provider concurrently (rate limited, with
+        # timeouts, retries and circuit breakers)
+        with stage("provider_search"):
+            for i, query in enumerate(queries):
+                if i and deadline.left("search") <= 0:
+                    deadline.degrade("search", "queries_skipped", queries=len(queries) - i)
+                    break
+                logger.info(f"Searching for papers using query: {query}")
+                all_papers.extend(self.providers.search_all(query, num_results=num_papers))
+        
+        with stage("candidate_ranking"):
+            candidates = self.query_planner.deduplicate(all_papers)
+            candidates = self.query_planner.rank_candidates(suspect_text, candidates)
+        if fetch_budget is None:
+            fetch_budget = num_papers * 2
+        selected = self.query_planner.select_for_fetch(candidates, fetch_budget)
+        
+        logger.info(f"Found {len(all_papers)} hits ({len(candidates)} unique). Fetching {len(selected)} candidates...")
+        
+        # Fetch content for each selected paper, a sliding window of downloads at a time
+        retrieved = 0
+        abstract_only = 0
+        deadline.begin("fetch")
+        
+        def fetch(paper: Dict[str, Any]) -> str:
+            return self.fetch_paper_content(paper.get('link', ''), timeout=deadline.timeout("fetch", 10))
+        
+        papers = iter(selected)
+        window = deque()
+        with ThreadPoolExecutor(max_workers=self.fetch_concurrency, thread_name_prefix="reference-fetch") as executor:
+            while True:
+                for paper in papers:
+                    # Try to get content from URL, while the fetch stage has time left
+                    if deadline.left("fetch") > 0:
+                        window.append((paper, executor.submit(contextvars.copy_context().run, fetch, paper)))
+                    else:
+                        window.append((paper, None))
+                        abstract_only += 1
+                    if len(window) >= self.fetch_concurrency:
+                        break
+                if not window:
+                    break
+                paper, future = window.popleft()
+                content = future.result() if future is not None else ""
                 
-            paper_contents.append(content)
-            paper_sources.append({
-                'title': paper.get('title', 'Unknown'),
-                'link': paper.get('link', ''),
-                'source': paper.get('source', 'Unknown'),
-                'author': paper.get('author', '') if 'author' in paper else paper.get('publication_info', '')
-            })
-        
-        print(f"Successfully retrieved content for {len(paper_contents)} papers")
-        return paper_contents, paper_sources
+                # If no content from URL, use abstract or snippet if available
+                if not content:
+                    content = paper.get('abstract', '') or paper.get('snippet', '')
+                
+                # Skip papers with insufficient content
+                if len(content) < 100:
+                    continue
+                    
+                retrieved += 1
+                yield content, {
+                    'title': paper.get('title', 'Unknown'),
+                    'link': paper.get('link', ''),
+                    'source': paper.get('source', 'Unknown'),
+                    'author': paper.get('author', '') if 'author' in paper else paper.get('publication_info', '')
+                }
+        
+        if abstract_only:
+            deadline.degrade("fetch", "abstract_only", references=abstract_only)
+        logger.info(f"Successfully retrieved content for {retrieved} papers")
     
     def check_plagiarism_with_scholarly_search(self, suspect_text: str, num_papers: int = 5, 
-                                              thresholds: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+                                              thresholds: Optional[Dict[str, float]] = None,
+                                              sections: Optional[Dict[str, str]] = None,
+                                              fetch_budget: Optional[int] = None,
+                                              section_aligned: bool = False) -> List[Dict[str, Any]]:
         """
         Check plagiarism by searching scholarly databases for similar papers
         
@@ -683,18 +748,31 @@ class PlagiarismChecker:
             suspect_text: Text to check for plagiarism
             num_papers: Number of papers to retrieve from each source
             thresholds: Dictionary with thresholds for each similarity method
+            sections: Optional sections of the suspect paper used to plan queries
+            fetch_budget: Maximum number of full-text fetches
+            section_aligned: Compare `sections` with the sections of each fetched paper
             
         Returns:
             List of dictionaries with plagiarism results
         """
-        paper_contents, paper_sources = self.search_scholarly_databases(suspect_text, num_papers)
+        paper_sources = []
         
-        if not paper_contents:
-            print("No papers found or failed to retrieve content.")
-            return []
+        def paper_contents() -> Iterator[str]:
+            # Search and fetching run on a background thread, a bounded queue
+            # ahead of the comparison, so each reference is scored as it arrives
+            references = prefetch(self.iter_scholarly_references(suspect_text, num_papers, sections,
+                                                                 fetch_budget), self.fetch_queue_size)
+            for content, source in references:
+                paper_sources.append(source)
+                yield content
         
         # Check plagiarism against retrieved papers
-        results = self.check_plagiarism(suspect_text, paper_contents, thresholds)
+        results = self.check_plagiarism(suspect_text, paper_contents(), thresholds,
+                                        suspect_sections=sections if section_aligned else None)
+        
+        if not paper_sources:
+            logger.info("No papers found or failed to retrieve content.")
+            return []
         
         # Add paper source information to the results
         for i, result in enumerate(results):
@@ -703,5 +781,70 @@ class PlagiarismChecker:
                 result['paper_info'] = paper_sources[ref_id]
             else:
                 result['paper_info'] = {'title': 'Unknown', 'link': '', 'source': 'Unknown'}
+            for alias in result.get('aliases') or []:
+                alias['paper_info'] = paper_sources[alias['reference_id']]
+        
+        return results 
+    
+    def retrieve_local_candidates(self, suspect_text: str, k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Candidate references for a suspect from the current corpus snapshot
+        
+        The suspect's most distinctive terms are looked up in the snapshot's
+        BM25 term index, and when the snapshot has document embeddings the
+        BM25 ranking is fused with the embedding ranking (see
+        Snapshot.search_hybrid).
         
-        return results 
\ No newline at end of file
+        Args:
+            suspect_text: Text to check
+            k: Number of candidates (defaults to LOCAL_CANDIDATES or 10)
+            
+        Returns:
+            Matches of Snapshot.search_hybrid with the reference's full text in
+            'text' and its source information (title, link, source, author) in
+            'paper_info'
+        """
+        snapshot = self.snapshot_index.current if self.snapshot_index is not None else None
+        if snapshot is None:
+            return []
+        embedding = None
+        if snapshot.model is not None:
+            embedding = self.get_bert_embeddings(self.preprocess_text(suspect_text))
+        with stage("local_candidate_retrieval"):
+            candidates = snapshot.search_hybrid(suspect_text, embedding, k or self.local_candidates)
+            for candidate in candidates:
+                candidate['text'] = snapshot.text(candidate['reference_key'])
+                info = candidate['paper_info'] or {}
+                candidate['paper_info'] = {'title': info.get('title') or candidate['reference_key'],
+                                           'link': info.get('link', ''),
+                                           'source': info.get('source', 'Local corpus'),
+                                           'author': info.get('author', '')}
+        return candidates
+    
+    def check_plagiarism_with_local_corpus(self, suspect_text: str,
+                                           thresholds: Optional[Dict[str, float]] = None,
+                                           sections: Optional[Dict[str, str]] = None,
+                                           section_aligned: bool = False) -> List[Dict[str, Any]]:
+        """
+        Check plagiarism against candidates retrieved from the local corpus snapshot
+        
+        Args:
+            suspect_text: Text to check for plagiarism
+            thresholds: Dictionary with thresholds for each similarity method
+            sections: Optional sections of the suspect paper
+            section_aligned: Compare `sections` with the sections of each candidate
+            
+        Returns:
+            List of dictionaries with plagiarism results
+        """
+        candidates = self.retrieve_local_candidates(suspect_text)
+        results = self.check_plagiarism(suspect_text, [candidate['text'] for candidate in candidates], thresholds,
+                                        suspect_sections=sections if section_aligned else None)
+        
+        paper_sources = [candidate['paper_info'] for candidate in candidates]
+        for result in results:
+            result['paper_info'] = paper_sources[result['reference_id']]
+            for alias in result.get('aliases') or []:
+                alias['paper_info'] = paper_sources[alias['reference_id']]
+        
+        return results
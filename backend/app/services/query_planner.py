@@ -0,0 +1,201 @@
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+
+class QueryPlanner:
+    """
+    Builds targeted scholarly search queries from distinctive passages of a paper
+    and decides which search hits are worth fetching in full.
+
+    Args:
+        max_queries: Maximum number of queries generated per paper
+        terms_per_query: Number of distinctive terms in each query
+        passage_words: Passage size (in words) used when no sections are available
+        skip_sections: Section names that never produce queries
+    """
+
+    def __init__(self, max_queries: int = 4, terms_per_query: int = 6, passage_words: int = 200,
+                 skip_sections: Optional[List[str]] = None):
+        self.max_queries = max_queries
+        self.terms_per_query = terms_per_query
+        self.passage_words = passage_words
+        self.skip_sections = set(skip_sections if skip_sections is not None
+                                 else ["title", "references", "acknowledgements"])
+
+    def _passages(self, text: str, sections: Optional[Dict[str, str]]) -> List[str]:
+        """Split the paper into passages, one per section when sections are known"""
+        if sections:
+            passages = [content for name, content in sections.items()
+                        if name not in self.skip_sections and len(content.split()) >= 20]
+            if passages:
+                return passages
+
+        words = text.split()
+        return [" ".join(words[i:i + self.passage_words])
+                for i in range(0, len(words), self.passage_words)]
+
+    def plan_queries(self, text: str, sections: Optional[Dict[str, str]] = None) -> List[str]:
+        """
+        Build several targeted queries from the most distinctive passages
+
+        Each passage is weighted with TF-IDF against the other passages of the same
+        paper, so terms that are frequent everywhere (the paper's general topic)
+        score lower than terms specific to one passage. Unigrams and bigrams are
+        both considered.
+
+        Args:
+            text: Full text of the paper
+            sections: Optional mapping of section names to their content
+
+        Returns:
+            List of query strings, most distinctive passage first
+        """
+        passages = self._passages(text, sections)
+        if not passages:
+            return []
+
+        vectorizer = TfidfVectorizer(stop_words="english", ngram_range=(1, 2), sublinear_tf=True,
+                                     token_pattern=r"(?u)\b[a-zA-Z][a-zA-Z0-9\-]{2,}\b")
+        try:
+            matrix = vectorizer.fit_transform(passages)
+        except ValueError:
+            # Passages contain only stopwords or numbers
+            return []
+        vocabulary = np.array(vectorizer.get_feature_names_out())
+
+        candidates = []
+        for row in range(matrix.shape[0]):
+            weights = matrix[row].toarray().ravel()
+            order = np.argsort(weights)[::-1]
+            query_words = []
+            for index in order:
+                if weights[index] <= 0 or len(query_words) >= self.terms_per_query:
+                    break
+                # Bigrams contribute only the words not already in the query
+                for word in vocabulary[index].split():
+                    if word not in query_words and len(query_words) < self.terms_per_query:
+                        query_words.append(word)
+            if query_words:
+                strength = float(weights[order[:self.terms_per_query]].sum())
+                candidates.append((strength, " ".join(query_words)))
+
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        queries = []
+        for _, query in candidates:
+            if query not in queries:
+                queries.append(query)
+            if len(queries) >= self.max_queries:
+                break
+        return queries
+
+    @staticmethod
+    def _normalize_doi(doi: str) -> str:
+        doi = (doi or "").strip().lower()
+        return re.sub(r"^(https?://(dx\.)?doi\.org/|doi:)", "", doi)
+
+    @staticmethod
+    def _normalize_title(title: str) -> str:
+        return re.sub(r"[^a-z0-9]+", " ", (title or "").lower()).strip()
+
+    def paper_key(self, paper: Dict[str, Any]) -> str:
+        """Identity of a search hit: its DOI if known, otherwise its normalized title"""
+        doi = self._normalize_doi(paper.get('doi', ''))
+        if not doi:
+            link = paper.get('link', '') or ''
+            match = re.search(r"doi\.org/(10\.\S+)", link)
+            doi = match.group(1).lower() if match else ""
+        if doi:
+            return f"doi:{doi}"
+        title = self._normalize_title(paper.get('title', ''))
+        if title and title != "unknown":
+            return f"title:{title}"
+        return f"link:{paper.get('link', '')}"
+
+    def deduplicate(self, papers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Merge hits for the same paper returned by several queries or providers
+
+        The first hit is kept and missing fields (abstract, snippet, link) are
+        filled in from later duplicates. All providers that returned the paper
+        are listed under 'sources'.
+
+        Args:
+            papers: Search hits from all providers
+
+        Returns:
+            Deduplicated list of papers, in first-seen order
+        """
+        merged: Dict[str, Dict[str, Any]] = {}
+        # Titles seen so far, so a DOI-less hit can be merged with a DOI hit
+        title_keys: Dict[str, str] = {}
+
+        for paper in papers:
+            key = self.paper_key(paper)
+            title = self._normalize_title(paper.get('title', ''))
+            if key not in merged and title in title_keys:
+                key = title_keys[title]
+
+            if key not in merged:
+                merged[key] = dict(paper, sources=[paper.get('source', 'Unknown')])
+                if title and title != "unknown":
+                    title_keys.setdefault(title, key)
+                continue
+
+            existing = merged[key]
+            for field in ('abstract', 'snippet', 'link', 'author', 'doi'):
+                if not existing.get(field) and paper.get(field):
+                    existing[field] = paper[field]
+            source = paper.get('source', 'Unknown')
+            if source not in existing['sources']:
+                existing['sources'].append(source)
+
+        return list(merged.values())
+
+    def rank_candidates(self, suspect_text: str, papers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Rank search hits by lexical similarity between their snippet and the suspect text
+
+        Args:
+            suspect_text: Text being checked for plagiarism
+            papers: Deduplicated search hits
+
+        Returns:
+            Papers sorted by descending 'snippet_score'
+        """
+        if not papers:
+            return []
+
+        snippets = [" ".join(str(paper.get(field, '') or '') for field in ('title', 'abstract', 'snippet'))
+                    for paper in papers]
+        vectorizer = TfidfVectorizer(stop_words="english", sublinear_tf=True)
+        try:
+            matrix = vectorizer.fit_transform([suspect_text] + snippets)
+            scores = cosine_similarity(matrix[0], matrix[1:]).ravel()
+        except ValueError:
+            scores = np.zeros(len(papers))
+
+        ranked = []
+        for paper, score in zip(papers, scores):
+            ranked.append(dict(paper, snippet_score=float(score)))
+        ranked.sort(key=lambda paper: paper['snippet_score'], reverse=True)
+        return ranked
+
+    def select_for_fetch(self, ranked_papers: List[Dict[str, Any]], fetch_budget: int,
+                         min_score: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        Pick the candidates whose full text should be fetched
+
+        Args:
+            ranked_papers: Papers sorted by snippet score
+            fetch_budget: Maximum number of full-text fetches
+            min_score: Candidates scoring at or below this are never fetched
+
+        Returns:
+            At most `fetch_budget` papers
+        """
+        selected = [paper for paper in ranked_papers if paper.get('snippet_score', 0.0) > min_score]
+        return selected[:max(0, fetch_budget)]
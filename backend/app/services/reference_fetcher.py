@@ -0,0 +1,319 @@
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+import PyPDF2
+import requests
+from urllib3.util.request import ACCEPT_ENCODING
+
+from app.core.memory import current_budget
+from app.core.metrics import metrics, record_bytes_downloaded, record_cache, stage
+from app.utils.html_extractor import MAX_HTML_CHARS, HTMLExtractor
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+              'Chrome/91.0.4472.124 Safari/537.36')
+ACCEPT = "application/pdf, text/html;q=0.9, application/xhtml+xml;q=0.9, text/plain;q=0.8, */*;q=0.1"
+
+# Bytes read before the type of a response is decided
+SNIFF_BYTES = 1024
+CHUNK_BYTES = 64 * 1024
+
+# Declared types never fetched in full
+REJECTED_TYPE_PREFIXES = ("image/", "audio/", "video/", "font/", "model/")
+REJECTED_TYPES = {"application/zip", "application/gzip", "application/x-tar", "application/x-7z-compressed",
+                  "application/vnd.rar", "application/x-rar-compressed", "application/java-archive",
+                  "application/vnd.ms-fontobject", "application/x-shockwave-flash", "application/wasm"}
+# Signatures of binary formats at the start of a body
+BINARY_SIGNATURES = (b"PK\x03\x04", b"\x89PNG", b"\xff\xd8\xff", b"GIF8", b"\x1f\x8b", b"RIFF", b"OggS",
+                     b"ID3", b"7z\xbc\xaf", b"Rar!", b"\x00\x00\x01\x00", b"wOFF", b"wOF2", b"\xd0\xcf\x11\xe0")
+
+
+def sniff(head: bytes, content_type: str, url: str = "") -> Optional[str]:
+    """
+    Kind of a response from its first bytes and declared type
+
+    PDF and HTML signatures win over the declared type, which servers often
+    get wrong (PDFs served as application/octet-stream, HTML as text/plain).
+
+    Returns:
+        'pdf', 'html', 'text', or None for content that is not text
+    """
+    if b"%PDF-" in head:
+        return "pdf"
+    stripped = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if stripped.startswith(b"<") and (b"<html" in head.lower() or b"<!doctype" in stripped[:16] or
+                                      stripped.startswith(b"<?xml") or b"<head" in head.lower()):
+        return "html"
+    if head.startswith(BINARY_SIGNATURES) or b"\x00" in head:
+        return None
+    if "html" in content_type or "xml" in content_type:
+        return "html"
+    if content_type.startswith("text/") or not content_type:
+        return "text"
+    if url.lower().endswith(".pdf") or "pdf" in content_type:
+        # Declared a PDF but does not start like one (an error page or a viewer)
+        return "html" if stripped.startswith(b"<") else None
+    return None
+
+
+def read_body(response: requests.Response, body: BinaryIO, content_type: str, url: str, max_bytes: int,
+              max_chars: int, source: str = "reference", digest=None) -> Tuple[Optional[str], int, bool]:
+    """
+    Stream a response body into `body`, deciding its kind from the first SNIFF_BYTES
+
+    HTML is read only up to what the extractor parses and plain text up to
+    `max_chars`; anything else is read up to `max_bytes`.
+
+    Args:
+        response: Response opened with stream=True
+        body: Binary file the body is written to
+        content_type: Declared type of the response
+        url: URL of the response (its extension is a hint of the type)
+        max_bytes: Download allowance
+        max_chars: Characters of text needed
+        source: Source label of the downloaded bytes metric
+        digest: Optional hashlib object updated with the bytes written
+
+    Returns:
+        Tuple of (kind or None, decoded bytes read, whether the body was cut
+        off at the download allowance)
+    """
+    kind = None
+    sniffed = False
+    size = 0
+    head = b""
+    limit = max_bytes
+    truncated = False
+
+    def write(data: bytes):
+        body.write(data)
+        if digest is not None:
+            digest.update(data)
+
+    for chunk in response.iter_content(chunk_size=CHUNK_BYTES):
+        if not sniffed:
+            head += chunk
+            if len(head) < SNIFF_BYTES:
+                continue
+            sniffed = True
+            kind = sniff(head[:SNIFF_BYTES], content_type, url)
+            if kind is None:
+                break
+            chunk, head = head, b""
+            # HTML beyond what the extractor parses and text beyond the reference allowance are not needed
+            if kind == "html":
+                limit = min(max_bytes, MAX_HTML_CHARS)
+            elif kind == "text":
+                limit = min(max_bytes, max_chars * 4)
+        if size + len(chunk) > limit:
+            write(chunk[:limit - size])
+            size = limit
+            # Cutting where the extractor or the reference allowance would cut anyway loses nothing
+            truncated = limit == max_bytes
+            break
+        write(chunk)
+        size += len(chunk)
+    if not sniffed and head:
+        # Bodies shorter than SNIFF_BYTES
+        kind = sniff(head, content_type, url)
+        if kind is not None:
+            write(head[:limit])
+            size = min(len(head), limit)
+    wire_bytes = response.raw.tell() if hasattr(response.raw, "tell") else size
+    record_bytes_downloaded(source, wire_bytes)
+    return kind, size, truncated
+
+
+class FetchCache:
+    """
+    Thread-safe LRU cache of extracted reference texts with their HTTP validators.
+
+    Only responses with an ETag or Last-Modified are cached, and every use
+    is revalidated with a conditional request: an unchanged reference costs a
+    304 instead of a download and its extraction.
+
+    Args:
+        max_entries: Maximum number of cached texts (0 disables caching)
+        max_chars: Maximum total characters of the cached texts
+    """
+
+    def __init__(self, max_entries: int = 256, max_chars: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.chars = 0
+        self.lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry is not None:
+                self.entries.move_to_end(url)
+            return entry
+
+    def put(self, url: str, entry: Dict[str, Any]):
+        if self.max_entries <= 0 or len(entry['text']) > self.max_chars:
+            return
+        with self.lock:
+            previous = self.entries.pop(url, None)
+            if previous is not None:
+                self.chars -= len(previous['text'])
+            self.entries[url] = entry
+            self.chars += len(entry['text'])
+            while len(self.entries) > self.max_entries or self.chars > self.max_chars:
+                _, evicted = self.entries.popitem(last=False)
+                self.chars -= len(evicted['text'])
+
+
+class ReferenceFetcher:
+    """
+    Bandwidth-efficient download and text extraction of reference papers.
+
+    Responses are streamed and compressed transfer is requested (gzip and
+    deflate, plus brotli and zstd when their decoders are installed). The
+    type is decided from the headers and the first kilobyte: images,
+    archives and other binary content are abandoned after that kilobyte,
+    and bodies that declare a size above the request's download allowance
+    are never read. HTML is read only up to what the extractor parses
+    (MAX_HTML_MB) and plain text up to the reference allowance; a PDF over
+    the allowance is skipped, since a cut-off PDF cannot be parsed. Only the
+    first `max_reference_pages` pages of a PDF are extracted when the
+    request's budget sets a page limit.
+
+    Texts are cached with their ETag/Last-Modified and revalidated with
+    conditional requests. Connections are kept alive per thread.
+
+    Args:
+        html_extractor: HTMLExtractor for HTML pages
+        cache: FetchCache (defaults to FETCH_CACHE_ENTRIES entries, default 256,
+            and FETCH_CACHE_MB of text, default 64)
+    """
+
+    def __init__(self, html_extractor: Optional[HTMLExtractor] = None, cache: Optional[FetchCache] = None):
+        self.html_extractor = html_extractor or HTMLExtractor()
+        self.cache = cache if cache is not None else FetchCache(
+            int(os.getenv("FETCH_CACHE_ENTRIES", "256")),
+            int(float(os.getenv("FETCH_CACHE_MB", "64")) * 1024 * 1024)
+        )
+        self.local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({'User-Agent': USER_AGENT, 'Accept': ACCEPT, 'Accept-Encoding': ACCEPT_ENCODING})
+            self.local.session = session
+        return session
+
+    def _reject(self, url: str, reason: str, **details) -> str:
+        metrics.inc("plagiarism_fetch_aborted_total", labels={'reason': reason},
+                    description="Reference downloads abandoned before or while reading the body")
+        logger.info(f"Skipped reference {url}: {reason} {details or ''}")
+        return ""
+
+    def fetch(self, url: str, timeout: float = 10) -> str:
+        """
+        Download a reference and extract its text
+
+        Args:
+            url: URL to the paper or abstract page
+            timeout: Seconds to wait for the server
+
+        Returns:
+            Extracted text ("" when the reference is unavailable or not text)
+        """
+        if not url:
+            return ""
+        budget = current_budget()
+        max_pages = budget.max_reference_pages
+        cached = self.cache.get(url)
+        # A text extracted under a tighter page limit is not reused for a looser one
+        if cached is not None and cached['max_pages'] and (not max_pages or max_pages > cached['max_pages']):
+            cached = None
+        headers = {}
+        if cached is not None:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        with self._session().get(url, headers=headers, timeout=timeout, stream=True) as response, \
+                tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as body:
+            if response.status_code == 304 and cached is not None:
+                record_cache("reference_fetch", True)
+                return cached['text']
+            if cached is not None:
+                record_cache("reference_fetch", False)
+            if response.status_code != 200:
+                return ""
+
+            content_type = response.headers.get('Content-Type', '').split(";")[0].strip().lower()
+            if content_type.startswith(REJECTED_TYPE_PREFIXES) or content_type in REJECTED_TYPES:
+                return self._reject(url, "content_type", content_type=content_type)
+            declared = int(response.headers.get('Content-Length') or 0)
+            # With a Content-Encoding this is the compressed size; the decoded body is larger still
+            if declared > budget.max_download_bytes:
+                budget.degrade(url, "skipped", declared_bytes=declared)
+                return self._reject(url, "too_large", declared_bytes=declared)
+
+            with stage("reference_download"):
+                kind, size, truncated = read_body(response, body, content_type, url, budget.max_download_bytes,
+                                                  budget.max_reference_chars)
+            if kind is None:
+                return self._reject(url, "not_text", content_type=content_type)
+            body.seek(0)
+
+            if kind == "pdf":
+                if truncated:
+                    # A cut-off PDF has no cross-reference table to read
+                    budget.degrade(url, "skipped", downloaded_bytes=size)
+                    return self._reject(url, "too_large", downloaded_bytes=size)
+                try:
+                    text, cut = self.pdf_text(body, url, budget.max_reference_chars, max_pages)
+                except Exception as e:
+                    logger.warning(f"PDF extraction error: {str(e)}")
+                    return ""
+            else:
+                cut = None
+                if truncated:
+                    budget.degrade(url, "truncated", downloaded_bytes=size)
+                    cut = "truncated"
+                text = body.read().decode(response.encoding or 'utf-8', errors='replace')
+                if kind == "html":
+                    text = self.html_extractor.extract(text, url)
+
+            validators = {'etag': response.headers.get('ETag'),
+                          'last_modified': response.headers.get('Last-Modified')}
+        # Texts cut by the request's allowances are not cached; those cut by a page limit are, with the limit
+        if text and (validators['etag'] or validators['last_modified']) and cut in (None, "page_limit"):
+            self.cache.put(url, {'text': text, 'max_pages': max_pages if cut else None, **validators})
+        return text
+
+    def pdf_text(self, stream: BinaryIO, url: str, max_chars: int, max_pages: Optional[int] = None):
+        """
+        Text of a PDF, page by page until `max_chars` characters or `max_pages` pages are read
+
+        Returns:
+            Tuple of (text, None when every page was read, else 'truncated' or 'page_limit')
+        """
+        pdf_reader = PyPDF2.PdfReader(stream)
+        total_pages = len(pdf_reader.pages)
+        pages = []
+        chars = 0
+        with stage("reference_pdf_extraction"):
+            for page_num in range(total_pages):
+                if chars >= max_chars:
+                    current_budget().degrade(url, "truncated", pages_read=page_num, total_pages=total_pages)
+                    return "".join(pages), "truncated"
+                if max_pages and page_num >= max_pages:
+                    current_budget().degrade(url, "page_limit", pages_read=page_num, total_pages=total_pages)
+                    return "".join(pages), "page_limit"
+                page_text = pdf_reader.pages[page_num].extract_text() or ""
+                pages.append(page_text)
+                chars += len(page_text)
+        return "".join(pages), None
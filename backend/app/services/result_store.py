@@ -0,0 +1,298 @@
+import base64
+import datetime
+import hmac
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Dict, List, Optional
+
+from app.core.metrics import stage
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report_id TEXT PRIMARY KEY,
+    tenant TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    content_hash TEXT,
+    submission_id TEXT,
+    user_id TEXT,
+    course_id TEXT,
+    title TEXT,
+    plagiarism_score REAL NOT NULL,
+    ai_probability REAL,
+    word_count INTEGER,
+    degraded INTEGER NOT NULL DEFAULT 0,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_by_date ON reports (tenant, created_at DESC, report_id DESC);
+CREATE INDEX IF NOT EXISTS reports_by_score ON reports (tenant, plagiarism_score DESC, report_id DESC);
+CREATE INDEX IF NOT EXISTS reports_by_hash ON reports (tenant, content_hash, created_at DESC);
+CREATE INDEX IF NOT EXISTS reports_by_submission ON reports (tenant, submission_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS reports_by_user ON reports (tenant, user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS reports_by_course ON reports (tenant, course_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS reports_by_age ON reports (created_at);
+"""
+
+# Summary columns returned by history queries (the payload is only read for single reports)
+_SUMMARY_COLUMNS = ("report_id", "created_at", "content_hash", "submission_id", "user_id", "course_id",
+                    "title", "plagiarism_score", "ai_probability", "word_count", "degraded")
+# Sort orders of history queries and the column each one pages on
+HISTORY_ORDERS = {'date': "created_at", 'score': "plagiarism_score"}
+# Seconds between purges of expired reports
+PURGE_INTERVAL = 3600.0
+
+
+def parse_api_keys(value: Optional[str]) -> Dict[str, str]:
+    """Parse "tenant=key,tenant=key" settings into a mapping of key to tenant"""
+    keys = {}
+    for item in (value or "").split(","):
+        tenant, _, key = item.partition("=")
+        if tenant.strip() and key.strip():
+            keys[key.strip()] = tenant.strip()
+    return keys
+
+
+def authenticate(api_key: Optional[str], keys: Dict[str, str]) -> Optional[str]:
+    """Tenant whose API key is `api_key`, or None if it matches no key"""
+    if not api_key:
+        return None
+    tenant = None
+    for key, key_tenant in keys.items():
+        # Compare against every key so the time taken does not reveal which one matched
+        if hmac.compare_digest(key.encode("utf-8"), api_key.encode("utf-8")):
+            tenant = key_tenant
+    return tenant
+
+
+def utc_timestamp(value: str) -> str:
+    """
+    ISO 8601 time as stored in created_at (UTC, millisecond precision); times
+    without an offset are taken as UTC
+
+    Raises:
+        ValueError: If the value is not an ISO 8601 time
+    """
+    try:
+        moment = datetime.datetime.fromisoformat(value.strip())
+    except (ValueError, AttributeError):
+        raise ValueError(f"Invalid ISO 8601 time: {value!r}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return moment.astimezone(datetime.timezone.utc).isoformat(timespec="milliseconds")
+
+
+def _encode_cursor(value: Any, report_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, report_id]).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> List[Any]:
+    try:
+        value, report_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return [value, report_id]
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+
+
+class ResultStore:
+    """
+    SQLite store of completed check responses.
+
+    Each response is saved once, zlib-compressed, next to the columns that
+    history queries filter and sort on (tenant, date, content hash,
+    submission, user, course and score), each covered by an index. Reports
+    are served from the stored bytes, so reopening one never re-runs a check.
+    History queries page with keyset cursors and never read the payloads.
+
+    Every row belongs to the tenant the check ran for. Tenants come from the
+    unauthenticated X-Tenant-ID header, so the API only serves reports to
+    callers authenticated with a tenant's key (REPORT_API_KEYS), and the store
+    is disabled unless RESULT_STORE_PATH is set. Reports older than the
+    retention period are purged, at most once per PURGE_INTERVAL.
+
+    Args:
+        path: Database file (defaults to RESULT_STORE_PATH or ./results.sqlite3)
+        compression_level: zlib level of the stored responses
+        retention_days: Age after which reports are deleted (defaults to
+            RESULT_RETENTION_DAYS or 90; 0 keeps them forever)
+    """
+
+    def __init__(self, path: Optional[str] = None, compression_level: int = 6,
+                 retention_days: Optional[float] = None):
+        self.path = path or os.getenv("RESULT_STORE_PATH") or "results.sqlite3"
+        self.compression_level = compression_level
+        self.retention_days = retention_days if retention_days is not None else \
+            float(os.getenv("RESULT_RETENTION_DAYS", "90"))
+        self.local = threading.local()
+        self.purge_lock = threading.Lock()
+        self.last_purge: Optional[float] = None
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        with connection:
+            connection.executescript(_SCHEMA)
+            connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @classmethod
+    def from_env(cls) -> Optional["ResultStore"]:
+        """Store at RESULT_STORE_PATH, or None when it is not set (the store is opt-in)"""
+        path = os.getenv("RESULT_STORE_PATH", "")
+        return cls(path) if path else None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection of the calling thread (sqlite3 connections are not shared between threads)"""
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10.0)
+            connection.row_factory = sqlite3.Row
+            # Readers do not block the writer and vice versa
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def save(self, response: Dict[str, Any], tenant: str, user_id: Optional[str] = None,
+             course_id: Optional[str] = None, submission_id: Optional[str] = None) -> str:
+        """
+        Store a check response
+
+        Args:
+            response: Fields of PlagiarismResponse (stored with its new 'report_id')
+            tenant: Tenant the check ran for
+            user_id: Optional user the report belongs to
+            course_id: Optional course the report belongs to
+            submission_id: Submission lineage of an incremental check
+
+        Returns:
+            Id of the stored report
+        """
+        report_id = uuid.uuid4().hex
+        response = dict(response, report_id=report_id)
+        created_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds")
+        ai_results = response.get('ai_detection_results') or {}
+        with stage("result_store_save"):
+            payload = zlib.compress(json.dumps(response, separators=(",", ":")).encode("utf-8"),
+                                    self.compression_level)
+            connection = self._connection()
+            with connection:
+                connection.execute(
+                    "INSERT INTO reports (report_id, tenant, created_at, content_hash, submission_id, user_id, "
+                    "course_id, title, plagiarism_score, ai_probability, word_count, degraded, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (report_id, tenant, created_at, response.get('content_hash'), submission_id, user_id,
+                     course_id, ((response.get('sections') or {}).get('title') or "")[:300] or None,
+                     float(response.get('plagiarism_overall_score') or 0.0),
+                     ai_results.get('overall_ai_probability'), response.get('total_word_count'),
+                     int(bool(response.get('degraded'))), payload)
+                )
+        self._purge_if_due()
+        return report_id
+
+    def purge(self, now: Optional[datetime.datetime] = None) -> int:
+        """
+        Delete reports older than the retention period
+
+        Returns:
+            Number of reports deleted
+        """
+        if self.retention_days <= 0:
+            return 0
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        cutoff = (now - datetime.timedelta(days=self.retention_days)).isoformat(timespec="milliseconds")
+        with stage("result_store_purge"):
+            connection = self._connection()
+            with connection:
+                deleted = connection.execute("DELETE FROM reports WHERE created_at < ?", (cutoff,)).rowcount
+        return deleted
+
+    def _purge_if_due(self):
+        """Purge expired reports unless that was done less than PURGE_INTERVAL ago"""
+        with self.purge_lock:
+            if self.last_purge is not None and time.monotonic() - self.last_purge < PURGE_INTERVAL:
+                return
+            self.last_purge = time.monotonic()
+        self.purge()
+
+    def get(self, report_id: str, tenant: str) -> Optional[bytes]:
+        """
+        Stored response of a report, as JSON
+
+        Returns:
+            UTF-8 encoded JSON of the response, or None if the tenant has no such report
+        """
+        with stage("result_store_get"):
+            row = self._connection().execute(
+                "SELECT payload FROM reports WHERE report_id = ? AND tenant = ?", (report_id, tenant)
+            ).fetchone()
+            return zlib.decompress(row['payload']) if row is not None else None
+
+    def history(self, tenant: str, user_id: Optional[str] = None, course_id: Optional[str] = None,
+                content_hash: Optional[str] = None, submission_id: Optional[str] = None,
+                since: Optional[str] = None, until: Optional[str] = None, min_score: Optional[float] = None,
+                max_score: Optional[float] = None, order: str = "date", limit: int = 50,
+                cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Page of report summaries, newest (or highest scoring) first
+
+        Args:
+            tenant: Tenant whose reports are listed
+            user_id, course_id, content_hash, submission_id: Exact-match filters
+            since, until: ISO 8601 bounds of the creation time (inclusive, exclusive);
+                times without an offset are taken as UTC
+            min_score, max_score: Bounds of the overall plagiarism score (inclusive)
+            order: 'date' or 'score'
+            limit: Page size
+            cursor: `next_cursor` of the previous page
+
+        Returns:
+            Dictionary with 'reports' (summaries without the stored responses)
+            and 'next_cursor' (None on the last page)
+
+        Raises:
+            ValueError: If the order, a time or the cursor is invalid
+        """
+        if order not in HISTORY_ORDERS:
+            raise ValueError(f"Unknown order: {order}")
+        column = HISTORY_ORDERS[order]
+        conditions = ["tenant = ?"]
+        params: List[Any] = [tenant]
+        for name, value in (('user_id', user_id), ('course_id', course_id), ('content_hash', content_hash),
+                            ('submission_id', submission_id)):
+            if value is not None:
+                conditions.append(f"{name} = ?")
+                params.append(value)
+        since = utc_timestamp(since) if since is not None else None
+        until = utc_timestamp(until) if until is not None else None
+        for condition, value in (("created_at >= ?", since), ("created_at < ?", until),
+                                 ("plagiarism_score >= ?", min_score), ("plagiarism_score <= ?", max_score)):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        if cursor:
+            value, report_id = _decode_cursor(cursor)
+            conditions.append(f"({column} < ? OR ({column} = ? AND report_id < ?))")
+            params.extend([value, value, report_id])
+
+        query = (f"SELECT {', '.join(_SUMMARY_COLUMNS)} FROM reports WHERE {' AND '.join(conditions)} "
+                 f"ORDER BY {column} DESC, report_id DESC LIMIT ?")
+        with stage("result_store_history"):
+            rows = self._connection().execute(query, params + [limit + 1]).fetchall()
+
+        reports = [dict(row, degraded=bool(row['degraded'])) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = reports[-1]
+            next_cursor = _encode_cursor(last[column], last['report_id'])
+        return {'reports': reports, 'next_cursor': next_cursor}
+
+    def close(self):
+        """Close the calling thread's connection"""
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
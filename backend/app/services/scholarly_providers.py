@@ -0,0 +1,740 @@
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from app.core.deadline import current_deadline
+from app.core.metrics import metrics, record_provider_call, stage
+from app.core.scheduler import current_tenant, parse_weights
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderError(Exception):
+    """Raised by a provider when a search fails"""
+
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket used to rate limit calls to one provider.
+
+    Args:
+        rate: Tokens added per second
+        capacity: Maximum number of tokens (burst size)
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """
+        Take tokens from the bucket, waiting for a refill if necessary
+
+        Args:
+            tokens: Number of tokens to take
+            timeout: Maximum number of seconds to wait (None waits forever)
+
+        Returns:
+            True if the tokens were taken, False if the timeout expired first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait = (tokens - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or wait > remaining:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class TenantBudgets:
+    """
+    Per-tenant budgets of scholarly API calls.
+
+    Each tenant may make `calls_per_hour` calls to each provider, refilled
+    continuously, so one tenant's bulk checks cannot use up the API quotas
+    shared by every tenant. Calls beyond the budget are skipped.
+
+    Args:
+        calls_per_hour: Default budget per tenant and provider (0 means unlimited)
+        overrides: Budgets of individual tenants
+    """
+
+    def __init__(self, calls_per_hour: float = 0.0, overrides: Optional[Dict[str, float]] = None):
+        self.calls_per_hour = calls_per_hour
+        self.overrides = overrides or {}
+        self.buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "TenantBudgets":
+        """Budgets of TENANT_API_CALLS_PER_HOUR and TENANT_API_BUDGETS ("tenant=calls,...")"""
+        return cls(float(os.getenv("TENANT_API_CALLS_PER_HOUR", "0")),
+                   parse_weights(os.getenv("TENANT_API_BUDGETS")))
+
+    def limit(self, tenant: str) -> float:
+        return self.overrides.get(tenant, self.calls_per_hour)
+
+    def try_acquire(self, tenant: str, provider: str) -> bool:
+        """Take one call from a tenant's budget for a provider, without waiting"""
+        limit = self.limit(tenant)
+        if limit <= 0:
+            return True
+        with self.lock:
+            bucket = self.buckets.get((tenant, provider))
+            if bucket is None:
+                bucket = self.buckets[(tenant, provider)] = TokenBucket(limit / 3600.0, limit)
+        return bucket.acquire(timeout=0)
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        """Remaining calls of each tenant per provider"""
+        report: Dict[str, Dict[str, Any]] = {}
+        with self.lock:
+            buckets = list(self.buckets.items())
+        for (tenant, provider), bucket in buckets:
+            with bucket.lock:
+                bucket._refill()
+                remaining = bucket.tokens
+            report.setdefault(tenant, {'calls_per_hour': self.limit(tenant), 'remaining': {}})
+            report[tenant]['remaining'][provider] = int(remaining)
+        return report
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker that stops calling a provider while it keeps failing.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls are
+    skipped. Once `reset_timeout` seconds have passed a single trial call is let
+    through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self._state = self.CLOSED
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Return True if a call may be made now"""
+        with self.lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let exactly one trial request through
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def release(self):
+        """
+        Give back a trial call that was granted but ended without an outcome
+        (skipped or abandoned), so the next request may make the trial instead
+        """
+        with self.lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.OPEN
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self._state = self.CLOSED
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ScholarlyProvider:
+    """
+    Base class for scholarly search providers.
+
+    Subclasses implement `search` and raise `ProviderError` on failure instead of
+    swallowing errors, so that `ProviderManager` can retry and track health.
+    """
+
+    name = "base"
+    # Default rate limit (requests per second) and burst size
+    rate_limit = 1.0
+    burst = 2
+
+    def __init__(self, timeout: float = 10.0):
+        self.timeout = timeout
+
+    def is_configured(self) -> bool:
+        """Return False if the provider is missing credentials and should be skipped"""
+        return True
+
+    def search(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        """
+        Search the provider
+
+        Args:
+            query: Search query
+            num_results: Number of results to return
+
+        Returns:
+            List of dictionaries with paper details
+        """
+        raise NotImplementedError
+
+    def _check_response(self, response: requests.Response):
+        """Raise a ProviderError for unsuccessful HTTP responses"""
+        if response.status_code == 200:
+            return
+        retryable = response.status_code == 429 or response.status_code >= 500
+        raise ProviderError(f"{self.name} API error: {response.status_code}, {response.text[:200]}",
+                            retryable=retryable)
+
+
+class GoogleScholarProvider(ScholarlyProvider):
+    """Google Scholar through SerpAPI, falling back to the scholarly package"""
+
+    name = "google_scholar"
+    rate_limit = 0.5
+    burst = 1
+
+    def __init__(self, serpapi_key: Optional[str] = None, timeout: float = 15.0):
+        super().__init__(timeout)
+        self.serpapi_key = serpapi_key
+
+    def search(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        results = []
+
+        # Try using SerpAPI if API key is available (more reliable)
+        if self.serpapi_key:
+            try:
+                from serpapi import Client
+
+                params = {
+                    "api_key": self.serpapi_key,
+                    "engine": "google_scholar",
+                    "q": query,
+                    "num": num_results
+                }
+                client = Client(api_key=self.serpapi_key)
+                response = client.search(params)
+
+                if "organic_results" in response:
+                    for paper in response["organic_results"][:num_results]:
+                        results.append({
+                            'title': paper.get('title', 'Unknown'),
+                            'link': paper.get('link', ''),
+                            'snippet': paper.get('snippet', ''),
+                            'publication_info': paper.get('publication_info', {}).get('summary', ''),
+                            'source': 'Google Scholar (SerpAPI)'
+                        })
+                return results
+            except Exception as e:
+                logger.warning(f"SerpAPI search failed, falling back to scholarly: {str(e)}")
+
+        # Fall back to scholarly (less reliable but free)
+        try:
+            from scholarly import scholarly
+
+            search_query = scholarly.search_pubs(query)
+            for _ in range(num_results):
+                try:
+                    publication = next(search_query)
+                except StopIteration:
+                    break
+                bib = publication.get('bib', {})
+                results.append({
+                    'title': bib.get('title', 'Unknown'),
+                    'abstract': bib.get('abstract', ''),
+                    'pub_year': bib.get('pub_year', ''),
+                    'author': bib.get('author', 'Unknown'),
+                    'venue': bib.get('venue', ''),
+                    'link': publication.get('pub_url', ''),
+                    'citations': publication.get('num_citations', 0),
+                    'source': 'Google Scholar (scholarly)'
+                })
+            return results
+        except Exception as e:
+            raise ProviderError(f"Scholarly search failed: {str(e)}")
+
+
+class ScopusProvider(ScholarlyProvider):
+    """Elsevier Scopus search API"""
+
+    name = "scopus"
+    rate_limit = 2.0
+    burst = 3
+    url = "https://api.elsevier.com/content/search/scopus"
+
+    def __init__(self, api_key: Optional[str] = None, timeout: float = 10.0):
+        super().__init__(timeout)
+        self.api_key = api_key
+
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
+
+    def search(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        headers = {
+            "X-ELS-APIKey": self.api_key,
+            "Accept": "application/json"
+        }
+        params = {
+            "query": query.replace(' ', '+'),
+            "count": num_results,
+            "view": "COMPLETE"
+        }
+        response = requests.get(self.url, headers=headers, params=params, timeout=self.timeout)
+        self._check_response(response)
+
+        results = []
+        data = response.json()
+        for paper in data.get("search-results", {}).get("entry", []):
+            results.append({
+                'title': paper.get('dc:title', 'Unknown'),
+                'abstract': paper.get('dc:description', ''),
+                'author': paper.get('dc:creator', 'Unknown'),
+                'publication_year': paper.get('prism:coverDate', '')[:4] if 'prism:coverDate' in paper else '',
+                'link': paper.get('prism:url', ''),
+                'doi': paper.get('prism:doi', ''),
+                'source': 'Scopus API'
+            })
+        return results
+
+
+class CoreProvider(ScholarlyProvider):
+    """CORE (core.ac.uk) search API"""
+
+    name = "core"
+    rate_limit = 1.0
+    burst = 2
+    url = "https://api.core.ac.uk/v3/search/works"
+
+    def __init__(self, api_key: Optional[str] = None, timeout: float = 10.0):
+        super().__init__(timeout)
+        self.api_key = api_key
+
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
+
+    def search(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        body = {
+            "q": query,
+            "limit": num_results,
+            "scroll": True
+        }
+        response = requests.post(self.url, headers=headers, json=body, timeout=self.timeout)
+        self._check_response(response)
+
+        results = []
+        for paper in response.json().get("results", []):
+            authors = [author.get("name", "") for author in paper.get("authors") or [] if "name" in author]
+            results.append({
+                'title': paper.get('title', 'Unknown'),
+                'abstract': paper.get('abstract', ''),
+                'author': ", ".join(authors) if authors else 'Unknown',
+                'publication_year': str(paper.get('yearPublished', '')),
+                'link': paper.get('downloadUrl', '') or paper.get('doi', ''),
+                'doi': paper.get('doi', '') or '',
+                'source': 'CORE API'
+            })
+        return results
+
+
+class IEEEProvider(ScholarlyProvider):
+    """IEEE Xplore search API"""
+
+    name = "ieee"
+    rate_limit = 2.0
+    burst = 2
+    url = "https://ieeexploreapi.ieee.org/api/v1/search/articles"
+
+    def __init__(self, api_key: Optional[str] = None, timeout: float = 10.0):
+        super().__init__(timeout)
+        self.api_key = api_key
+
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
+
+    def search(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        params = {
+            "apikey": self.api_key,
+            "format": "json",
+            "max_records": num_results,
+            "querytext": query,
+            "abstract": True
+        }
+        response = requests.get(self.url, params=params, timeout=self.timeout)
+        self._check_response(response)
+
+        results = []
+        for paper in response.json().get("articles", []):
+            authors = paper.get('authors', {}).get('authors') or [{}]
+            results.append({
+                'title': paper.get('title', 'Unknown'),
+                'abstract': paper.get('abstract', ''),
+                'author': authors[0].get('full_name', 'Unknown'),
+                'publication_year': paper.get('publication_year', ''),
+                'link': f"https://doi.org/{paper.get('doi', '')}" if 'doi' in paper else '',
+                'doi': paper.get('doi', ''),
+                'source': 'IEEE Xplore API'
+            })
+        return results
+
+
+class FakeProvider(ScholarlyProvider):
+    """
+    Offline provider for load testing and development.
+
+    Returns papers from an in-memory corpus ranked by word overlap with the query,
+    or deterministic synthetic papers when no corpus is given. Latency and failure
+    rate can be injected to exercise retries and circuit breakers.
+
+    Args:
+        corpus: Optional list of paper dictionaries to search
+        latency: Seconds to sleep per search
+        failure_rate: Probability (0-1) that a search raises a retryable error
+        name: Provider name used for health reporting
+        seed: Seed for the failure injection random generator
+    """
+
+    rate_limit = 1000.0
+    burst = 1000
+
+    def __init__(self, corpus: Optional[List[Dict[str, Any]]] = None, latency: float = 0.0,
+                 failure_rate: float = 0.0, name: str = "fake", seed: Optional[int] = None,
+                 timeout: float = 10.0):
+        super().__init__(timeout)
+        self.name = name
+        self.corpus = corpus
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+    def search(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise ProviderError(f"{self.name}: injected failure")
+
+        if self.corpus is None:
+            return [self._synthetic_paper(query, i) for i in range(num_results)]
+
+        query_words = set(query.lower().split())
+
+        def overlap(paper):
+            text = f"{paper.get('title', '')} {paper.get('abstract', '')}".lower()
+            return len(query_words.intersection(text.split()))
+
+        ranked = sorted(self.corpus, key=overlap, reverse=True)
+        return [dict(paper, source=paper.get('source', self.name)) for paper in ranked[:num_results]]
+
+    def _synthetic_paper(self, query: str, index: int) -> Dict[str, Any]:
+        words = query.split() or ["paper"]
+        abstract = " ".join(words[(index + i) % len(words)] for i in range(60))
+        return {
+            'title': f"Synthetic study {index} on {' '.join(words[:3])}",
+            'abstract': f"This synthetic abstract discusses {abstract}.",
+            'author': f"Author {index}",
+            'link': '',
+            'doi': f"10.0000/fake.{abs(hash(query)) % 10000}.{index}",
+            'source': self.name
+        }
+
+
+class ProviderManager:
+    """
+    Runs searches against registered providers with per-provider rate limiting,
+    per-tenant call budgets, timeouts, bounded retries with jittered backoff
+    and circuit breakers.
+
+    A search that times out is abandoned, not stopped: its thread stays busy
+    until the provider's HTTP call returns or hits the provider's own timeout.
+    The executor has 4 threads per provider so that a few hung calls do not
+    hold up new searches; `abandoned` in the statistics counts them.
+
+    Args:
+        providers: Providers to register, searched in the given order
+        max_retries: Number of retries after the first failed attempt
+        backoff_base: Base delay in seconds for exponential backoff
+        failure_threshold: Consecutive failures before a circuit opens
+        reset_timeout: Seconds a circuit stays open before a trial call
+        budgets: Per-tenant call budgets (unlimited by default)
+    """
+
+    def __init__(self, providers: List[ScholarlyProvider], max_retries: int = 2,
+                 backoff_base: float = 0.5, failure_threshold: int = 3,
+                 reset_timeout: float = 30.0, budgets: Optional[TenantBudgets] = None):
+        self.providers = {provider.name: provider for provider in providers}
+        self.budgets = budgets or TenantBudgets()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.buckets = {
+            provider.name: TokenBucket(provider.rate_limit, provider.burst) for provider in providers
+        }
+        self.breakers = {
+            provider.name: CircuitBreaker(failure_threshold, reset_timeout) for provider in providers
+        }
+        self.stats = {
+            provider.name: {'calls': 0, 'successes': 0, 'failures': 0, 'timeouts': 0,
+                            'skipped': 0, 'abandoned': 0, 'last_error': None, 'last_latency': None}
+            for provider in providers
+        }
+        self.stats_lock = threading.Lock()
+        # Searches run in worker threads so that a hung provider can be abandoned
+        self.executor = ThreadPoolExecutor(max_workers=max(4, 4 * len(providers)),
+                                           thread_name_prefix="scholarly-provider")
+
+    @classmethod
+    def from_env(cls, serpapi_key: Optional[str] = None, scopus_api_key: Optional[str] = None,
+                 core_api_key: Optional[str] = None, ieee_api_key: Optional[str] = None) -> "ProviderManager":
+        """
+        Build a manager from environment configuration.
+
+        SCHOLARLY_PROVIDERS selects the providers (comma separated, default
+        "google_scholar,scopus,core,ieee"; use "fake" for offline runs).
+        PROVIDER_TIMEOUT, PROVIDER_MAX_RETRIES, PROVIDER_FAILURE_THRESHOLD and
+        PROVIDER_RESET_TIMEOUT tune the guards; TENANT_API_CALLS_PER_HOUR and
+        TENANT_API_BUDGETS set the per-tenant call budgets.
+        """
+        timeout = float(os.getenv('PROVIDER_TIMEOUT', '10'))
+        available = {
+            'google_scholar': lambda: GoogleScholarProvider(serpapi_key, timeout=timeout),
+            'scopus': lambda: ScopusProvider(scopus_api_key, timeout=timeout),
+            'core': lambda: CoreProvider(core_api_key, timeout=timeout),
+            'ieee': lambda: IEEEProvider(ieee_api_key, timeout=timeout),
+            'fake': lambda: FakeProvider(latency=float(os.getenv('FAKE_PROVIDER_LATENCY', '0')),
+                                         failure_rate=float(os.getenv('FAKE_PROVIDER_FAILURE_RATE', '0')),
+                                         timeout=timeout),
+        }
+
+        names = os.getenv('SCHOLARLY_PROVIDERS', 'google_scholar,scopus,core,ieee')
+        providers = []
+        for name in [n.strip() for n in names.split(',') if n.strip()]:
+            if name not in available:
+                logger.warning(f"Unknown scholarly provider '{name}' ignored")
+                continue
+            providers.append(available[name]())
+
+        return cls(
+            providers,
+            max_retries=int(os.getenv('PROVIDER_MAX_RETRIES', '2')),
+            failure_threshold=int(os.getenv('PROVIDER_FAILURE_THRESHOLD', '3')),
+            reset_timeout=float(os.getenv('PROVIDER_RESET_TIMEOUT', '30')),
+            budgets=TenantBudgets.from_env(),
+        )
+
+    def register(self, provider: ScholarlyProvider):
+        """Add or replace a provider"""
+        self.providers[provider.name] = provider
+        self.buckets[provider.name] = TokenBucket(provider.rate_limit, provider.burst)
+        self.breakers[provider.name] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        with self.stats_lock:
+            self.stats[provider.name] = {'calls': 0, 'successes': 0, 'failures': 0, 'timeouts': 0,
+                                         'skipped': 0, 'abandoned': 0, 'last_error': None,
+                                         'last_latency': None}
+
+    def _record(self, name: str, **updates):
+        with self.stats_lock:
+            stats = self.stats[name]
+            for key, value in updates.items():
+                if key in ('calls', 'successes', 'failures', 'timeouts', 'skipped', 'abandoned'):
+                    stats[key] += value
+                else:
+                    stats[key] = value
+
+    def search(self, name: str, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        """
+        Search a single provider through its guards
+
+        Args:
+            name: Registered provider name
+            query: Search query
+            num_results: Number of results to return
+
+        Returns:
+            List of dictionaries with paper details (empty if the provider is
+            unconfigured, its circuit is open, every attempt failed, the
+            tenant's call budget is used up, or the search stage of the
+            request deadline ran out)
+        """
+        provider = self.providers.get(name)
+        if provider is None or not provider.is_configured():
+            return []
+
+        breaker = self.breakers[name]
+        bucket = self.buckets[name]
+        deadline = current_deadline()
+        tenant = current_tenant()
+
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow_request():
+                self._record(name, skipped=1)
+                logger.info(f"Skipping provider {name}: circuit open")
+                return []
+
+            # Below, exits without a call or its outcome give a half-open circuit's trial back
+
+            # Attempts are cut short by the request deadline, not only the provider timeout
+            timeout = deadline.timeout("search", provider.timeout)
+            if timeout <= 0:
+                breaker.release()
+                self._record(name, skipped=1)
+                deadline.degrade("search", "skipped", provider=name)
+                return []
+
+            # Every attempt is an API call charged to the tenant
+            if not self.budgets.try_acquire(tenant, name):
+                breaker.release()
+                self._record(name, skipped=1)
+                metrics.inc("plagiarism_tenant_api_budget_exhausted_total",
+                            labels={'tenant': tenant, 'provider': name},
+                            description="Scholarly API calls skipped because the tenant's budget was used up")
+                logger.info(f"Skipping provider {name}: API budget of tenant {tenant} used up")
+                return []
+
+            if not bucket.acquire(timeout=timeout):
+                breaker.release()
+                self._record(name, skipped=1, last_error="rate limit wait exceeded timeout")
+                return []
+
+            self._record(name, calls=1)
+            start_time = time.monotonic()
+            # Run in the caller's context so per-request profiling sees the call
+            context = contextvars.copy_context()
+            future = self.executor.submit(context.run, provider.search, query, num_results)
+            try:
+                with stage(f"provider_{name}"):
+                    results = future.result(timeout=timeout)
+                latency = time.monotonic() - start_time
+                breaker.record_success()
+                self._record(name, successes=1, last_latency=latency)
+                record_provider_call(name, latency, "success")
+                return results
+            except FutureTimeoutError:
+                if not future.cancel():
+                    # Already running; its thread is busy until the provider call returns
+                    self._record(name, abandoned=1)
+                if timeout < provider.timeout:
+                    # Out of request time; not a provider failure
+                    breaker.release()
+                    self._record(name, skipped=1)
+                    deadline.degrade("search", "cut_short", provider=name, timeout_s=round(timeout, 3))
+                    return []
+                retryable = True
+                outcome = "timeout"
+                self._record(name, timeouts=1, failures=1, last_error=f"timed out after {provider.timeout}s")
+            except ProviderError as e:
+                retryable = e.retryable
+                outcome = "error"
+                self._record(name, failures=1, last_error=str(e))
+            except requests.RequestException as e:
+                retryable = True
+                outcome = "error"
+                self._record(name, failures=1, last_error=str(e))
+            except Exception as e:
+                retryable = False
+                outcome = "error"
+                self._record(name, failures=1, last_error=str(e))
+
+            latency = time.monotonic() - start_time
+            self._record(name, last_latency=latency)
+            record_provider_call(name, latency, outcome)
+            breaker.record_failure()
+            logger.warning(f"Provider {name} attempt {attempt + 1} failed: {self.stats[name]['last_error']}")
+
+            if not retryable or attempt == self.max_retries:
+                break
+
+            # Exponential backoff with full jitter
+            time.sleep(random.uniform(0, self.backoff_base * (2 ** attempt)))
+
+        return []
+
+    def search_all(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        """
+        Search every registered provider concurrently
+
+        Args:
+            query: Search query
+            num_results: Number of results to return from each provider
+
+        Returns:
+            Combined list of results, in provider registration order
+        """
+        names = list(self.providers)
+        with ThreadPoolExecutor(max_workers=max(1, len(names))) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, self.search, name, query, num_results)
+                       for name in names]
+            results = []
+            for future in futures:
+                results.extend(future.result())
+        return results
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Report health for every registered provider
+
+        Returns:
+            Dictionary mapping provider names to their configuration, circuit
+            state and call statistics
+        """
+        report = {}
+        with self.stats_lock:
+            for name, provider in self.providers.items():
+                configured = provider.is_configured()
+                state = self.breakers[name].state
+                if not configured:
+                    status = "disabled"
+                elif state == CircuitBreaker.CLOSED:
+                    status = "healthy"
+                elif state == CircuitBreaker.HALF_OPEN:
+                    status = "recovering"
+                else:
+                    status = "unhealthy"
+                report[name] = dict(self.stats[name], configured=configured,
+                                    circuit_state=state, status=status)
+        return report
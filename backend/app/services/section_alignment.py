@@ -0,0 +1,144 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.metrics import metrics, stage
+from app.services.cascade import SCORE_WEIGHTS
+from app.utils.pdf_extractor import PDFExtractor
+from app.utils.text import clean_pdf_text
+
+# Sections compared like with like; the title, references and unrecognized text are not
+ALIGNED_SECTIONS = ("abstract", "introduction", "methodology", "results", "discussion", "conclusion")
+# Share of the lexical weights in a section's score
+_LEXICAL_WEIGHT = SCORE_WEIGHTS['ngram'] + SCORE_WEIGHTS['fuzzy']
+
+
+class SectionAligner:
+    """
+    Section-aligned comparison of a suspect with a reference.
+
+    References are split into sections with the suspect's extractor, and each
+    suspect section is compared with the reference section of the same name
+    (abstract with abstract, methodology with methodology). A suspect section
+    is also compared with another reference section only when the reference
+    as a whole holds clearly more of its n-grams than the aligned section
+    does (text moved between sections); the other sections are never
+    compared. Fuzzy matching, the expensive lexical method, therefore runs on
+    a few short section pairs instead of two whole documents.
+
+    Sections come from the extractor's heading lines, or from headings found
+    inline when the text's line breaks were lost (as in extracted
+    documents). Texts with fewer than two recognized sections are compared
+    as a whole.
+
+    Args:
+        plagiarism_checker: PlagiarismChecker providing preprocessing and similarity methods
+        cross_section_signal: Share of a suspect section's n-grams that must occur in the
+            reference, beyond those in the aligned section, to compare it across sections
+            (defaults to SECTION_CROSS_SIGNAL or 0.05)
+        min_words: Shortest section compared
+    """
+
+    def __init__(self, plagiarism_checker, cross_section_signal: Optional[float] = None, min_words: int = 20):
+        self.checker = plagiarism_checker
+        self.cross_section_signal = cross_section_signal if cross_section_signal is not None else \
+            float(os.getenv("SECTION_CROSS_SIGNAL", "0.05"))
+        self.min_words = min_words
+        self.extractor = PDFExtractor()
+
+    def split(self, text: str) -> Dict[str, str]:
+        """Aligned sections of a raw or preprocessed text ({} when it has fewer than two)"""
+        with stage("section_split"):
+            sections = self._aligned(self.extractor.extract_sections(text))
+            if not sections:
+                sections = self._aligned(self.extractor.extract_inline_sections(clean_pdf_text(text)))
+        return sections
+
+    def select(self, sections: Dict[str, str]) -> Dict[str, str]:
+        """
+        Aligned sections of an extracted document ({} when fewer than two qualify)
+
+        When the extracted sections are not usable the document is split
+        again from its concatenated text.
+        """
+        return self._aligned(sections) or self.split(" ".join(sections.values()))
+
+    def _aligned(self, sections: Dict[str, str]) -> Dict[str, str]:
+        selected = {name: content for name, content in sections.items()
+                    if name in ALIGNED_SECTIONS and len(content.split()) >= self.min_words}
+        return selected if len(selected) >= 2 else {}
+
+    def prepare(self, sections: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """Preprocessed text, n-gram fingerprints and word count of each section"""
+        prepared = {}
+        for name, content in sections.items():
+            processed = self.checker.preprocess_text(content)
+            prepared[name] = {'text': processed, 'hashes': set(self.checker.hash_ngrams(processed)),
+                              'words': len(processed.split())}
+        return prepared
+
+    def _pair(self, suspect: Dict[str, Any], reference: Dict[str, Any]) -> Tuple[float, float, float]:
+        """N-gram similarity, containment of the suspect section and fuzzy similarity of a section pair"""
+        shared = len(suspect['hashes'] & reference['hashes'])
+        union = len(suspect['hashes'] | reference['hashes'])
+        ngram_sim = shared / union if union else 0.0
+        containment = shared / len(suspect['hashes']) if suspect['hashes'] else 0.0
+        fuzzy_sim = self.checker.fuzzy_match_similarity(suspect['text'], reference['text'])
+        return ngram_sim, containment, fuzzy_sim
+
+    def compare(self, suspect: Dict[str, Dict[str, Any]],
+                reference: Dict[str, Dict[str, Any]]) -> Tuple[float, List[Dict[str, Any]]]:
+        """
+        Compare prepared suspect and reference sections
+
+        Returns:
+            Tuple of (fuzzy similarity of the document: the best fuzzy
+            similarity of each compared suspect section, weighted by its
+            length; section matches, highest score first). Each match has
+            'suspect_section', 'reference_section', 'aligned', 'ngram_similarity',
+            'containment', 'fuzzy_similarity' and 'score' (the lexical part of
+            overall_score).
+        """
+        reference_hashes = set().union(*(section['hashes'] for section in reference.values()))
+        matches = []
+        weighted_fuzzy = 0.0
+        compared_words = 0
+        cross_section = 0
+        with stage("section_compare"):
+            for name, section in suspect.items():
+                if not section['hashes']:
+                    continue
+                pairs = []
+                aligned_shared = len(section['hashes'] & reference[name]['hashes']) if name in reference else 0
+                if name in reference:
+                    pairs.append((name, True))
+                # Cross-section comparison only where the rest of the reference holds its text
+                elsewhere = len(section['hashes'] & reference_hashes) - aligned_shared
+                if elsewhere / len(section['hashes']) >= self.cross_section_signal:
+                    other = max((other for other in reference if other != name),
+                                key=lambda other: len(section['hashes'] & reference[other]['hashes']), default=None)
+                    if other is not None:
+                        pairs.append((other, False))
+                        cross_section += 1
+                best_fuzzy = None
+                for other, aligned in pairs:
+                    ngram_sim, containment, fuzzy_sim = self._pair(section, reference[other])
+                    matches.append({
+                        'suspect_section': name,
+                        'reference_section': other,
+                        'aligned': aligned,
+                        'ngram_similarity': float(ngram_sim),
+                        'containment': float(containment),
+                        'fuzzy_similarity': float(fuzzy_sim),
+                        'score': float((SCORE_WEIGHTS['ngram'] * ngram_sim + SCORE_WEIGHTS['fuzzy'] * fuzzy_sim)
+                                       / _LEXICAL_WEIGHT),
+                    })
+                    best_fuzzy = fuzzy_sim if best_fuzzy is None else max(best_fuzzy, fuzzy_sim)
+                if best_fuzzy is not None:
+                    weighted_fuzzy += best_fuzzy * section['words']
+                    compared_words += section['words']
+        if cross_section:
+            metrics.inc("plagiarism_cross_section_comparisons_total", cross_section,
+                        description="Section pairs compared across different section names")
+
+        matches.sort(key=lambda match: match['score'], reverse=True)
+        return (weighted_fuzzy / compared_words if compared_words else 0.0), matches
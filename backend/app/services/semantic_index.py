@@ -0,0 +1,341 @@
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.metrics import stage
+from app.utils.text import split_sentences
+
+EMBEDDINGS_FILE = "embeddings.bin"
+SCALES_FILE = "scales.bin"
+REF_IDS_FILE = "ref_ids.bin"
+OFFSETS_FILE = "offsets.bin"
+SENTENCES_FILE = "sentences.txt"
+META_FILE = "meta.json"
+
+
+def quantize(embeddings: np.ndarray, dtype: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Quantize row vectors for storage
+
+    Args:
+        embeddings: Float array of shape (n, dim)
+        dtype: 'int8' (symmetric per-row scale) or 'float16'
+
+    Returns:
+        Tuple of (quantized rows, per-row float32 scales)
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if dtype == "float16":
+        return embeddings.astype(np.float16), np.ones(len(embeddings), dtype=np.float32)
+    if dtype == "int8":
+        scales = np.abs(embeddings).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    raise ValueError(f"Unsupported index dtype: {dtype}")
+
+
+class SentenceIndexBuilder:
+    """
+    Writes a SentenceIndex incrementally. Rows are appended to flat binary files
+    as references are added, so building never holds the corpus in memory.
+
+    Args:
+        directory: Output directory (created if missing)
+        dim: Embedding dimension
+        dtype: Storage type, 'int8' (default, 1 byte per value) or 'float16'
+    """
+
+    def __init__(self, directory: str, dim: int, dtype: str = "int8"):
+        if dtype not in ("int8", "float16"):
+            raise ValueError(f"Unsupported index dtype: {dtype}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dim = dim
+        self.dtype = dtype
+        self.count = 0
+        self.references: List[Dict[str, Any]] = []
+        self.text_offset = 0
+
+        self.files = {
+            name: open(os.path.join(directory, name), "wb")
+            for name in (EMBEDDINGS_FILE, SCALES_FILE, REF_IDS_FILE, OFFSETS_FILE, SENTENCES_FILE)
+        }
+
+    def add(self, ref_key: str, sentences: List[str], embeddings: np.ndarray,
+            info: Optional[Dict[str, Any]] = None):
+        """
+        Append the sentences of one reference
+
+        Args:
+            ref_key: Stable identifier of the reference (DOI, URL, file path...)
+            sentences: Sentences of the reference
+            embeddings: Normalized embeddings of the sentences, shape (len(sentences), dim)
+            info: Optional metadata stored with the reference (title, link, ...)
+        """
+        if len(sentences) != len(embeddings):
+            raise ValueError("sentences and embeddings must have the same length")
+        if len(sentences) == 0:
+            return
+        if embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dimension {self.dim}, got {embeddings.shape[1]}")
+
+        ref_id = len(self.references)
+        self.references.append({'key': ref_key, 'info': info or {}, 'sentences': len(sentences)})
+
+        quantized, scales = quantize(embeddings, self.dtype)
+        self.files[EMBEDDINGS_FILE].write(quantized.tobytes())
+        self.files[SCALES_FILE].write(scales.tobytes())
+        self.files[REF_IDS_FILE].write(np.full(len(sentences), ref_id, dtype=np.int32).tobytes())
+
+        offsets = np.empty(len(sentences), dtype=np.int64)
+        for i, sentence in enumerate(sentences):
+            encoded = (sentence.replace("\n", " ") + "\n").encode("utf-8")
+            offsets[i] = self.text_offset
+            self.files[SENTENCES_FILE].write(encoded)
+            self.text_offset += len(encoded)
+        self.files[OFFSETS_FILE].write(offsets.tobytes())
+        self.count += len(sentences)
+
+    def finalize(self, metadata: Optional[Dict[str, Any]] = None) -> "SentenceIndex":
+        """Close the files, write the metadata and open the finished index"""
+        for f in self.files.values():
+            f.close()
+        meta = {
+            'version': 1,
+            'dim': self.dim,
+            'dtype': self.dtype,
+            'count': self.count,
+            'references': self.references,
+        }
+        meta.update(metadata or {})
+        with open(os.path.join(self.directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return SentenceIndex(self.directory)
+
+
+class SentenceIndex:
+    """
+    Read-only sentence embedding index over a reference corpus.
+
+    Embeddings are stored quantized (int8 with a per-row scale, or float16) in
+    flat files that are memory-mapped, so memory use does not grow with the
+    corpus: one million 384-dim sentences take about 390 MB on disk in int8 and
+    only the pages touched by a scan are resident. Queries scan the matrix in
+    chunks and keep a running top-k.
+
+    Args:
+        directory: Directory written by SentenceIndexBuilder
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.dim = self.meta['dim']
+        self.count = self.meta['count']
+        self.references = self.meta['references']
+        self.model = self.meta.get('model')
+
+        dtype = np.int8 if self.meta['dtype'] == "int8" else np.float16
+        if self.count:
+            self.embeddings = np.memmap(os.path.join(directory, EMBEDDINGS_FILE), dtype=dtype, mode="r",
+                                        shape=(self.count, self.dim))
+            self.scales = np.memmap(os.path.join(directory, SCALES_FILE), dtype=np.float32, mode="r",
+                                    shape=(self.count,))
+            self.ref_ids = np.memmap(os.path.join(directory, REF_IDS_FILE), dtype=np.int32, mode="r",
+                                     shape=(self.count,))
+            self.offsets = np.memmap(os.path.join(directory, OFFSETS_FILE), dtype=np.int64, mode="r",
+                                     shape=(self.count,))
+        else:
+            self.embeddings = np.zeros((0, self.dim), dtype=dtype)
+            self.scales = np.zeros(0, dtype=np.float32)
+            self.ref_ids = np.zeros(0, dtype=np.int32)
+            self.offsets = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def check_model(self, model: str):
+        """Raise ValueError unless the index holds embeddings of `model` (EmbeddingModel.name)"""
+        if self.model != model:
+            raise ValueError(f"Sentence index {self.directory} was built with model {self.model!r}, "
+                             f"not {model!r}; rebuild it with the configured model")
+
+    def sentence(self, row: int) -> str:
+        """Text of an indexed sentence"""
+        with open(os.path.join(self.directory, SENTENCES_FILE), "rb") as f:
+            f.seek(int(self.offsets[row]))
+            return f.readline().decode("utf-8").rstrip("\n")
+
+    def search(self, queries: np.ndarray, k: int = 5, chunk_rows: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Batched top-k cosine search
+
+        Args:
+            queries: Normalized query embeddings of shape (m, dim)
+            k: Number of neighbours per query
+            chunk_rows: Index rows dequantized and scored at a time
+
+        Returns:
+            Tuple of (scores, rows), both of shape (m, k'), k' = min(k, len(index)),
+            sorted by descending score
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        m = len(queries)
+        k = min(k, self.count)
+        if m == 0 or k == 0:
+            return np.zeros((m, 0), dtype=np.float32), np.zeros((m, 0), dtype=np.int64)
+
+        best_scores = np.full((m, k), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((m, k), dtype=np.int64)
+
+        with stage("sentence_index_search"):
+            for start in range(0, self.count, chunk_rows):
+                end = min(start + chunk_rows, self.count)
+                chunk = np.asarray(self.embeddings[start:end], dtype=np.float32)
+                chunk *= np.asarray(self.scales[start:end])[:, None]
+                scores = queries @ chunk.T
+
+                # Merge this chunk's candidates with the running top-k
+                take = min(k, end - start)
+                part = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+                part_scores = np.take_along_axis(scores, part, axis=1)
+                merged_scores = np.concatenate([best_scores, part_scores], axis=1)
+                merged_rows = np.concatenate([best_rows, part + start], axis=1)
+                keep = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(merged_scores, keep, axis=1)
+                best_rows = np.take_along_axis(merged_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+    def coverage(self, queries: np.ndarray, threshold: float = 0.85, k: int = 5,
+                 max_examples: int = 3, query_sentences: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Roll sentence hits up into per-reference paraphrase coverage
+
+        Coverage of a reference is the fraction of suspect sentences whose best
+        match within that reference reaches `threshold`.
+
+        Args:
+            queries: Normalized embeddings of the suspect sentences
+            threshold: Minimum cosine similarity for a sentence to count as matched
+            k: Neighbours retrieved per suspect sentence
+            max_examples: Matched sentence pairs reported per reference
+            query_sentences: Optional suspect sentences, included in the examples
+
+        Returns:
+            List of dictionaries sorted by descending coverage, each with
+            'reference_key', 'paper_info', 'coverage', 'matched_sentences',
+            'mean_similarity' and 'examples'
+        """
+        scores, rows = self.search(queries, k)
+        if scores.size == 0:
+            return []
+
+        # Best score per (suspect sentence, reference)
+        per_reference: Dict[int, Dict[int, Tuple[float, int]]] = {}
+        for query_index in range(len(scores)):
+            for score, row in zip(scores[query_index], rows[query_index]):
+                if score < threshold:
+                    break
+                ref_id = int(self.ref_ids[row])
+                matches = per_reference.setdefault(ref_id, {})
+                if query_index not in matches or score > matches[query_index][0]:
+                    matches[query_index] = (float(score), int(row))
+
+        results = []
+        for ref_id, matches in per_reference.items():
+            best = sorted(matches.items(), key=lambda item: item[1][0], reverse=True)
+            examples = []
+            for query_index, (score, row) in best[:max_examples]:
+                example = {'similarity': round(score, 4), 'reference_sentence': self.sentence(row)}
+                if query_sentences is not None:
+                    example['suspect_sentence'] = query_sentences[query_index]
+                examples.append(example)
+            reference = self.references[ref_id]
+            results.append({
+                'reference_key': reference['key'],
+                'paper_info': reference.get('info', {}),
+                'coverage': len(matches) / len(scores),
+                'matched_sentences': len(matches),
+                'mean_similarity': float(np.mean([score for score, _ in matches.values()])),
+                'examples': examples,
+            })
+
+        results.sort(key=lambda result: result['coverage'], reverse=True)
+        return results
+
+
+def build_sentence_index(documents: Iterable[Tuple[str, str, Dict[str, Any]]], directory: str,
+                         embed: Callable[[List[str]], np.ndarray], dim: int, dtype: str = "int8",
+                         metadata: Optional[Dict[str, Any]] = None) -> SentenceIndex:
+    """
+    Build a sentence index from (reference key, text, info) tuples
+
+    Args:
+        documents: Iterable of (reference key, full text, metadata) tuples
+        directory: Output directory
+        embed: Function returning normalized embeddings for a list of sentences
+        dim: Embedding dimension
+        dtype: 'int8' or 'float16'
+        metadata: Extra metadata stored in meta.json
+
+    Returns:
+        The finished SentenceIndex
+    """
+    builder = SentenceIndexBuilder(directory, dim, dtype)
+    for ref_key, text, info in documents:
+        sentences = split_sentences(text)
+        if sentences:
+            builder.add(ref_key, sentences, embed(sentences), info)
+    return builder.finalize(metadata)
+
+
+def iter_corpus(directory: str, pdf_extractor) -> Iterable[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Yield (path, text, info) for every .txt and .pdf file under a directory
+
+    Args:
+        directory: Corpus directory
+        pdf_extractor: PDFExtractor used for PDF files
+    """
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if name.lower().endswith(".pdf"):
+                with open(path, "rb") as f:
+                    text = pdf_extractor.preprocess_text(pdf_extractor.extract_text_from_pdf(f))
+            elif name.lower().endswith(".txt"):
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    text = f.read()
+            else:
+                continue
+            yield path, text, {'title': os.path.splitext(name)[0], 'link': path, 'source': 'Local corpus'}
+
+
+def main(argv=None):
+    """Build a sentence index from a directory of .txt and .pdf files"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build a sentence embedding index over a reference corpus")
+    parser.add_argument("input", help="Directory of .txt and .pdf reference documents")
+    parser.add_argument("output", help="Index directory to create")
+    parser.add_argument("--dtype", choices=["int8", "float16"], default="int8")
+    args = parser.parse_args(argv)
+
+    from app.services.plagiarism_checker import PlagiarismChecker
+    from app.utils.pdf_extractor import PDFExtractor
+
+    checker = PlagiarismChecker()
+    index = build_sentence_index(iter_corpus(args.input, PDFExtractor()), args.output,
+                                 checker.get_sentence_embeddings, checker.embedder.dim, args.dtype,
+                                 metadata={'model': checker.embedder.name})
+    print(f"Indexed {len(index)} sentences from {len(index.references)} references into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,637 @@
+import hashlib
+import heapq
+import ipaddress
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Client, Listener
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.metrics import metrics, stage
+from app.services.dedup import cluster_near_duplicates
+from app.services.semantic_index import SentenceIndex, build_sentence_index, iter_corpus
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINTS_FILE = "fingerprints.npy"
+DOC_IDS_FILE = "doc_ids.npy"
+REFERENCES_FILE = "references.json"
+SENTENCES_DIR = "sentences"
+# References of a shard spooled while a corpus is partitioned
+SPOOL_DOCUMENTS_FILE = "documents.jsonl.tmp"
+SPOOL_FINGERPRINTS_FILE = "fingerprints.bin.tmp"
+
+
+def fingerprint_array(hashes: Iterable[str]) -> np.ndarray:
+    """
+    Convert hex n-gram hashes (as returned by PlagiarismChecker.hash_ngrams)
+    into a sorted array of unique 64-bit fingerprints
+    """
+    return np.unique(np.array([int(h[:16], 16) for h in hashes], dtype=np.uint64))
+
+
+def shard_for(ref_key: str, num_shards: int) -> int:
+    """Stable shard assignment of a reference"""
+    return int(hashlib.sha1(ref_key.encode("utf-8")).hexdigest()[:8], 16) % num_shards
+
+
+class FingerprintShard:
+    """
+    N-gram fingerprint index over the references of one shard.
+
+    Fingerprints of all references are stored as one array sorted by
+    fingerprint, with a parallel array of reference ids, so a query is a
+    vectorized binary search rather than a scan of per-reference sets.
+
+    Args:
+        directory: Shard directory written by build_shards
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, REFERENCES_FILE), "r", encoding="utf-8") as f:
+            self.references = json.load(f)
+        self.fingerprints = np.load(os.path.join(directory, FINGERPRINTS_FILE), mmap_mode="r")
+        self.doc_ids = np.load(os.path.join(directory, DOC_IDS_FILE), mmap_mode="r")
+        self.sizes = np.array([reference['fingerprints'] for reference in self.references], dtype=np.int64)
+
+        sentences_dir = os.path.join(directory, SENTENCES_DIR)
+        self.sentence_index = SentenceIndex(sentences_dir) \
+            if os.path.exists(os.path.join(sentences_dir, "meta.json")) else None
+
+    def search_fingerprints(self, fingerprints: np.ndarray, k: int = 10,
+                            min_similarity: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        Top-k references by n-gram Jaccard similarity
+
+        Args:
+            fingerprints: Sorted unique fingerprints of the suspect (fingerprint_array)
+            k: Number of references returned
+            min_similarity: Minimum Jaccard similarity
+
+        Returns:
+            List of matches sorted by descending similarity
+        """
+        if len(fingerprints) == 0 or len(self.fingerprints) == 0:
+            return []
+
+        left = np.searchsorted(self.fingerprints, fingerprints, side="left")
+        right = np.searchsorted(self.fingerprints, fingerprints, side="right")
+        hits = right > left
+        if not hits.any():
+            return []
+        matched_rows = np.concatenate([np.arange(l, r) for l, r in zip(left[hits], right[hits])])
+        shared = np.bincount(self.doc_ids[matched_rows], minlength=len(self.references))
+
+        candidates = np.nonzero(shared)[0]
+        union = len(fingerprints) + self.sizes[candidates] - shared[candidates]
+        similarity = shared[candidates] / union
+        order = np.argsort(-similarity)[:k]
+
+        matches = []
+        for i in order:
+            if similarity[i] < min_similarity:
+                break
+            reference = self.references[int(candidates[i])]
+            matches.append({
+                'reference_key': reference['key'],
+                'paper_info': reference.get('info', {}),
+                'ngram_similarity': float(similarity[i]),
+                'containment': float(shared[candidates[i]] / len(fingerprints)),
+                'shared_ngrams': int(shared[candidates[i]]),
+                'aliases': reference.get('aliases', [])
+            })
+        return matches
+
+    def search_sentences(self, embeddings: np.ndarray, k: int = 10, threshold: float = 0.9,
+                         query_sentences: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Top-k references by paraphrase coverage (empty when the shard has no sentence index)"""
+        if self.sentence_index is None or len(self.sentence_index) == 0:
+            return []
+        return self.sentence_index.coverage(embeddings, threshold=threshold,
+                                            query_sentences=query_sentences)[:k]
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer one request sent by a ShardClient"""
+        op = request.get('op')
+        if op == 'ping':
+            return {'ok': True, 'references': len(self.references),
+                    'sentences': len(self.sentence_index) if self.sentence_index is not None else 0,
+                    'model': self.sentence_index.model if self.sentence_index is not None else None}
+        if op == 'search':
+            fingerprint_matches = []
+            if request.get('fingerprints') is not None:
+                fingerprint_matches = self.search_fingerprints(request['fingerprints'], request.get('k', 10),
+                                                               request.get('min_similarity', 0.0))
+            paraphrase_matches = []
+            if request.get('embeddings') is not None:
+                if self.sentence_index is not None and request.get('model') is not None:
+                    try:
+                        self.sentence_index.check_model(request['model'])
+                    except ValueError as e:
+                        return {'ok': False, 'error': str(e)}
+                paraphrase_matches = self.search_sentences(request['embeddings'], request.get('k', 10),
+                                                           request.get('threshold', 0.9),
+                                                           request.get('query_sentences'))
+            return {'ok': True, 'fingerprint_matches': fingerprint_matches,
+                    'paraphrase_matches': paraphrase_matches}
+        return {'ok': False, 'error': f"Unknown operation: {op}"}
+
+
+class _ShardWriter:
+    """
+    Spools the references of one shard to its directory while a corpus is
+    partitioned, then writes the shard from the spool, so only one shard's
+    fingerprints are in memory at a time and texts never are.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.documents = open(os.path.join(directory, SPOOL_DOCUMENTS_FILE), "w", encoding="utf-8")
+        self.fingerprints = open(os.path.join(directory, SPOOL_FINGERPRINTS_FILE), "wb")
+        self.sizes: List[int] = []
+
+    def add(self, ref_key: str, text: str, info: Dict[str, Any], values: np.ndarray):
+        self.documents.write(json.dumps([ref_key, text, info]) + "\n")
+        self.fingerprints.write(np.asarray(values, dtype=np.uint64).tobytes())
+        self.sizes.append(len(values))
+
+    def _spooled(self) -> Iterable[Tuple[str, str, Dict[str, Any], np.ndarray]]:
+        """(key, text, info, fingerprints) of the spooled references, in the order they were added"""
+        path = os.path.join(self.directory, SPOOL_FINGERPRINTS_FILE)
+        fingerprints = np.memmap(path, dtype=np.uint64, mode="r") if os.path.getsize(path) \
+            else np.zeros(0, dtype=np.uint64)
+        start = 0
+        with open(os.path.join(self.directory, SPOOL_DOCUMENTS_FILE), "r", encoding="utf-8") as f:
+            for line, size in zip(f, self.sizes):
+                ref_key, text, info = json.loads(line)
+                yield ref_key, text, info, fingerprints[start:start + size]
+                start += size
+
+    def finish(self, keep: Optional[set], aliases: Dict[str, List[Dict[str, Any]]],
+               embed: Optional[Callable[[List[str]], np.ndarray]], dim: Optional[int], dtype: str,
+               metadata: Optional[Dict[str, Any]]):
+        """Write the shard's indexes from the spool, keeping only the references in `keep` (all when None)"""
+        self.documents.close()
+        self.fingerprints.close()
+        references, fingerprint_parts, doc_id_parts = [], [], []
+        for ref_key, _, info, values in self._spooled():
+            if keep is not None and ref_key not in keep:
+                continue
+            doc_id_parts.append(np.full(len(values), len(references), dtype=np.int32))
+            fingerprint_parts.append(np.array(values))
+            references.append({'key': ref_key, 'info': info, 'fingerprints': int(len(values)),
+                               'aliases': aliases.get(ref_key, [])})
+
+        values = np.concatenate(fingerprint_parts) if fingerprint_parts else np.zeros(0, dtype=np.uint64)
+        doc_ids = np.concatenate(doc_id_parts) if doc_id_parts else np.zeros(0, dtype=np.int32)
+        del fingerprint_parts, doc_id_parts
+        order = np.argsort(values, kind="stable")
+        np.save(os.path.join(self.directory, FINGERPRINTS_FILE), values[order])
+        np.save(os.path.join(self.directory, DOC_IDS_FILE), doc_ids[order])
+        with open(os.path.join(self.directory, REFERENCES_FILE), "w", encoding="utf-8") as f:
+            json.dump(references, f)
+        del values, doc_ids, order
+
+        if embed is not None:
+            build_sentence_index(((ref_key, text, info) for ref_key, text, info, _ in self._spooled()
+                                  if keep is None or ref_key in keep),
+                                 os.path.join(self.directory, SENTENCES_DIR), embed, dim, dtype, metadata)
+        os.remove(os.path.join(self.directory, SPOOL_DOCUMENTS_FILE))
+        os.remove(os.path.join(self.directory, SPOOL_FINGERPRINTS_FILE))
+
+
+def build_shards(documents: Iterable[Tuple[str, str, Dict[str, Any]]], directory: str, num_shards: int,
+                 fingerprint: Callable[[str], np.ndarray],
+                 embed: Optional[Callable[[List[str]], np.ndarray]] = None, dim: Optional[int] = None,
+                 dtype: str = "int8", metadata: Optional[Dict[str, Any]] = None,
+                 dedup_threshold: float = 0.0) -> List[str]:
+    """
+    Partition a reference corpus into shards
+
+    Each reference is assigned to one shard by a hash of its key, so every
+    shard holds complete references and per-reference scores computed by a
+    shard are final. With `dedup_threshold`, near-duplicates across the
+    whole corpus are clustered first and only the most complete copy of each
+    cluster is indexed; the others are stored as its 'aliases'.
+
+    Documents are streamed: each is spooled to its shard's directory as it
+    is read, and the shards are then written one at a time. Texts are never
+    held in memory, and fingerprints only for one shard at a time, except
+    that deduplication needs the fingerprints of the whole corpus.
+
+    Args:
+        documents: Iterable of (reference key, full text, metadata) tuples
+        directory: Output directory; shards are written to shard-000, shard-001, ...
+        num_shards: Number of shards
+        fingerprint: Function returning the fingerprint array of a text
+        embed: Optional sentence embedding function; when given, each shard also
+            gets a sentence index
+        dim: Embedding dimension (required with `embed`)
+        dtype: Storage type of the sentence indexes
+        metadata: Extra metadata stored with the sentence indexes
+        dedup_threshold: Minimum n-gram containment of near-duplicates (0 disables)
+
+    Returns:
+        List of shard directories
+    """
+    shard_dirs = [os.path.join(directory, f"shard-{i:03d}") for i in range(num_shards)]
+    writers = [_ShardWriter(shard_dir) for shard_dir in shard_dirs]
+    dedup_items: List[Tuple[str, np.ndarray]] = []
+    infos: Dict[str, Dict[str, Any]] = {}
+    for ref_key, text, info in documents:
+        values = fingerprint(text)
+        writers[shard_for(ref_key, num_shards)].add(ref_key, text, info, values)
+        if dedup_threshold > 0:
+            dedup_items.append((ref_key, values))
+            infos[ref_key] = info
+
+    keep = None
+    aliases: Dict[str, List[Dict[str, Any]]] = {}
+    if dedup_threshold > 0:
+        clusters = cluster_near_duplicates(dedup_items, dedup_threshold)
+        del dedup_items
+        for cluster in clusters:
+            aliases[cluster['canonical']] = [{'key': key, 'info': infos[key], 'similarity': float(similarity)}
+                                             for key, similarity in cluster['aliases']]
+        keep = set(aliases)
+        logger.info(f"Indexing {len(keep)} references after folding "
+                    f"{sum(len(cluster['aliases']) for cluster in clusters)} near-duplicates")
+
+    for writer in writers:
+        writer.finish(keep, aliases, embed, dim, dtype, metadata)
+    return shard_dirs
+
+
+def _serve_connection(shard: FingerprintShard, conn):
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+            try:
+                response = shard.handle(request)
+            except Exception as e:
+                logger.error(f"Shard {shard.directory} failed to handle request: {str(e)}")
+                response = {'ok': False, 'error': str(e)}
+            conn.send(response)
+    finally:
+        conn.close()
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve_shard(directory: str, host: str = "127.0.0.1", port: int = 0, authkey: Optional[bytes] = None,
+                ready: Optional[Any] = None):
+    """
+    Serve a shard until the process is terminated
+
+    Requests are pickled, so shards must only listen on trusted networks and
+    every client must present the shared `authkey` (SHARD_AUTHKEY). Without
+    an authkey a shard only listens on a loopback address.
+
+    Args:
+        directory: Shard directory
+        host: Interface to listen on
+        port: Port to listen on (0 picks a free port)
+        authkey: Shared secret
+        ready: Optional multiprocessing connection that receives the bound address
+
+    Raises:
+        ValueError: If `host` is not a loopback address and there is no `authkey`
+    """
+    if not authkey and not _is_loopback(host):
+        raise ValueError(f"Refusing to serve a shard on {host} without SHARD_AUTHKEY: "
+                         "anyone reaching the port could run code through pickled requests")
+    shard = FingerprintShard(directory)
+    if not authkey:
+        logger.warning("Serving a shard without SHARD_AUTHKEY; any local process can query it")
+    with Listener((host, port), authkey=authkey) as listener:
+        logger.info(f"Serving shard {directory} ({len(shard.references)} references) on {listener.address}")
+        if ready is not None:
+            ready.send(listener.address)
+            ready.close()
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:  # failed handshake
+                logger.warning(f"Rejected shard connection: {str(e)}")
+                continue
+            threading.Thread(target=_serve_connection, args=(shard, conn), daemon=True).start()
+
+
+class ShardClient:
+    """
+    Connection to one shard server. The connection is opened lazily, reused
+    across requests and reopened after a failure.
+
+    Args:
+        address: (host, port) of the shard
+        authkey: Shared secret
+        timeout: Seconds to wait for a response
+    """
+
+    def __init__(self, address: Tuple[str, int], authkey: Optional[bytes] = None, timeout: float = 10.0):
+        self.address = tuple(address)
+        self.authkey = authkey
+        self.timeout = timeout
+        self.conn = None
+        self.lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return f"{self.address[0]}:{self.address[1]}"
+
+    def request(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a request and wait for the response"""
+        with self.lock:
+            try:
+                if self.conn is None:
+                    self.conn = Client(self.address, authkey=self.authkey)
+                self.conn.send(payload)
+                if not self.conn.poll(self.timeout):
+                    raise TimeoutError(f"Shard {self.name} did not answer within {self.timeout}s")
+                response = self.conn.recv()
+            except Exception:
+                self.close_connection()
+                raise
+        if not response.get('ok'):
+            raise RuntimeError(response.get('error', f"Shard {self.name} failed"))
+        return response
+
+    def close_connection(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except OSError:
+                pass
+            self.conn = None
+
+
+class ShardedSearch:
+    """
+    Scatter/gather search over fingerprint and sentence index shards.
+
+    Every query is sent to all shards in parallel and the per-shard top-k
+    lists are merged into a global top-k. A shard that fails or times out is
+    reported in 'failed_shards' and the remaining shards' results are
+    returned with 'partial' set.
+
+    Args:
+        clients: One ShardClient per shard
+        sentences: Whether the shards have sentence indexes (suspect sentences
+            are only embedded when they do)
+    """
+
+    def __init__(self, clients: List[ShardClient], sentences: bool = True):
+        self.clients = clients
+        self.sentences = sentences
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(clients)), thread_name_prefix="shard")
+
+    @classmethod
+    def from_env(cls) -> Optional["ShardedSearch"]:
+        """
+        Create a client from SHARD_ADDRESSES (comma-separated host:port),
+        SHARD_AUTHKEY, SHARD_TIMEOUT and SHARD_SENTENCES; returns None when no
+        shards are configured
+        """
+        addresses = os.getenv("SHARD_ADDRESSES", "")
+        if not addresses.strip():
+            return None
+        authkey = os.getenv("SHARD_AUTHKEY", "").encode("utf-8") or None
+        timeout = float(os.getenv("SHARD_TIMEOUT", "10"))
+        clients = []
+        for address in addresses.split(","):
+            host, _, port = address.strip().rpartition(":")
+            clients.append(ShardClient((host, int(port)), authkey=authkey, timeout=timeout))
+        return cls(clients, sentences=os.getenv("SHARD_SENTENCES", "1").lower() not in ("0", "false", "no"))
+
+    def _request(self, client: ShardClient, payload: Dict[str, Any]) -> Dict[str, Any]:
+        start_time = time.perf_counter()
+        outcome = "success"
+        try:
+            return client.request(payload)
+        except Exception:
+            outcome = "failure"
+            raise
+        finally:
+            metrics.observe("plagiarism_shard_latency_seconds", time.perf_counter() - start_time,
+                            {'shard': client.name}, description="Latency of shard requests")
+            metrics.inc("plagiarism_shard_requests_total", labels={'shard': client.name, 'outcome': outcome},
+                        description="Shard requests by outcome")
+
+    def scatter(self, payload: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, str]]]:
+        """
+        Send a request to every shard
+
+        Returns:
+            Tuple of (responses of the shards that answered, failed shards with their errors)
+        """
+        futures = [(client, self.executor.submit(self._request, client, payload)) for client in self.clients]
+        responses, failed = [], []
+        for client, future in futures:
+            try:
+                responses.append(future.result())
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                logger.warning(f"Shard {client.name} failed: {error}")
+                failed.append({'shard': client.name, 'error': error})
+        return responses, failed
+
+    def search(self, fingerprints: Optional[np.ndarray] = None, embeddings: Optional[np.ndarray] = None,
+               k: int = 10, threshold: float = 0.9, min_similarity: float = 0.0,
+               query_sentences: Optional[List[str]] = None, model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Search all shards
+
+        Args:
+            fingerprints: Suspect fingerprints (fingerprint_array)
+            embeddings: Normalized suspect sentence embeddings
+            k: Global number of references returned per result list
+            threshold: Minimum sentence similarity counted as a paraphrase hit
+            min_similarity: Minimum n-gram Jaccard similarity
+            query_sentences: Suspect sentences, included in paraphrase examples
+            model: Model of the embeddings; shards whose sentence index was built
+                with another model fail the request instead of comparing them
+
+        Returns:
+            Dictionary with 'fingerprint_matches', 'paraphrase_matches',
+            'shards', 'failed_shards' and 'partial'
+        """
+        payload = {
+            'op': 'search',
+            'fingerprints': fingerprints,
+            'embeddings': embeddings,
+            'k': k,
+            'threshold': threshold,
+            'min_similarity': min_similarity,
+            'query_sentences': query_sentences,
+            'model': model
+        }
+        with stage("sharded_search"):
+            responses, failed = self.scatter(payload)
+
+        with stage("sharded_merge"):
+            fingerprint_matches = heapq.nlargest(
+                k, (match for response in responses for match in response['fingerprint_matches']),
+                key=lambda match: match['ngram_similarity']
+            )
+            paraphrase_matches = heapq.nlargest(
+                k, (match for response in responses for match in response['paraphrase_matches']),
+                key=lambda match: match['coverage']
+            )
+
+        return {
+            'fingerprint_matches': fingerprint_matches,
+            'paraphrase_matches': paraphrase_matches,
+            'shards': len(self.clients),
+            'failed_shards': failed,
+            'partial': bool(failed)
+        }
+
+    def health(self) -> List[Dict[str, Any]]:
+        """Ping every shard"""
+        responses = {}
+        futures = {client.name: self.executor.submit(self._request, client, {'op': 'ping'})
+                   for client in self.clients}
+        for name, future in futures.items():
+            try:
+                response = future.result()
+                responses[name] = {'shard': name, 'status': 'up', 'references': response['references'],
+                                   'sentences': response['sentences'], 'model': response.get('model')}
+            except Exception as e:
+                responses[name] = {'shard': name, 'status': 'down', 'error': str(e) or type(e).__name__}
+        return list(responses.values())
+
+
+class LocalShardCluster:
+    """
+    Runs one shard server process per shard directory on this machine, for
+    local testing and single-host deployments.
+
+    Args:
+        shard_dirs: Shard directories
+        host: Interface to listen on
+        base_port: First port (ports are consecutive); 0 picks free ports
+        authkey: Shared secret
+    """
+
+    def __init__(self, shard_dirs: List[str], host: str = "127.0.0.1", base_port: int = 0,
+                 authkey: Optional[bytes] = None):
+        self.shard_dirs = shard_dirs
+        self.host = host
+        self.base_port = base_port
+        self.authkey = authkey
+        self.processes: List[multiprocessing.Process] = []
+        self.addresses: List[Tuple[str, int]] = []
+
+    def start(self) -> List[Tuple[str, int]]:
+        """Start the shard processes and return their addresses"""
+        context = multiprocessing.get_context("spawn")
+        for i, shard_dir in enumerate(self.shard_dirs):
+            receiver, sender = context.Pipe(duplex=False)
+            port = self.base_port + i if self.base_port else 0
+            process = context.Process(target=serve_shard, args=(shard_dir, self.host, port, self.authkey, sender),
+                                      daemon=True, name=f"shard-{i}")
+            process.start()
+            sender.close()
+            self.processes.append(process)
+            self.addresses.append(tuple(receiver.recv()))
+            receiver.close()
+        return self.addresses
+
+    def stop(self):
+        """Terminate the shard processes"""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join(timeout=5)
+        self.processes = []
+
+    def search_client(self, timeout: float = 10.0) -> ShardedSearch:
+        """ShardedSearch connected to this cluster"""
+        return ShardedSearch([ShardClient(address, self.authkey, timeout) for address in self.addresses])
+
+    def __enter__(self) -> "LocalShardCluster":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    """Build shards from a corpus directory, or serve shards"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build and serve sharded reference indexes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Partition a directory of .txt/.pdf references into shards")
+    build.add_argument("input")
+    build.add_argument("output")
+    build.add_argument("--shards", type=int, default=4)
+    build.add_argument("--sentences", action="store_true", help="Also build per-shard sentence indexes")
+    build.add_argument("--dtype", choices=["int8", "float16"], default="int8")
+    build.add_argument("--dedup-threshold", type=float, default=0.8,
+                       help="Fold references sharing this share of n-grams into one (0 disables)")
+
+    serve = subparsers.add_parser("serve", help="Serve one shard directory")
+    serve.add_argument("shard_dir")
+    serve.add_argument("--host", default="127.0.0.1",
+                       help="Interface to listen on; other than loopback requires SHARD_AUTHKEY")
+    serve.add_argument("--port", type=int, required=True)
+
+    local = subparsers.add_parser("local", help="Serve every shard under a directory as local processes")
+    local.add_argument("directory")
+    local.add_argument("--host", default="127.0.0.1")
+    local.add_argument("--base-port", type=int, default=7600)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    authkey = os.getenv("SHARD_AUTHKEY", "").encode("utf-8") or None
+
+    if args.command == "serve":
+        serve_shard(args.shard_dir, args.host, args.port, authkey)
+    elif args.command == "local":
+        shard_dirs = sorted(os.path.join(args.directory, name) for name in os.listdir(args.directory)
+                            if name.startswith("shard-"))
+        with LocalShardCluster(shard_dirs, args.host, args.base_port, authkey) as cluster:
+            print("SHARD_ADDRESSES=" + ",".join(f"{host}:{port}" for host, port in cluster.addresses))
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+    else:
+        from app.services.plagiarism_checker import PlagiarismChecker
+        from app.utils.pdf_extractor import PDFExtractor
+
+        checker = PlagiarismChecker()
+        shard_dirs = build_shards(
+            iter_corpus(args.input, PDFExtractor()), args.output, args.shards,
+            fingerprint=lambda text: fingerprint_array(checker.hash_ngrams(checker.preprocess_text(text))),
+            embed=checker.get_sentence_embeddings if args.sentences else None,
+            dim=checker.embedder.dim, dtype=args.dtype,
+            metadata={'model': checker.embedder.name}, dedup_threshold=args.dedup_threshold
+        )
+        print(f"Wrote {len(shard_dirs)} shards to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,829 @@
+import datetime
+import heapq
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not locked against each other
+    fcntl = None
+
+from app.core.metrics import metrics, stage
+from app.services.lexical_index import TERMS_DIR, TermIndex, query_terms, write_term_index
+from app.services.semantic_index import iter_corpus, quantize
+from app.services.sharded_search import DOC_IDS_FILE, FINGERPRINTS_FILE, REFERENCES_FILE, FingerprintShard
+from app.utils.text import term_frequencies
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+SCALES_FILE = "scales.npy"
+TEXTS_FILE = "texts.txt"
+SEGMENT_META_FILE = "segment.json"
+SEGMENTS_DIR = "segments"
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "LOCK"
+# Rank constant of reciprocal rank fusion
+RRF_K = 60
+
+
+def _fsync_directory(directory: str):
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _write_atomic(path: str, data: bytes):
+    """Replace a file in one step: readers see the old or the new content, never a mix"""
+    tmp_path = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_directory(os.path.dirname(path))
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def write_segment(directory: str, documents: Iterable[Tuple[str, str, Dict[str, Any]]],
+                  fingerprint: Callable[[str], np.ndarray], embed: Optional[Callable[[str], np.ndarray]] = None,
+                  dtype: str = "int8", metadata: Optional[Dict[str, Any]] = None,
+                  deleted: Iterable[str] = ()) -> Dict[str, Any]:
+    """
+    Write an immutable segment: n-gram fingerprints, document embeddings, a
+    BM25 term index, texts and metadata
+
+    Fingerprints are laid out like a FingerprintShard (one array sorted by
+    fingerprint with a parallel array of reference ids), embeddings are
+    normalized and quantized like a SentenceIndex, and the term index is
+    written by write_term_index, so all three can be memory-mapped.
+
+    Args:
+        directory: Segment directory (must not exist)
+        documents: Iterable of (reference key, full text, metadata) tuples
+        fingerprint: Function returning the fingerprint array of a text
+        embed: Optional function returning the embedding of a text
+        dtype: Storage type of the embeddings, 'int8' or 'float16'
+        metadata: Extra metadata stored in segment.json (such as the embedding model)
+        deleted: Keys of references removed from the snapshots this segment is added to
+
+    Returns:
+        Contents of segment.json
+    """
+    entries = ((ref_key, text, info, fingerprint(text), embed(text) if embed is not None else None)
+               for ref_key, text, info in documents)
+    return _write_entries(directory, entries, dtype, metadata, deleted)
+
+
+def _write_entries(directory: str,
+                   entries: Iterable[Tuple[str, str, Dict[str, Any], np.ndarray, Optional[np.ndarray]]],
+                   dtype: str, metadata: Optional[Dict[str, Any]], deleted: Iterable[str]) -> Dict[str, Any]:
+    os.makedirs(directory)
+    references, fingerprint_parts, doc_id_parts, embeddings = [], [], [], []
+    text_offset = 0
+    with open(os.path.join(directory, TEXTS_FILE), "wb") as texts:
+        for ref_key, text, info, values, embedding in entries:
+            doc_id_parts.append(np.full(len(values), len(references), dtype=np.int32))
+            fingerprint_parts.append(values)
+            encoded = text.encode("utf-8")
+            texts.write(encoded)
+            references.append({'key': ref_key, 'info': info, 'fingerprints': int(len(values)),
+                               'text_offset': text_offset, 'text_length': len(encoded)})
+            text_offset += len(encoded)
+            if embedding is not None:
+                embeddings.append(_normalize(embedding))
+    if embeddings and len(embeddings) != len(references):
+        raise ValueError("Either every reference of a segment has an embedding or none has")
+
+    values = np.concatenate(fingerprint_parts) if fingerprint_parts else np.zeros(0, dtype=np.uint64)
+    doc_ids = np.concatenate(doc_id_parts) if doc_id_parts else np.zeros(0, dtype=np.int32)
+    order = np.argsort(values, kind="stable")
+    np.save(os.path.join(directory, FINGERPRINTS_FILE), values[order])
+    np.save(os.path.join(directory, DOC_IDS_FILE), doc_ids[order])
+    dim = None
+    if embeddings:
+        quantized, scales = quantize(np.vstack(embeddings), dtype)
+        np.save(os.path.join(directory, EMBEDDINGS_FILE), quantized)
+        np.save(os.path.join(directory, SCALES_FILE), scales)
+        dim = int(quantized.shape[1])
+    with open(os.path.join(directory, REFERENCES_FILE), "w", encoding="utf-8") as f:
+        json.dump(references, f)
+    with open(os.path.join(directory, TEXTS_FILE), "rb") as texts:
+        # Texts are read back one at a time rather than kept in memory
+        write_term_index(directory, (term_frequencies(texts.read(reference['text_length']).decode("utf-8"))
+                                     for reference in references))
+
+    meta = {
+        'version': 1,
+        'references': len(references),
+        'dim': dim,
+        'dtype': dtype if dim else None,
+        'deleted': sorted(set(deleted)),
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+    meta.update(metadata or {})
+    with open(os.path.join(directory, SEGMENT_META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    # Durable before the segment is moved into place
+    for path in (directory, os.path.join(directory, TERMS_DIR)):
+        for name in os.listdir(path):
+            if os.path.isfile(os.path.join(path, name)):
+                with open(os.path.join(path, name), "rb") as f:
+                    os.fsync(f.fileno())
+    _fsync_directory(os.path.join(directory, TERMS_DIR))
+    return meta
+
+
+class SnapshotSegment(FingerprintShard):
+    """
+    Memory-mapped segment of a snapshot: a fingerprint shard with document
+    embeddings, a BM25 term index and texts. Opening one reads only its metadata.
+
+    The texts file is kept open, so a segment stays readable after a newer
+    snapshot has replaced it and its directory was removed.
+    """
+
+    def __init__(self, directory: str):
+        super().__init__(directory)
+        with open(os.path.join(directory, SEGMENT_META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.model = self.meta.get('model')
+        self.deleted = set(self.meta.get('deleted', []))
+        self.embeddings, self.scales = None, None
+        if self.meta.get('dim') and self.references:
+            self.embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+            self.scales = np.load(os.path.join(directory, SCALES_FILE), mmap_mode="r")
+        # Segments written before term indexes were added have none
+        self.terms = TermIndex(directory) if os.path.isdir(os.path.join(directory, TERMS_DIR)) else None
+        self.texts = open(os.path.join(directory, TEXTS_FILE), "rb")
+        self.text_lock = threading.Lock()
+
+    def text(self, ref_id: int) -> str:
+        """Full text of a reference"""
+        reference = self.references[ref_id]
+        with self.text_lock:
+            self.texts.seek(reference['text_offset'])
+            return self.texts.read(reference['text_length']).decode("utf-8")
+
+    def close(self):
+        self.texts.close()
+
+
+class Snapshot:
+    """
+    One published version of the corpus index: its segments, oldest first.
+
+    A reference added again in a later segment replaces the earlier copy, and
+    keys listed as deleted by a later segment hide the earlier copies; hidden
+    rows are skipped by searches and dropped by compaction.
+
+    Args:
+        root: Snapshot store directory
+        manifest: Manifest of the version (see SnapshotStore)
+    """
+
+    def __init__(self, root: str, manifest: Dict[str, Any]):
+        self.version = manifest['version']
+        self.manifest = manifest
+        self.segments = [SnapshotSegment(os.path.join(root, SEGMENTS_DIR, segment_id))
+                         for segment_id in manifest['segments']]
+        models = {segment.model for segment in self.segments if segment.embeddings is not None}
+        if len(models) > 1:
+            raise ValueError(f"Snapshot {self.version} mixes embeddings of models {sorted(models, key=str)}")
+        self.model = models.pop() if models else None
+
+        # Newest copy of every key: segment and reference id
+        self.live: Dict[str, Tuple[int, int]] = {}
+        hidden = set()
+        for position in range(len(self.segments) - 1, -1, -1):
+            segment = self.segments[position]
+            for ref_id, reference in enumerate(segment.references):
+                key = reference['key']
+                if key not in self.live and key not in hidden:
+                    self.live[key] = (position, ref_id)
+            hidden |= segment.deleted
+        self.masks = []
+        for position, segment in enumerate(self.segments):
+            mask = np.array([self.live.get(reference['key']) == (position, ref_id)
+                             for ref_id, reference in enumerate(segment.references)], dtype=bool)
+            self.masks.append(mask)
+
+    def __len__(self) -> int:
+        return len(self.live)
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+    def text(self, key: str) -> Optional[str]:
+        """Full text of a reference, or None if the snapshot does not hold it"""
+        if key not in self.live:
+            return None
+        position, ref_id = self.live[key]
+        return self.segments[position].text(ref_id)
+
+    def search_fingerprints(self, fingerprints: np.ndarray, k: int = 10,
+                            min_similarity: float = 0.0) -> List[Dict[str, Any]]:
+        """Top-k live references by n-gram Jaccard similarity (see FingerprintShard.search_fingerprints)"""
+        matches = []
+        with stage("snapshot_fingerprint_search"):
+            for position, (segment, mask) in enumerate(zip(self.segments, self.masks)):
+                hidden = int(len(mask) - mask.sum())
+                for match in segment.search_fingerprints(fingerprints, k + hidden, min_similarity):
+                    if self.live.get(match['reference_key'], (None,))[0] == position:
+                        matches.append(match)
+        return heapq.nlargest(k, matches, key=lambda match: match['ngram_similarity'])
+
+    def search_embeddings(self, query: np.ndarray, k: int = 5, chunk_rows: int = 65536) -> List[Dict[str, Any]]:
+        """
+        Top-k live references by cosine similarity of their document embeddings
+
+        Args:
+            query: Embedding of the suspect, of shape (dim,) or (1, dim)
+            k: Number of references returned
+            chunk_rows: Embeddings dequantized and scored at a time
+
+        Returns:
+            List of dictionaries with 'reference_key', 'paper_info' and
+            'similarity', sorted by descending similarity
+        """
+        query = _normalize(query)
+        candidates: List[Tuple[float, int, int]] = []
+        with stage("snapshot_embedding_search"):
+            for position, (segment, mask) in enumerate(zip(self.segments, self.masks)):
+                if segment.embeddings is None:
+                    continue
+                for start in range(0, len(segment.embeddings), chunk_rows):
+                    end = min(start + chunk_rows, len(segment.embeddings))
+                    chunk = np.asarray(segment.embeddings[start:end], dtype=np.float32)
+                    scores = (chunk @ query) * np.asarray(segment.scales[start:end])
+                    scores[~mask[start:end]] = -np.inf
+                    take = min(k, end - start)
+                    for row in np.argpartition(-scores, take - 1)[:take]:
+                        if np.isfinite(scores[row]):
+                            candidates.append((float(scores[row]), position, start + int(row)))
+        results = []
+        for score, position, ref_id in heapq.nlargest(k, candidates):
+            reference = self.segments[position].references[ref_id]
+            results.append({'reference_key': reference['key'], 'paper_info': reference.get('info', {}),
+                            'similarity': score})
+        return results
+
+    def document_frequencies(self, hashes: np.ndarray) -> np.ndarray:
+        """Documents of the snapshot's segments containing each term hash"""
+        df = np.zeros(len(hashes), dtype=np.int64)
+        for segment in self.segments:
+            if segment.terms is not None:
+                df += segment.terms.document_frequencies(hashes)
+        return df
+
+    def search_terms(self, text: str, k: int = 10, max_terms: int = 32) -> List[Dict[str, Any]]:
+        """
+        Top-k live references by BM25 over the suspect's most distinctive terms
+
+        Term weights use document frequencies over the whole snapshot, so
+        scores of different segments are comparable; the k-th best score of
+        the segments searched so far is the threshold of the next one, which
+        lets it skip more posting blocks.
+
+        Args:
+            text: Suspect text
+            k: Number of references returned
+            max_terms: Query terms taken from the suspect (see lexical_index.query_terms)
+
+        Returns:
+            List of dictionaries with 'reference_key', 'paper_info' and
+            'bm25_score', sorted by descending score
+        """
+        with stage("snapshot_term_search"):
+            docs = sum(len(segment.references) for segment in self.segments if segment.terms is not None)
+            hashes, idfs = query_terms(term_frequencies(text), self.document_frequencies, docs, max_terms)
+            candidates: List[Tuple[float, int, int]] = []
+            threshold = 0.0
+            # Newest segments first: they hold the replacements of older copies
+            for position in range(len(self.segments) - 1, -1, -1):
+                segment = self.segments[position]
+                if segment.terms is None or len(hashes) == 0:
+                    continue
+                ref_ids, scores = segment.terms.top_k(hashes, idfs, k, threshold, self.masks[position])
+                candidates = heapq.nlargest(k, candidates + [(float(score), position, int(ref_id))
+                                                             for ref_id, score in zip(ref_ids, scores)])
+                if len(candidates) >= k:
+                    threshold = candidates[-1][0]
+        results = []
+        for score, position, ref_id in candidates:
+            reference = self.segments[position].references[ref_id]
+            results.append({'reference_key': reference['key'], 'paper_info': reference.get('info', {}),
+                            'bm25_score': score})
+        return results
+
+    def search_hybrid(self, text: str, embedding: Optional[np.ndarray] = None, k: int = 10,
+                      depth: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Top-k live references by reciprocal rank fusion of BM25 and embedding similarity
+
+        A reference scores sum(1 / (RRF_K + rank)) over the rankings it
+        appears in, so exact wording (BM25) and paraphrase (embeddings) both
+        bring in candidates without calibrating one score against the other.
+
+        Args:
+            text: Suspect text
+            embedding: Optional document embedding of the suspect (BM25 only without it)
+            k: Number of references returned
+            depth: Candidates taken from each ranking (defaults to 2 * k)
+
+        Returns:
+            List of dictionaries with 'reference_key', 'paper_info', 'fused_score',
+            'bm25_score' and 'similarity' (None when missing from a ranking)
+        """
+        depth = depth or 2 * k
+        rankings = [("bm25_score", self.search_terms(text, depth))]
+        if embedding is not None and self.model is not None:
+            rankings.append(("similarity", self.search_embeddings(embedding, depth)))
+        fused: Dict[str, Dict[str, Any]] = {}
+        for score_name, ranking in rankings:
+            for rank, match in enumerate(ranking, start=1):
+                entry = fused.setdefault(match['reference_key'], {
+                    'reference_key': match['reference_key'], 'paper_info': match['paper_info'],
+                    'fused_score': 0.0, 'bm25_score': None, 'similarity': None,
+                })
+                entry['fused_score'] += 1.0 / (RRF_K + rank)
+                entry[score_name] = match[score_name]
+        return heapq.nlargest(k, fused.values(), key=lambda entry: entry['fused_score'])
+
+    def live_documents(self) -> Iterator[Tuple[str, str, Dict[str, Any], np.ndarray, Optional[np.ndarray]]]:
+        """(key, text, info, fingerprints, embedding) of every live reference, oldest segment first"""
+        for position, (segment, mask) in enumerate(zip(self.segments, self.masks)):
+            if not mask.any():
+                continue
+            order = np.argsort(segment.doc_ids, kind="stable")
+            doc_ids = np.asarray(segment.doc_ids)[order]
+            fingerprints = np.asarray(segment.fingerprints)[order]
+            bounds = np.searchsorted(doc_ids, np.arange(len(segment.references) + 1))
+            for ref_id in np.nonzero(mask)[0]:
+                reference = segment.references[ref_id]
+                embedding = None
+                if segment.embeddings is not None:
+                    embedding = np.asarray(segment.embeddings[ref_id], dtype=np.float32) * segment.scales[ref_id]
+                yield (reference['key'], segment.text(int(ref_id)), reference.get('info', {}),
+                       fingerprints[bounds[ref_id]:bounds[ref_id + 1]], embedding)
+
+
+class SnapshotStore:
+    """
+    Versioned, immutable on-disk snapshots of the corpus index.
+
+    Layout of the store directory:
+
+        segments/<id>/        immutable segments (write_segment)
+        versions/<n>.json     manifest of version n: its segments and parent version
+        CURRENT               number of the version being served
+
+    New references are written as a new segment and published as a new
+    version listing the current segments plus the new one; compaction
+    publishes a version with all segments merged into one. Every file is
+    written before the manifest that refers to it, and a version goes live
+    by atomically replacing CURRENT, so readers never see a partial
+    snapshot. Rolling back points CURRENT at the parent of the current
+    version. Versions beyond the newest `keep` are removed with the segments
+    only they used.
+
+    Writers (adding, compacting, rolling back) take a file lock, so several
+    processes may share a store.
+
+    Args:
+        root: Store directory (created if missing)
+        keep: Versions kept for rollback (at least 2)
+    """
+
+    def __init__(self, root: str, keep: int = 3):
+        self.root = root
+        self.keep = max(2, keep)
+        os.makedirs(os.path.join(root, SEGMENTS_DIR), exist_ok=True)
+        os.makedirs(os.path.join(root, VERSIONS_DIR), exist_ok=True)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def writer(self, blocking: bool = True) -> Iterator[bool]:
+        """
+        Hold the store's write lock
+
+        Yields:
+            Whether the lock was acquired (always True when blocking)
+        """
+        if not self.lock.acquire(blocking):
+            yield False
+            return
+        try:
+            if fcntl is None:
+                yield True
+                return
+            with open(os.path.join(self.root, LOCK_FILE), "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            self.lock.release()
+
+    def _manifest_path(self, version: int) -> str:
+        return os.path.join(self.root, VERSIONS_DIR, f"{version:08d}.json")
+
+    def versions(self) -> List[int]:
+        """Published versions, oldest first"""
+        return sorted(int(name[:-5]) for name in os.listdir(os.path.join(self.root, VERSIONS_DIR))
+                      if name.endswith(".json") and name[:-5].isdigit())
+
+    def current_version(self) -> Optional[int]:
+        """Version being served, or None before the first publish"""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), "r", encoding="utf-8") as f:
+                return int(f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def manifest(self, version: int) -> Dict[str, Any]:
+        with open(self._manifest_path(version), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def open(self, version: Optional[int] = None) -> Optional[Snapshot]:
+        """Open a version (the current one by default); None when nothing was published"""
+        version = self.current_version() if version is None else version
+        if version is None:
+            return None
+        return Snapshot(self.root, self.manifest(version))
+
+    def _publish(self, segments: List[str], reason: str, parent: Optional[int]) -> int:
+        versions = self.versions()
+        version = (versions[-1] if versions else 0) + 1
+        manifest = {
+            'version': version,
+            'segments': segments,
+            'parent': parent,
+            'reason': reason,
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        }
+        _write_atomic(self._manifest_path(version), json.dumps(manifest).encode("utf-8"))
+        self._set_current(version)
+        logger.info(f"Published snapshot {version} ({reason}, {len(segments)} segments)")
+        return version
+
+    def _set_current(self, version: int):
+        _write_atomic(os.path.join(self.root, CURRENT_FILE), f"{version}\n".encode("utf-8"))
+
+    def _current_segments(self) -> List[str]:
+        version = self.current_version()
+        return list(self.manifest(version)['segments']) if version is not None else []
+
+    def _new_segment(self, write: Callable[[str], Any]) -> str:
+        """Write a segment to a temporary directory and move it into place"""
+        segment_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        tmp_dir = os.path.join(self.root, SEGMENTS_DIR, f".tmp-{segment_id}")
+        try:
+            write(tmp_dir)
+            os.replace(tmp_dir, os.path.join(self.root, SEGMENTS_DIR, segment_id))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        _fsync_directory(os.path.join(self.root, SEGMENTS_DIR))
+        return segment_id
+
+    def add(self, documents: Iterable[Tuple[str, str, Dict[str, Any]]], fingerprint: Callable[[str], np.ndarray],
+            embed: Optional[Callable[[str], np.ndarray]] = None, dtype: str = "int8",
+            metadata: Optional[Dict[str, Any]] = None, deleted: Iterable[str] = ()) -> int:
+        """
+        Publish a version with one more segment
+
+        References whose key is already indexed replace the earlier copy.
+        Arguments are those of write_segment.
+
+        Returns:
+            The new version
+        """
+        with self.writer():
+            segment_id = self._new_segment(lambda directory: write_segment(
+                directory, documents, fingerprint, embed, dtype, metadata, deleted))
+            version = self._publish(self._current_segments() + [segment_id], "add", self.current_version())
+            self.collect()
+        return version
+
+    def compact(self, blocking: bool = True) -> Optional[int]:
+        """
+        Merge the segments of the current version into one and publish it
+
+        Replaced and deleted references are dropped. Searches keep using the
+        current version while the merged segment is written.
+
+        Returns:
+            The new version, or None when there was nothing to merge (or,
+            without blocking, another writer holds the lock)
+        """
+        with self.writer(blocking) as acquired:
+            if not acquired:
+                return None
+            snapshot = self.open()
+            if snapshot is None or len(snapshot.segments) < 2:
+                return None
+            try:
+                start_time = time.perf_counter()
+                segment_id = self._new_segment(lambda directory: self._write_merged(directory, snapshot))
+                version = self._publish([segment_id], "compact", snapshot.version)
+            finally:
+                snapshot.close()
+            self.collect()
+        metrics.inc("plagiarism_snapshot_compactions_total", description="Snapshot compactions")
+        metrics.observe("plagiarism_snapshot_compaction_seconds", time.perf_counter() - start_time,
+                        description="Time to merge the segments of a snapshot")
+        return version
+
+    @staticmethod
+    def _write_merged(directory: str, snapshot: Snapshot):
+        embedded = [segment for segment in snapshot.segments if segment.embeddings is not None]
+        _write_entries(directory, snapshot.live_documents(), embedded[-1].meta['dtype'] if embedded else "int8",
+                       {'model': snapshot.model} if snapshot.model else None, ())
+
+    def rollback(self) -> int:
+        """
+        Serve the parent of the current version again
+
+        Returns:
+            The version now being served
+
+        Raises:
+            ValueError: If the current version has no parent left to roll back to
+        """
+        with self.writer():
+            version = self.current_version()
+            parent = self.manifest(version)['parent'] if version is not None else None
+            if parent is None or parent not in self.versions():
+                raise ValueError(f"Snapshot {version} has no previous version to roll back to")
+            self._set_current(parent)
+            logger.info(f"Rolled back snapshot {version} to {parent}")
+            return parent
+
+    def collect(self):
+        """Remove versions beyond the newest `keep` and segments no kept version uses"""
+        versions = self.versions()
+        current = self.current_version()
+        kept = set(versions[-self.keep:]) | ({current} if current is not None else set())
+        for version in versions:
+            if version not in kept:
+                os.remove(self._manifest_path(version))
+        used = {segment_id for version in kept for segment_id in self.manifest(version)['segments']}
+        for name in os.listdir(os.path.join(self.root, SEGMENTS_DIR)):
+            if name not in used and not name.startswith(".tmp-"):
+                # Processes still serving an older version keep their mapped files until they swap
+                shutil.rmtree(os.path.join(self.root, SEGMENTS_DIR, name), ignore_errors=True)
+
+
+class SnapshotIndex:
+    """
+    Serves the current snapshot of a store and hot-swaps to newer versions.
+
+    A watcher thread polls the store's CURRENT pointer and opens a new (or
+    rolled back) version in the background; the swap is a single reference
+    assignment. A search takes the snapshot once (`current`) and uses it to
+    the end, so requests in flight finish on the version they started with
+    and none are dropped. If opening a version fails, the previous one keeps
+    serving. Every worker process runs its own watcher, so all of them
+    switch within one poll interval. Threads do not survive a fork, so the
+    watcher is started in the process that first uses the index, and again
+    in every process forked from it (such as gunicorn workers of a preloaded
+    app).
+
+    With auto-compaction the watcher also merges the segments once there are
+    more than `max_segments`, in the one process that gets the store's lock.
+
+    Args:
+        store: SnapshotStore to serve
+        poll_seconds: Interval of the watcher (0 disables it)
+        max_segments: Segments of a version before it is compacted
+        auto_compact: Compact in the background
+    """
+
+    def __init__(self, store: SnapshotStore, poll_seconds: float = 5.0, max_segments: int = 8,
+                 auto_compact: bool = False):
+        self.store = store
+        self.poll_seconds = poll_seconds
+        self.max_segments = max_segments
+        self.auto_compact = auto_compact
+        # Embedding model the checker uses; versions built with another are not served
+        self.model: Optional[str] = None
+        self.snapshot: Optional[Snapshot] = None
+        self.loaded_at: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.swap_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.watcher: Optional[threading.Thread] = None
+        # Process the watcher runs in
+        self.watcher_pid: Optional[int] = None
+        self.start_lock = threading.Lock()
+        self.refresh()
+
+    @classmethod
+    def from_env(cls) -> Optional["SnapshotIndex"]:
+        """
+        Index of the store at SNAPSHOT_DIR, watched every SNAPSHOT_POLL_SECONDS
+        (default 5), keeping SNAPSHOT_KEEP versions (default 3) and compacting
+        past SNAPSHOT_MAX_SEGMENTS segments (default 8) when SNAPSHOT_COMPACT
+        is set; returns None when no store is configured
+        """
+        root = os.getenv("SNAPSHOT_DIR")
+        if not root:
+            return None
+        index = cls(SnapshotStore(root, keep=int(os.getenv("SNAPSHOT_KEEP", "3"))),
+                    poll_seconds=float(os.getenv("SNAPSHOT_POLL_SECONDS", "5")),
+                    max_segments=int(os.getenv("SNAPSHOT_MAX_SEGMENTS", "8")),
+                    auto_compact=os.getenv("SNAPSHOT_COMPACT", "0").lower() in ("1", "true", "yes"))
+        index.start()
+        return index
+
+    @property
+    def current(self) -> Optional[Snapshot]:
+        """Snapshot to use for one search"""
+        self.start()
+        return self.snapshot
+
+    def check_model(self, model: str):
+        """
+        Raise ValueError unless the current snapshot holds embeddings of `model`
+        (or none), and refuse to swap to versions built with another model
+
+        Args:
+            model: Model id of the embedder (weights and pooling)
+        """
+        self.model = model
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.model is not None and snapshot.model != model:
+            raise ValueError(f"Snapshot {snapshot.version} in {self.store.root} was built with model "
+                             f"{snapshot.model!r}, not {model!r}; rebuild it with the configured model")
+
+    def refresh(self) -> bool:
+        """
+        Swap to the store's current version if it changed
+
+        Returns:
+            Whether a new snapshot was swapped in
+        """
+        with self.swap_lock:
+            version = self.store.current_version()
+            if version is None or (self.snapshot is not None and self.snapshot.version == version):
+                return False
+            start_time = time.perf_counter()
+            try:
+                snapshot = self.store.open(version)
+            except Exception as e:
+                self.last_error = f"Snapshot {version}: {str(e)}"
+                logger.error(f"Failed to open snapshot {version}, still serving "
+                             f"{self.snapshot.version if self.snapshot else 'nothing'}: {str(e)}")
+                return False
+            if self.model is not None and snapshot.model is not None and snapshot.model != self.model:
+                self.last_error = f"Snapshot {version} was built with model {snapshot.model!r}, not {self.model!r}"
+                logger.error(f"Not serving snapshot {version}, still serving "
+                             f"{self.snapshot.version if self.snapshot else 'nothing'}: {self.last_error}")
+                return False
+            # The previous snapshot is unmapped once the searches holding it finish
+            self.snapshot = snapshot
+            self.loaded_at = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+            self.last_error = None
+        metrics.observe("plagiarism_snapshot_load_seconds", time.perf_counter() - start_time,
+                        description="Time to open a snapshot")
+        metrics.inc("plagiarism_snapshot_swaps_total", description="Snapshots swapped in")
+        metrics.set("plagiarism_snapshot_version", version, description="Snapshot version being served")
+        metrics.set("plagiarism_snapshot_segments", len(snapshot.segments),
+                    description="Segments of the snapshot being served")
+        logger.info(f"Serving snapshot {version} ({len(snapshot)} references, {len(snapshot.segments)} segments)")
+        return True
+
+    def rollback(self) -> int:
+        """Roll the store back to the previous version and serve it"""
+        version = self.store.rollback()
+        self.refresh()
+        return version
+
+    def _watch(self):
+        while not self.stopped.wait(self.poll_seconds):
+            try:
+                self.refresh()
+                snapshot = self.snapshot
+                if self.auto_compact and snapshot is not None and len(snapshot.segments) > self.max_segments:
+                    if self.store.compact(blocking=False) is not None:
+                        self.refresh()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Snapshot watcher failed: {str(e)}")
+
+    def start(self):
+        """Start the watcher thread of the calling process, unless it runs already"""
+        if self.poll_seconds <= 0 or self.watcher_pid == os.getpid() or self.stopped.is_set():
+            return
+        with self.start_lock:
+            if self.watcher_pid == os.getpid():
+                return
+            if self.watcher_pid is not None:
+                # Forked: the parent's watcher did not come along, and its lock may have been held
+                self.swap_lock = threading.Lock()
+                logger.info(f"Restarting the snapshot watcher in process {os.getpid()}")
+            self.watcher = threading.Thread(target=self._watch, name="snapshot-watcher", daemon=True)
+            self.watcher_pid = os.getpid()
+            self.watcher.start()
+
+    def stop(self):
+        """Stop the watcher thread"""
+        self.stopped.set()
+        if self.watcher is not None and self.watcher_pid == os.getpid():
+            self.watcher.join(timeout=5)
+        self.watcher = None
+
+    def health(self) -> Dict[str, Any]:
+        """Version being served and versions available for rollback"""
+        snapshot = self.current
+        return {
+            'directory': self.store.root,
+            'version': snapshot.version if snapshot is not None else None,
+            'references': len(snapshot) if snapshot is not None else 0,
+            'segments': len(snapshot.segments) if snapshot is not None else 0,
+            'model': snapshot.model if snapshot is not None else None,
+            'loaded_at': self.loaded_at,
+            'store_version': self.store.current_version(),
+            'versions': self.store.versions(),
+            'last_error': self.last_error,
+        }
+
+
+def main(argv=None):
+    """Add references to a snapshot store, compact it, roll it back or list its versions"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage versioned corpus index snapshots")
+    parser.add_argument("store", help="Snapshot store directory")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add = subparsers.add_parser("add", help="Index a directory of .txt/.pdf references as a new segment")
+    add.add_argument("input")
+    add.add_argument("--dtype", choices=["int8", "float16"], default="int8")
+    add.add_argument("--no-embeddings", action="store_true", help="Index n-gram fingerprints only")
+    add.add_argument("--delete", nargs="*", default=[], help="Keys of references to remove")
+    subparsers.add_parser("compact", help="Merge the current segments into one")
+    subparsers.add_parser("rollback", help="Serve the previous version again")
+    subparsers.add_parser("list", help="List the versions")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    store = SnapshotStore(args.store, keep=int(os.getenv("SNAPSHOT_KEEP", "3")))
+
+    if args.command == "add":
+        from app.services.plagiarism_checker import PlagiarismChecker
+        from app.services.sharded_search import fingerprint_array
+        from app.utils.pdf_extractor import PDFExtractor
+
+        checker = PlagiarismChecker()
+        embed = None
+        if not args.no_embeddings:
+            embed = lambda text: checker.get_bert_embeddings(checker.preprocess_text(text))
+        version = store.add(
+            iter_corpus(args.input, PDFExtractor()),
+            fingerprint=lambda text: fingerprint_array(checker.hash_ngrams(checker.preprocess_text(text))),
+            embed=embed, dtype=args.dtype, metadata={'model': checker.embedder.model_id} if embed else None,
+            deleted=args.delete
+        )
+        print(f"Published snapshot {version}")
+    elif args.command == "compact":
+        version = store.compact()
+        print(f"Published snapshot {version}" if version is not None else "Nothing to compact")
+    elif args.command == "rollback":
+        print(f"Serving snapshot {store.rollback()}")
+    else:
+        current = store.current_version()
+        for version in store.versions():
+            manifest = store.manifest(version)
+            marker = "*" if version == current else " "
+            print(f"{marker} {version}  {manifest['created_at']}  {manifest['reason']:<8} "
+                  f"{len(manifest['segments'])} segments  parent {manifest['parent']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import random
+
+from app.services.cascade import REPORTED_TOP_N, CascadePolicy, CascadeScorer
+
+THRESHOLDS = {'semantic': 0.85, 'ngram': 0.3, 'fuzzy': 0.7}
+SUSPECT = " ".join(f"word{i}" for i in range(60))
+
+
+def reference(copied: int, index: int) -> str:
+    """Reference sharing its first `copied` words with the suspect"""
+    return " ".join(SUSPECT.split()[:copied] + [f"ref{index}w{i}" for i in range(60 - copied)])
+
+
+def run(make_checker, references, cosines, fuzzy, enabled):
+    checker = make_checker(cosines=cosines)
+    scorer = CascadeScorer(checker, CascadePolicy(enabled=enabled))
+    results, summary = scorer.score(SUSPECT, references, THRESHOLDS, fuzzy=lambda i, text: fuzzy[i])
+    for i, result in enumerate(results):
+        result['reference_id'] = i
+    results.sort(key=lambda result: result['overall_score'], reverse=True)
+    return results, summary
+
+
+def aggregate(results):
+    top = [result['overall_score'] for result in results[:REPORTED_TOP_N]]
+    return sum(top) / len(top)
+
+
+def assert_same_outcome(make_checker, references, cosines, fuzzy):
+    full, _ = run(make_checker, references, cosines, fuzzy, enabled=False)
+    cascade, summary = run(make_checker, references, cosines, fuzzy, enabled=True)
+    top_full = [(result['reference_id'], round(result['overall_score'], 9)) for result in full[:REPORTED_TOP_N]]
+    top_cascade = [(result['reference_id'], round(result['overall_score'], 9))
+                   for result in cascade[:REPORTED_TOP_N]]
+    assert top_cascade == top_full
+    assert abs(aggregate(cascade) - aggregate(full)) < 1e-9
+    verdicts = {result['reference_id']: result['is_plagiarized'] for result in full}
+    for result in cascade:
+        if result['semantic_similarity'] is not None:
+            assert result['is_plagiarized'] == verdicts[result['reference_id']]
+    return summary
+
+
+def test_unrelated_references_above_the_ceiling_keep_their_scores(make_stub_checker):
+    # Unrelated references whose embeddings are nonetheless close (raw [CLS] cosines around 0.85)
+    references = [reference(0, i) for i in range(5)]
+    cosines = {text: 0.84 + 0.002 * i for i, text in enumerate(references)}
+    summary = assert_same_outcome(make_stub_checker, references, cosines, [0.1] * 5)
+    # Every reference could reach the top 3, so BERT ran for all of them
+    assert summary['semantic_computed'] == 5
+
+
+def test_screened_references_outside_the_top_k_are_skipped(make_stub_checker):
+    references = [reference(55, i) for i in range(3)] + [reference(0, i) for i in range(3, 9)]
+    cosines = {text: 0.95 if i < 3 else 0.6 for i, text in enumerate(references)}
+    fuzzy = [0.95] * 3 + [0.1] * 6
+    summary = assert_same_outcome(make_stub_checker, references, cosines, fuzzy)
+    assert summary['semantic_computed'] == 3
+    assert summary['semantic_skipped'] == 6
+
+
+def test_cascade_matches_full_scoring_on_random_references(make_stub_checker):
+    rng = random.Random(7)
+    for trial in range(50):
+        count = rng.randint(1, 12)
+        references = [reference(rng.choice([0, 0, 5, 20, 40, 58]), trial * 100 + i) for i in range(count)]
+        cosines = {text: rng.uniform(0.0, 0.99) for text in references}
+        fuzzy = [rng.choice([0.05, 0.3, 0.6, 0.9]) for _ in references]
+        assert_same_outcome(make_stub_checker, references, cosines, fuzzy)
@@ -0,0 +1,98 @@
+import pytest
+
+from app.utils.exclusion import TextExcluder
+from app.utils.text import tokenize
+
+THESIS = (
+    'Transformers dominate language modelling [3]. Earlier work (Smith et al., 2019; Lee, 2020a) relied on '
+    'recurrence, as argued in [2, 5-7]. As Hochreiter wrote, "the gradient vanishes over long time lags in '
+    'practice" and later models (see Vaswani and Shazeer, 2017) fixed this. Training minimises '
+    'L = - sum log p ( y | x ) over the batch.'
+)
+
+PROSE = (
+    'In 2019, 45 participants (aged 18 to 65) completed 3 sessions of 20 minutes each. The sample grew from '
+    '120 in 2015 to 340 in 2016, 415 in 2017, 502 in 2018 and 610 in 2019, while costs rose by 3 to 5 percent '
+    'per year. Chapter 2 (pages 14-30) reviews the 1990s, and Section 4.2 compares the two groups of 12 and 15. '
+    'She said "yes" twice. Where n = 5, the error falls below 0.3 in (2020) trials [sic].'
+)
+
+CONCLUSION = "The results support the main hypothesis of this thesis across every dataset considered. " * 3
+
+
+def spans_of(text, *parts):
+    """(rule, start, end) of each (rule, substring) part, searched in order"""
+    spans, position = [], 0
+    for rule, part in parts:
+        start = text.index(part, position)
+        spans.append((rule, start, start + len(part)))
+        position = start + len(part)
+    return spans
+
+
+def test_citations_quotes_and_equations_of_thesis_text():
+    expected = spans_of(
+        THESIS,
+        ("citations", "[3]"),
+        ("citations", "(Smith et al., 2019; Lee, 2020a)"),
+        ("citations", "[2, 5-7]"),
+        ("quotes", '"the gradient vanishes over long time lags in practice"'),
+        ("citations", "(see Vaswani and Shazeer, 2017)"),
+        ("equations", "L = - sum log p ( y | x )"),
+    )
+    assert TextExcluder().find_spans(THESIS) == expected
+
+    masked, report = TextExcluder().apply({'introduction': THESIS})
+    assert report['spans']['introduction'] == [{'rule': rule, 'start': start, 'end': end}
+                                               for rule, start, end in expected]
+    assert report['tokens_total'] == len(tokenize(THESIS))
+    assert report['tokens_excluded'] == sum(len(tokenize(THESIS[start:end])) for _, start, end in expected)
+    for _, start, end in expected:
+        assert THESIS[start:end] not in masked['introduction']
+    assert masked['introduction'].startswith("Transformers dominate language modelling . Earlier work relied on")
+
+
+@pytest.mark.parametrize("rule", ["citations", "quotes", "equations"])
+def test_rules_apply_only_when_chosen(rule):
+    spans = TextExcluder([rule]).find_spans(THESIS)
+    assert spans and all(span[0] == rule for span in spans)
+    assert TextExcluder([]).find_spans(THESIS) == []
+
+
+def test_tables_and_trailing_bibliography():
+    table = ("Table 2 shows the results. Model Accuracy F1 BERT 91 88 RoBERTa 93 90 GPT 89 85 XLNet 92 89 "
+             "LSTM 84 80 CNN 82 78 Overall the pretrained models win.")
+    assert TextExcluder().find_spans(table) == spans_of(
+        table, ("tables", "91 88 RoBERTa 93 90 GPT 89 85 XLNet 92 89 LSTM 84 80 CNN 82 78"))
+
+    references = "References [1] A. Smith. Deep learning. 2019. [2] B. Lee. Attention. 2020."
+    text = CONCLUSION + references
+    assert TextExcluder(["bibliography"]).find_spans(text) == [("bibliography", len(CONCLUSION), len(text))]
+    # The bibliography span covers the citation-like entries within it
+    assert TextExcluder().find_spans(text) == [("bibliography", len(CONCLUSION), len(text))]
+    # A heading in the first half of a section is not its trailing reference list
+    assert TextExcluder(["bibliography"]).find_spans(references + " " + CONCLUSION * 2) == []
+    # Nor is the word in running prose
+    assert TextExcluder(["bibliography"]).find_spans(CONCLUSION + "References to prior work are rare.") == []
+
+
+def test_no_false_positives_on_prose_with_numbers():
+    assert TextExcluder().find_spans(PROSE) == []
+    masked, report = TextExcluder().apply({'methods': PROSE})
+    assert masked == {'methods': PROSE}
+    assert report['tokens_excluded'] == 0 and report['spans'] == {}
+
+
+def test_bibliography_and_acknowledgements_sections_are_dropped():
+    sections = {'introduction': PROSE, 'acknowledgements': "We thank our families.",
+                'references': "[1] A. Smith. Deep learning. 2019."}
+    masked, report = TextExcluder().apply(sections)
+    assert list(masked) == ["introduction"]
+    assert report['excluded_sections'] == ["acknowledgements", "references"]
+    assert report['tokens_excluded'] == len(tokenize(sections['acknowledgements'])) + \
+        len(tokenize(sections['references']))
+    masked, report = TextExcluder([]).apply(sections)
+    assert masked == sections and report['tokens_excluded'] == 0
+
+    with pytest.raises(ValueError):
+        TextExcluder(["footnotes"])
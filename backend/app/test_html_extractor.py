@@ -0,0 +1,36 @@
+import time
+
+from app.core.metrics import metrics
+from app.utils.html_extractor import HTMLExtractor
+
+PAGE = "<html><body><p>" + "Paper content " * 20 + "</p></body></html>"
+
+
+def slow_extractor(page):
+    if "slow" in page.url:
+        time.sleep(60)
+    return "extracted " + page.url
+
+
+def test_timed_out_pages_are_skipped_and_the_pool_replaced():
+    extractor = HTMLExtractor([("slow", slow_extractor)], workers=1, timeout=2.0)
+    timeouts = metrics.get("plagiarism_html_extraction_failures_total", {'reason': "timeout"})
+    try:
+        assert extractor.extract(PAGE, "fast-1") == "extracted fast-1"
+        pool = extractor._pool
+        processes = list(pool._processes.values())
+
+        started = time.monotonic()
+        assert extractor.extract(PAGE, "slow") == ""
+        assert time.monotonic() - started < 10
+        assert metrics.get("plagiarism_html_extraction_failures_total", {'reason': "timeout"}) == timeouts + 1
+
+        # The busy worker is stopped, and the next page gets a new pool
+        for process in processes:
+            process.join(timeout=5)
+            assert not process.is_alive()
+        assert extractor._pool is None
+        assert extractor.extract(PAGE, "fast-2") == "extracted fast-2"
+        assert extractor._pool is not pool
+    finally:
+        extractor.close()
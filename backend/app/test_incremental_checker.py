@@ -0,0 +1,209 @@
+import multiprocessing
+import os
+import threading
+
+import pytest
+from fuzzywuzzy import fuzz
+
+from app.core.scheduler import tenant_scope
+from app.services.incremental_checker import RevisionStore
+
+
+def words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+SECTIONS = {
+    'abstract': words("abs", 30),
+    'introduction': words("intro", 40),
+    'methodology': words("method", 40),
+}
+# Shares the end of the introduction and the start of the methodology, across the section boundary
+REFERENCE = words("other", 20) + " " + " ".join(SECTIONS['introduction'].split()[-5:]) + " " + \
+    " ".join(SECTIONS['methodology'].split()[:5]) + " " + words("tail", 20)
+
+
+class StubSnapshot:
+    version = 1
+
+
+class StubSnapshotIndex:
+    current = StubSnapshot()
+
+
+def test_lineages_are_kept_per_tenant(tmp_path, make_incremental_checker):
+    incremental = make_incremental_checker([REFERENCE])
+    with tenant_scope("tenant-a"):
+        incremental.check("paper-1", SECTIONS, check_online_sources=True)
+    with tenant_scope("tenant-b"):
+        result = incremental.check("paper-1", {'abstract': words("b", 30)})
+    # Tenant B starts its own lineage: no reuse of tenant A's references or sections
+    assert result['revision']['revision'] == 1
+    assert result['plagiarism_results'] == []
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".json")]) == 2
+    assert incremental.store.load("paper-1", "tenant-a")['tenant'] == "tenant-a"
+    with tenant_scope("tenant-a"):
+        assert incremental.check("paper-1", SECTIONS, check_online_sources=True)['revision']['revision'] == 1
+
+
+def test_resubmission_fuzzy_matches_only_changed_sections(tmp_path, make_incremental_checker):
+    incremental = make_incremental_checker([REFERENCE])
+    incremental.check("paper-1", SECTIONS, check_online_sources=True, section_aligned=True)
+    checker = incremental.plagiarism_checker
+    checker.fuzzy_calls.clear()
+    embedded = len(checker.embedded)
+
+    # The new abstract quotes the reference
+    revised = dict(SECTIONS, abstract=words("other", 20) + " " + words("revised", 10))
+    result = incremental.check("paper-1", revised, check_online_sources=True, section_aligned=True)
+    assert result['revision']['changed_sections'] == ['abstract']
+    assert checker.fuzzy_calls == [revised['abstract']]
+    # The text read by the embedding model changed with the abstract; the reference's embedding is kept
+    assert len(checker.embedded) == embedded + 1
+
+    # Same scores as checking the revision from scratch
+    fresh = make_incremental_checker([REFERENCE], directory=tmp_path / "fresh").check("paper-1", revised, check_online_sources=True,
+                                                    section_aligned=True)
+    assert result['plagiarism_results'][0]['fuzzy_similarity'] == \
+        fresh['plagiarism_results'][0]['fuzzy_similarity']
+    assert result['plagiarism_results'][0]['section_matches'] == fresh['plagiarism_results'][0]['section_matches']
+
+
+def test_ngram_similarity_counts_ngrams_across_section_boundaries(make_incremental_checker):
+    incremental = make_incremental_checker([REFERENCE])
+    result = incremental.check("paper-1", SECTIONS, check_online_sources=True)
+    checker = incremental.plagiarism_checker
+    suspect = set(checker.hash_ngrams(checker.preprocess_text(" ".join(SECTIONS.values()))))
+    reference = set(checker.hash_ngrams(checker.preprocess_text(REFERENCE)))
+    expected = len(suspect & reference) / len(suspect | reference)
+    assert result['plagiarism_results'][0]['ngram_similarity'] == expected
+
+    revised = dict(SECTIONS, abstract=words("revised", 30))
+    result = incremental.check("paper-1", revised, check_online_sources=True)
+    suspect = set(checker.hash_ngrams(checker.preprocess_text(" ".join(revised.values()))))
+    assert result['plagiarism_results'][0]['ngram_similarity'] == len(suspect & reference) / len(suspect | reference)
+
+
+def test_changed_ai_threshold_runs_ai_detection_again(make_incremental_checker):
+    incremental = make_incremental_checker([REFERENCE])
+    incremental.check("paper-1", SECTIONS, ai_threshold=0.7)
+    result = incremental.check("paper-1", SECTIONS, ai_threshold=0.95)
+    assert incremental.ai_detector.analyzed[-1] == list(SECTIONS)
+    assert result['ai_detection_results']['threshold'] == 0.95
+    assert not any(section['is_ai_generated'] for section in result['ai_detection_results']['section_results'].values())
+
+    # The same threshold again reuses the stored results
+    analyzed = len(incremental.ai_detector.analyzed)
+    assert incremental.check("paper-1", SECTIONS, ai_threshold=0.95)['ai_detection_results'] == \
+        result['ai_detection_results']
+    assert len(incremental.ai_detector.analyzed) == analyzed
+
+
+def test_changed_sections_are_searched_and_new_references_added(make_incremental_checker):
+    incremental = make_incremental_checker([REFERENCE])
+    incremental.check("paper-1", SECTIONS, check_online_sources=True)
+    checker = incremental.plagiarism_checker
+    assert checker.searches == [list(sorted(SECTIONS))]
+
+    # The revised methodology quotes a paper the first search did not return
+    quoted = words("quoted", 30)
+    checker.references.append(quoted + " " + words("paper", 20))
+    revised = dict(SECTIONS, methodology=quoted)
+    result = incremental.check("paper-1", revised, check_online_sources=True)
+    assert checker.searches[-1] == ['methodology']
+    assert result['revision']['references_reused'] and result['revision']['references_added'] == 1
+    assert [match['paper_info']['title'] for match in result['plagiarism_results']] == ["Reference 1", "Reference 0"]
+
+    # Found again by a later search, a reference is not added twice
+    revised = dict(revised, abstract=words("again", 30))
+    result = incremental.check("paper-1", revised, check_online_sources=True)
+    assert result['revision']['references_added'] == 0
+    assert len(result['plagiarism_results']) == 2
+
+
+def test_offline_checks_use_the_local_corpus(make_incremental_checker):
+    incremental = make_incremental_checker([REFERENCE], snapshot_index=StubSnapshotIndex())
+    result = incremental.check("paper-1", SECTIONS)
+    checker = incremental.plagiarism_checker
+    assert checker.searches == ["local"]
+    [match] = result['plagiarism_results']
+    assert match['paper_info'] == {'title': "Local 0"}
+    # Without section alignment fuzzy similarity is whole-text matching, as in a normal check
+    assert 'section_matches' not in match
+    assert match['fuzzy_similarity'] == fuzz.token_sort_ratio(
+        checker.preprocess_text(" ".join(SECTIONS.values())), checker.preprocess_text(REFERENCE)) / 100
+
+    # References of another source are not reused
+    result = incremental.check("paper-1", SECTIONS, check_online_sources=True)
+    assert not result['revision']['references_reused']
+    assert result['plagiarism_results'][0]['paper_info']['title'] == "Reference 0"
+
+
+def test_cascade_embeds_only_references_that_matter(make_incremental_checker):
+    text = " ".join(SECTIONS.values())
+    unrelated = words("unrelated", 80)
+    incremental = make_incremental_checker([text, text + " copy", text + " again", unrelated])
+    result = incremental.check("paper-1", SECTIONS, check_online_sources=True, ai_early_exit=True)
+    checker = incremental.plagiarism_checker
+    assert incremental.ai_detector.early_exit
+    # The unrelated reference cannot reach the reported results and is never embedded
+    assert unrelated not in checker.embedded
+    assert result['plagiarism_results'][-1]['semantic_similarity'] is None
+    assert incremental.store.load("paper-1")['references'][3]['embedding'] is None
+
+
+def test_concurrent_revisions_of_a_lineage_are_not_lost(make_incremental_checker):
+    incremental = make_incremental_checker([REFERENCE])
+    incremental.check("paper-1", SECTIONS, check_online_sources=True)
+    incremental.plagiarism_checker.search_seconds = 0.05
+    revisions = []
+
+    def resubmit(i):
+        revised = dict(SECTIONS, abstract=words(f"revision{i}x", 30))
+        revisions.append(incremental.check("paper-1", revised, check_online_sources=True)['revision']['revision'])
+
+    threads = [threading.Thread(target=resubmit, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(revisions) == [2, 3, 4, 5]
+    assert incremental.store.load("paper-1")['revision'] == 5
+    assert incremental.store.lineage_locks == {}
+
+
+def _hold_lineage(directory, held, release):
+    store = RevisionStore(directory)
+    with store.lineage("paper-1", "tenant-a"):
+        held.set()
+        release.wait(5)
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_lineage_lock_holds_across_processes(tmp_path):
+    store = RevisionStore(str(tmp_path / "revisions"))
+    assert not os.path.exists(store.directory)
+    context = multiprocessing.get_context("fork")
+    held, release = context.Event(), context.Event()
+    holder = context.Process(target=_hold_lineage, args=(store.directory, held, release))
+    holder.start()
+    try:
+        assert held.wait(5)
+        acquired = threading.Event()
+
+        def acquire():
+            with store.lineage("paper-1", "tenant-a"):
+                acquired.set()
+
+        waiter = threading.Thread(target=acquire)
+        waiter.start()
+        # Other lineages are not held up
+        with store.lineage("paper-2", "tenant-a"):
+            pass
+        assert not acquired.wait(0.3)
+        release.set()
+        assert acquired.wait(5)
+        waiter.join()
+    finally:
+        release.set()
+        holder.join(5)
@@ -0,0 +1,177 @@
+import hashlib
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from app.services.lexical_index import (BLOCK_SIZE, B, K1, TermIndex, bm25_idf, decode_varints, encode_varints,
+                                        term_hash, write_term_index)
+from app.services.sharded_search import fingerprint_array
+from app.services.snapshots import RRF_K, SnapshotStore
+from app.utils.text import term_frequencies
+
+VOCABULARY = [f"term{i}" for i in range(400)]
+
+
+def random_document(rng, words=None):
+    """Words drawn from a Zipf-like distribution, so some terms span many posting blocks"""
+    ranks = np.minimum(rng.zipf(1.3, size=words or int(rng.integers(5, 120))), len(VOCABULARY)) - 1
+    return [VOCABULARY[rank] for rank in ranks]
+
+
+def brute_force(documents, query, idfs, live=None):
+    """BM25 of every live document, computed directly from its term frequencies"""
+    lengths = np.array([sum(document.values()) for document in documents], dtype=np.float64)
+    avgdl = lengths.mean()
+    scores = {}
+    for doc_id, document in enumerate(documents):
+        if live is not None and not live[doc_id]:
+            continue
+        score = 0.0
+        for term, idf in zip(query, idfs):
+            tf = document.get(term, 0)
+            score += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * lengths[doc_id] / avgdl))
+        if score > 0:
+            scores[doc_id] = score
+    return scores
+
+
+def assert_top_k(found_ids, found_scores, expected, k):
+    best = sorted(expected.values(), reverse=True)[:k]
+    assert np.allclose(found_scores, best)
+    # Any order of tied documents is correct
+    for doc_id, score in zip(found_ids, found_scores):
+        assert expected[int(doc_id)] == pytest.approx(score)
+    assert len(set(int(doc_id) for doc_id in found_ids)) == len(found_ids)
+
+
+def test_varints_round_trip():
+    values = np.array([0, 1, 127, 128, 300, 16383, 16384, 2 ** 21, 2 ** 28 + 5, 2 ** 35 - 1], dtype=np.int64)
+    encoded, sizes = encode_varints(values)
+    assert sizes.tolist() == [1, 1, 1, 2, 2, 2, 3, 4, 5, 5] and len(encoded) == sizes.sum()
+    assert decode_varints(np.frombuffer(encoded, dtype=np.uint8)).tolist() == values.tolist()
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_top_k_matches_brute_force_bm25(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    documents = [Counter(random_document(rng)) for _ in range(5 * BLOCK_SIZE + 37)]
+    write_term_index(str(tmp_path), documents)
+    index = TermIndex(str(tmp_path))
+    df = Counter(term for document in documents for term in document)
+
+    # Replaced and deleted rows are masked out
+    masks = [None, rng.random(len(documents)) < 0.7]
+    for _ in range(10):
+        size = int(rng.integers(1, 10))
+        # Frequent terms (many blocks), rare terms and terms absent from the segment
+        query = list(dict.fromkeys(
+            [VOCABULARY[int(rank)] for rank in rng.integers(0, 8, size=2)] +
+            [VOCABULARY[int(rank)] for rank in rng.integers(0, len(VOCABULARY), size=size)] + ["missing"]))
+        hashes = np.array([term_hash(term) for term in query], dtype=np.uint64)
+        idfs = bm25_idf([df.get(term, 0) for term in query], len(documents))
+        for live in masks:
+            expected = brute_force(documents, query, idfs, live)
+            for k in (1, 5, 20):
+                ids, scores = index.top_k(hashes, idfs, k, live=live)
+                assert_top_k(ids, scores, expected, k)
+                if live is not None:
+                    assert live[ids].all()
+                # A threshold from other segments only drops documents at or below it
+                if len(scores) == k:
+                    threshold = float(scores[-1])
+                    ids, scores = index.top_k(hashes, idfs, k, threshold=threshold, live=live)
+                    assert (scores > threshold).all()
+                    # Documents tied with the threshold may differ from it by rounding
+                    assert_top_k(ids, scores, {doc_id: score for doc_id, score in expected.items()
+                                               if score > threshold + 1e-9}, k)
+
+
+def fingerprint(text):
+    words = text.split()
+    return fingerprint_array(hashlib.md5(" ".join(words[i:i + 3]).encode()).hexdigest()
+                             for i in range(len(words) - 2))
+
+
+def embed(text):
+    vector = np.zeros(32, dtype=np.float32)
+    for word in text.split():
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 32] += 1.0
+    return vector
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    """
+    Snapshot of two segments, the second replacing and deleting references of
+    the first, with the texts of each segment and of the live references
+    """
+    rng = np.random.default_rng(7)
+    store = SnapshotStore(str(tmp_path / "store"))
+    first = {f"ref-{i}": " ".join(random_document(rng)) for i in range(300)}
+    second = {f"ref-{i}": " ".join(random_document(rng)) for i in range(250, 400)}
+    deleted = [f"ref-{i}" for i in range(0, 60, 2)]
+    for texts, removed in ((first, ()), (second, deleted)):
+        store.add([(key, text, {'title': key}) for key, text in texts.items()], fingerprint, embed=embed,
+                  metadata={'model': "stub-model:mean"}, deleted=removed)
+    live = {**{key: text for key, text in first.items() if key not in deleted}, **second}
+    return store.open(), [first, second], live
+
+
+def test_snapshot_search_terms_matches_brute_force_bm25(snapshot):
+    snapshot, segments, live = snapshot
+    rows = [[term_frequencies(text) for text in segment.values()] for segment in segments]
+    documents = [document for segment in rows for document in segment]
+    df = Counter(term for document in documents for term in document)
+    rng = np.random.default_rng(1)
+    for _ in range(10):
+        # Fewer distinct terms than max_terms, so every term is queried
+        query = list(dict.fromkeys(random_document(rng, words=12)))
+        idfs = bm25_idf([df.get(term, 0) for term in query], len(documents))
+        # BM25 of each live reference, with its segment's average length
+        expected = {}
+        for segment, frequencies in zip(segments, rows):
+            scores = brute_force(frequencies, query, idfs)
+            for position, key in enumerate(segment):
+                if position in scores and live.get(key) == segment[key]:
+                    expected[key] = scores[position]
+        for k in (1, 10):
+            results = snapshot.search_terms(" ".join(query), k=k)
+            keys = [result['reference_key'] for result in results]
+            assert len(set(keys)) == len(keys)
+            assert np.allclose([result['bm25_score'] for result in results],
+                               sorted(expected.values(), reverse=True)[:k])
+            for result in results:
+                assert expected[result['reference_key']] == pytest.approx(result['bm25_score'])
+                assert result['paper_info'] == {'title': result['reference_key']}
+
+
+def test_snapshot_search_hybrid_fuses_both_rankings(snapshot):
+    snapshot, _, live = snapshot
+    text = live["ref-300"]
+    depth = 20
+    bm25 = snapshot.search_terms(text, depth)
+    nearest = snapshot.search_embeddings(embed(text), depth)
+    expected = {}
+    for score_name, ranking in (("bm25_score", bm25), ("similarity", nearest)):
+        for rank, match in enumerate(ranking, start=1):
+            entry = expected.setdefault(match['reference_key'], {'fused_score': 0.0, 'bm25_score': None,
+                                                                 'similarity': None})
+            entry['fused_score'] += 1.0 / (RRF_K + rank)
+            entry[score_name] = match[score_name]
+
+    results = snapshot.search_hybrid(text, embed(text), k=10, depth=depth)
+    assert results[0]['reference_key'] == "ref-300"
+    assert results[0]['bm25_score'] is not None and results[0]['similarity'] is not None
+    assert [result['fused_score'] for result in results] == \
+        sorted((entry['fused_score'] for entry in expected.values()), reverse=True)[:10]
+    for result in results:
+        assert result['reference_key'] in live
+        entry = expected[result['reference_key']]
+        assert result['fused_score'] == pytest.approx(entry['fused_score'])
+        assert (result['bm25_score'], result['similarity']) == (entry['bm25_score'], entry['similarity'])
+
+    # Without an embedding the BM25 ranking is kept
+    results = snapshot.search_hybrid(text, k=10, depth=depth)
+    assert [result['reference_key'] for result in results] == [match['reference_key'] for match in bm25[:10]]
+    assert all(result['similarity'] is None for result in results)
@@ -0,0 +1,26 @@
+from app.core.memory import BYTES_PER_CHAR, MB, MemoryBudget, memory_budget
+from app.core.models import PlagiarismOptions
+from app.services.pipeline import PlagiarismPipeline
+
+
+def test_large_document_is_truncated_and_recorded(make_stub_checker, stub_detector):
+    checker = make_stub_checker()
+    pipeline = PlagiarismPipeline(None, checker, stub_detector)
+    sections = {
+        'introduction': " ".join(f"introduction{i}" for i in range(20_000)),
+        'methodology': " ".join(f"method{i}" for i in range(20_000)),
+    }
+    document_chars = len(" ".join(sections.values()))
+
+    with memory_budget(MemoryBudget(budget_bytes=4 * MB)):
+        result = pipeline.check_sections(sections, PlagiarismOptions(exclusions=[]))
+
+    max_text_chars = 4 * MB // 2 // BYTES_PER_CHAR
+    assert result['memory']['max_text_chars'] == max_text_chars
+    assert document_chars > max_text_chars >= len(checker.checked[0]) > max_text_chars // 2
+    assert result['memory']['degradations'] == [{
+        'input': 'document', 'reason': 'truncated',
+        'original_chars': document_chars, 'kept_chars': len(checker.checked[0])
+    }]
+    # The response still describes the whole document
+    assert result['total_word_count'] == 40_000
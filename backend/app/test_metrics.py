@@ -0,0 +1,103 @@
+import multiprocessing
+import os
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.core.metrics import MetricsRegistry, ProcessMetrics, route_label
+
+
+def make_app(registry):
+    app = FastAPI()
+
+    @app.middleware("http")
+    async def record(request: Request, call_next):
+        response = await call_next(request)
+        registry.inc("http_requests_total", labels={"path": route_label(request.scope),
+                                                     "status": response.status_code})
+        return response
+
+    @app.get("/api/reports/{report_id}")
+    async def report(report_id: str):
+        return {"id": report_id}
+
+    return app
+
+
+def test_http_metrics_are_labelled_with_route_templates():
+    registry = MetricsRegistry()
+    client = TestClient(make_app(registry))
+    for i in range(20):
+        client.get(f"/api/reports/{i}")
+        client.get(f"/scan/{i}/.env")
+    client.post("/api/reports/1")
+
+    rendered = registry.render()
+    series = [line for line in rendered.splitlines() if line.startswith("http_requests_total{")]
+    assert sorted(series) == [
+        'http_requests_total{path="/api/reports/{report_id}",status="200"} 20.0',
+        'http_requests_total{path="/api/reports/{report_id}",status="405"} 1.0',
+        'http_requests_total{path="unmatched",status="404"} 20.0',
+    ]
+
+
+def worker_registry(requests, in_flight, latency):
+    registry = MetricsRegistry()
+    registry.inc("http_requests_total", requests, {"status": 200}, description="HTTP requests")
+    registry.set("plagiarism_checks_in_flight", in_flight, description="Checks running")
+    registry.observe("http_request_duration_seconds", latency, buckets=(0.1, 1.0))
+    return registry
+
+
+def series(rendered, name):
+    return sorted(line for line in rendered.splitlines() if line.startswith(name + "{") or line.startswith(name + " "))
+
+
+def test_scrape_aggregates_the_metrics_of_every_process(tmp_path):
+    scraping = ProcessMetrics(str(tmp_path), worker_registry(1, 0, 0.05), flush_seconds=0)
+    other = ProcessMetrics(str(tmp_path), worker_registry(2, 1, 0.5), flush_seconds=0)
+    other.write(pid=4242)
+    rendered = scraping.render()
+    assert series(rendered, "http_requests_total") == ['http_requests_total{status="200"} 3.0']
+    assert set(series(rendered, "plagiarism_checks_in_flight")) == {
+        f'plagiarism_checks_in_flight{{pid="{os.getpid()}"}} 0',
+        'plagiarism_checks_in_flight{pid="4242"} 1',
+    }
+    assert 'http_request_duration_seconds_bucket{le="0.1"} 1' in rendered
+    assert 'http_request_duration_seconds_bucket{le="1.0"} 2' in rendered
+    assert 'http_request_duration_seconds_count 2' in rendered
+
+    # An exited worker's counters stay in the totals; its gauges go
+    scraping.mark_process_dead(4242)
+    rendered = scraping.render()
+    assert series(rendered, "http_requests_total") == ['http_requests_total{status="200"} 3.0']
+    assert series(rendered, "plagiarism_checks_in_flight") == [
+        f'plagiarism_checks_in_flight{{pid="{os.getpid()}"}} 0'
+    ]
+
+    scraping.clear()
+    assert os.listdir(tmp_path) == []
+
+
+def _count_in_forked_worker(process_metrics, done):
+    process_metrics.forked()
+    process_metrics.registry.inc("http_requests_total", 5, {"status": 200})
+    process_metrics.write()
+    done.set()
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_forked_workers_do_not_count_their_parents_totals_again(tmp_path):
+    parent = ProcessMetrics(str(tmp_path), worker_registry(1, 2, 0.05), flush_seconds=0)
+    parent.write()
+    context = multiprocessing.get_context("fork")
+    done = context.Event()
+    child = context.Process(target=_count_in_forked_worker, args=(parent, done))
+    child.start()
+    assert done.wait(10)
+    child.join(10)
+    rendered = parent.render()
+    assert series(rendered, "http_requests_total") == ['http_requests_total{status="200"} 6.0']
+    # The worker keeps the gauges it inherited
+    assert f'plagiarism_checks_in_flight{{pid="{child.pid}"}} 2' in rendered
@@ -0,0 +1,69 @@
+import asyncio
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.utils.pdf_extractor import PDFExtractor
+from app.utils.upload import UploadTooLarge
+
+PDF = b"%PDF-1.4\n" + b"0" * 200_000 + b"\n%%EOF\n"
+HTML = b"<!DOCTYPE html><html><head><title>Not found</title></head><body>" + b"x" * 2000 + b"</body></html>"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.0"
+
+    def do_GET(self):
+        body, declare = {
+            "/paper.pdf": (PDF, True),
+            "/undeclared.pdf": (PDF, False),
+            "/missing.pdf": (HTML, True),
+        }[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        if declare:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+def download(url, **kwargs):
+    return asyncio.run(PDFExtractor().download_pdf(url, **kwargs))
+
+
+@pytest.mark.parametrize("path", ["/paper.pdf", "/undeclared.pdf"])
+def test_pdf_is_streamed_to_a_file_and_hashed(server, path):
+    pdf_file, sha256 = download(server + path)
+    try:
+        assert pdf_file.read() == PDF
+        assert sha256 == hashlib.sha256(PDF).hexdigest()
+    finally:
+        pdf_file.close()
+
+
+@pytest.mark.parametrize("path", ["/paper.pdf", "/undeclared.pdf"])
+def test_pdf_over_the_limit_is_abandoned(server, path):
+    with pytest.raises(UploadTooLarge):
+        download(server + path, max_bytes=64 * 1024)
+
+
+def test_error_page_is_not_taken_for_a_pdf(server):
+    with pytest.raises(Exception, match="did not return a PDF"):
+        download(server + "/missing.pdf")
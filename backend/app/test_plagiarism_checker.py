@@ -0,0 +1,81 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from app.services.cascade import SCORE_WEIGHTS  # noqa: E402
+from app.services.plagiarism_checker import PlagiarismChecker  # noqa: E402
+
+THRESHOLDS = {'semantic': 0.85, 'ngram': 0.4, 'fuzzy': 0.7}
+SUSPECT = "graph neural networks learn node representations by passing messages between neighbours"
+REFERENCES = [
+    "graph neural networks learn node representations by passing messages along edges",
+    "convolutional networks classify images from local pixel patterns",
+]
+
+
+def embedding(text):
+    """Bag-of-words vector standing in for the document embedding"""
+    vector = np.zeros((1, 64), dtype=np.float32)
+    for word in text.split():
+        vector[0, int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1.0
+    return vector
+
+
+class StubSnapshot:
+    version = "v1"
+
+    def __init__(self, texts):
+        self.texts = texts
+
+    def search_embeddings(self, query_vector, top_n):
+        return [{'reference_key': key, 'similarity': 0.5} for key in list(self.texts)[:top_n]]
+
+    def text(self, key):
+        return self.texts[key]
+
+
+class StubSnapshotIndex:
+    def __init__(self, current=None):
+        self.current = current
+
+
+def make_checker(snapshot=None):
+    """PlagiarismChecker without models, scholarly providers or configured corpora"""
+    checker = PlagiarismChecker.__new__(PlagiarismChecker)
+    checker.vector_database = None
+    checker.snapshot_index = StubSnapshotIndex(snapshot)
+    checker.dedup_threshold = 0.0
+    checker.get_bert_embeddings = lambda text, max_length=None: embedding(text)
+    return checker
+
+
+def test_database_check_without_published_snapshot_builds_the_database():
+    checker = make_checker(snapshot=None)
+    results = checker.check_plagiarism(SUSPECT, REFERENCES, THRESHOLDS, use_database=True)
+    assert [result['reference_id'] for result in results] == [0, 1]
+    assert checker.vector_database is not None
+
+
+def test_database_check_scores_passed_references_despite_snapshot():
+    snapshot = StubSnapshot({'snap-1': "an unrelated snapshot reference about protein folding"})
+    checker = make_checker(snapshot)
+    results = checker.check_plagiarism(SUSPECT, REFERENCES, THRESHOLDS, use_database=True)
+    assert sorted(result['reference_id'] for result in results) == [0, 1]
+
+    # Without references of its own, a check searches the snapshot
+    results = make_checker(snapshot).check_plagiarism(SUSPECT, [], THRESHOLDS, use_database=True)
+    assert [result['reference_id'] for result in results] == ['snap-1']
+
+
+def test_database_check_uses_score_weights(monkeypatch):
+    monkeypatch.setitem(SCORE_WEIGHTS, 'semantic', 0.2)
+    monkeypatch.setitem(SCORE_WEIGHTS, 'ngram', 0.2)
+    monkeypatch.setitem(SCORE_WEIGHTS, 'fuzzy', 0.6)
+    results = make_checker().check_plagiarism(SUSPECT, REFERENCES, THRESHOLDS, use_database=True)
+    for result in results:
+        assert result['overall_score'] == pytest.approx(0.2 * result['semantic_similarity']
+                                                        + 0.2 * result['ngram_similarity']
+                                                        + 0.6 * result['fuzzy_similarity'])
@@ -0,0 +1,144 @@
+import io
+
+import pytest
+from requests.adapters import HTTPAdapter
+from urllib3.response import HTTPResponse
+
+from app.core.memory import memory_budget
+from app.core.metrics import metrics
+from app.services.reference_fetcher import CHUNK_BYTES, SNIFF_BYTES, FetchCache, ReferenceFetcher, sniff
+from app.utils.html_extractor import MAX_HTML_CHARS
+
+
+class Body(io.BytesIO):
+    """Response body counting the bytes read from it"""
+
+    bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def read1(self, size=-1):
+        data = super().read1(size)
+        self.bytes_read += len(data)
+        return data
+
+
+class StubAdapter(HTTPAdapter):
+    """Serves canned responses by URL and records the requests and the bytes read of each body"""
+
+    def __init__(self, routes):
+        super().__init__()
+        self.routes = routes
+        self.requests = []
+        self.bodies = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        status, headers, data = self.routes[request.url](request)
+        body = Body(data)
+        self.bodies.append(body)
+        raw = HTTPResponse(body=body, headers=headers, status=status, preload_content=False,
+                           decode_content=False)
+        return self.build_response(request, raw)
+
+
+class StubExtractor:
+    def __init__(self):
+        self.pages = []
+
+    def extract(self, html, url=""):
+        self.pages.append(html)
+        return "extracted"
+
+
+def make_fetcher(routes):
+    adapter = StubAdapter(routes)
+    fetcher = ReferenceFetcher(html_extractor=StubExtractor(), cache=FetchCache())
+    fetcher._session().mount("http://", adapter)
+    return fetcher, adapter
+
+
+def serve(data, content_type, status=200, **headers):
+    return lambda request: (status, {'Content-Type': content_type, **headers}, data)
+
+
+def test_sniff_trusts_signatures_over_declared_types():
+    assert sniff(b"%PDF-1.7\n...", "application/octet-stream") == "pdf"
+    assert sniff(b"\xef\xbb\xbf <!DOCTYPE html><html>", "text/plain") == "html"
+    assert sniff(b"\x89PNG\r\n\x1a\n", "text/html") is None
+    assert sniff(b"Plain words", "text/plain") == "text"
+    assert sniff(b"Plain words", "") == "text"
+    assert sniff(b"<p>Not found</p>", "application/pdf", "http://x/paper.pdf") == "html"
+    assert sniff(b"\x00\x01binary", "application/pdf", "http://x/paper.pdf") is None
+
+
+def test_bodies_shorter_than_the_sniffed_head():
+    text = "A short reference abstract."
+    assert len(text) < SNIFF_BYTES
+    fetcher, _ = make_fetcher({
+        'http://refs/short.txt': serve(text.encode(), "text/plain"),
+        'http://refs/short.png': serve(b"\x89PNG\r\n\x1a\n" + b"\x00" * 10, "application/octet-stream"),
+        'http://refs/short.html': serve(b"<html><body><p>Hi</p></body></html>", "text/html"),
+    })
+    assert fetcher.fetch("http://refs/short.txt") == text
+    assert fetcher.fetch("http://refs/short.png") == ""
+    assert fetcher.fetch("http://refs/short.html") == "extracted"
+    assert fetcher.html_extractor.pages == ["<html><body><p>Hi</p></body></html>"]
+
+
+def test_pdfs_over_the_allowance_are_skipped():
+    pdf = b"%PDF-1.4\n" + b"0" * (10 * CHUNK_BYTES)
+    fetcher, adapter = make_fetcher({
+        'http://refs/streamed.pdf': serve(pdf, "application/pdf"),
+        'http://refs/declared.pdf': serve(pdf, "application/pdf", **{'Content-Length': str(len(pdf))}),
+    })
+    with memory_budget(max_download_bytes=100_000) as budget:
+        assert fetcher.fetch("http://refs/streamed.pdf") == ""
+        # Read up to the allowance, then abandoned: a cut-off PDF cannot be parsed
+        assert 100_000 <= adapter.bodies[0].bytes_read < len(pdf)
+        assert fetcher.fetch("http://refs/declared.pdf") == ""
+        # A declared size over the allowance is never read
+        assert adapter.bodies[1].bytes_read == 0
+    assert budget.degradations == [
+        {'input': "http://refs/streamed.pdf", 'reason': "skipped", 'downloaded_bytes': 100_000},
+        {'input': "http://refs/declared.pdf", 'reason': "skipped", 'declared_bytes': len(pdf)},
+    ]
+
+
+def test_html_is_read_only_up_to_what_the_extractor_parses():
+    page = b"<html><body>" + b"<p>paragraph</p>" * (MAX_HTML_CHARS // 8) + b"</body></html>"
+    fetcher, adapter = make_fetcher({'http://refs/page.html': serve(page, "text/html")})
+    with memory_budget(max_download_bytes=4 * MAX_HTML_CHARS) as budget:
+        assert fetcher.fetch("http://refs/page.html") == "extracted"
+    [html] = fetcher.html_extractor.pages
+    assert len(html) == MAX_HTML_CHARS and page.decode().startswith(html)
+    assert adapter.bodies[0].bytes_read < len(page)
+    # The extractor would cut there anyway, so nothing is reported
+    assert budget.degradations == []
+
+
+def test_unchanged_references_are_revalidated_with_their_etag():
+    text = "Reference text " * 200
+
+    def versioned(request):
+        if request.headers.get('If-None-Match') == '"v1"':
+            return 304, {'ETag': '"v1"'}, b""
+        return 200, {'Content-Type': "text/plain; charset=utf-8", 'ETag': '"v1"'}, text.encode()
+
+    fetcher, adapter = make_fetcher({'http://refs/paper.txt': versioned})
+    hits = metrics.get("plagiarism_cache_requests_total", {'cache': "reference_fetch", 'result': "hit"})
+    assert fetcher.fetch("http://refs/paper.txt") == text
+    assert 'If-None-Match' not in adapter.requests[0].headers
+    assert fetcher.fetch("http://refs/paper.txt") == text
+    assert adapter.requests[1].headers['If-None-Match'] == '"v1"'
+    assert metrics.get("plagiarism_cache_requests_total",
+                       {'cache': "reference_fetch", 'result': "hit"}) == hits + 1
+
+
+@pytest.mark.parametrize("status", [404, 500])
+def test_failed_responses_give_no_text(status):
+    fetcher, _ = make_fetcher({'http://refs/missing': serve(b"Not found", "text/plain", status=status)})
+    assert fetcher.fetch("http://refs/missing") == ""
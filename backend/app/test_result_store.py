@@ -0,0 +1,101 @@
+import datetime
+import json
+
+import pytest
+
+from app.services.result_store import ResultStore, authenticate, parse_api_keys
+
+
+def response(score, title="A thesis"):
+    return {'plagiarism_overall_score': score, 'sections': {'title': title, 'abstract': "Full text"},
+            'ai_detection_results': {'overall_ai_probability': 0.25}, 'total_word_count': 1200,
+            'content_hash': f"hash-{score}", 'degraded': False}
+
+
+def set_created_at(store, report_id, moment):
+    connection = store._connection()
+    with connection:
+        connection.execute("UPDATE reports SET created_at = ? WHERE report_id = ?",
+                           (moment.astimezone(datetime.timezone.utc).isoformat(timespec="milliseconds"),
+                            report_id))
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore(str(tmp_path / "results.sqlite3"), retention_days=30)
+
+
+def test_save_and_get_are_scoped_to_the_tenant(store):
+    report_id = store.save(response(0.4), "physics", user_id="u1", course_id="c1")
+    stored = json.loads(store.get(report_id, "physics"))
+    assert stored['report_id'] == report_id
+    assert stored['sections']['abstract'] == "Full text"
+    assert store.get(report_id, "library") is None
+    assert store.history("library")['reports'] == []
+    [summary] = store.history("physics")['reports']
+    assert summary['user_id'] == "u1" and summary['title'] == "A thesis" and summary['degraded'] is False
+    assert 'payload' not in summary
+
+
+def test_history_pages_with_cursors(store):
+    ids = [store.save(response(i / 10), "physics") for i in range(7)]
+    for order, expected in (("score", ids[::-1]), ("date", None)):
+        seen, cursor = [], None
+        while True:
+            page = store.history("physics", order=order, limit=3, cursor=cursor)
+            seen += [report['report_id'] for report in page['reports']]
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        assert sorted(seen) == sorted(ids) and len(seen) == 7
+        if expected is not None:
+            assert seen == expected
+    filtered = store.history("physics", min_score=0.3, max_score=0.5, order="score")['reports']
+    assert [report['report_id'] for report in filtered] == [ids[5], ids[4], ids[3]]
+    with pytest.raises(ValueError):
+        store.history("physics", cursor="not-a-cursor")
+
+
+def test_history_time_bounds_are_compared_in_utc(store):
+    report_id = store.save(response(0.5), "physics")
+    # Stored as 10:00 UTC, which is 12:00 at +02:00
+    set_created_at(store, report_id, datetime.datetime(2026, 5, 1, 10, 0, tzinfo=datetime.timezone.utc))
+
+    def found(**bounds):
+        return [report['report_id'] for report in store.history("physics", **bounds)['reports']] == [report_id]
+
+    assert found(since="2026-05-01T11:30:00+02:00")
+    assert not found(since="2026-05-01T12:30:00+02:00")
+    assert found(until="2026-05-01T12:30:00+02:00")
+    assert not found(until="2026-05-01T11:30:00+02:00")
+    assert found(since="2026-05-01T09:59:59", until="2026-05-01T10:00:01Z")
+    for invalid in ("yesterday", "2026-13-01", ""):
+        with pytest.raises(ValueError):
+            store.history("physics", since=invalid)
+
+
+def test_expired_reports_are_purged(store):
+    old = store.save(response(0.1), "physics")
+    recent = store.save(response(0.2), "physics")
+    now = datetime.datetime.now(datetime.timezone.utc)
+    set_created_at(store, old, now - datetime.timedelta(days=31))
+    assert store.purge() == 1
+    assert store.get(old, "physics") is None
+    assert store.get(recent, "physics") is not None
+    assert ResultStore(store.path, retention_days=0).purge() == 0
+
+
+def test_store_is_opt_in(monkeypatch, tmp_path):
+    monkeypatch.delenv("RESULT_STORE_PATH", raising=False)
+    assert ResultStore.from_env() is None
+    monkeypatch.setenv("RESULT_STORE_PATH", str(tmp_path / "reports.sqlite3"))
+    assert ResultStore.from_env() is not None
+
+
+def test_api_keys_identify_the_tenant():
+    keys = parse_api_keys("physics=secret-1, library = secret-2,broken")
+    assert keys == {'secret-1': "physics", 'secret-2': "library"}
+    assert authenticate("secret-2", keys) == "library"
+    assert authenticate("secret-3", keys) is None
+    assert authenticate(None, keys) is None
+    assert authenticate("secret-1", {}) is None
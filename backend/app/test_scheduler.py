@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from app.core.metrics import metrics
+from app.core.scheduler import DEFAULT_TENANT, FairQueue, resolve_tenant
+
+
+def test_unconfigured_tenants_map_to_the_default(monkeypatch):
+    monkeypatch.setenv("TENANTS", "physics,library")
+    monkeypatch.setenv("TENANT_WEIGHTS", "chemistry=2")
+    monkeypatch.delenv("DEFAULT_TENANT", raising=False)
+    assert resolve_tenant("physics") == "physics"
+    assert resolve_tenant(" library ") == "library"
+    assert resolve_tenant("chemistry") == "chemistry"
+    assert resolve_tenant("attacker-123") == DEFAULT_TENANT
+    assert resolve_tenant(None) == DEFAULT_TENANT
+    with pytest.raises(ValueError):
+        resolve_tenant("../etc")
+
+
+def test_random_tenant_headers_do_not_grow_scheduler_state(monkeypatch):
+    monkeypatch.setenv("TENANTS", "physics")
+    monkeypatch.delenv("TENANT_WEIGHTS", raising=False)
+    monkeypatch.delenv("TENANT_API_BUDGETS", raising=False)
+    queue = FairQueue(capacity=1)
+
+    async def run():
+        for i in range(200):
+            tenant = resolve_tenant(f"tenant-{i}")
+            await queue.acquire(tenant, "interactive")
+            queue.release(tenant, "interactive", 0.01)
+        await queue.acquire(resolve_tenant("physics"), "bulk")
+        queue.release("physics", "bulk", 0.01)
+
+    asyncio.run(run())
+    assert set(queue.stats) == {DEFAULT_TENANT, "physics"}
+    assert set(queue.finish) == {(DEFAULT_TENANT, "interactive"), ("physics", "bulk")}
+    assert queue.health()[DEFAULT_TENANT]['checks'] == 200
+    assert 'tenant="tenant-7"' not in metrics.render()
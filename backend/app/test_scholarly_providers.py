@@ -0,0 +1,67 @@
+import time
+
+from app.core.deadline import Deadline, deadline_scope
+from app.core.scheduler import tenant_scope
+from app.services.scholarly_providers import (CircuitBreaker, FakeProvider, ProviderManager, TenantBudgets,
+                                              TokenBucket)
+
+
+def half_open_manager(**kwargs) -> ProviderManager:
+    """Manager whose only provider's circuit is due for a trial call"""
+    manager = ProviderManager([FakeProvider()], max_retries=0, failure_threshold=1, reset_timeout=0.01, **kwargs)
+    manager.breakers["fake"].record_failure()
+    time.sleep(0.02)
+    assert manager.breakers["fake"].state == CircuitBreaker.HALF_OPEN
+    return manager
+
+
+def test_trial_skipped_by_rate_limit_is_released():
+    manager = half_open_manager()
+    manager.buckets["fake"] = TokenBucket(rate=0.0, capacity=0.0)
+    assert manager.search("fake", "graph neural networks") == []
+    # The trial was not made: the next search may make it
+    assert manager.breakers["fake"].state == CircuitBreaker.HALF_OPEN
+
+    manager.buckets["fake"] = TokenBucket(rate=1000.0, capacity=10.0)
+    assert len(manager.search("fake", "graph neural networks", 3)) == 3
+    assert manager.breakers["fake"].state == CircuitBreaker.CLOSED
+
+
+def test_trial_skipped_by_tenant_budget_is_released():
+    manager = half_open_manager(budgets=TenantBudgets(overrides={'tenant-a': 1.0}))
+    with tenant_scope("tenant-a"):
+        manager.budgets.try_acquire("tenant-a", "fake")
+        assert manager.search("fake", "query") == []
+    assert manager.breakers["fake"].state == CircuitBreaker.HALF_OPEN
+    assert manager.search("fake", "query", 2)
+    assert manager.breakers["fake"].state == CircuitBreaker.CLOSED
+
+
+def test_trial_skipped_by_deadline_is_released():
+    manager = half_open_manager()
+    deadline = Deadline(budget_ms=1)
+    time.sleep(0.01)
+    with deadline_scope(deadline):
+        assert manager.search("fake", "query") == []
+    assert manager.breakers["fake"].state == CircuitBreaker.HALF_OPEN
+    assert manager.search("fake", "query", 2)
+    assert manager.breakers["fake"].state == CircuitBreaker.CLOSED
+
+
+def test_trial_cut_short_by_deadline_is_released_and_counted_abandoned():
+    manager = ProviderManager([FakeProvider(latency=0.3, timeout=5.0)], max_retries=0, failure_threshold=1,
+                              reset_timeout=0.01)
+    manager.breakers["fake"].record_failure()
+    time.sleep(0.02)
+    with deadline_scope(Deadline(budget_ms=100)):
+        assert manager.search("fake", "query") == []
+    assert manager.breakers["fake"].state == CircuitBreaker.HALF_OPEN
+    assert manager.health()["fake"]["abandoned"] == 1
+    assert manager.health()["fake"]["failures"] == 0
+
+
+def test_failed_trial_reopens_circuit():
+    manager = half_open_manager()
+    manager.providers["fake"].failure_rate = 1.0
+    assert manager.search("fake", "query") == []
+    assert manager.breakers["fake"].state == CircuitBreaker.OPEN
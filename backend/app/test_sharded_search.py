@@ -0,0 +1,66 @@
+import hashlib
+import os
+
+import numpy as np
+import pytest
+
+from app.services.sharded_search import (SPOOL_DOCUMENTS_FILE, SPOOL_FINGERPRINTS_FILE, FingerprintShard,
+                                         build_shards, fingerprint_array, serve_shard)
+
+
+def fingerprint(text):
+    words = text.split()
+    return fingerprint_array(hashlib.md5(" ".join(words[i:i + 3]).encode()).hexdigest()
+                             for i in range(len(words) - 2))
+
+
+def corpus(count, words=40):
+    for i in range(count):
+        yield f"ref-{i}", " ".join(f"doc{i}word{j}" for j in range(words)), {'title': f"Reference {i}"}
+
+
+def test_build_streams_documents_into_shards(tmp_path):
+    spooled = []
+
+    def documents():
+        # Texts larger than the spool's write buffer
+        for document in corpus(30, words=2000):
+            yield document
+            # Earlier references are already on disk, not held by build_shards
+            spooled.append(sum(os.path.getsize(os.path.join(tmp_path, name, SPOOL_DOCUMENTS_FILE))
+                               for name in os.listdir(tmp_path)))
+
+    shard_dirs = build_shards(documents(), str(tmp_path), 3, fingerprint)
+    assert spooled[-1] > spooled[0] > 0
+
+    keys = []
+    for shard_dir in shard_dirs:
+        assert not os.path.exists(os.path.join(shard_dir, SPOOL_DOCUMENTS_FILE))
+        assert not os.path.exists(os.path.join(shard_dir, SPOOL_FINGERPRINTS_FILE))
+        shard = FingerprintShard(shard_dir)
+        assert np.all(np.diff(np.asarray(shard.fingerprints).astype(np.float64)) >= 0)
+        keys += [reference['key'] for reference in shard.references]
+    assert sorted(keys) == sorted(f"ref-{i}" for i in range(30))
+
+    key, text, _ = list(corpus(30, words=2000))[8]
+    matches = [match for shard_dir in shard_dirs
+               for match in FingerprintShard(shard_dir).search_fingerprints(fingerprint(text), 1)]
+    assert max(matches, key=lambda match: match['ngram_similarity'])['reference_key'] == key
+
+
+def test_build_folds_near_duplicates(tmp_path):
+    documents = list(corpus(4))
+    documents.append(("ref-0-copy", documents[0][1] + " extra words", {'title': "Copy"}))
+    shard_dirs = build_shards(iter(documents), str(tmp_path), 2, fingerprint, dedup_threshold=0.8)
+    references = [reference for shard_dir in shard_dirs for reference in FingerprintShard(shard_dir).references]
+    assert len(references) == 4
+    canonical = next(reference for reference in references if reference['aliases'])
+    assert canonical['key'] == "ref-0-copy"
+    assert [alias['key'] for alias in canonical['aliases']] == ["ref-0"]
+
+
+def test_serve_refuses_public_address_without_authkey(tmp_path):
+    shard_dir = build_shards(corpus(2), str(tmp_path), 1, fingerprint)[0]
+    for host in ("0.0.0.0", "", "10.1.2.3", "shards.example.org"):
+        with pytest.raises(ValueError):
+            serve_shard(shard_dir, host, 0, authkey=None)
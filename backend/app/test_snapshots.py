@@ -0,0 +1,190 @@
+import hashlib
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pytest
+
+from app.core.models import PlagiarismOptions
+from app.services.pipeline import PlagiarismPipeline
+from app.services.sharded_search import fingerprint_array
+from app.services.snapshots import SEGMENTS_DIR, SnapshotIndex, SnapshotStore
+
+MODEL = "stub-model:mean"
+
+
+def fingerprint(text):
+    words = text.split()
+    return fingerprint_array(hashlib.md5(" ".join(words[i:i + 3]).encode()).hexdigest()
+                             for i in range(len(words) - 2))
+
+
+def embed(text):
+    """Bag-of-words vector standing in for the document embedding"""
+    vector = np.zeros(32, dtype=np.float32)
+    for word in text.split():
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 32] += 1.0
+    return vector
+
+
+def document(key, prefix, words=40):
+    return key, " ".join(f"{prefix}{j}" for j in range(words)), {'title': key}
+
+
+def add(store, documents, deleted=(), model=MODEL):
+    return store.add(documents, fingerprint, embed=embed, metadata={'model': model}, deleted=deleted)
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SnapshotStore(str(tmp_path / "store"), keep=3)
+
+
+def test_later_segments_replace_and_delete_references(store):
+    add(store, [document("ref-0", "zero"), document("ref-1", "one"), document("ref-2", "two")])
+    add(store, [document("ref-1", "revised"), document("ref-3", "three")], deleted=["ref-2"])
+    snapshot = store.open()
+    assert len(snapshot.segments) == 2
+    assert sorted(snapshot.live) == ["ref-0", "ref-1", "ref-3"]
+    assert [mask.tolist() for mask in snapshot.masks] == [[True, False, False], [True, True]]
+    assert snapshot.text("ref-1").startswith("revised0")
+    assert snapshot.text("ref-2") is None
+
+    # The replaced and deleted copies are not found by any search
+    _, old_text, _ = document("ref-1", "one")
+    for text in (old_text, document("ref-2", "two")[1]):
+        keys = [match['reference_key'] for match in snapshot.search_fingerprints(fingerprint(text), k=4)]
+        assert "ref-2" not in keys and all(snapshot.text(key) != text for key in keys)
+        keys = [match['reference_key'] for match in snapshot.search_embeddings(embed(text), k=4)]
+        assert sorted(keys) == ["ref-0", "ref-1", "ref-3"]
+    assert snapshot.model == MODEL
+
+
+def test_compaction_drops_hidden_rows(store):
+    add(store, [document("ref-0", "zero"), document("ref-1", "one"), document("ref-2", "two")])
+    add(store, [document("ref-1", "revised")], deleted=["ref-2"])
+    before = store.open()
+    version = store.compact()
+    snapshot = store.open()
+    assert snapshot.version == version and len(snapshot.segments) == 1
+    assert sorted(snapshot.live) == ["ref-0", "ref-1"]
+    assert [mask.tolist() for mask in snapshot.masks] == [[True, True]]
+    for key in snapshot.live:
+        assert snapshot.text(key) == before.text(key)
+    assert snapshot.model == MODEL
+    [match] = snapshot.search_fingerprints(fingerprint(before.text("ref-1")), k=1)
+    assert match['reference_key'] == "ref-1" and match['ngram_similarity'] == 1.0
+    # A single segment has nothing to merge
+    assert store.compact() is None
+
+
+def test_rollback_serves_the_parent_version(store):
+    first = add(store, [document("ref-0", "zero")])
+    second = add(store, [document("ref-1", "one")])
+    compacted = store.compact()
+    assert store.rollback() == second
+    assert store.current_version() == second and len(store.open().segments) == 2
+    assert store.rollback() == first
+    assert sorted(store.open().live) == ["ref-0"]
+    with pytest.raises(ValueError):
+        store.rollback()
+    # Rolled-back versions stay until collected
+    assert compacted in store.versions()
+
+
+def test_collect_keeps_the_newest_versions_and_their_segments(tmp_path):
+    store = SnapshotStore(str(tmp_path / "store"), keep=2)
+    for i in range(4):
+        add(store, [document(f"ref-{i}", f"doc{i}word")])
+    assert store.versions() == [3, 4]
+    used = {segment_id for version in store.versions() for segment_id in store.manifest(version)['segments']}
+    assert set(os.listdir(os.path.join(store.root, SEGMENTS_DIR))) == used
+    assert sorted(store.open().live) == ["ref-0", "ref-1", "ref-2", "ref-3"]
+
+
+def test_watcher_swaps_to_new_versions(store):
+    add(store, [document("ref-0", "zero")])
+    index = SnapshotIndex(store, poll_seconds=0.02)
+    try:
+        snapshot = index.current
+        assert snapshot.version == 1
+        version = add(store, [document("ref-1", "one")])
+        assert wait_for(lambda: index.current.version == version)
+        # A search holding the previous snapshot still finishes on it
+        assert snapshot.text("ref-0") is not None and snapshot.text("ref-1") is None
+        assert index.health()['version'] == version and index.health()['last_error'] is None
+    finally:
+        index.stop()
+
+
+def _serve_after_fork(index, queue):
+    # Runs in a forked child, like a gunicorn worker of a preloaded app
+    version = add(index.store, [document("ref-1", "one")])
+    queue.put(wait_for(lambda: index.current.version == version))
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_watcher_runs_again_in_forked_processes(store):
+    add(store, [document("ref-0", "zero")])
+    index = SnapshotIndex(store, poll_seconds=0.02)
+    index.start()
+    try:
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        child = context.Process(target=_serve_after_fork, args=(index, queue))
+        child.start()
+        swapped = queue.get(timeout=10)
+        child.join(timeout=10)
+        assert swapped
+    finally:
+        index.stop()
+
+
+def test_versions_of_another_model_are_not_served(store):
+    add(store, [document("ref-0", "zero")])
+    index = SnapshotIndex(store, poll_seconds=0)
+    index.check_model(MODEL)
+    with pytest.raises(ValueError):
+        index.check_model("other-model:cls")
+    index.check_model(MODEL)
+
+    # A store still empty when the checker started is not filled with another model's embeddings
+    other = SnapshotStore(os.path.join(store.root, "other"))
+    index = SnapshotIndex(other, poll_seconds=0)
+    index.check_model(MODEL)
+    add(other, [document("ref-0", "zero")], model="stub-model:cls")
+    assert not index.refresh()
+    assert index.current is None
+    assert "stub-model:cls" in index.last_error
+
+
+class StubExtractor:
+    def extract_and_process(self, pdf):
+        return {'introduction': " ".join(f"word{i}" for i in range(200))}
+
+
+def test_cached_results_are_not_served_across_snapshots(store, make_stub_checker, stub_detector):
+    add(store, [document("ref-0", "zero")])
+    index = SnapshotIndex(store, poll_seconds=0)
+    checker = make_stub_checker(snapshot_index=index)
+    pipeline = PlagiarismPipeline(StubExtractor(), checker, stub_detector)
+    options = PlagiarismOptions(exclusions=[])
+
+    pipeline.check_pdf(b"%PDF", options, content_hash="hash")
+    pipeline.check_pdf(b"%PDF", options, content_hash="hash")
+    assert len(checker.checked) == 1
+
+    add(store, [document("ref-1", "one")])
+    index.refresh()
+    pipeline.check_pdf(b"%PDF", options, content_hash="hash")
+    assert len(checker.checked) == 2
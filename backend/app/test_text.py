@@ -0,0 +1,32 @@
+import gc
+import weakref
+
+from app.utils.text import tokenization_cache, tokenize
+
+TEXT = "Graph neural networks pass messages between neighbouring nodes."
+
+
+def test_tokenizations_are_not_cached_outside_a_check():
+    assert tokenize(TEXT) is not tokenize(TEXT)
+
+
+def test_tokenizations_are_shared_within_a_check_and_dropped_after_it():
+    with tokenization_cache():
+        tokenized = tokenize(TEXT)
+        assert tokenize(TEXT) is tokenized
+        with tokenization_cache():
+            assert tokenize(TEXT) is tokenized
+        released = weakref.ref(tokenized)
+    del tokenized
+    gc.collect()
+    assert released() is None
+
+
+def test_tokenization_cache_is_bounded():
+    long_text = "word " * 30_000
+    with tokenization_cache(max_entries=4):
+        first = tokenize(TEXT)
+        for i in range(4):
+            tokenize(f"{TEXT} {i}")
+        assert tokenize(TEXT) is not first
+        assert tokenize(long_text) is not tokenize(long_text)
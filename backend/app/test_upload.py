@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+
+import pytest
+from pydantic import ValidationError
+
+from app.core.models import parse_options
+from app.utils.upload import (MAX_FIELD_BYTES, MAX_FIELDS, InvalidUpload, StreamingUpload, UploadTooLarge)
+
+BOUNDARY = "----boundary7MA4YWxkTrZu0gW"
+
+
+def multipart(parts):
+    """Multipart body of (name, value, filename) parts"""
+    body = b""
+    for name, value, filename in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename:
+            disposition += f'; filename="{filename}"\r\nContent-Type: application/pdf'
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + value + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+def make_request(body, chunk_size):
+    from starlette.requests import Request
+
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    messages = [{'type': "http.request", 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+
+    async def receive():
+        return messages.pop(0)
+
+    scope = {'type': "http", 'method': "POST", 'path': "/upload", 'query_string': b"",
+             'headers': [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]}
+    return Request(scope, receive)
+
+
+def receive(body, chunk_size=7, **kwargs):
+    return asyncio.run(StreamingUpload(make_request(body, chunk_size), **kwargs).receive())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, len(BOUNDARY) + 3, 1 << 20])
+def test_parts_are_parsed_whatever_the_chunk_boundaries(chunk_size):
+    pdf = b"%PDF-1.4 " + bytes(range(256)) * 20 + f"\r\n--{BOUNDARY[:-1]}".encode()
+    body = multipart([("options", b'{"num_papers": 3}', None), ("file", pdf, "paper.pdf")])
+    upload = receive(body, chunk_size)
+    try:
+        assert upload.file.read() == pdf
+        assert upload.size == len(pdf) and upload.sha256 == hashlib.sha256(pdf).hexdigest()
+        assert upload.filename == "paper.pdf" and upload.content_type == "application/pdf"
+        assert upload.fields == {'options': '{"num_papers": 3}'}
+    finally:
+        upload.close()
+
+
+def test_oversized_files_and_fields_are_rejected():
+    with pytest.raises(UploadTooLarge):
+        receive(multipart([("file", b"x" * 1000, "paper.pdf")]), max_bytes=999)
+    with pytest.raises(UploadTooLarge, match="'options'"):
+        receive(multipart([("options", b"x" * (MAX_FIELD_BYTES + 1), None), ("file", b"%PDF", "a.pdf")]),
+                chunk_size=4096)
+    # Fields under the per-field limit still count towards the total
+    fields = [(f"field{i}", b"x" * (MAX_FIELD_BYTES - 100), None) for i in range(MAX_FIELDS)]
+    with pytest.raises(UploadTooLarge):
+        receive(multipart(fields + [("file", b"%PDF", "a.pdf")]), chunk_size=4096)
+
+
+def test_malformed_uploads_are_invalid():
+    with pytest.raises(InvalidUpload, match="form fields"):
+        receive(multipart([(f"field{i}", b"1", None) for i in range(MAX_FIELDS + 1)] + [("file", b"%PDF", "a.pdf")]))
+    with pytest.raises(InvalidUpload, match="No 'file'"):
+        receive(multipart([("options", b"{}", None)]))
+    with pytest.raises(InvalidUpload, match="Multiple"):
+        receive(multipart([("file", b"%PDF", "a.pdf"), ("file", b"%PDF", "b.pdf")]))
+
+
+def test_options_must_be_a_json_object():
+    assert parse_options(None).num_papers == parse_options("{}").num_papers
+    assert parse_options('{"num_papers": 3}').num_papers == 3
+    for text in ("[1, 2]", '"text"', "3", "null", "{not json"):
+        with pytest.raises(ValueError):
+            parse_options(text)
+    with pytest.raises(ValidationError):
+        parse_options('{"num_papers": "many"}')
+
+
+def test_upload_endpoint_maps_errors_to_status_codes():
+    pytest.importorskip("torch")
+    from fastapi.testclient import TestClient
+
+    from app import main
+
+    client = TestClient(main.app)
+    headers = {'content-type': f"multipart/form-data; boundary={BOUNDARY}"}
+
+    def post(parts):
+        return client.post("/api/check-plagiarism/upload", content=multipart(parts), headers=headers)
+
+    assert post([("options", b"{}", None)]).status_code == 400
+    assert post([(f"field{i}", b"1", None) for i in range(MAX_FIELDS + 1)]).status_code == 400
+    fields = [(f"field{i}", b"x" * (MAX_FIELD_BYTES - 100), None) for i in range(MAX_FIELDS)]
+    assert post(fields + [("file", b"%PDF", "a.pdf")]).status_code == 413
+    for options in (b"[1, 2]", b"3", b"{not json"):
+        assert post([("options", options, None), ("file", b"%PDF", "a.pdf")]).status_code == 422
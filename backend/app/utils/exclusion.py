@@ -0,0 +1,219 @@
+import bisect
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.metrics import metrics, stage
+from app.utils.text import tokenize
+
+# Sections dropped as a whole by the rule of the same name
+EXCLUDED_SECTIONS = {
+    "bibliography": ("references",),
+    "acknowledgements": ("acknowledgements",),
+}
+
+# A bibliography heading followed by the first entry ("[1]", "1." or "Surname, I."),
+# for documents whose reference list was not detected as a section of its own
+_BIBLIOGRAPHY = re.compile(
+    r"(?:^|(?<=\s))(?:References|REFERENCES|Bibliography|BIBLIOGRAPHY|Works Cited|Literature Cited)\s+"
+    r"(?=\[1\]|1\.\s|[A-Z][\w'-]+,\s+(?:[A-Z]\.|[A-Z][\w'-]+))"
+)
+# Quoted passages of at least five words (quotes are straight after text.fix_unicode)
+_QUOTE = re.compile(r'"(?:[^"\s]+\s+){4,150}[^"\s]+"')
+# Numeric ("[3]", "[2, 5-7]") and author-year ("(Smith et al., 2019; Lee, 2020a)") citations
+_CITATION = re.compile(
+    r"\[\d+(?:\s*[,;\-]\s*\d+)*\]"
+    r"|\((?:see\s+|e\.g\.,?\s+|cf\.\s+)?"
+    r"[A-Z][\w'-]+(?:\s+(?:et\s+al\.|and|&)(?:\s+[A-Z][\w'-]+)?)?,?\s+\d{4}[a-z]?"
+    r"(?:\s*[;,]\s*(?:[A-Z][\w'-]+(?:\s+(?:et\s+al\.|and|&)(?:\s+[A-Z][\w'-]+)?)?,?\s+)?\d{4}[a-z]?)*\)"
+)
+
+# Tokens of formulas: relations and operators, brackets, single letters and common functions
+_RELATIONS = frozenset("=<>≤≥≈≠∝∈∉⊂⊆→←↔∼~")
+_OPERATORS = frozenset("+-*/^_|!∑∏∫√∂∇±×·∞%()[]{},.;:'")
+_FUNCTIONS = frozenset(("sin", "cos", "tan", "tanh", "log", "ln", "exp", "max", "min", "argmax", "argmin",
+                        "sum", "prod", "lim", "sup", "inf", "det", "tr", "mod", "softmax", "sigmoid"))
+# Punctuation trimmed from the ends of a run
+_SEPARATORS = frozenset(",.;:")
+# Shortest formula (in tokens) and smallest table (in numbers)
+MIN_EQUATION_TOKENS = 5
+MIN_TABLE_NUMBERS = 12
+
+
+def _is_formula_token(token: str) -> bool:
+    return (token in _RELATIONS or token in _OPERATORS or token.isdigit() or len(token) == 1
+            or token.lower() in _FUNCTIONS or "Ͱ" <= token[0] <= "Ͽ")
+
+
+def _classify_run(tokens: Tuple[str, ...], spans: List[Tuple[int, int]],
+                  start: int, end: int) -> Iterable[Tuple[str, int, int]]:
+    while start < end and tokens[start] in _SEPARATORS:
+        start += 1
+    while end > start and tokens[end - 1] in _SEPARATORS:
+        end -= 1
+    run = tokens[start:end]
+    numbers = sum(1 for token in run if token.isdigit())
+    if numbers >= MIN_TABLE_NUMBERS and numbers * 2 >= len(run):
+        yield "tables", spans[start][0], spans[end - 1][1]
+    elif len(run) >= MIN_EQUATION_TOKENS and any(token in _RELATIONS for token in run):
+        yield "equations", spans[start][0], spans[end - 1][1]
+
+
+def _formula_runs(text: str) -> Iterable[Tuple[str, int, int]]:
+    """
+    Equations and tables found in runs of formula-like tokens
+
+    A run may bridge single words followed by a number (row labels of a
+    table). It is a table when at least half of its tokens are numbers, and
+    an equation when it holds a relation such as '='.
+    """
+    tokenized = tokenize(text)
+    tokens, spans = tokenized.tokens, tokenized.spans
+    start = None
+    for i, token in enumerate(tokens):
+        if _is_formula_token(token) or (start is not None and i + 1 < len(tokens) and tokens[i + 1].isdigit()
+                                        and _is_formula_token(tokens[i - 1])):
+            if start is None:
+                start = i
+        elif start is not None:
+            yield from _classify_run(tokens, spans, start, i)
+            start = None
+    if start is not None:
+        yield from _classify_run(tokens, spans, start, len(tokens))
+
+
+def _pattern_spans(rule: str, pattern: re.Pattern, text: str) -> Iterable[Tuple[str, int, int]]:
+    for match in pattern.finditer(text):
+        yield rule, match.start(), match.end()
+
+
+def _bibliography_spans(text: str) -> Iterable[Tuple[str, int, int]]:
+    """Trailing reference list, when its heading appears in the second half of a section"""
+    matches = list(_BIBLIOGRAPHY.finditer(text))
+    if matches and matches[-1].start() >= len(text) // 2:
+        yield "bibliography", matches[-1].start(), len(text)
+
+
+# Span finders of each rule; tables and equations share one token scan
+_SPAN_FINDERS = {
+    "bibliography": _bibliography_spans,
+    "quotes": lambda text: _pattern_spans("quotes", _QUOTE, text),
+    "citations": lambda text: _pattern_spans("citations", _CITATION, text),
+    "equations": _formula_runs,
+    "tables": _formula_runs,
+}
+
+EXCLUSION_RULES = ("bibliography", "acknowledgements", "quotes", "citations", "equations", "tables")
+
+
+def default_rules() -> List[str]:
+    """Rules applied when a request does not choose its own (EXCLUSION_RULES, comma-separated, or all)"""
+    value = os.getenv("EXCLUSION_RULES")
+    if value is None:
+        return list(EXCLUSION_RULES)
+    return [rule.strip() for rule in value.split(",") if rule.strip()]
+
+
+def _merge(spans: List[Tuple[str, int, int]]) -> List[Tuple[str, int, int]]:
+    """Sort spans and drop those covered by an earlier one, trimming partial overlaps"""
+    merged: List[Tuple[str, int, int]] = []
+    for rule, start, end in sorted(spans, key=lambda span: (span[1], -span[2])):
+        if merged and start < merged[-1][2]:
+            if end <= merged[-1][2]:
+                continue
+            start = merged[-1][2]
+        merged.append((rule, start, end))
+    return merged
+
+
+def mask(text: str, spans: List[Tuple[str, int, int]]) -> str:
+    """Text without the given (merged) spans, each replaced by a single space"""
+    parts = []
+    position = 0
+    for _, start, end in spans:
+        parts.append(text[position:start])
+        position = end
+    parts.append(text[position:])
+    return " ".join(part.strip() for part in parts if part.strip())
+
+
+class TextExcluder:
+    """
+    Removes text that should not be scored for plagiarism: the bibliography
+    and acknowledgements, quoted passages, citation markers, equations and
+    tables.
+
+    Each rule finds character spans in the extracted sections; the spans are
+    reported by offset and cut out before any features are computed. Section
+    rules drop whole sections by name.
+
+    Args:
+        rules: Names of the rules to apply (defaults to EXCLUSION_RULES or all)
+    """
+
+    def __init__(self, rules: Optional[Iterable[str]] = None):
+        self.rules = list(default_rules() if rules is None else rules)
+        unknown = [rule for rule in self.rules if rule not in EXCLUSION_RULES]
+        if unknown:
+            raise ValueError(f"Unknown exclusion rules: {', '.join(unknown)}")
+
+    def find_spans(self, text: str) -> List[Tuple[str, int, int]]:
+        """
+        Excluded spans of a text
+
+        Returns:
+            Non-overlapping (rule, start, end) character spans, in text order
+        """
+        spans = []
+        finders = {_SPAN_FINDERS[rule] for rule in self.rules if rule in _SPAN_FINDERS}
+        for finder in finders:
+            spans.extend(span for span in finder(text) if span[0] in self.rules)
+        return _merge(spans)
+
+    def apply(self, sections: Dict[str, str]) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """
+        Mask the excluded text of a document's sections
+
+        Args:
+            sections: Dictionary mapping section names to their content
+
+        Returns:
+            Tuple of (masked sections, report). Fully excluded sections are
+            left out of the masked sections. The report lists the rules, the
+            excluded sections, the excluded spans per section as
+            {'rule', 'start', 'end'} offsets into the original section text,
+            and the number of tokens in total and excluded.
+        """
+        with stage("exclusion"):
+            excluded_sections = {section for rule in self.rules for section in EXCLUDED_SECTIONS.get(rule, ())}
+            masked: Dict[str, str] = {}
+            report: Dict[str, Any] = {'rules': self.rules, 'excluded_sections': [], 'spans': {},
+                                      'tokens_total': 0, 'tokens_excluded': 0}
+            excluded_by_rule: Dict[str, int] = {}
+            for name, content in sections.items():
+                tokenized = tokenize(content)
+                tokens = len(tokenized)
+                report['tokens_total'] += tokens
+                if name in excluded_sections:
+                    report['excluded_sections'].append(name)
+                    report['tokens_excluded'] += tokens
+                    rule = next(rule for rule in self.rules if name in EXCLUDED_SECTIONS.get(rule, ()))
+                    excluded_by_rule[rule] = excluded_by_rule.get(rule, 0) + tokens
+                    continue
+                spans = self.find_spans(content)
+                if spans:
+                    report['spans'][name] = [{'rule': rule, 'start': start, 'end': end}
+                                             for rule, start, end in spans]
+                    # Tokens inside each span, from the token offsets of the section
+                    token_starts = [start for start, _ in tokenized.spans]
+                    for rule, start, end in spans:
+                        count = bisect.bisect_left(token_starts, end) - bisect.bisect_left(token_starts, start)
+                        excluded_by_rule[rule] = excluded_by_rule.get(rule, 0) + count
+                        report['tokens_excluded'] += count
+                    content = mask(content, spans)
+                masked[name] = content
+
+        for rule, tokens in excluded_by_rule.items():
+            metrics.inc("plagiarism_excluded_tokens_total", tokens, {'rule': rule},
+                        description="Tokens excluded from scoring by exclusion rule")
+        return masked, report
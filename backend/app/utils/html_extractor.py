@@ -0,0 +1,290 @@
+import html as html_lib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from app.core.metrics import metrics, stage
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # fall back to BeautifulSoup
+    LexborHTMLParser = None
+
+logger = logging.getLogger(__name__)
+
+# Pages are cut to MAX_HTML_MB before parsing
+MAX_HTML_CHARS = int(float(os.getenv("MAX_HTML_MB", "2")) * 1024 * 1024)
+# Shortest text accepted from an extractor (shorter pages are skipped as references anyway)
+MIN_CONTENT_CHARS = 100
+# Only the start of the page is scanned for <meta> tags and JSON-LD
+HEAD_SCAN_CHARS = 256 * 1024
+
+# Meta tags holding the abstract (Highwire/Google Scholar, Dublin Core, EPrints)
+ABSTRACT_META_NAMES = ("citation_abstract", "dcterms.abstract", "dc.description", "eprints.abstract")
+
+# Abstract containers of common publishers, then generic abstract-like containers
+ABSTRACT_SELECTORS = (
+    "blockquote.abstract",                    # arXiv
+    "div.abstract-content",                   # PubMed
+    "section[data-title=Abstract]",           # Springer Nature
+    "section.article-section__abstract",      # Wiley
+    "div.abstractSection",                    # ACM, Taylor & Francis
+    "div.abstract.author",                    # Elsevier
+    "div[class*=abstract i], section[class*=abstract i], p[class*=abstract i], "
+    "div[class*=summary i], section[class*=summary i], div[class*=paper-content i]",
+)
+REMOVED_TAGS = ["script", "style", "nav", "footer", "header", "noscript", "svg"]
+
+_META_TAG = re.compile(r"<meta\s[^>]*>", re.IGNORECASE)
+_ATTRIBUTE = re.compile(r"""([\w:.-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+_JSON_LD = re.compile(r"<script[^>]*type\s*=\s*[\"']application/ld\+json[\"'][^>]*>(.*?)</script>",
+                      re.IGNORECASE | re.DOTALL)
+_TAG = re.compile(r"<[^>]+>")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _clean(text: str) -> str:
+    """Plain text of an HTML fragment with single spaces"""
+    return _WHITESPACE.sub(" ", html_lib.unescape(_TAG.sub(" ", text))).strip()
+
+
+class HTMLPage:
+    """
+    An HTML page and its lazily built parse tree.
+
+    The tree uses selectolax (lexbor) when it is installed and BeautifulSoup
+    otherwise; extractors only need CSS selection and text, which both offer.
+
+    Args:
+        html: Page source (cut to `max_chars`)
+        url: Page URL, for logging
+        max_chars: Maximum number of characters parsed
+    """
+
+    def __init__(self, html: str, url: str = "", max_chars: int = MAX_HTML_CHARS):
+        self.truncated = len(html) > max_chars
+        self.html = html[:max_chars]
+        self.url = url
+        self._tree = None
+
+    @property
+    def head(self) -> str:
+        """Start of the page, where meta tags and JSON-LD usually are"""
+        end = self.html.find("</head>", 0, HEAD_SCAN_CHARS)
+        return self.html[:end if end >= 0 else HEAD_SCAN_CHARS]
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            with stage("html_parse"):
+                if LexborHTMLParser is not None:
+                    self._tree = LexborHTMLParser(self.html)
+                    self._tree.strip_tags(REMOVED_TAGS)
+                else:
+                    from bs4 import BeautifulSoup
+                    self._tree = BeautifulSoup(self.html, "html.parser")
+                    for element in self._tree(REMOVED_TAGS):
+                        element.decompose()
+        return self._tree
+
+    def has(self, selector: str) -> bool:
+        """Whether any element matches a CSS selector"""
+        if LexborHTMLParser is not None:
+            return self.tree.css_first(selector) is not None
+        return self.tree.select_one(selector) is not None
+
+    def select_text(self, selector: str, nested: bool = True) -> List[str]:
+        """
+        Text of every element matching a CSS selector
+
+        Args:
+            selector: CSS selector
+            nested: Whether matches may be nested; only the outermost are kept then
+        """
+        if LexborHTMLParser is not None:
+            texts = [node.text(separator=" ") for node in self.tree.css(selector)]
+        else:
+            texts = [element.get_text(" ") for element in self.tree.select(selector)]
+        results = []
+        for text in texts:
+            text = _WHITESPACE.sub(" ", text).strip()
+            # Nested matches repeat the text of their ancestor
+            if text and not (nested and any(text in kept for kept in results)):
+                results.append(text)
+        return results
+
+    def main_paragraphs(self) -> List[str]:
+        """Text of the paragraphs of <main>, <article> or <body>"""
+        for selector in ("main", "article", "body"):
+            if self.has(selector):
+                return self.select_text(f"{selector} p", nested=False)
+        return []
+
+
+def extract_meta(page: HTMLPage) -> Optional[str]:
+    """Abstract from citation/Dublin Core meta tags, without parsing the page"""
+    for tag in _META_TAG.findall(page.head):
+        attributes = {}
+        for name, double, single, bare in _ATTRIBUTE.findall(tag):
+            attributes[name.lower()] = double or single or bare
+        if attributes.get("name", "").lower() in ABSTRACT_META_NAMES:
+            content = _clean(attributes.get("content", ""))
+            if len(content) >= MIN_CONTENT_CHARS:
+                return content
+    return None
+
+
+def extract_json_ld(page: HTMLPage) -> Optional[str]:
+    """Abstract (or article body) from schema.org JSON-LD, without parsing the page"""
+    for block in _JSON_LD.findall(page.head):
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+        items = data if isinstance(data, list) else data.get("@graph", [data]) if isinstance(data, dict) else []
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            for key in ("abstract", "articleBody", "description"):
+                value = item.get(key)
+                if isinstance(value, str) and len(value) >= MIN_CONTENT_CHARS:
+                    return _clean(value)
+    return None
+
+
+def extract_containers(page: HTMLPage) -> Optional[str]:
+    """Text of the first publisher or generic abstract containers found"""
+    for selector in ABSTRACT_SELECTORS:
+        texts = page.select_text(selector)
+        if texts and sum(len(text) for text in texts) >= MIN_CONTENT_CHARS:
+            return "\n\n".join(texts)
+    return None
+
+
+def extract_paragraphs(page: HTMLPage) -> Optional[str]:
+    """Paragraphs of the main content (full tree traversal, the last resort)"""
+    return "\n\n".join(page.main_paragraphs()) or None
+
+
+# Extractors are tried in order and the first result wins; the cheapest come first
+DEFAULT_EXTRACTORS: List[Tuple[str, Callable[[HTMLPage], Optional[str]]]] = [
+    ("meta", extract_meta),
+    ("json_ld", extract_json_ld),
+    ("containers", extract_containers),
+    ("paragraphs", extract_paragraphs),
+]
+
+
+class HTMLExtractor:
+    """
+    Extracts the paper content of a fetched HTML page.
+
+    Extractors run cheapest first: meta tags and JSON-LD are read from the
+    page head with regular expressions, publisher abstract containers are
+    looked up with CSS selectors, and only pages without any of these are
+    traversed for their paragraphs. With `workers` > 0 extraction runs in a
+    process pool, so parsing large pages does not hold the GIL of the worker
+    serving requests.
+
+    Args:
+        extractors: (name, function) pairs taking an HTMLPage and returning text or None;
+            module-level functions, so they can be sent to the pool
+        workers: Extraction processes (defaults to HTML_EXTRACT_WORKERS or 0, in-process)
+        timeout: Seconds to wait for a pooled extraction; a page taking longer is
+            skipped and the pool, whose worker is still busy with it, replaced
+    """
+
+    def __init__(self, extractors: Optional[Sequence[Tuple[str, Callable[[HTMLPage], Optional[str]]]]] = None,
+                 workers: Optional[int] = None, timeout: float = 30.0):
+        self.extractors = list(extractors or DEFAULT_EXTRACTORS)
+        self.workers = workers if workers is not None else int(os.getenv("HTML_EXTRACT_WORKERS", "0"))
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def extract_page(self, html: str, url: str = "") -> Tuple[str, Optional[str]]:
+        """
+        Extract content in this process
+
+        Returns:
+            Tuple of (content, name of the extractor that produced it or None)
+        """
+        page = HTMLPage(html, url)
+        if page.truncated:
+            logger.info(f"Parsing the first {MAX_HTML_CHARS} characters of {url or 'page'}")
+        for name, extractor in self.extractors:
+            content = extractor(page)
+            if content:
+                return content, name
+        return "", None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Spawned, not forked: the parent holds model threads
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def extract(self, html: str, url: str = "") -> str:
+        """
+        Extract the content of a page, in the pool when one is configured
+
+        Args:
+            html: Page source
+            url: Page URL
+
+        Returns:
+            Extracted text (empty when nothing was found)
+        """
+        with stage("html_extract"):
+            if self.workers > 0:
+                pool = self._get_pool()
+                try:
+                    future = pool.submit(_extract_in_worker, html, url, self.extractors)
+                    content, name = future.result(self.timeout)
+                except BrokenProcessPool:
+                    logger.warning("HTML extraction pool failed; extracting in process")
+                    self._recycle(pool, "broken")
+                    content, name = self.extract_page(html, url)
+                except FutureTimeout:
+                    logger.warning(f"HTML extraction of {url or 'page'} timed out after {self.timeout}s; skipped")
+                    self._recycle(pool, "timeout")
+                    content, name = "", None
+            else:
+                content, name = self.extract_page(html, url)
+        metrics.inc("plagiarism_html_extractions_total", labels={'extractor': name or 'none'},
+                    description="HTML pages by the extractor that produced their content")
+        return content
+
+    def _recycle(self, pool: ProcessPoolExecutor, reason: str):
+        """Replace a failed pool, stopping its workers"""
+        metrics.inc("plagiarism_html_extraction_failures_total", labels={'reason': reason},
+                    description="Pooled HTML extractions that failed, by reason")
+        with self._lock:
+            # Another thread may have replaced it already
+            if self._pool is pool:
+                self._pool = None
+        # A worker stuck on a page does not stop on shutdown
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def close(self):
+        """Shut down the worker pool"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+
+def _extract_in_worker(html: str, url: str, extractors) -> Tuple[str, Optional[str]]:
+    return HTMLExtractor(extractors, workers=0).extract_page(html, url)
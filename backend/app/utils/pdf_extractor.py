@@ -1,19 +1,20 @@
 import PyPDF2
 import re
 import io
+import hashlib
+import tempfile
 import requests
-import nltk
-from nltk.tokenize import sent_tokenize
-from typing import Dict, List, Tuple
+from typing import BinaryIO, Dict, List, Tuple, Union
+from starlette.concurrency import run_in_threadpool
+from app.core.deadline import current_deadline
+from app.core.memory import current_budget
+from app.core.metrics import timed
+from app.services.reference_fetcher import USER_AGENT, read_body
+from app.utils.text import clean_pdf_text
+from app.utils.upload import MAX_UPLOAD_BYTES, SPOOL_BYTES, UploadTooLarge
 
 class PDFExtractor:
     def __init__(self):
-        # Ensure NLTK resources are downloaded
-        try:
-            nltk.data.find('tokenizers/punkt')
-        except LookupError:
-            nltk.download('punkt')
-        
         # Define section patterns
         self.section_patterns = {
             "title": r"(?i)^(?!abstract|introduction|methodology|methods|results|discussion|conclusion|references|acknowledgements).*$",
@@ -26,51 +27,119 @@ class PDFExtractor:
             "acknowledgements": r"(?i)^(?:6\.\s*)?(?:acknowledgements|acknowledgments|acknowledgement)",
             "references": r"(?i)^(?:7\.\s*)?(?:references|bibliography|works cited|literature cited)"
         }
+        self.section_regexes = {section: re.compile(pattern, re.IGNORECASE)
+                                for section, pattern in self.section_patterns.items()}
+        # Headings inside text whose line breaks were collapsed: a (numbered) heading
+        # word after the end of a sentence, followed by a capitalized word
+        self.inline_heading_regex = re.compile(
+            r"(?:^|(?<=[.!?:]\s))(?:\d\.?\s*)?"
+            r"(Abstract|Introduction|Methodology|Methods|Materials and Methods|Experimental Setup|Results"
+            r"|Discussion|Conclusions?|Acknowledge?ments|References|Bibliography)"
+            r"\s+(?=[A-Z\[])"
+        )
+        self.inline_heading_sections = {
+            "abstract": "abstract", "introduction": "introduction", "methodology": "methodology",
+            "methods": "methodology", "materials and methods": "methodology", "experimental setup": "methodology",
+            "results": "results", "discussion": "discussion", "conclusion": "conclusion",
+            "conclusions": "conclusion", "acknowledgements": "acknowledgements",
+            "acknowledgments": "acknowledgements", "references": "references", "bibliography": "references"
+        }
     
-    async def download_pdf(self, url: str) -> bytes:
+    @timed("pdf_download")
+    async def download_pdf(self, url: str, timeout: float = 30,
+                           max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[BinaryIO, str]:
         """
         Download PDF file from URL
         
+        The body is streamed in a worker thread into a spooled temporary file
+        (kept in memory up to UPLOAD_SPOOL_MB) and hashed as it arrives, like
+        an upload. The download is abandoned once it exceeds `max_bytes`, or
+        before it starts when the server declares a larger size.
+        
         Args:
             url: URL to the PDF file
+            timeout: Seconds to wait for the server
+            max_bytes: Largest PDF accepted (MAX_UPLOAD_MB by default)
             
         Returns:
-            PDF content as bytes
+            Tuple of (PDF file positioned at the start, hex SHA-256 of the PDF);
+            the caller closes the file
+            
+        Raises:
+            UploadTooLarge: If the PDF is larger than `max_bytes`
         """
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()  # Raise exception for bad status codes
-            
-            return response.content
+            sha256 = await run_in_threadpool(self._stream_pdf, url, body, timeout, max_bytes)
+        except UploadTooLarge:
+            body.close()
+            raise
         except Exception as e:
+            body.close()
             raise Exception(f"Failed to download PDF: {str(e)}")
+        body.seek(0)
+        return body, sha256
+    
+    def _stream_pdf(self, url: str, body: BinaryIO, timeout: float, max_bytes: int) -> str:
+        headers = {'User-Agent': USER_AGENT, 'Accept': "application/pdf, */*;q=0.1"}
+        with requests.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            response.raise_for_status()  # Raise exception for bad status codes
+            declared = int(response.headers.get('Content-Length') or 0)
+            if declared > max_bytes:
+                raise UploadTooLarge(f"PDF at {url} is {declared} bytes, over the {max_bytes} byte limit")
+            content_type = response.headers.get('Content-Type', '').split(";")[0].strip().lower()
+            digest = hashlib.sha256()
+            kind, size, truncated = read_body(response, body, content_type, url, max_bytes, max_bytes,
+                                              source="pdf", digest=digest)
+        if truncated:
+            raise UploadTooLarge(f"PDF at {url} is over the {max_bytes} byte limit")
+        if kind != "pdf":
+            raise ValueError(f"{url} did not return a PDF")
+        return digest.hexdigest()
     
-    def extract_text_from_pdf(self, pdf_content: bytes) -> str:
+    @timed("pdf_extract_text")
+    def extract_text_from_pdf(self, pdf_content: Union[bytes, BinaryIO]) -> str:
         """
         Extract text from a PDF file
         
+        Pages are read until the memory budget's document allowance is
+        reached or the extraction's share of the deadline runs out; the
+        remaining pages are skipped and reported as a degradation.
+        
         Args:
-            pdf_content: PDF content as bytes
+            pdf_content: PDF content as bytes, or a seekable binary file object
+                (e.g. an uploaded file) which is read in place without copying
             
         Returns:
             Extracted text as string
         """
         try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-            text = ""
+            stream = pdf_content if hasattr(pdf_content, "read") else io.BytesIO(pdf_content)
+            pdf_reader = PyPDF2.PdfReader(stream)
+            budget = current_budget()
+            deadline = current_deadline()
+            deadline.begin("extraction")
+            pages = []
+            chars = 0
             
             for page_num in range(len(pdf_reader.pages)):
+                if chars >= budget.max_text_chars:
+                    budget.degrade("document", "truncated", pages_read=page_num,
+                                   total_pages=len(pdf_reader.pages))
+                    break
+                if pages and deadline.left("extraction") <= 0:
+                    deadline.degrade("extraction", "truncated", pages_read=page_num,
+                                     total_pages=len(pdf_reader.pages))
+                    break
                 page = pdf_reader.pages[page_num]
-                text += page.extract_text() + "\n"
+                pages.append(page.extract_text() + "\n")
+                chars += len(pages[-1])
                 
-            return text
+            return "".join(pages)
         except Exception as e:
             raise Exception(f"Failed to extract text from PDF: {str(e)}")
     
+    @timed("pdf_preprocess")
     def preprocess_text(self, text: str) -> str:
         """
         Clean and preprocess extracted text
@@ -81,20 +150,9 @@ class PDFExtractor:
         Returns:
             Preprocessed text
         """
-        # Replace multiple newlines with a single newline
-        text = re.sub(r'\n+', '\n', text)
-        
-        # Replace multiple spaces with a single space
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Remove page numbers
-        text = re.sub(r'\b\d+\s*\|\s*P a g e\b', '', text, flags=re.IGNORECASE)
-        text = re.sub(r'\bpage\s*\d+\s*of\s*\d+\b', '', text, flags=re.IGNORECASE)
-        
-        # Remove headers and footers (common patterns)
-        text = re.sub(r'\b(?:confidential|draft|internal use only)\b', '', text, flags=re.IGNORECASE)
-        
-        return text.strip()
+        # Unicode and hyphenation fixes, whitespace, page numbers and headers/footers
+        # in one pass of precompiled patterns (see app/utils/text.py)
+        return clean_pdf_text(text)
     
     def identify_section_boundaries(self, text: str) -> List[Tuple[str, int, int]]:
         """
@@ -116,8 +174,8 @@ class PDFExtractor:
             if not line:
                 continue
                 
-            for section, pattern in self.section_patterns.items():
-                if re.search(pattern, line, re.IGNORECASE):
+            for section, regex in self.section_regexes.items():
+                if regex.search(line):
                     # Found a section heading
                     section_boundaries.append((section, i))
                     break
@@ -139,6 +197,7 @@ class PDFExtractor:
             
         return sections
     
+    @timed("pdf_sections")
     def extract_sections(self, text: str) -> Dict[str, str]:
         """
         Extract different sections from the text
@@ -164,12 +223,40 @@ class PDFExtractor:
             
         return sections
     
-    def extract_and_process(self, pdf_content: bytes) -> Dict[str, str]:
+    def extract_inline_sections(self, text: str) -> Dict[str, str]:
+        """
+        Extract sections from text whose line breaks were collapsed
+        
+        Headings are recognized inline, as a heading word that starts a
+        sentence and is followed by a capitalized word ("... results. 2.
+        Methodology We ..."). Text before the first heading is the title.
+        
+        Args:
+            text: Preprocessed text
+            
+        Returns:
+            Dictionary mapping section names to their content (empty when no heading is found)
+        """
+        matches = list(self.inline_heading_regex.finditer(text))
+        if not matches:
+            return {}
+        sections = {}
+        if text[:matches[0].start()].strip():
+            sections["title"] = text[:matches[0].start()].strip()
+        for i, match in enumerate(matches):
+            section = self.inline_heading_sections[match.group(1).lower()]
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            content = text[match.start():end].strip()
+            # A repeated heading continues its section
+            sections[section] = f"{sections[section]} {content}" if section in sections else content
+        return sections
+    
+    def extract_and_process(self, pdf_content: Union[bytes, BinaryIO]) -> Dict[str, str]:
         """
         Extract text from PDF and separate into sections
         
         Args:
-            pdf_content: PDF content as bytes
+            pdf_content: PDF content as bytes or a seekable binary file object
             
         Returns:
             Dictionary with extracted sections
@@ -0,0 +1,234 @@
+import contextvars
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+# Bump when normalization or tokenization changes; fingerprints computed by
+# another version are not comparable
+TOKENIZER_VERSION = 1
+
+# Ligatures and other characters PDF text extraction leaves behind
+_CHAR_FIXES = str.maketrans({
+    "\ufb00": "ff", "\ufb01": "fi", "\ufb02": "fl", "\ufb03": "ffi", "\ufb04": "ffl",
+    "\ufb05": "st", "\ufb06": "st",
+    "\u00ad": None,  # soft hyphen
+    "\u200b": None, "\u200c": None, "\u200d": None, "\ufeff": None,  # zero-width characters
+    "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"',
+    "\u2010": "-", "\u2011": "-", "\u2012": "-", "\u2013": "-", "\u2014": "-", "\u2212": "-",
+    "\u00a0": " ",
+})
+
+# Words hyphenated across a line break ("detec-\ntion")
+_HYPHENATED_BREAK = re.compile(r"(?<=[^\W\d_])-[ \t]*\r?\n\s*(?=[a-z])")
+_WHITESPACE = re.compile(r"\s+")
+# Page numbers and header/footer boilerplate
+_BOILERPLATE = re.compile(
+    r"\b\d+\s*\|\s*P a g e\b|\bpage\s*\d+\s*of\s*\d+\b|\b(?:confidential|draft|internal use only)\b",
+    re.IGNORECASE,
+)
+# Words (with inner hyphens/apostrophes) and single punctuation marks
+_TOKEN = re.compile(r"\w+(?:['\-]\w+)*|[^\w\s]")
+_WORD = re.compile(r"\w+(?:['\-]\w+)*")
+# Sentence boundary: end punctuation followed by whitespace and an upper-case letter or digit
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[])")
+
+STOP_WORDS = frozenset(ENGLISH_STOP_WORDS)
+
+# Generous upper bound of the characters covered by one WordPiece/BPE token in
+# whitespace-normalized text, used to cut text before tokenizing
+MAX_CHARS_PER_TOKEN = 16
+
+
+def fix_unicode(text: str) -> str:
+    """Replace ligatures, typographic quotes and dashes, and drop invisible characters"""
+    text = text.translate(_CHAR_FIXES)
+    if not text.isascii():
+        text = unicodedata.normalize("NFKC", text)
+    return text
+
+
+def clean_pdf_text(text: str) -> str:
+    """
+    Normalize raw text extracted from a PDF
+
+    Fixes Unicode artifacts, joins words hyphenated across line breaks,
+    collapses whitespace and removes page numbers and header/footer
+    boilerplate.
+    """
+    text = fix_unicode(text)
+    text = _HYPHENATED_BREAK.sub("", text)
+    text = _WHITESPACE.sub(" ", text)
+    text = _BOILERPLATE.sub("", text)
+    return text.strip()
+
+
+def normalize(text: str) -> str:
+    """Normalized form used for matching: fixed Unicode, lower case, single spaces"""
+    return _WHITESPACE.sub(" ", fix_unicode(text).lower()).strip()
+
+
+def model_input(text: str, max_tokens: int) -> str:
+    """
+    Prefix of a text that still yields at least `max_tokens` model tokens
+
+    Model tokenizers truncate to `max_tokens` anyway; cutting first keeps them
+    from tokenizing whole papers only to discard most of the tokens.
+    """
+    return text[:max_tokens * MAX_CHARS_PER_TOKEN]
+
+
+class TokenizedText:
+    """
+    Tokens of a text with their character offsets.
+
+    Tokens are words (keeping inner hyphens and apostrophes) and single
+    punctuation marks. Offsets are computed on first use.
+
+    Attributes:
+        text: The tokenized text
+        tokens: Tuple of token strings
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens: Tuple[str, ...] = tuple(_TOKEN.findall(text))
+        self._spans: Optional[List[Tuple[int, int]]] = None
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    @property
+    def spans(self) -> List[Tuple[int, int]]:
+        """(start, end) character offsets of each token in `text`"""
+        if self._spans is None:
+            self._spans = [match.span() for match in _TOKEN.finditer(self.text)]
+        return self._spans
+
+    def words(self) -> List[str]:
+        """Tokens that are words (no punctuation)"""
+        return [token for token in self.tokens if token[0].isalnum() or token[0] == "_"]
+
+    def ngrams(self, n: int) -> List[Tuple[str, ...]]:
+        """Consecutive token n-grams"""
+        tokens = self.tokens
+        return [tokens[i:i + n] for i in range(len(tokens) - n + 1)]
+
+    def ngram_spans(self, n: int) -> List[Tuple[int, int]]:
+        """Character span of each n-gram returned by `ngrams`"""
+        spans = self.spans
+        return [(spans[i][0], spans[i + n - 1][1]) for i in range(len(spans) - n + 1)]
+
+
+# Texts longer than this are not cached, so the cache cannot pin whole papers in memory
+_CACHE_MAX_CHARS = 100_000
+# Tokenizations kept per check: the suspect, its sections and the reference being scored
+_CACHE_ENTRIES = 8
+
+
+class _TokenCache:
+    """Most recently used tokenizations of one check"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, TokenizedText]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, text: str) -> TokenizedText:
+        with self.lock:
+            tokenized = self.entries.get(text)
+            if tokenized is not None:
+                self.entries.move_to_end(text)
+                return tokenized
+        tokenized = TokenizedText(text)
+        with self.lock:
+            self.entries[text] = tokenized
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return tokenized
+
+
+_token_cache: contextvars.ContextVar[Optional[_TokenCache]] = contextvars.ContextVar("token_cache", default=None)
+
+
+@contextmanager
+def tokenization_cache(max_entries: int = _CACHE_ENTRIES) -> Iterator[None]:
+    """
+    Share tokenizations between the stages run inside the block (one check)
+
+    The cache holds at most `max_entries` texts of up to 100K characters and
+    is dropped when the block ends. Nested blocks share the enclosing cache.
+    """
+    if _token_cache.get() is not None:
+        yield
+        return
+    token = _token_cache.set(_TokenCache(max_entries))
+    try:
+        yield
+    finally:
+        _token_cache.reset(token)
+
+
+def tokenize(text: str) -> TokenizedText:
+    """
+    Tokenize a text; within a tokenization_cache block, results for texts up
+    to 100K characters are cached so stages working on the same text share
+    one tokenization. Treat the result as read-only.
+    """
+    cache = _token_cache.get()
+    if cache is None or len(text) > _CACHE_MAX_CHARS:
+        return TokenizedText(text)
+    return cache.get(text)
+
+
+def words(text: str) -> List[str]:
+    """Word tokens of a text (no punctuation)"""
+    return _WORD.findall(text)
+
+
+def content_words(text: str) -> List[str]:
+    """Lower-cased words without stop words and numbers"""
+    return [word for word in _WORD.findall(normalize(text)) if word not in STOP_WORDS and not word.isdigit()]
+
+
+def term_frequencies(text: str) -> "Counter[str]":
+    """Occurrences of each content word of a text (see content_words)"""
+    return Counter(content_words(text))
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """(start, end) character offsets of the sentences of a text"""
+    spans = []
+    start = 0
+    for match in _SENTENCE_BOUNDARY.finditer(text):
+        if match.start() > start:
+            spans.append((start, match.start()))
+        start = match.end()
+    end = len(text.rstrip())
+    if end > start:
+        spans.append((start, end))
+    return spans
+
+
+def split_sentences(text: str, min_words: int = 5) -> List[str]:
+    """
+    Split text into sentences, dropping fragments shorter than `min_words`
+
+    Args:
+        text: Text to split
+        min_words: Minimum number of words for a sentence to be kept
+
+    Returns:
+        List of sentences
+    """
+    text = _WHITESPACE.sub(" ", text).strip()
+    sentences = []
+    for start, end in sentence_spans(text):
+        sentence = text[start:end]
+        if len(sentence.split()) >= min_words:
+            sentences.append(sentence)
+    return sentences
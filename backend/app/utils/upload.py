@@ -0,0 +1,208 @@
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Dict, Optional
+
+from starlette.requests import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from app.core.metrics import stage
+
+# Limits can be overridden with MAX_UPLOAD_MB and UPLOAD_SPOOL_MB
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+SPOOL_BYTES = int(float(os.getenv("UPLOAD_SPOOL_MB", "5")) * 1024 * 1024)
+MAX_FIELD_BYTES = 64 * 1024
+MAX_FIELDS = 16
+MAX_FIELDS_BYTES = 4 * MAX_FIELD_BYTES
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the size limit"""
+
+
+class InvalidUpload(Exception):
+    """Raised when a multipart body is malformed or has no file part"""
+
+
+class UploadedFile:
+    """
+    A file received from a multipart upload
+
+    Attributes:
+        file: Spooled temporary file positioned at the start
+        filename: Client-supplied file name
+        content_type: Client-supplied content type of the part
+        size: Size in bytes
+        sha256: Hex SHA-256 of the content, computed while receiving
+        fields: Other (non-file) form fields
+    """
+
+    def __init__(self, file: BinaryIO, filename: str, content_type: str, size: int, sha256: str,
+                 fields: Optional[Dict[str, str]] = None):
+        self.file = file
+        self.fields = fields or {}
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.sha256 = sha256
+
+    def close(self):
+        self.file.close()
+
+
+class StreamingUpload:
+    """
+    Receives a multipart/form-data body chunk by chunk.
+
+    The file part is written straight to a spooled temporary file (kept in
+    memory up to `spool_bytes`, then moved to disk) and hashed as it arrives;
+    the size limit is enforced per chunk, so oversized uploads are rejected
+    without being buffered. Other parts are collected as small text fields:
+    at most MAX_FIELDS of them, each up to MAX_FIELD_BYTES and all together
+    (with their headers) up to MAX_FIELDS_BYTES.
+
+    Args:
+        request: Incoming request
+        field_name: Name of the file field
+        max_bytes: Maximum size of the file
+        spool_bytes: In-memory size before spilling to disk
+    """
+
+    def __init__(self, request: Request, field_name: str = "file", max_bytes: int = MAX_UPLOAD_BYTES,
+                 spool_bytes: int = SPOOL_BYTES):
+        self.request = request
+        self.field_name = field_name
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+
+        self.fields: Dict[str, str] = {}
+        self.field_count = 0
+        self.field_bytes = 0
+        self.file: Optional[BinaryIO] = None
+        self.filename = ""
+        self.content_type = ""
+        self.size = 0
+        self.hasher = hashlib.sha256()
+
+        # Per-part parser state
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._part_name: Optional[str] = None
+        self._part_is_file = False
+        self._field_buffer = bytearray()
+
+    # Parser callbacks
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._part_name = None
+        self._part_is_file = False
+        self._field_buffer = bytearray()
+
+    def _count_field_bytes(self, size: int):
+        self.field_bytes += size
+        if self.field_bytes > MAX_FIELDS_BYTES:
+            raise UploadTooLarge(f"Form fields exceed the limit of {MAX_FIELDS_BYTES} bytes")
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._count_field_bytes(end - start)
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._count_field_bytes(end - start)
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, params = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = params.get(b"name", b"").decode("utf-8", errors="replace")
+        self._part_name = name
+        if name == self.field_name and b"filename" in params:
+            if self.file is not None:
+                raise InvalidUpload(f"Multiple '{self.field_name}' parts in upload")
+            self._part_is_file = True
+            self.filename = params[b"filename"].decode("utf-8", errors="replace")
+            self.content_type = self._headers.get(b"content-type", b"").decode("latin-1")
+            self.file = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes)
+        else:
+            self.field_count += 1
+            if self.field_count > MAX_FIELDS:
+                raise InvalidUpload(f"Upload has more than {MAX_FIELDS} form fields")
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        chunk = data[start:end]
+        if self._part_is_file:
+            self.size += len(chunk)
+            if self.size > self.max_bytes:
+                raise UploadTooLarge(f"Upload exceeds the limit of {self.max_bytes} bytes")
+            self.hasher.update(chunk)
+            self.file.write(chunk)
+        else:
+            self._count_field_bytes(len(chunk))
+            self._field_buffer += chunk
+            if len(self._field_buffer) > MAX_FIELD_BYTES:
+                raise UploadTooLarge(f"Form field '{self._part_name}' exceeds the limit of {MAX_FIELD_BYTES} bytes")
+
+    def _on_part_end(self):
+        if not self._part_is_file and self._part_name:
+            self.fields[self._part_name] = self._field_buffer.decode("utf-8", errors="replace")
+
+    async def receive(self) -> UploadedFile:
+        """
+        Consume the request body
+
+        Returns:
+            The uploaded file, positioned at the start
+
+        Raises:
+            UploadTooLarge: If the file (or declared body) exceeds the limit
+            InvalidUpload: If the body is not multipart or has no file part
+        """
+        content_type, params = parse_options_header(self.request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise InvalidUpload("Expected a multipart/form-data body")
+
+        # Reject early when the declared body is clearly too large
+        declared = self.request.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > self.max_bytes + MAX_FIELDS_BYTES:
+            raise UploadTooLarge(f"Upload exceeds the limit of {self.max_bytes} bytes")
+
+        parser = MultipartParser(params[b"boundary"], callbacks={
+            'on_part_begin': self._on_part_begin,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+        })
+
+        try:
+            with stage("upload_receive"):
+                async for chunk in self.request.stream():
+                    parser.write(chunk)
+                parser.finalize()
+        except (UploadTooLarge, InvalidUpload):
+            if self.file is not None:
+                self.file.close()
+            raise
+        except Exception as e:
+            if self.file is not None:
+                self.file.close()
+            raise InvalidUpload(f"Malformed multipart body: {str(e)}")
+
+        if self.file is None:
+            raise InvalidUpload(f"No '{self.field_name}' file part in upload")
+
+        self.file.seek(0)
+        return UploadedFile(self.file, self.filename, self.content_type, self.size, self.hasher.hexdigest(),
+                            fields=self.fields)
@@ -0,0 +1,183 @@
+"""
+Compare embedding models for the semantic stage on a labeled set of pairs.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.embedding_models --models bert,minilm --output models.json
+    python -m benchmarks.embedding_models --models bert,/models/all-MiniLM-L6-v2 --pairs labeled.jsonl
+
+`--pairs` reads a JSONL file of {"suspect", "reference", "label"} objects
+(label 1 for plagiarized pairs); without it pairs are generated from
+benchmarks.synthetic: every suspect against its source and against an
+unrelated reference. Models are names of app.services.embeddings presets,
+Hugging Face ids or local directories. Each model runs in a fresh process, so
+its load time and peak RSS are measured in isolation.
+
+Per model the report gives document and sentence embedding throughput,
+memory, and detection quality of the semantic similarity alone: ROC AUC, the
+F1 score at the model's default threshold, the best threshold and its F1, and
+the 99th percentile of unrelated pairs (a calibration of the cascade's
+semantic ceiling).
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from benchmarks.run_benchmarks import git_commit, peak_rss_mb, percentile
+from benchmarks.synthetic import SyntheticCorpus, paper_text
+
+
+def load_pairs(args: argparse.Namespace) -> List[Tuple[str, str, int]]:
+    """(suspect, reference, label) pairs of the labeled file or the synthetic corpus"""
+    if args.pairs:
+        with open(args.pairs, "r", encoding="utf-8") as f:
+            return [(item['suspect'], item['reference'], int(item['label']))
+                    for item in map(json.loads, f) if item]
+    corpus = SyntheticCorpus(seed=args.seed)
+    references = corpus.reference_corpus(args.references)
+    by_id = {reference['id']: reference for reference in references}
+    rng = random.Random(args.seed)
+    pairs = []
+    for suspect in corpus.suspects(args.synthetic, references):
+        source_id = suspect['plagiarism']['source_id']
+        if source_id is not None:
+            pairs.append((paper_text(suspect), paper_text(by_id[source_id]), 1))
+        unrelated = rng.choice([reference for reference in references if reference['id'] != source_id])
+        pairs.append((paper_text(suspect), paper_text(unrelated), 0))
+    return pairs
+
+
+def detection_quality(similarities: np.ndarray, labels: np.ndarray, threshold: float) -> Dict[str, Any]:
+    """ROC AUC, F1 at `threshold`, and the threshold with the best F1"""
+    from sklearn.metrics import f1_score, precision_recall_curve, roc_auc_score
+
+    quality: Dict[str, Any] = {
+        'roc_auc': round(float(roc_auc_score(labels, similarities)), 4) if 0 < labels.sum() < len(labels) else None,
+        'default_threshold': threshold,
+        'f1_at_default': round(float(f1_score(labels, similarities >= threshold, zero_division=0)), 4),
+    }
+    precision, recall, thresholds = precision_recall_curve(labels, similarities)
+    f1 = 2 * precision[:-1] * recall[:-1] / np.maximum(precision[:-1] + recall[:-1], 1e-12)
+    best = int(np.argmax(f1))
+    quality['best_threshold'] = round(float(thresholds[best]), 4)
+    quality['best_f1'] = round(float(f1[best]), 4)
+    negatives = similarities[labels == 0]
+    quality['unrelated_p99'] = round(percentile(negatives.tolist(), 99), 4) if len(negatives) else None
+    quality['mean_similarity'] = {
+        'plagiarized': round(float(similarities[labels == 1].mean()), 4) if labels.any() else None,
+        'unrelated': round(float(negatives.mean()), 4) if len(negatives) else None,
+    }
+    return quality
+
+
+def measure_model(model: str, pairs: List[Tuple[str, str, int]], batch_size: int) -> Dict[str, Any]:
+    """Load one model and measure it (run in a fresh process)"""
+    from app.services.embeddings import EmbeddingModel
+    from app.utils.text import normalize, split_sentences
+
+    rss_before = peak_rss_mb()
+    start_time = time.perf_counter()
+    embedder = EmbeddingModel.from_env(model)
+    load_s = time.perf_counter() - start_time
+    rss_loaded = peak_rss_mb()
+
+    # Document embeddings, as the semantic stage computes them
+    texts = sorted({text for suspect, reference, _ in pairs for text in (suspect, reference)})
+    vectors = {}
+    latencies = []
+    for text in texts:
+        call_start = time.perf_counter()
+        vector = embedder.embed_document(normalize(text)).ravel()
+        latencies.append(time.perf_counter() - call_start)
+        vectors[text] = vector / (np.linalg.norm(vector) or 1.0)
+
+    # Sentence embeddings, as the paraphrase index computes them
+    sentences = [sentence for text in texts for sentence in split_sentences(text)]
+    start_time = time.perf_counter()
+    embedder.embed_sentences(sentences, batch_size=batch_size)
+    sentence_s = time.perf_counter() - start_time
+
+    similarities = np.array([float(vectors[suspect] @ vectors[reference]) for suspect, reference, _ in pairs])
+    labels = np.array([label for _, _, label in pairs])
+    return {
+        'model_id': embedder.model_id,
+        'dim': embedder.dim,
+        'parameters': sum(parameter.numel() for parameter in embedder.model.parameters()),
+        'load_s': round(load_s, 2),
+        'model_rss_mb': round(rss_loaded - rss_before, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'documents': {
+            'count': len(texts),
+            'docs_per_s': round(len(texts) / sum(latencies), 2) if latencies else None,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        },
+        'sentences': {
+            'count': len(sentences),
+            'sentences_per_s': round(len(sentences) / sentence_s, 2) if sentence_s else None,
+        },
+        'quality': detection_quality(similarities, labels, embedder.semantic_threshold),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    pairs = load_pairs(args)
+    if not pairs:
+        raise SystemExit("No labeled pairs")
+    models = [model.strip() for model in args.models.split(",") if model.strip()]
+
+    results: Dict[str, Any] = {
+        'metadata': {
+            'git_commit': git_commit(),
+            'pairs': len(pairs),
+            'plagiarized_pairs': sum(label for _, _, label in pairs),
+            'arguments': vars(args),
+        },
+        'models': {},
+    }
+    for model in models:
+        # A fresh process per model keeps load time and peak RSS separate
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results['models'][model] = executor.submit(measure_model, model, pairs, args.batch_size).result()
+
+    if len(models) > 1:
+        baseline = results['models'][models[0]]
+        for model in models[1:]:
+            measured = results['models'][model]
+            measured['vs_' + models[0]] = {
+                'docs_per_s': round(measured['documents']['docs_per_s'] / baseline['documents']['docs_per_s'], 2),
+                'model_rss': round(measured['model_rss_mb'] / baseline['model_rss_mb'], 2)
+                if baseline['model_rss_mb'] else None,
+                'best_f1_delta': round(measured['quality']['best_f1'] - baseline['quality']['best_f1'], 4),
+            }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark embedding models for the semantic stage")
+    parser.add_argument("--models", default="bert,minilm",
+                        help="Comma-separated presets, Hugging Face ids or local model directories")
+    parser.add_argument("--pairs", help="JSONL file of labeled {suspect, reference, label} pairs")
+    parser.add_argument("--synthetic", type=int, default=40, help="Synthetic suspects when --pairs is not given")
+    parser.add_argument("--references", type=int, default=20, help="Synthetic reference papers")
+    parser.add_argument("--batch-size", type=int, default=32, help="Sentences per forward pass")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
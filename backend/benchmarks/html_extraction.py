@@ -0,0 +1,167 @@
+"""
+Compare HTML content extraction paths on a corpus of publisher pages.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.html_extraction --pages saved_pages/ --output html.json
+    python -m benchmarks.html_extraction --synthetic 60 --workers 4
+
+`--pages` reads saved landing pages (*.html, *.htm); without it synthetic
+pages in the styles of benchmarks.synthetic.PUBLISHER_TEMPLATES are used.
+Each page goes through the previous BeautifulSoup path (`legacy`) and
+HTMLExtractor (`fast`). The report gives per-page latency percentiles,
+pages/s and MB/s, which extractor produced each page's content, and how
+closely the fast output matches the legacy output.
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from typing import Any, Callable, Dict, List, Tuple
+
+from bs4 import BeautifulSoup
+
+from app.utils import html_extractor
+from app.utils.html_extractor import HTMLExtractor
+from benchmarks.run_benchmarks import git_commit, percentile
+from benchmarks.synthetic import PUBLISHER_TEMPLATES, SyntheticCorpus, publisher_page
+
+
+def legacy_extract(html: str) -> str:
+    """The extraction PlagiarismChecker.fetch_paper_content used before HTMLExtractor"""
+    soup = BeautifulSoup(html, 'html.parser')
+    for script in soup(["script", "style", "nav", "footer", "header"]):
+        script.extract()
+    content = ""
+    abstract_sections = soup.find_all(['div', 'section', 'p'],
+                                      class_=lambda c: c and any(term in c.lower() for term in
+                                                               ['abstract', 'summary', 'paper-content']))
+    if abstract_sections:
+        for section in abstract_sections:
+            content += section.get_text(strip=True) + "\n\n"
+    else:
+        main_content = soup.find('main') or soup.find('article') or soup.find('body')
+        if main_content:
+            for p in main_content.find_all('p'):
+                content += p.get_text(strip=True) + "\n\n"
+    return content.strip()
+
+
+def load_pages(args: argparse.Namespace) -> List[Tuple[str, str]]:
+    """(name, html) pairs of the saved or synthetic corpus"""
+    if args.pages:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(args.pages, "**", "*.htm*"), recursive=True)):
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                pages.append((os.path.relpath(path, args.pages), f.read()))
+        return pages
+    corpus = SyntheticCorpus(seed=args.seed)
+    pages = []
+    for i in range(args.synthetic):
+        template = PUBLISHER_TEMPLATES[i % len(PUBLISHER_TEMPLATES)]
+        pages.append((f"synthetic-{i}-{template}", publisher_page(corpus.paper(f"p{i}"), template, args.noise_links)))
+    return pages
+
+
+def measure(extract: Callable[[str], str], pages: List[Tuple[str, str]], repeat: int) -> Dict[str, Any]:
+    latencies = []
+    outputs = []
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        outputs = []
+        for _, html in pages:
+            call_start = time.perf_counter()
+            outputs.append(extract(html))
+            latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start_time
+    total_bytes = sum(len(html.encode("utf-8")) for _, html in pages) * repeat
+    return {
+        'pages_per_s': round(len(latencies) / elapsed, 2),
+        'mb_per_s': round(total_bytes / elapsed / 1e6, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'outputs': outputs,
+    }
+
+
+def similarity(a: str, b: str) -> float:
+    """Character overlap of two extractions, ignoring whitespace (legacy output drops spaces between tags)"""
+    a, b = re.sub(r"\s+", "", a), re.sub(r"\s+", "", b)
+    if not a and not b:
+        return 1.0
+    return SequenceMatcher(None, a, b, autojunk=False).quick_ratio()
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    pages = load_pages(args)
+    if not pages:
+        raise SystemExit("No pages to benchmark")
+    extractor = HTMLExtractor(workers=0)
+
+    legacy = measure(legacy_extract, pages, args.repeat)
+    fast = measure(extractor.extract, pages, args.repeat)
+
+    extractors: Dict[str, int] = {}
+    for _, html in pages:
+        _, name = extractor.extract_page(html)
+        extractors[name or 'none'] = extractors.get(name or 'none', 0) + 1
+    similarities = [similarity(old, new) for old, new in zip(legacy.pop('outputs'), fast.pop('outputs'))]
+
+    results = {
+        'metadata': {
+            'git_commit': git_commit(),
+            'parser': 'selectolax' if html_extractor.LexborHTMLParser is not None else 'beautifulsoup',
+            'pages': len(pages),
+            'total_mb': round(sum(len(html.encode("utf-8")) for _, html in pages) / 1e6, 2),
+            'arguments': vars(args),
+        },
+        'legacy': legacy,
+        'fast': fast,
+        'speedup_p50': round(legacy['p50_ms'] / fast['p50_ms'], 1) if fast['p50_ms'] else None,
+        'extractors': extractors,
+        'mean_similarity_to_legacy': round(sum(similarities) / len(similarities), 3),
+        'pages_below_0.8_similarity': [name for (name, _), value in zip(pages, similarities) if value < 0.8],
+    }
+
+    if args.workers:
+        # Concurrent callers sharing the process pool, as request threads would
+        pooled = HTMLExtractor(workers=args.workers)
+        pooled.extract(pages[0][1])  # start the workers
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            list(executor.map(pooled.extract, [html for _, html in pages] * args.repeat))
+        elapsed = time.perf_counter() - start_time
+        pooled.close()
+        results['pool'] = {
+            'workers': args.workers,
+            'pages_per_s': round(len(pages) * args.repeat / elapsed, 2),
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark HTML content extraction")
+    parser.add_argument("--pages", help="Directory of saved publisher pages")
+    parser.add_argument("--synthetic", type=int, default=60, help="Synthetic pages when --pages is not given")
+    parser.add_argument("--noise-links", type=int, default=2000, help="Navigation links per synthetic page")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=0, help="Also measure the process pool with N workers")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Closed-loop load test against a running API server.
+
+Usage (from the backend directory, with the server started separately):
+
+    python run.py --production                       # e.g. WEB_CONCURRENCY=4
+    python -m benchmarks.load_test --url http://localhost:8000 --concurrency 8 --duration 120 \\
+        --server-cores 8 --output load.json
+
+Each client uploads synthetic suspect papers to /api/check-plagiarism/upload
+in a loop (local checks only, so the numbers measure the server and not the
+scholarly providers). Every upload is unique so the result cache is not
+exercised. The report gives requests/sec overall and per server
+core, latency percentiles and the error count.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List
+
+import requests
+
+from benchmarks.run_benchmarks import git_commit, percentile
+from benchmarks.synthetic import SyntheticCorpus, make_pdf, paper_text
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    corpus = SyntheticCorpus(seed=args.seed, words_per_section=args.words_per_section)
+    references = corpus.reference_corpus(args.documents)
+    texts = [paper_text(paper) for paper in corpus.suspects(args.documents, references)]
+    options = json.dumps({'check_online_sources': False})
+    url = args.url.rstrip("/") + "/api/check-plagiarism/upload"
+
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.warmup + args.duration
+    measure_from = time.perf_counter() + args.warmup
+
+    def client(index: int):
+        session = requests.Session()
+        i = index
+        while True:
+            start_time = time.perf_counter()
+            if start_time >= deadline:
+                return
+            # A unique suffix keeps the server's result cache out of the measurement
+            document = make_pdf(texts[i % len(texts)] + f" Submission {i}.")
+            i += args.concurrency
+            try:
+                response = session.post(url, files={'file': (f"doc{i}.pdf", document, "application/pdf")},
+                                        data={'options': options}, timeout=args.timeout)
+                outcome = None if response.status_code == 200 else str(response.status_code)
+            except requests.RequestException as e:
+                outcome = type(e).__name__
+            end_time = time.perf_counter()
+            if start_time < measure_from or end_time > deadline:
+                continue  # only count requests entirely inside the measurement window
+            with lock:
+                if outcome is None:
+                    latencies.append(end_time - start_time)
+                else:
+                    errors[outcome] = errors.get(outcome, 0) + 1
+
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    requests_per_s = len(latencies) / args.duration
+    return {
+        'metadata': {
+            'git_commit': git_commit(),
+            'url': args.url,
+            'arguments': vars(args),
+        },
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_s': round(requests_per_s, 3),
+        'requests_per_s_per_core': round(requests_per_s / args.server_cores, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test a running plagiarism detection API")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=60, help="Measurement window in seconds")
+    parser.add_argument("--warmup", type=float, default=10, help="Seconds excluded from the results")
+    parser.add_argument("--server-cores", type=int, default=os.cpu_count() or 1,
+                        help="Cores available to the server, for requests/sec per core")
+    parser.add_argument("--documents", type=int, default=8, help="Distinct synthetic documents")
+    parser.add_argument("--words-per-section", type=int, default=250)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
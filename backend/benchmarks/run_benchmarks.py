@@ -0,0 +1,311 @@
+"""
+Benchmark every stage of the plagiarism pipeline on a synthetic corpus.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.run_benchmarks --references 50 --suspects 8 --output bench.json
+    python -m benchmarks.run_benchmarks --compare baseline.json bench.json
+
+Results are written as JSON: per-stage throughput, p50/p95/p99 latency and the
+process peak RSS after the stage, plus metadata (git commit, seed, arguments)
+so runs can be compared across commits.
+"""
+import argparse
+import datetime
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Sequence
+
+from benchmarks.stub_server import StubSearchProvider, StubServer
+from benchmarks.synthetic import SyntheticCorpus, make_pdf, paper_text
+
+STAGES = [
+    "pdf_extraction", "sectioning", "tokenization", "embeddings", "ngram", "fuzzy",
+    "vector_query", "ai_detection", "cascade", "large_document", "end_to_end",
+]
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Percentile with linear interpolation between closest ranks"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def time_stage(func: Callable[[Any], Any], inputs: List[Any], repeat: int, items_per_call: int = 1) -> Dict[str, Any]:
+    """
+    Call `func` on every input `repeat` times and summarize the latencies
+
+    Args:
+        func: Function to time, called with one input
+        inputs: Inputs for the function
+        repeat: Number of passes over the inputs
+        items_per_call: Items processed per call, used for throughput
+
+    Returns:
+        Dictionary with call count, throughput and latency percentiles
+    """
+    durations = []
+    for _ in range(repeat):
+        for item in inputs:
+            start_time = time.perf_counter()
+            func(item)
+            durations.append(time.perf_counter() - start_time)
+
+    total = sum(durations)
+    return {
+        'calls': len(durations),
+        'items': len(durations) * items_per_call,
+        'total_s': round(total, 6),
+        'throughput_per_s': round(len(durations) * items_per_call / total, 3) if total > 0 else None,
+        'p50_ms': round(percentile(durations, 50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 95) * 1000, 3),
+        'p99_ms': round(percentile(durations, 99) * 1000, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    corpus = SyntheticCorpus(seed=args.seed, words_per_section=args.words_per_section)
+    references = corpus.reference_corpus(args.references)
+    suspects = corpus.suspects(args.suspects, references)
+    stages = STAGES if args.stages == "all" else [s.strip() for s in args.stages.split(",")]
+
+    # Reuse the endpoint's service instances so models are loaded once
+    from app.api import endpoints
+    from app.services.scholarly_providers import ProviderManager
+    pdf_extractor = endpoints.pdf_extractor
+    checker = endpoints.plagiarism_checker
+    detector = endpoints.ai_detector
+
+    suspect_pdfs = [make_pdf(paper_text(paper)) for paper in suspects]
+    suspect_texts = [checker.preprocess_text(" ".join(paper['sections'].values())) for paper in suspects]
+    reference_texts = [checker.preprocess_text(" ".join(paper['sections'].values())) for paper in references]
+    pairs = [(s, r) for s in suspect_texts for r in reference_texts[:args.pairs_per_suspect]]
+
+    results: Dict[str, Any] = {}
+    for stage in stages:
+        print(f"Running stage: {stage}", file=sys.stderr)
+        if stage == "pdf_extraction":
+            results[stage] = time_stage(pdf_extractor.extract_text_from_pdf, suspect_pdfs, args.repeat)
+        elif stage == "sectioning":
+            raw_texts = [pdf_extractor.extract_text_from_pdf(pdf) for pdf in suspect_pdfs]
+            results[stage] = time_stage(
+                lambda raw: pdf_extractor.extract_sections(pdf_extractor.preprocess_text(raw)),
+                raw_texts, args.repeat)
+        elif stage == "tokenization":
+            from app.utils.text import TokenizedText
+            # Uncached tokenization, as every stage of a new document pays it once
+            results[stage] = time_stage(TokenizedText, suspect_texts, args.repeat)
+        elif stage == "embeddings":
+            results[stage] = time_stage(checker.get_bert_embeddings, suspect_texts, args.repeat)
+        elif stage == "ngram":
+            results[stage] = time_stage(lambda pair: checker.ngram_similarity(*pair), pairs, args.repeat)
+        elif stage == "fuzzy":
+            results[stage] = time_stage(lambda pair: checker.fuzzy_match_similarity(*pair), pairs, args.repeat)
+        elif stage == "vector_query":
+            build_start = time.perf_counter()
+            checker.create_vector_database(reference_texts)
+            build_time = time.perf_counter() - build_start
+            results[stage] = time_stage(checker.query_vector_database, suspect_texts, args.repeat)
+            results[stage]['build_s'] = round(build_time, 6)
+            checker.vector_database = None
+        elif stage == "ai_detection":
+            results[stage] = time_stage(detector.analyze_sections, [p['sections'] for p in suspects], args.repeat)
+        elif stage == "cascade":
+            results[stage] = run_cascade(args, references, suspects, checker)
+        elif stage == "large_document":
+            results[stage] = run_large_document(args, references, suspects, checker)
+        elif stage == "end_to_end":
+            results[stage] = run_end_to_end(args, references, suspects, checker, ProviderManager)
+        else:
+            raise ValueError(f"Unknown stage: {stage}")
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+        },
+        'stages': results,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def run_cascade(args, references, suspects, checker) -> Dict[str, Any]:
+    """Compare the similarity cascade with the full computation on every suspect"""
+    from app.services.cascade import CascadePolicy, CascadeScorer
+
+    thresholds = checker.default_thresholds()
+    reference_texts = [checker.preprocess_text(" ".join(paper['sections'].values())) for paper in references]
+    full = CascadeScorer(checker, CascadePolicy(enabled=False))
+    summary = {'references': 0, 'semantic_computed': 0, 'decision_mismatches': 0, 'top1_mismatches': 0}
+
+    def check(paper):
+        suspect = checker.preprocess_text(" ".join(paper['sections'].values()))
+        cascade_results, cascade_summary = checker.cascade.score(suspect, reference_texts, thresholds)
+        full_results, _ = full.score(suspect, reference_texts, thresholds)
+        summary['references'] += cascade_summary['references']
+        summary['semantic_computed'] += cascade_summary['semantic_computed']
+        summary['decision_mismatches'] += sum(a['is_plagiarized'] != b['is_plagiarized']
+                                              for a, b in zip(cascade_results, full_results))
+        top = lambda results: max(range(len(results)), key=lambda i: results[i]['overall_score'])
+        summary['top1_mismatches'] += top(cascade_results) != top(full_results)
+
+    timing = time_stage(check, suspects, 1)
+    summary['semantic_call_ratio'] = round(summary['semantic_computed'] / summary['references'], 3) \
+        if summary['references'] else None
+    timing.update(summary)
+    return timing
+
+
+def run_large_document(args, references, suspects, checker) -> Dict[str, Any]:
+    """
+    Peak Python heap of check_plagiarism as the suspect grows
+
+    The suspect is the first synthetic paper repeated `scale` times; references
+    are generated lazily. With the memory budget the peak should level off
+    once the document reaches its allowance instead of growing with it.
+    """
+    import tracemalloc
+    from app.core.memory import MemoryBudget, memory_budget
+
+    paper_text_ = " ".join(suspects[0]['sections'].values())
+    reference_texts = [" ".join(paper['sections'].values()) for paper in references[:args.pairs_per_suspect]]
+    summary = {}
+    for scale in args.large_scales:
+        suspect = " ".join([paper_text_] * scale)
+        with memory_budget(MemoryBudget(budget_bytes=args.memory_budget_mb * 1024 * 1024)) as budget:
+            tracemalloc.start()
+            start_time = time.perf_counter()
+            checker.check_plagiarism(budget.truncate(suspect, "document"), (text for text in reference_texts))
+            elapsed = time.perf_counter() - start_time
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        summary[f"x{scale}"] = {
+            'chars': len(suspect),
+            'elapsed_s': round(elapsed, 3),
+            'peak_heap_mb': round(peak / (1024 * 1024), 1),
+            'truncated': bool(budget.degradations),
+        }
+    return summary
+
+
+def run_end_to_end(args, references, suspects, checker, provider_manager_cls) -> Dict[str, Any]:
+    """Run the HTTP endpoint for every suspect against the stub server"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)
+    original_providers = checker.providers
+    detected = 0
+    plagiarized = 0
+
+    with StubServer(references, suspects) as stub:
+        checker.providers = provider_manager_cls([StubSearchProvider(stub.base_url)])
+
+        def check(paper):
+            nonlocal detected, plagiarized
+            response = client.post("/api/check-plagiarism", json={
+                'pdf_url': f"{stub.base_url}/suspects/{paper['id']}.pdf",
+                'check_online_sources': True,
+                'num_papers': args.num_papers,
+            })
+            response.raise_for_status()
+            source_id = paper['plagiarism']['source_id']
+            if source_id:
+                plagiarized += 1
+                highest = response.json().get('highest_match') or {}
+                link = (highest.get('paper_info') or {}).get('link', '')
+                if f"/papers/{source_id}." in link:
+                    detected += 1
+
+        try:
+            summary = time_stage(check, suspects, args.repeat)
+        finally:
+            checker.providers = original_providers
+        summary['stub_requests'] = stub.requests_served
+        summary['stub_bytes'] = stub.bytes_served
+
+    summary['top1_source_recall'] = round(detected / plagiarized, 3) if plagiarized else None
+    return summary
+
+
+def compare(baseline_path: str, current_path: str):
+    """Print the relative change of each stage's latency between two result files"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+
+    print(f"{'stage':<16}{'metric':<10}{'baseline':>12}{'current':>12}{'change':>10}")
+    for stage, stats in current['stages'].items():
+        old = baseline['stages'].get(stage)
+        if not old or 'p50_ms' not in stats:
+            continue  # stages reporting other measures (e.g. large_document)
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            before, after = old[metric], stats[metric]
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"{stage:<16}{metric:<10}{before:>12.3f}{after:>12.3f}{change:>10}")
+    print(f"{'peak_rss_mb':<26}{baseline['peak_rss_mb']:>12.1f}{current['peak_rss_mb']:>12.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the plagiarism detection pipeline")
+    parser.add_argument("--references", type=int, default=50, help="Size of the reference corpus")
+    parser.add_argument("--suspects", type=int, default=8, help="Number of suspect papers")
+    parser.add_argument("--words-per-section", type=int, default=250)
+    parser.add_argument("--pairs-per-suspect", type=int, default=10,
+                        help="References compared with each suspect in the ngram/fuzzy stages")
+    parser.add_argument("--num-papers", type=int, default=3, help="num_papers sent to the endpoint")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the inputs per stage")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--large-scales", type=lambda value: [int(v) for v in value.split(",")], default=[1, 16, 256],
+                        help="Comma separated suspect sizes (in papers) for the large_document stage")
+    parser.add_argument("--memory-budget-mb", type=int, default=64, help="Memory budget in the large_document stage")
+    parser.add_argument("--stages", default="all", help=f"Comma separated subset of: {', '.join(STAGES)}")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="Compare two result files instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Local HTTP stub standing in for scholarly sources during benchmarks.
+
+Serves suspect PDFs, reference papers (as HTML and PDF) and a small JSON search
+API, so the end-to-end endpoint can run without touching the network.
+"""
+import json
+import threading
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from app.services.scholarly_providers import ScholarlyProvider
+from benchmarks.synthetic import make_pdf, paper_text
+
+
+class StubServer:
+    """
+    Threaded HTTP server on 127.0.0.1 serving a synthetic corpus
+
+    Routes:
+        /suspects/<id>.pdf   suspect paper as PDF
+        /papers/<id>.pdf     reference paper as PDF
+        /papers/<id>.html    reference paper as an HTML abstract page
+        /search?q=...&n=...  JSON search over reference titles and abstracts
+
+    Args:
+        references: Reference papers from SyntheticCorpus
+        suspects: Suspect papers from SyntheticCorpus
+    """
+
+    def __init__(self, references: List[Dict[str, Any]], suspects: List[Dict[str, Any]]):
+        self.references = {paper['id']: paper for paper in references}
+        self.suspects = {paper['id']: paper for paper in suspects}
+        self.pdf_cache: Dict[str, bytes] = {}
+        self.requests_served = 0
+        self.bytes_served = 0
+        self.lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                status, content_type, body = server.route(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with server.lock:
+                    server.requests_served += 1
+                    server.bytes_served += len(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _pdf(self, paper: Dict[str, Any]) -> bytes:
+        if paper['id'] not in self.pdf_cache:
+            self.pdf_cache[paper['id']] = make_pdf(paper_text(paper))
+        return self.pdf_cache[paper['id']]
+
+    def _html(self, paper: Dict[str, Any]) -> bytes:
+        body = "".join(f"<p>{escape(content)}</p>" for name, content in paper['sections'].items()
+                       if name not in ("abstract", "references"))
+        return (
+            f"<html><head><title>{escape(paper['title'])}</title></head><body>"
+            f"<nav>Journal navigation</nav><main><h1>{escape(paper['title'])}</h1>"
+            f"<div class=\"abstract\">{escape(paper['sections'].get('abstract', ''))}</div>"
+            f"{body}</main><footer>Copyright</footer></body></html>"
+        ).encode()
+
+    def _search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        words = set(query.lower().split())
+        scored = []
+        for paper in self.references.values():
+            text = f"{paper['title']} {paper['sections'].get('abstract', '')}".lower()
+            score = len(words.intersection(text.replace(".", " ").split()))
+            scored.append((score, paper))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        results = []
+        for index, (_, paper) in enumerate(scored[:limit]):
+            extension = "pdf" if index % 2 == 0 else "html"
+            results.append({
+                'title': paper['title'],
+                'abstract': paper['sections'].get('abstract', ''),
+                'author': 'Synthetic Author',
+                'doi': f"10.0000/{paper['id']}",
+                'link': f"{self.base_url}/papers/{paper['id']}.{extension}",
+            })
+        return results
+
+    def route(self, path: str):
+        parsed = urlparse(path)
+        parts = parsed.path.strip("/").split("/")
+
+        if parts == ["search"]:
+            params = parse_qs(parsed.query)
+            query = params.get("q", [""])[0]
+            limit = int(params.get("n", ["5"])[0])
+            return 200, "application/json", json.dumps({'results': self._search(query, limit)}).encode()
+
+        if len(parts) == 2 and parts[0] in ("papers", "suspects"):
+            paper_id, _, extension = parts[1].rpartition(".")
+            store = self.references if parts[0] == "papers" else self.suspects
+            paper = store.get(paper_id)
+            if paper is not None and extension == "pdf":
+                return 200, "application/pdf", self._pdf(paper)
+            if paper is not None and extension == "html":
+                return 200, "text/html; charset=utf-8", self._html(paper)
+
+        return 404, "text/plain", b"not found"
+
+
+class StubSearchProvider(ScholarlyProvider):
+    """Scholarly provider that searches a StubServer over HTTP"""
+
+    name = "stub"
+    rate_limit = 1000.0
+    burst = 1000
+
+    def __init__(self, base_url: str, timeout: float = 10.0):
+        super().__init__(timeout)
+        self.base_url = base_url
+
+    def search(self, query: str, num_results: int = 5) -> List[Dict[str, Any]]:
+        response = requests.get(f"{self.base_url}/search", params={'q': query, 'n': num_results},
+                                timeout=self.timeout)
+        self._check_response(response)
+        return [dict(paper, source='Benchmark stub') for paper in response.json()['results']]
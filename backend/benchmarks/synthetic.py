@@ -0,0 +1,312 @@
+"""
+Synthetic papers and reference corpora for benchmarking.
+
+Everything is generated from a seeded random generator, so the same arguments
+always produce the same corpus and results are comparable across commits.
+"""
+import json
+import random
+from html import escape
+from typing import Any, Dict, List, Optional
+
+NOUNS = [
+    "model", "network", "dataset", "framework", "algorithm", "system", "approach", "method",
+    "representation", "embedding", "classifier", "corpus", "benchmark", "architecture", "pipeline",
+    "signal", "protocol", "sensor", "graph", "kernel", "feature", "parameter", "distribution",
+    "estimator", "policy", "agent", "controller", "circuit", "compiler", "database", "index",
+    "query", "document", "sentence", "token", "vector", "matrix", "tensor", "gradient", "loss",
+    "optimizer", "encoder", "decoder", "attention", "layer", "cluster", "sample", "experiment",
+    "hypothesis", "variable", "measurement", "simulation", "enzyme", "protein", "cell", "tissue",
+    "reactor", "catalyst", "polymer", "material", "alloy", "turbine", "battery", "membrane",
+]
+ADJECTIVES = [
+    "robust", "efficient", "scalable", "novel", "adaptive", "probabilistic", "sparse", "dense",
+    "hierarchical", "distributed", "stochastic", "deterministic", "linear", "nonlinear", "latent",
+    "supervised", "unsupervised", "semantic", "lexical", "temporal", "spatial", "multimodal",
+    "lightweight", "accurate", "interpretable", "convex", "discrete", "continuous", "parallel",
+    "incremental", "thermal", "mechanical", "biological", "chemical", "statistical", "empirical",
+]
+VERBS = [
+    "improves", "reduces", "increases", "captures", "models", "predicts", "estimates", "optimizes",
+    "evaluates", "measures", "controls", "detects", "encodes", "aligns", "compresses", "filters",
+    "extends", "outperforms", "approximates", "regularizes", "stabilizes", "accelerates",
+]
+CONNECTIVES = [
+    "Furthermore", "Moreover", "In addition", "However", "Consequently", "In contrast",
+    "As a result", "Specifically", "In particular", "Therefore",
+]
+# Substitutions used to paraphrase injected passages
+SYNONYMS = {
+    "improves": "enhances", "reduces": "lowers", "increases": "raises", "captures": "records",
+    "predicts": "forecasts", "estimates": "approximates", "evaluates": "assesses",
+    "detects": "identifies", "outperforms": "surpasses", "accelerates": "speeds up",
+    "robust": "resilient", "efficient": "economical", "novel": "new", "accurate": "precise",
+    "method": "technique", "approach": "strategy", "model": "formulation", "system": "platform",
+    "dataset": "data collection", "experiment": "trial", "Furthermore": "Additionally",
+    "Moreover": "Besides", "However": "Nevertheless", "Therefore": "Thus",
+}
+
+SECTION_HEADINGS = [
+    ("abstract", "Abstract"),
+    ("introduction", "1. Introduction"),
+    ("methodology", "2. Methodology"),
+    ("results", "3. Results"),
+    ("discussion", "4. Discussion"),
+    ("conclusion", "5. Conclusion"),
+    ("references", "7. References"),
+]
+
+PLAGIARISM_KINDS = ("verbatim", "paraphrased", "reordered")
+
+
+class SyntheticCorpus:
+    """
+    Generates synthetic papers, a reference corpus, and suspect papers with
+    controlled plagiarism injected from known references.
+
+    Args:
+        seed: Seed for the random generator
+        words_per_section: Approximate number of words in each body section
+    """
+
+    def __init__(self, seed: int = 42, words_per_section: int = 250):
+        self.random = random.Random(seed)
+        self.words_per_section = words_per_section
+
+    def sentence(self) -> str:
+        r = self.random
+        parts = [
+            f"The {r.choice(ADJECTIVES)} {r.choice(NOUNS)}",
+            r.choice(VERBS),
+            f"the {r.choice(ADJECTIVES)} {r.choice(NOUNS)} of the {r.choice(NOUNS)}",
+        ]
+        if r.random() < 0.5:
+            parts.append(f"using a {r.choice(ADJECTIVES)} {r.choice(NOUNS)}")
+        if r.random() < 0.3:
+            parts.insert(0, f"{r.choice(CONNECTIVES)},")
+            parts[1] = parts[1][0].lower() + parts[1][1:]
+        return " ".join(parts) + "."
+
+    def passage(self, num_words: int) -> str:
+        sentences = []
+        count = 0
+        while count < num_words:
+            sentence = self.sentence()
+            sentences.append(sentence)
+            count += len(sentence.split())
+        return " ".join(sentences)
+
+    def paper(self, paper_id: str, num_sections: int = 6) -> Dict[str, Any]:
+        """
+        Generate a paper as a dictionary of sections
+
+        Args:
+            paper_id: Identifier stored with the paper
+            num_sections: Number of body sections (abstract included)
+
+        Returns:
+            Dictionary with 'id', 'title' and 'sections'
+        """
+        title = f"A {self.random.choice(ADJECTIVES)} {self.random.choice(NOUNS)} for {self.random.choice(NOUNS)} analysis"
+        sections = {}
+        for name, _ in SECTION_HEADINGS[:num_sections]:
+            size = self.words_per_section // 2 if name == "abstract" else self.words_per_section
+            sections[name] = self.passage(size)
+        sections["references"] = " ".join(
+            f"[{i + 1}] A. Author, {self.random.choice(ADJECTIVES).title()} {self.random.choice(NOUNS)}s, "
+            f"Journal of {self.random.choice(NOUNS).title()}s, {self.random.randint(1990, 2024)}."
+            for i in range(8)
+        )
+        return {'id': paper_id, 'title': title, 'sections': sections}
+
+    def paraphrase(self, text: str) -> str:
+        """Substitute synonyms and drop a few words so the passage is no longer verbatim"""
+        words = []
+        for word in text.split():
+            bare = word.rstrip(".,")
+            suffix = word[len(bare):]
+            if bare in SYNONYMS and self.random.random() < 0.8:
+                word = SYNONYMS[bare] + suffix
+            elif bare in ("the", "a") and self.random.random() < 0.2:
+                continue
+            words.append(word)
+        return " ".join(words)
+
+    def reorder(self, text: str) -> str:
+        """Shuffle the sentence order of a passage"""
+        sentences = [s.strip() for s in text.split(".") if s.strip()]
+        self.random.shuffle(sentences)
+        return ". ".join(sentences) + "."
+
+    def reference_corpus(self, size: int) -> List[Dict[str, Any]]:
+        """Generate `size` reference papers"""
+        return [self.paper(f"ref-{i}") for i in range(size)]
+
+    def suspect(self, paper_id: str, references: List[Dict[str, Any]], kind: Optional[str] = None,
+                fraction: float = 0.3) -> Dict[str, Any]:
+        """
+        Generate a suspect paper with plagiarism injected from one reference
+
+        Args:
+            paper_id: Identifier stored with the paper
+            references: Reference corpus to copy from
+            kind: 'verbatim', 'paraphrased', 'reordered' or None for an original paper
+            fraction: Fraction of body sections replaced with copied material
+
+        Returns:
+            Paper dictionary with 'plagiarism' ground truth
+            ({'kind', 'source_id', 'sections'})
+        """
+        paper = self.paper(paper_id)
+        paper['plagiarism'] = {'kind': kind, 'source_id': None, 'sections': []}
+        if kind is None or not references:
+            return paper
+        if kind not in PLAGIARISM_KINDS:
+            raise ValueError(f"Unknown plagiarism kind: {kind}")
+
+        source = self.random.choice(references)
+        body = [name for name in paper['sections'] if name in source['sections'] and name != "references"]
+        count = max(1, int(round(len(body) * fraction)))
+        for name in self.random.sample(body, min(count, len(body))):
+            copied = source['sections'][name]
+            if kind == "paraphrased":
+                copied = self.paraphrase(copied)
+            elif kind == "reordered":
+                copied = self.reorder(copied)
+            paper['sections'][name] = copied
+            paper['plagiarism']['sections'].append(name)
+        paper['plagiarism']['source_id'] = source['id']
+        return paper
+
+    def suspects(self, count: int, references: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Generate `count` suspects cycling through original and every plagiarism kind"""
+        kinds = (None,) + PLAGIARISM_KINDS
+        return [self.suspect(f"suspect-{i}", references, kinds[i % len(kinds)]) for i in range(count)]
+
+
+def paper_text(paper: Dict[str, Any], with_headings: bool = True) -> str:
+    """Render a paper as plain text, one heading line per section"""
+    lines = [paper['title']]
+    headings = dict(SECTION_HEADINGS)
+    for name, content in paper['sections'].items():
+        if with_headings:
+            lines.append(headings.get(name, name.title()))
+        lines.append(content)
+    return "\n".join(lines)
+
+
+PUBLISHER_TEMPLATES = ("highwire", "json_ld", "arxiv", "springer", "generic", "paragraphs")
+
+
+def publisher_page(paper: Dict[str, Any], template: str, noise_links: int = 2000) -> str:
+    """
+    Render a paper as an HTML landing page in the style of a publisher
+
+    Args:
+        paper: Paper from SyntheticCorpus.paper
+        template: One of PUBLISHER_TEMPLATES, which decides where the abstract is
+        noise_links: Navigation links and script lines around the content, as
+            bulky publisher pages have
+
+    Returns:
+        HTML source
+    """
+    title = escape(paper['title'])
+    abstract = escape(paper['sections'].get('abstract', ''))
+    body = "".join(f"<section><h2>{escape(name.title())}</h2><p>{escape(content)}</p></section>"
+                   for name, content in paper['sections'].items() if name not in ("abstract", "references"))
+    head = [f"<title>{title}</title>", '<meta charset="utf-8">',
+            f'<meta name="citation_title" content="{title}">']
+    if template == "highwire":
+        head.append(f'<meta name="citation_abstract" content="{abstract}">')
+    elif template == "json_ld":
+        data = {"@context": "https://schema.org", "@type": "ScholarlyArticle", "headline": paper['title'],
+                "abstract": paper['sections'].get('abstract', '')}
+        head.append(f'<script type="application/ld+json">{json.dumps(data)}</script>')
+    head.append("<script>" + "var analytics = {};\n" * (noise_links // 4) + "</script>")
+
+    if template == "arxiv":
+        abstract_html = f'<blockquote class="abstract mathjax">{abstract}</blockquote>'
+    elif template == "springer":
+        abstract_html = f'<section data-title="Abstract"><div id="Abs1-content"><p>{abstract}</p></div></section>'
+    elif template == "generic":
+        abstract_html = f'<div class="article-abstract"><p>{abstract}</p></div>'
+    elif template == "paragraphs":
+        abstract_html = f"<p>{abstract}</p>"
+    else:
+        abstract_html = f'<div class="hidden-abstract"><p>{abstract}</p></div>'
+
+    navigation = "".join(f'<li><a href="/journal/{i}">Journal {i}</a></li>' for i in range(noise_links))
+    return (
+        f"<!DOCTYPE html><html><head>{''.join(head)}</head><body>"
+        f"<header><ul>{navigation}</ul></header><nav>Browse</nav>"
+        f"<main><article><h1>{title}</h1>{abstract_html}{body}</article></main>"
+        f"<footer><ul>{navigation}</ul></footer></body></html>"
+    )
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text: str, width: int) -> List[str]:
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + len(word) + 1 > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+    return lines
+
+
+def make_pdf(text: str, lines_per_page: int = 50, width: int = 90) -> bytes:
+    """
+    Render plain text as a minimal multi-page PDF (Helvetica, one text object per page)
+
+    Args:
+        text: Text to render; newlines start new lines
+        lines_per_page: Number of lines on each page
+        width: Maximum characters per line
+
+    Returns:
+        PDF file content as bytes
+    """
+    lines = _wrap(text, width)
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[""]]
+
+    # Object 1: catalog, 2: page tree, 3: font, then a (page, content) pair per page
+    objects = []
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    for page_id, page_lines in zip(page_ids, pages):
+        stream_lines = ["BT", "/F1 10 Tf", "12 TL", "50 780 Td"]
+        for line in page_lines:
+            stream_lines.append(f"({_pdf_escape(line)}) Tj T*")
+        stream_lines.append("ET")
+        stream = "\n".join(stream_lines).encode("latin-1", errors="replace")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode()
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode()
+    return bytes(output)
@@ -0,0 +1,317 @@
+"""
+Offline bulk checking of PDF archives.
+
+Runs the same PlagiarismPipeline as the API over a directory, glob or
+manifest of PDFs in a pool of worker processes and writes one JSON line per
+document. The output file doubles as the checkpoint: rerunning with --resume
+skips documents that already have a successful record.
+
+Examples:
+    python bulk_check.py archive/ --output results.jsonl --workers 4
+    python bulk_check.py "archive/**/*.pdf" --output results.jsonl --resume --parquet results.parquet
+    python bulk_check.py manifest.jsonl --output results.jsonl --check-online-sources
+"""
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+logger = logging.getLogger("bulk_check")
+
+# Services of this process, created by load_services (inherited by forked workers with --preload)
+_pipeline = None
+
+
+def load_services(torch_threads: Optional[int] = None):
+    """Load the models and build the pipeline of this process"""
+    global _pipeline
+    if _pipeline is not None:
+        return _pipeline
+
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+
+    from app.services.ai_detector import AIDetector
+    from app.services.incremental_checker import IncrementalChecker
+    from app.services.pipeline import PlagiarismPipeline
+    from app.services.plagiarism_checker import PlagiarismChecker
+    from app.utils.pdf_extractor import PDFExtractor
+
+    plagiarism_checker = PlagiarismChecker()
+    ai_detector = AIDetector()
+    _pipeline = PlagiarismPipeline(PDFExtractor(), plagiarism_checker, ai_detector,
+                                   IncrementalChecker(plagiarism_checker, ai_detector), result_cache_size=0)
+    return _pipeline
+
+
+def _init_worker(torch_threads: Optional[int]):
+    load_services(torch_threads)
+
+
+def _json_default(value):
+    # numpy scalars and arrays
+    if hasattr(value, "item") and getattr(value, "ndim", 1) == 0:
+        return value.item()
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def check_document(item: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Check one document in a worker process
+
+    Args:
+        item: Manifest entry with 'id', 'path' and optional per-document 'options'
+        options: Default PlagiarismOptions fields
+
+    Returns:
+        Output record
+    """
+    from app.core.models import PlagiarismOptions
+
+    start_time = time.perf_counter()
+    record = {'id': item['id'], 'path': item['path']}
+    try:
+        request = PlagiarismOptions(**{**options, **item.get('options', {})})
+        with open(item['path'], "rb") as f:
+            hasher = hashlib.sha256()
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(chunk)
+            size = f.tell()
+            f.seek(0)
+            result = load_services().check_pdf(f, request, content_hash=hasher.hexdigest())
+        record.update({'status': 'ok', 'bytes': size, 'result': result})
+    except Exception as e:
+        record.update({'status': 'error', 'error': str(e)})
+    record['elapsed_s'] = round(time.perf_counter() - start_time, 3)
+    return record
+
+
+def iter_inputs(inputs: List[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Expand directories, glob patterns and manifests into manifest entries
+
+    A manifest is a .txt file with one path per line, or a .jsonl file with
+    objects holding 'path' and optionally 'id' and 'options'. Ids default to
+    the path.
+    """
+    seen = set()
+
+    def entry(path: str, item_id: Optional[str] = None, options: Optional[Dict[str, Any]] = None):
+        item_id = item_id or path
+        if item_id in seen:
+            return None
+        seen.add(item_id)
+        return {'id': item_id, 'path': path, 'options': options or {}}
+
+    for value in inputs:
+        if os.path.isdir(value):
+            paths = sorted(glob.glob(os.path.join(value, "**", "*.pdf"), recursive=True))
+        elif value.endswith(".jsonl") and os.path.isfile(value):
+            with open(value, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        data = json.loads(line)
+                        item = entry(data['path'], data.get('id'), data.get('options'))
+                        if item:
+                            yield item
+            continue
+        elif value.endswith(".txt") and os.path.isfile(value):
+            with open(value, "r", encoding="utf-8") as f:
+                paths = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        else:
+            paths = sorted(glob.glob(value, recursive=True))
+
+        for path in paths:
+            item = entry(path)
+            if item:
+                yield item
+
+
+def load_checkpoint(output: str, retry_failed: bool) -> set:
+    """Ids already recorded in the output file (only successes when retrying failures)"""
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partial line from an interrupted run
+            if record.get('status') == 'ok' or not retry_failed:
+                done.add(record['id'])
+    return done
+
+
+def write_parquet(output: str, parquet_path: str):
+    """Convert the JSONL output into a Parquet table with one row per document"""
+    import pandas as pd
+
+    rows = {}
+    with open(output, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            result = record.get('result') or {}
+            ai = result.get('ai_detection_results') or {}
+            highest = result.get('highest_match') or {}
+            # Later records of the same id (retries) replace earlier ones
+            rows[record['id']] = {
+                'id': record['id'],
+                'path': record['path'],
+                'status': record['status'],
+                'error': record.get('error'),
+                'elapsed_s': record.get('elapsed_s'),
+                'content_hash': result.get('content_hash'),
+                'total_word_count': result.get('total_word_count'),
+                'plagiarism_overall_score': result.get('plagiarism_overall_score'),
+                'highest_match_score': highest.get('overall_score'),
+                'highest_match_title': (highest.get('paper_info') or {}).get('title'),
+                'overall_ai_probability': ai.get('overall_ai_probability'),
+                'overall_is_ai_generated': ai.get('overall_is_ai_generated'),
+                'result_json': json.dumps(result, default=_json_default) if result else None,
+            }
+    pd.DataFrame(list(rows.values())).to_parquet(parquet_path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check a directory, glob or manifest of PDFs offline")
+    parser.add_argument("inputs", nargs="+", help="Directories, glob patterns, or .txt/.jsonl manifests")
+    parser.add_argument("--output", required=True, help="JSONL output file (also the checkpoint)")
+    parser.add_argument("--parquet", help="Also write a Parquet summary table to this path")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--torch-threads", type=int, default=1, help="Torch intra-op threads per worker")
+    parser.add_argument("--preload", action="store_true",
+                        help="Load the models once in the parent and fork the workers (copy-on-write sharing)")
+    parser.add_argument("--resume", action="store_true", help="Skip documents already in the output")
+    parser.add_argument("--retry-failed", action="store_true", help="With --resume, retry documents that failed")
+    parser.add_argument("--check-online-sources", action="store_true")
+    parser.add_argument("--num-papers", type=int, default=3)
+    parser.add_argument("--fetch-budget", type=int)
+    parser.add_argument("--fetch-max-pages", type=int, help="Pages of each reference PDF extracted")
+    parser.add_argument("--fetch-max-mb", type=float, help="Largest reference download in MB")
+    parser.add_argument("--thresholds", type=json.loads, help='JSON object, e.g. \'{"semantic": 0.9}\'')
+    parser.add_argument("--exclusions", type=lambda value: [rule for rule in value.split(",") if rule],
+                        help="Comma-separated exclusion rules (default: all; empty string scores everything)")
+    parser.add_argument("--section-aligned", action="store_true",
+                        help="Compare references section by section and report per-section matches")
+    parser.add_argument("--progress-every", type=int, default=10, help="Log throughput every N documents")
+    args = parser.parse_args(argv)
+
+    options = {
+        'check_online_sources': args.check_online_sources,
+        'num_papers': args.num_papers,
+        'fetch_budget': args.fetch_budget,
+        'fetch_max_pages': args.fetch_max_pages,
+        'fetch_max_mb': args.fetch_max_mb,
+        'thresholds': args.thresholds,
+        'exclusions': args.exclusions,
+        'section_aligned': args.section_aligned,
+    }
+
+    if args.parquet:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("--parquet requires pyarrow (pip install pyarrow)")
+
+    if os.path.exists(args.output) and not args.resume:
+        parser.error(f"{args.output} exists; pass --resume to continue it")
+    done = load_checkpoint(args.output, args.retry_failed) if args.resume else set()
+    items = [item for item in iter_inputs(args.inputs) if item['id'] not in done]
+    logger.info(f"{len(items)} documents to check ({len(done)} already done)")
+    if not items:
+        return
+
+    if args.preload:
+        # Models are loaded before the fork and shared copy-on-write by the workers
+        load_services(args.torch_threads)
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context("spawn")
+
+    # Terminate a partial last line left by an interrupted run
+    if os.path.exists(args.output) and os.path.getsize(args.output):
+        with open(args.output, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    start_time = time.perf_counter()
+    completed = failed = total_bytes = 0
+    with open(args.output, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=args.workers, mp_context=context,
+                                initializer=_init_worker, initargs=(args.torch_threads,)) as executor:
+        pending = set()
+        queue = iter(items)
+        # Keep a bounded number of documents in flight
+        for item in queue:
+            pending.add(executor.submit(check_document, item, options))
+            if len(pending) >= args.workers * 2:
+                break
+
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                out.write(json.dumps(record, default=_json_default) + "\n")
+                out.flush()
+
+                completed += 1
+                total_bytes += record.get('bytes', 0)
+                if record['status'] != 'ok':
+                    failed += 1
+                    logger.warning(f"Failed {record['id']}: {record['error']}")
+                if completed % args.progress_every == 0 or completed == len(items):
+                    elapsed = time.perf_counter() - start_time
+                    logger.info(f"{completed}/{len(items)} documents, {failed} failed, "
+                                f"{completed / elapsed:.2f} docs/s, {total_bytes / elapsed / 1e6:.2f} MB/s")
+
+                next_item = next(queue, None)
+                if next_item is not None:
+                    pending.add(executor.submit(check_document, next_item, options))
+
+    elapsed = time.perf_counter() - start_time
+    summary = {
+        'documents': completed,
+        'failed': failed,
+        'elapsed_s': round(elapsed, 3),
+        'docs_per_s': round(completed / elapsed, 3) if elapsed else None,
+        'mb_per_s': round(total_bytes / elapsed / 1e6, 3) if elapsed else None,
+        'workers': args.workers,
+    }
+    logger.info(f"Done: {json.dumps(summary)}")
+
+    if args.parquet:
+        write_parquet(args.output, args.parquet)
+        logger.info(f"Wrote {args.parquet}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Gunicorn configuration for production (`python run.py --production`).
+
+The app, and with it both transformer models, is loaded once in the master
+process before the workers are forked, so the workers share the model
+weights copy-on-write instead of each loading its own copy. Torch intra-op
+threads are limited so that all workers together use each core once.
+Every worker writes its metrics to METRICS_DIR (a new temporary directory
+by default), and /metrics aggregates them, whichever worker answers.
+"""
+import gc
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Before app.core.metrics is imported, which reads it
+os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="plagiarism-metrics-"))
+
+from app.core.lifecycle import configure_torch_threads  # noqa: E402
+from app.core.metrics import process_metrics  # noqa: E402
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "0")) or max(1, (os.cpu_count() or 2) // 2)
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Load the app (and the models) in the master before forking
+preload_app = True
+
+# Seconds a worker gets to finish in-flight checks after SIGTERM
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "120"))
+# Seconds of silence before a worker is considered hung (a check can take minutes)
+timeout = int(os.getenv("WORKER_TIMEOUT", "300"))
+keepalive = 5
+
+# Optionally recycle workers; with preload a new worker forks from the loaded master
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+
+# Must happen before the models are loaded by preload_app
+torch_threads = configure_torch_threads(workers)
+
+
+def on_starting(server):
+    server.log.info(f"Starting {workers} workers with {torch_threads} torch threads each")
+    # Metrics of an earlier run in the same directory are not this server's
+    process_metrics.clear()
+
+
+def when_ready(server):
+    # What the master recorded while loading the app, kept up to date by its own flush thread
+    process_metrics.start()
+    process_metrics.write()
+
+
+def pre_fork(server, worker):
+    # Move the loaded objects out of the collector's generations so garbage
+    # collection in the workers does not touch (and copy) the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    configure_torch_threads(workers, torch_threads)
+    process_metrics.forked()
+
+
+def worker_exit(server, worker):
+    process_metrics.write()
+
+
+def child_exit(server, worker):
+    process_metrics.mark_process_dead(worker.pid)
@@ -1,5 +1,6 @@
 import uvicorn
 import os
+import sys
 import logging
 from dotenv import load_dotenv
 
@@ -14,6 +15,13 @@ logging.basicConfig(
 )
 
 if __name__ == "__main__":
+    # Production mode: preforked gunicorn workers configured by gunicorn.conf.py
+    if "--production" in sys.argv or os.getenv("RUN_MODE") == "production":
+        logging.info("Starting Plagiarism Detection API in production mode")
+        backend_dir = os.path.dirname(os.path.abspath(__file__))
+        os.execvp("gunicorn", ["gunicorn", "--chdir", backend_dir,
+                               "-c", os.path.join(backend_dir, "gunicorn.conf.py"), "app.main:app"])
+    
     # Set host and port
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "8000"))
@@ -15,10 +15,28 @@ export default function ReportPage() {
 
   useEffect(() => {
     // Get data from localStorage
-    const reportData = localStorage.getItem('reportData')
-    if (reportData) {
-      setData(JSON.parse(reportData))
+    const loadLocal = () => {
+      const reportData = localStorage.getItem('reportData')
+      if (reportData) {
+        setData(JSON.parse(reportData))
+      }
     }
+
+    // Stored reports are loaded by id from the backend, without re-running the check;
+    // reading them needs an API key, so the last local result is shown otherwise
+    const reportId = new URLSearchParams(window.location.search).get('id')
+    if (reportId) {
+      fetch(`http://localhost:8000/api/reports/${encodeURIComponent(reportId)}`)
+        .then((response) => (response.ok ? response.json() : null))
+        .then((report) => (report ? setData(report) : loadLocal()))
+        .catch((error) => {
+          console.error('Error loading report:', error)
+          loadLocal()
+        })
+      return
+    }
+
+    loadLocal()
   }, [])
 
   if (!data) {
@@ -80,31 +80,12 @@ export function PlagiarismChecker() {
 
   const uploadFile = async (file: File) => {
     try {
-      // First, save the file to public directory
+      // Stream the file straight to the backend together with the check options
       const formData = new FormData()
       formData.append("file", file)
-      
-      // Save to public directory
-      const saveResponse = await fetch("/api/upload", {
-        method: "POST",
-        body: formData,
-      })
-
-      if (!saveResponse.ok) {
-        throw new Error(`Failed to save file: ${saveResponse.status}`)
-      }
-
-      const { filePath } = await saveResponse.json()
-      console.log("File saved to:", filePath)
-
-      // Now make the API request with the same format as URL submission
-      const response = await fetch("http://localhost:8000/api/check-plagiarism", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          pdf_url: `http://localhost:3000${filePath}`,
+      formData.append(
+        "options",
+        JSON.stringify({
           check_online_sources: checkOnlineSources,
           num_papers: 5,
           thresholds: {
@@ -113,6 +94,11 @@ export function PlagiarismChecker() {
             fuzzy: thresholds.fuzzy,
           },
         }),
+      )
+
+      const response = await fetch("http://localhost:8000/api/check-plagiarism/upload", {
+        method: "POST",
+        body: formData,
       })
 
       if (!response.ok) {
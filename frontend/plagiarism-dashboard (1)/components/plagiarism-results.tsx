@@ -33,11 +33,14 @@ export function PlagiarismResults({ data }: PlagiarismResultsProps) {
   const isAiGenerated = data?.ai_detection_results?.overall_is_ai_generated || false
   const aiProbability = data?.ai_detection_results?.overall_ai_probability || 0
 
+  // Stored reports have a permanent URL; others are passed through localStorage
+  const reportPath = data?.report_id ? `/report?id=${data.report_id}` : '/report'
+
   // Function to handle full report navigation
   const handleFullReport = () => {
     // Store data in localStorage
     localStorage.setItem('reportData', JSON.stringify(data))
-    router.push('/report')
+    router.push(reportPath)
   }
 
   // Function to handle printing
@@ -112,7 +115,7 @@ export function PlagiarismResults({ data }: PlagiarismResultsProps) {
   const handleShare = async () => {
     // Store data in localStorage
     localStorage.setItem('reportData', JSON.stringify(data))
-    const reportUrl = `${window.location.origin}/report`
+    const reportUrl = `${window.location.origin}${reportPath}`
     
     if (navigator.share) {
       try {
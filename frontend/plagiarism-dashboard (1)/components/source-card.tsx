@@ -17,7 +17,7 @@ interface SourceCardProps {
       source: string
     }
     overall_score: number
-    semantic_similarity: number
+    semantic_similarity: number | null
     ngram_similarity: number
     fuzzy_similarity: number
     is_plagiarized: boolean
@@ -68,12 +68,14 @@ export function SourceCard({ source }: SourceCardProps) {
             <div>
               <div className="flex items-center justify-between mb-1">
                 <span className="text-xs font-medium">Semantic</span>
-                <span className="text-xs font-mono">{(source.semantic_similarity * 100).toFixed(2)}%</span>
+                <span className="text-xs font-mono">
+                  {source.semantic_similarity === null ? "skipped" : `${(source.semantic_similarity * 100).toFixed(2)}%`}
+                </span>
               </div>
               <Progress
-                value={source.semantic_similarity * 100}
+                value={(source.semantic_similarity ?? 0) * 100}
                 className="h-2"
-                indicatorClassName={source.semantic_similarity > 0.8 ? "bg-destructive" : "bg-primary"}
+                indicatorClassName={(source.semantic_similarity ?? 0) > 0.8 ? "bg-destructive" : "bg-primary"}
               />
             </div>
             <div>